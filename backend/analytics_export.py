@@ -0,0 +1,500 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 分析数据列式导出
+把 timer_sessions、user_daily_logs、chat_messages 按日期分区导出为 Parquet（或 Arrow IPC）文件，
+供离线分析使用，代替 check_users_and_logs.py 这类逐页拉 PostgREST JSON 的脚本
+
+- 内存有界：PostgreSQL 使用服务端游标（只读 REPEATABLE READ 事务内逐批取），
+  Supabase 使用按 (水位列, id) 的键集分页；每个分区最多缓存 batch_rows 行，打开的文件数有上限
+- 增量导出：每张表记录上次导出到的 (水位, id)，下次只导出之后变化的行；
+  timer_sessions / user_daily_logs 按 updated_at，chat_messages 按 created_at（只插入不更新）
+- 只导出 now - safety_lag 之前的行，避免漏掉导出时尚未提交的事务
+- 增量文件里同一行可能出现多次（会话完成、日志重建都会更新行），分析时按 id 取水位最大的一条
+- 文件先写为 .tmp，全部写完后改名，最后才推进水位；中途失败时下次从原水位重新导出
+
+目录结构（Hive 分区，pyarrow.dataset / DuckDB / pandas 可直接读取）：
+{out}/{table}/date=YYYY-MM-DD/part-{run_id}-{n}.parquet
+
+示例：
+python analytics_export.py --out exports
+python analytics_export.py --out exports --tables timer_sessions --full --format arrow
+python analytics_export.py --out exports --source supabase --since 2024-01-01
+"""
+
+import os
+import sys
+import json
+import uuid
+import asyncio
+import logging
+import argparse
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from clock import Clock, get_clock, ensure_utc, local_date
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - 只有导出时需要
+    pa = None
+    pq = None
+
+
+@dataclass(frozen=True)
+class ExportTable:
+    """一张导出表：列及其类型、增量水位列、分区日期列"""
+    name: str
+    columns: Tuple[Tuple[str, str], ...]
+    watermark: str
+    partition: str
+
+    @property
+    def column_names(self) -> List[str]:
+        return [name for name, _ in self.columns]
+
+
+EXPORT_TABLES: Dict[str, ExportTable] = {
+    "timer_sessions": ExportTable(
+        name="timer_sessions",
+        columns=(("id", "uuid"), ("user_id", "uuid"), ("timer_type_id", "int"), ("audio_track_id", "int"),
+                 ("planned_duration", "int"), ("actual_duration", "int"), ("started_at", "timestamp"),
+                 ("ended_at", "timestamp"), ("completed", "bool"), ("created_at", "timestamp"),
+                 ("updated_at", "timestamp")),
+        watermark="updated_at", partition="started_at"),
+    "user_daily_logs": ExportTable(
+        name="user_daily_logs",
+        columns=(("id", "uuid"), ("user_id", "uuid"), ("log_date", "date"), ("total_focus_time", "int"),
+                 ("total_sessions", "int"), ("completed_sessions", "int"), ("deep_work_count", "int"),
+                 ("deep_work_time", "int"), ("break_count", "int"), ("break_time", "int"),
+                 ("roundtable_count", "int"), ("roundtable_time", "int"), ("created_at", "timestamp"),
+                 ("updated_at", "timestamp")),
+        watermark="updated_at", partition="log_date"),
+    "chat_messages": ExportTable(
+        name="chat_messages",
+        columns=(("id", "uuid"), ("user_id", "uuid"), ("guide_id", "text"), ("role", "text"),
+                 ("content", "text"), ("session_id", "uuid"), ("created_at", "timestamp")),
+        watermark="created_at", partition="created_at"),
+}
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("列式导出需要 pyarrow：pip install pyarrow")
+
+
+def arrow_schema(table: ExportTable):
+    require_pyarrow()
+    types = {"uuid": pa.string(), "text": pa.string(), "int": pa.int64(), "bool": pa.bool_(),
+             "date": pa.date32(), "timestamp": pa.timestamp("us", tz="UTC")}
+    return pa.schema([(name, types[kind]) for name, kind in table.columns])
+
+
+def coerce(value: Any, kind: str) -> Any:
+    """把 asyncpg / PostgREST / 内存存储返回的值统一成导出类型"""
+    if value is None:
+        return None
+    if kind == "timestamp":
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return ensure_utc(value)
+    if kind == "date":
+        if isinstance(value, datetime):
+            return value.date()
+        return date.fromisoformat(value) if isinstance(value, str) else value
+    if kind in ("uuid", "text"):
+        return str(value)
+    if kind == "int":
+        return int(value)
+    if kind == "bool":
+        return bool(value)
+    return value
+
+
+def normalize_row(table: ExportTable, row: Dict[str, Any]) -> Dict[str, Any]:
+    return {name: coerce(row.get(name), kind) for name, kind in table.columns}
+
+
+def partition_of(table: ExportTable, row: Dict[str, Any]) -> date:
+    """分区日期：时间列按 APP_TIMEZONE 取日期，与 user_daily_logs.log_date 的口径一致"""
+    value = row[table.partition]
+    return local_date(value) if isinstance(value, datetime) else value
+
+
+# ==================== 数据源 ====================
+
+class ExportSource:
+    """按 (水位列, id) 升序逐批产出 (since, until] 之间的行"""
+
+    def iter_batches(self, table: ExportTable, since: Optional[Tuple[datetime, str]],
+                     until: datetime, batch_rows: int) -> AsyncIterator[List[Dict[str, Any]]]:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class PostgresExportSource(ExportSource):
+    """asyncpg 服务端游标；只读事务保证整张表在同一快照下导出"""
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._conn = None
+
+    async def _connection(self):
+        if self._conn is None:
+            import asyncpg
+            self._conn = await asyncpg.connect(self.dsn)
+        return self._conn
+
+    async def iter_batches(self, table, since, until, batch_rows):
+        conn = await self._connection()
+        wm = table.watermark
+        columns = ", ".join(table.column_names)
+        args: List[Any] = [until]
+        where = f"{wm} <= $1"
+        if since is not None:
+            where += f" AND ({wm}, id) > ($2, $3::uuid)"
+            args.extend(since)
+        query = f"SELECT {columns} FROM {table.name} WHERE {where} ORDER BY {wm}, id"
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            cursor = await conn.cursor(query, *args)
+            while True:
+                records = await cursor.fetch(batch_rows)
+                if not records:
+                    break
+                yield [dict(record) for record in records]
+
+    async def close(self):
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+
+class SupabaseExportSource(ExportSource):
+    """PostgREST 键集分页；同步客户端放到线程池里执行"""
+
+    def __init__(self, client):
+        self.client = client
+
+    @staticmethod
+    def _iso(value: datetime) -> str:
+        # 不带 "+"，避免在查询串里被解释成空格
+        return ensure_utc(value).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+    def _fetch(self, table: ExportTable, since, until: datetime, batch_rows: int) -> List[Dict[str, Any]]:
+        wm = table.watermark
+        query = self.client.table(table.name).select(",".join(table.column_names)) \
+            .lte(wm, self._iso(until))
+        if since is not None:
+            last, last_id = since
+            query = query.or_(f'{wm}.gt."{self._iso(last)}",and({wm}.eq."{self._iso(last)}",id.gt.{last_id})')
+        return query.order(wm).order("id").limit(batch_rows).execute().data or []
+
+    async def iter_batches(self, table, since, until, batch_rows):
+        loop = asyncio.get_running_loop()
+        while True:
+            rows = await loop.run_in_executor(None, self._fetch, table, since, until, batch_rows)
+            if not rows:
+                break
+            yield rows
+            last = rows[-1]
+            since = (coerce(last[table.watermark], "timestamp"), last["id"])
+            if len(rows) < batch_rows:
+                break
+
+
+class MemoryExportSource(ExportSource):
+    """从 InMemoryStore 导出，用于本地开发和测试；内存会话没有 updated_at 时取结束或开始时间"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def _rows(self, table: ExportTable) -> List[Dict[str, Any]]:
+        if table.name == "timer_sessions":
+            return [{**s, "created_at": s.get("created_at") or s["started_at"],
+                     "updated_at": s.get("updated_at") or s["ended_at"] or s["started_at"]}
+                    for s in self.store.sessions.values()]
+        if table.name == "user_daily_logs":
+            return list(self.store.daily_logs.values())
+        return [{**m, "id": m["message_id"]} for m in self.store.chat_messages]
+
+    async def iter_batches(self, table, since, until, batch_rows):
+        until = ensure_utc(until)
+        keyed = []
+        for row in self._rows(table):
+            key = (coerce(row[table.watermark], "timestamp"), str(row["id"]))
+            if key[0] <= until and (since is None or key > (ensure_utc(since[0]), since[1])):
+                keyed.append((key, row))
+        keyed.sort(key=lambda item: item[0])
+        for start in range(0, len(keyed), batch_rows):
+            await asyncio.sleep(0)
+            yield [row for _, row in keyed[start:start + batch_rows]]
+
+
+# ==================== 分区写入 ====================
+
+class ArrowPartWriter:
+    """一个分区文件；按批追加为 Parquet 行组或 Arrow 记录批"""
+
+    def __init__(self, path: str, table: ExportTable, fmt: str, compression: str):
+        require_pyarrow()
+        self.path = path
+        self.schema = arrow_schema(table)
+        self.names = table.column_names
+        if fmt == "parquet":
+            self._writer = pq.ParquetWriter(path, self.schema, compression=compression)
+        else:
+            self._sink = pa.OSFile(path, "wb")
+            options = pa.ipc.IpcWriteOptions(compression=None if compression == "none" else compression)
+            self._writer = pa.ipc.new_file(self._sink, self.schema, options=options)
+        self._fmt = fmt
+
+    def write(self, rows: List[Dict[str, Any]]):
+        batch = pa.RecordBatch.from_pydict({name: [row[name] for row in rows] for name in self.names},
+                                           schema=self.schema)
+        if self._fmt == "parquet":
+            self._writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            self._writer.write_batch(batch)
+
+    def close(self):
+        self._writer.close()
+        if self._fmt != "parquet":
+            self._sink.close()
+
+
+class PartitionedWriter:
+    """按分区日期缓存并写出行
+
+    每个分区最多缓存 batch_rows 行，所有分区合计超过 max_buffered_rows 时全部写出；
+    同时打开的文件超过 max_open_files 时关闭最久未写的文件，之后该分区再有数据时写入新的 part 文件
+    """
+
+    def __init__(self, out_dir: str, table: ExportTable, run_id: str, fmt: str = "parquet",
+                 batch_rows: int = 10000, max_buffered_rows: int = None, max_open_files: int = 16,
+                 compression: str = "zstd",
+                 open_part: Callable[[str, ExportTable], Any] = None):
+        self.out_dir = out_dir
+        self.table = table
+        self.run_id = run_id
+        self.fmt = fmt
+        self.batch_rows = batch_rows
+        self.max_buffered_rows = max_buffered_rows or batch_rows * 4
+        self.max_open_files = max_open_files
+        self.open_part = open_part or (lambda path, t: ArrowPartWriter(path, t, fmt, compression))
+        self._buffers: Dict[date, List[Dict[str, Any]]] = {}
+        self._buffered = 0
+        self._open: "OrderedDict[date, Any]" = OrderedDict()
+        self._parts: Dict[date, int] = {}
+        self.pending_files: List[str] = []
+        self.rows_written = 0
+
+    def _part_path(self, day: date) -> str:
+        index = self._parts.get(day, 0)
+        self._parts[day] = index + 1
+        directory = os.path.join(self.out_dir, self.table.name, f"date={day.isoformat()}")
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"part-{self.run_id}-{index}{FORMATS[self.fmt]}.tmp")
+
+    def _flush(self, day: date):
+        rows = self._buffers.pop(day, None)
+        if not rows:
+            return
+        self._buffered -= len(rows)
+        writer = self._open.pop(day, None)
+        if writer is None:
+            if len(self._open) >= self.max_open_files:
+                _, oldest = self._open.popitem(last=False)
+                oldest.close()
+            path = self._part_path(day)
+            writer = self.open_part(path, self.table)
+            self.pending_files.append(path)
+        self._open[day] = writer
+        writer.write(rows)
+        self.rows_written += len(rows)
+
+    def write(self, rows: List[Dict[str, Any]]):
+        for row in rows:
+            row = normalize_row(self.table, row)
+            day = partition_of(self.table, row)
+            buffer = self._buffers.setdefault(day, [])
+            buffer.append(row)
+            self._buffered += 1
+            if len(buffer) >= self.batch_rows:
+                self._flush(day)
+        if self._buffered >= self.max_buffered_rows:
+            for day in list(self._buffers):
+                self._flush(day)
+
+    def close(self) -> List[str]:
+        """写出剩余数据并把 .tmp 文件改为正式文件名，返回文件列表"""
+        for day in list(self._buffers):
+            self._flush(day)
+        while self._open:
+            self._open.popitem(last=False)[1].close()
+        files = []
+        for path in self.pending_files:
+            final = path[:-len(".tmp")]
+            os.replace(path, final)
+            files.append(final)
+        self.pending_files = []
+        return files
+
+    def abort(self):
+        while self._open:
+            try:
+                self._open.popitem(last=False)[1].close()
+            except Exception:
+                pass
+        for path in self.pending_files:
+            if os.path.exists(path):
+                os.remove(path)
+        self.pending_files = []
+
+
+# ==================== 水位 ====================
+
+class WatermarkStore:
+    """每张表上次导出到的 (水位, id)，保存在 {out}/_watermarks.json"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.state: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def get(self, table: str) -> Optional[Tuple[datetime, str]]:
+        entry = self.state.get(table)
+        if not entry or not entry.get("watermark"):
+            return None
+        return datetime.fromisoformat(entry["watermark"]), entry["last_id"]
+
+    def set(self, table: str, watermark: Tuple[datetime, str], rows: int, exported_at: datetime):
+        self.state[table] = {"watermark": ensure_utc(watermark[0]).isoformat(), "last_id": watermark[1],
+                             "rows": rows, "exported_at": ensure_utc(exported_at).isoformat()}
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+
+# ==================== 导出 ====================
+
+async def export_table(source: ExportSource, table: ExportTable, out_dir: str, watermarks: WatermarkStore,
+                       run_id: str, until: datetime, since: Optional[Tuple[datetime, str]] = None,
+                       incremental: bool = True, **writer_options) -> Dict[str, Any]:
+    """导出一张表，成功后推进水位；返回本次导出的统计"""
+    if incremental and since is None:
+        since = watermarks.get(table.name)
+    writer = PartitionedWriter(out_dir, table, run_id, **writer_options)
+    last = since
+    try:
+        async for rows in source.iter_batches(table, since, until, writer.batch_rows):
+            writer.write(rows)
+            tail = rows[-1]
+            last = (coerce(tail[table.watermark], "timestamp"), str(tail["id"]))
+        files = writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+    if last is not None:
+        watermarks.set(table.name, last, writer.rows_written, until)
+        watermarks.save()
+    logger.info(f"{table.name}: 导出 {writer.rows_written} 行，{len(files)} 个文件")
+    return {"table": table.name, "rows": writer.rows_written, "files": files,
+            "since": since[0].isoformat() if since else None,
+            "watermark": last[0].isoformat() if last else None}
+
+
+def clean_stale_files(out_dir: str):
+    """删除上次中途失败留下的 .tmp 文件"""
+    for root, _, files in os.walk(out_dir):
+        for name in files:
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(root, name))
+
+
+async def run_export(source: ExportSource, out_dir: str, tables: List[str] = None, fmt: str = "parquet",
+                     incremental: bool = True, since: Optional[datetime] = None, safety_lag: float = 60.0,
+                     clock: Clock = None, **writer_options) -> List[Dict[str, Any]]:
+    """导出多张表；since 指定时从该时间重新导出（不读取已保存的水位）"""
+    clean_stale_files(out_dir)
+    watermarks = WatermarkStore(os.path.join(out_dir, "_watermarks.json"))
+    until = (clock or get_clock()).now() - timedelta(seconds=safety_lag)
+    run_id = f"{until.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    # 比所有 UUID 都小的 id，使 since 时刻本身的行也被包含
+    start = (ensure_utc(since) - timedelta(microseconds=1), "00000000-0000-0000-0000-000000000000") \
+        if since else None
+    results = []
+    for name in tables or list(EXPORT_TABLES):
+        results.append(await export_table(source, EXPORT_TABLES[name], out_dir, watermarks, run_id, until,
+                                          since=start, incremental=incremental, fmt=fmt, **writer_options))
+    return results
+
+
+def create_source(kind: str = None) -> ExportSource:
+    """默认优先使用 EXPORT_DATABASE_URL（可指向只读副本）或 DATABASE_URL，否则使用 Supabase"""
+    dsn = os.getenv("EXPORT_DATABASE_URL") or os.getenv("DATABASE_URL")
+    kind = kind or ("postgres" if dsn else "supabase")
+    if kind == "postgres":
+        if not dsn:
+            raise ValueError("缺少 EXPORT_DATABASE_URL / DATABASE_URL")
+        return PostgresExportSource(dsn)
+    from supabase_integration import SupabaseClient
+    client = SupabaseClient()
+    return SupabaseExportSource(client.admin_client or client.client)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="AURA STUDIO 分析数据列式导出")
+    parser.add_argument("--out", default=os.getenv("EXPORT_DIR", "exports"), help="输出目录")
+    parser.add_argument("--tables", default=",".join(EXPORT_TABLES), help="逗号分隔的表名")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="parquet")
+    parser.add_argument("--source", choices=["postgres", "supabase"], help="数据源，默认按环境变量选择")
+    parser.add_argument("--full", action="store_true", help="忽略水位，全量导出")
+    parser.add_argument("--since", help="从该时间（ISO 格式）开始重新导出")
+    parser.add_argument("--batch-rows", type=int, default=int(os.getenv("EXPORT_BATCH_ROWS", "10000")),
+                        help="每批行数，同时也是每个行组的最大行数")
+    parser.add_argument("--max-open-files", type=int, default=16)
+    parser.add_argument("--compression", default=os.getenv("EXPORT_COMPRESSION", "zstd"))
+    parser.add_argument("--safety-lag", type=float, default=float(os.getenv("EXPORT_SAFETY_LAG", "60")),
+                        help="只导出该秒数之前更新的行")
+    args = parser.parse_args(argv)
+
+    tables = [t.strip() for t in args.tables.split(",") if t.strip()]
+    unknown = [t for t in tables if t not in EXPORT_TABLES]
+    if unknown:
+        parser.error(f"未知的表: {', '.join(unknown)}")
+    require_pyarrow()
+    since = datetime.fromisoformat(args.since) if args.since else None
+
+    async def run():
+        source = create_source(args.source)
+        try:
+            return await run_export(source, args.out, tables, fmt=args.format,
+                                    incremental=not args.full, since=since, safety_lag=args.safety_lag,
+                                    batch_rows=args.batch_rows, max_open_files=args.max_open_files,
+                                    compression=args.compression)
+        finally:
+            await source.close()
+
+    for result in asyncio.run(run()):
+        print(f"✅ {result['table']}: {result['rows']} 行，{len(result['files'])} 个文件，"
+              f"水位 {result['watermark'] or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 向导对话历史
+每个对话（用户 + 向导）在进程内保留最近 CHAT_HISTORY_TURNS 条消息的环形缓冲，
+重新打开对话时第一页直接从缓冲返回，不查询数据库；更早的消息用游标分页（“加载更早的消息”）
+
+- 游标是最早一条已返回消息的 (created_at, message_id)，编码为不透明字符串；
+  下一页按 (created_at, id) < 游标 查询，走 (user_id, guide_id, created_at DESC, id DESC) 索引，
+  不需要 OFFSET，也不会因为新消息插入而重复或漏掉
+- 通过 ChatHistory.save 写入的消息追加到已缓存对话的缓冲；缓冲不自动创建，第一次读取时从数据库载入
+- 多个 worker 时其他 worker 写入的消息要等缓冲过期（CHAT_HISTORY_TTL 秒）后才能看到
+- 最多缓存 CHAT_HISTORY_CONVERSATIONS 个对话，满时淘汰最久未访问的
+
+使用方法：
+from chat_history import ChatHistory
+
+chat_history = ChatHistory(lambda: repository)
+page = await chat_history.page(user_id, guide_id, limit=20)          # {"messages": [...], "next_cursor": "..."}
+older = await chat_history.page(user_id, guide_id, before=page["next_cursor"])
+await chat_history.save(user_id, guide_id, "user", "你好")
+"""
+
+import os
+import time
+import base64
+import binascii
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+from metrics import REGISTRY
+
+CHAT_HISTORY_REQUESTS = REGISTRY.counter(
+    "aura_chat_history_requests_total", "对话历史请求（result: hit/miss/page）", ["result"])
+
+MESSAGE_KEYS = ("message_id", "role", "content", "created_at")
+
+
+def _utc(created_at: Union[str, datetime]) -> datetime:
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.astimezone(timezone.utc)
+
+
+def encode_cursor(created_at: Union[str, datetime], message_id: str) -> str:
+    """把消息位置编码为游标；时间统一为 UTC 微秒精度，与数据库中的值逐位一致"""
+    position = f"{_utc(created_at).strftime('%Y-%m-%dT%H:%M:%S.%fZ')}|{message_id}"
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """解析游标为 (created_at, message_id)；格式不对时抛出 ValueError"""
+    try:
+        position = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, message_id = position.split("|", 1)
+        return _utc(created_at), message_id
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("无效的分页游标")
+
+
+def message_cursor(message: Dict[str, Any]) -> str:
+    return encode_cursor(message["created_at"], message["message_id"])
+
+
+class _Conversation:
+    """一个对话最近的消息；complete 表示缓冲中就是这个对话的全部消息"""
+
+    __slots__ = ("messages", "complete", "loaded_at")
+
+    def __init__(self, messages: List[Dict[str, Any]], turns: int, complete: bool):
+        self.messages: Deque[Dict[str, Any]] = deque(messages, maxlen=turns)
+        self.complete = complete
+        self.loaded_at = time.monotonic()
+
+    def append(self, message: Dict[str, Any]):
+        if len(self.messages) == self.messages.maxlen:
+            self.complete = False
+        self.messages.append(message)
+
+
+class ChatHistory:
+    """对话历史的第一页缓存和游标分页"""
+
+    def __init__(self, get_repository: Callable[[], Any], turns: int = None,
+                 max_conversations: int = None, ttl: float = None):
+        self.get_repository = get_repository
+        self.turns = turns or int(os.getenv("CHAT_HISTORY_TURNS", "50"))
+        self.max_conversations = max_conversations or int(os.getenv("CHAT_HISTORY_CONVERSATIONS", "10000"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("CHAT_HISTORY_TTL", "300"))
+        self._conversations: "OrderedDict[Tuple[str, str], _Conversation]" = OrderedDict()
+
+    def invalidate(self, user_id: str, guide_id: str):
+        self._conversations.pop((user_id, guide_id), None)
+
+    async def page(self, user_id: str, guide_id: str, limit: int = 20,
+                   before: Optional[str] = None) -> Dict[str, Any]:
+        """按时间正序返回 before 之前（未指定时为最新）的 limit 条消息和下一页游标（没有更早的消息时为 None）"""
+        if limit <= 0:
+            raise ValueError("limit 必须大于 0")
+        if before is not None:
+            position = decode_cursor(before)
+            CHAT_HISTORY_REQUESTS.inc(result="page")
+            rows = await self.get_repository().get_chat_history(user_id, guide_id, limit=limit + 1, before=position)
+            return self._result(rows[-limit:], more=len(rows) > limit)
+
+        key = (user_id, guide_id)
+        conversation = self._conversations.get(key)
+        if (conversation is not None and time.monotonic() - conversation.loaded_at < self.ttl
+                and (len(conversation.messages) >= limit or conversation.complete)):
+            self._conversations.move_to_end(key)
+            CHAT_HISTORY_REQUESTS.inc(result="hit")
+            messages = list(conversation.messages)
+            return self._result(messages[-limit:], more=len(messages) > limit or not conversation.complete)
+
+        # 一次取满一个缓冲（多取一条判断是否还有更早的消息）
+        CHAT_HISTORY_REQUESTS.inc(result="miss")
+        fetch = max(limit, self.turns) + 1
+        rows = await self.get_repository().get_chat_history(user_id, guide_id, limit=fetch)
+        complete = len(rows) < fetch
+        rows = rows[-(fetch - 1):]
+        self._store(key, _Conversation(rows, self.turns, complete and len(rows) <= self.turns))
+        return self._result(rows[-limit:], more=len(rows) > limit or not complete)
+
+    async def save(self, user_id: str, guide_id: str, role: str, content: str,
+                   session_id: str = None) -> Dict[str, Any]:
+        """保存一条消息，并追加到已缓存对话的缓冲"""
+        message = await self.get_repository().save_chat_message(user_id, guide_id, role, content, session_id)
+        conversation = self._conversations.get((user_id, guide_id))
+        if conversation is not None:
+            conversation.append({key: message[key] for key in MESSAGE_KEYS})
+        return message
+
+    def _store(self, key: Tuple[str, str], conversation: _Conversation):
+        self._conversations[key] = conversation
+        self._conversations.move_to_end(key)
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+
+    @staticmethod
+    def _result(messages: List[Dict[str, Any]], more: bool) -> Dict[str, Any]:
+        return {
+            "messages": messages,
+            "next_cursor": message_cursor(messages[0]) if more and messages else None,
+        }
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 时钟抽象
+计时器和每日日志代码统一从这里取当前时间，测试中可以换成虚拟时钟，
+在模拟时间里运行任意长度的会话，而不用真的等待
+
+约定：
+- now() 始终返回带时区的 UTC 时间，数据库中的 timestamptz 也按 UTC 处理
+- "某一天" 按 APP_TIMEZONE（默认 UTC，与数据库函数 generate_daily_log 一致）划分，
+  日界用 day_bounds() 计算，夏令时切换日可能是 23 或 25 小时
+
+使用方法：
+from clock import get_clock, elapsed_seconds, local_date
+
+now = get_clock().now()
+elapsed = elapsed_seconds(session.started_at, now)
+
+测试中：
+from clock import VirtualClock, use_clock
+with use_clock(VirtualClock(datetime(2024, 3, 30, 23, 50, tzinfo=timezone.utc))) as clock:
+    clock.advance(30 * 60)
+"""
+
+import os
+import time
+import asyncio
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta, timezone, tzinfo
+from typing import Optional, Tuple, Union
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python 3.8
+    try:
+        from backports.zoneinfo import ZoneInfo
+    except ImportError:
+        ZoneInfo = None
+
+
+def load_timezone(name: Optional[str] = None) -> tzinfo:
+    """按名称加载时区，未指定时读取 APP_TIMEZONE"""
+    name = name or os.getenv("APP_TIMEZONE", "UTC")
+    if name.upper() == "UTC":
+        return timezone.utc
+    if ZoneInfo is None:
+        raise ValueError(f"当前 Python 不支持时区 {name}，请安装 backports.zoneinfo")
+    return ZoneInfo(name)
+
+
+def ensure_utc(value: datetime) -> datetime:
+    """把时间转换为带时区的 UTC 时间；不带时区的时间按 UTC 解释（与数据库约定一致）"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+class Clock(ABC):
+    """时钟接口"""
+
+    @abstractmethod
+    def now(self) -> datetime:
+        """当前时间（带时区的 UTC）"""
+
+    @abstractmethod
+    def monotonic(self) -> float:
+        """单调时间（秒），只用于计算间隔"""
+
+    @abstractmethod
+    async def sleep(self, seconds: float): ...
+
+    def today(self, tz: Optional[tzinfo] = None) -> date:
+        """当前日期（按 APP_TIMEZONE）"""
+        return local_date(self.now(), tz)
+
+
+class SystemClock(Clock):
+    """真实时钟"""
+
+    def now(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    """虚拟时钟，只有调用 advance()/sleep() 时才前进"""
+
+    def __init__(self, start: Optional[datetime] = None):
+        self._now = ensure_utc(start) if start else datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self._monotonic = 0.0
+
+    def now(self) -> datetime:
+        return self._now
+
+    def monotonic(self) -> float:
+        return self._monotonic
+
+    def advance(self, delta: Union[float, timedelta]) -> datetime:
+        """前进指定秒数（或 timedelta），返回新的当前时间"""
+        seconds = delta.total_seconds() if isinstance(delta, timedelta) else float(delta)
+        if seconds < 0:
+            raise ValueError("虚拟时钟不能倒退")
+        self._now += timedelta(seconds=seconds)
+        self._monotonic += seconds
+        return self._now
+
+    def set(self, value: datetime):
+        """跳到指定时间（不能早于当前时间）"""
+        self.advance(ensure_utc(value) - self._now)
+
+    async def sleep(self, seconds: float):
+        self.advance(seconds)
+        await asyncio.sleep(0)
+
+
+# ==================== 全局时钟 ====================
+
+_clock: Clock = SystemClock()
+
+
+def get_clock() -> Clock:
+    return _clock
+
+
+def set_clock(clock: Clock) -> Clock:
+    """替换全局时钟，返回原来的时钟"""
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
+
+
+@contextmanager
+def use_clock(clock: Clock):
+    """在 with 块内使用指定时钟"""
+    previous = set_clock(clock)
+    try:
+        yield clock
+    finally:
+        set_clock(previous)
+
+
+# ==================== 时间计算 ====================
+
+def elapsed_seconds(started_at: datetime, now: Optional[datetime] = None) -> int:
+    """从 started_at 到 now 的整秒数，兼容带时区和不带时区的时间"""
+    now = now or get_clock().now()
+    return int((ensure_utc(now) - ensure_utc(started_at)).total_seconds())
+
+
+def local_date(value: datetime, tz: Optional[tzinfo] = None) -> date:
+    """时间点在 APP_TIMEZONE 中对应的日期"""
+    return ensure_utc(value).astimezone(tz or load_timezone()).date()
+
+
+def day_bounds(day: date, tz: Optional[tzinfo] = None) -> Tuple[datetime, datetime]:
+    """某一天在 UTC 中的起止时间，左闭右开 [start, end)
+
+    分别计算当天和次日零点再转换为 UTC，夏令时切换日得到 23 或 25 小时
+    """
+    tz = tz or load_timezone()
+    start = datetime.combine(day, datetime.min.time()).replace(tzinfo=tz)
+    end = datetime.combine(day + timedelta(days=1), datetime.min.time()).replace(tzinfo=tz)
+    return start.astimezone(timezone.utc), end.astimezone(timezone.utc)
@@ -56,6 +56,7 @@ CREATE TABLE IF NOT EXISTS timer_sessions (
     ended_at TIMESTAMP WITH TIME ZONE,
     completed BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     
     CONSTRAINT timer_sessions_duration_check CHECK (
         ended_at IS NULL OR started_at < ended_at
@@ -89,8 +90,15 @@ CREATE TABLE IF NOT EXISTS user_daily_logs (
 -- 7. 创建索引提高查询性能
 CREATE INDEX IF NOT EXISTS idx_timer_sessions_user_started ON timer_sessions (user_id, started_at);
 CREATE INDEX IF NOT EXISTS idx_timer_sessions_type ON timer_sessions (timer_type_id);
+-- 进行中的会话（超时会话回收在启动时按此索引加载）
+CREATE INDEX IF NOT EXISTS idx_timer_sessions_open ON timer_sessions (started_at, id)
+    WHERE ended_at IS NULL AND completed = FALSE;
 CREATE INDEX IF NOT EXISTS idx_user_daily_logs_date ON user_daily_logs (log_date);
 CREATE INDEX IF NOT EXISTS idx_user_daily_logs_user_id ON user_daily_logs (user_id);
+-- 分析导出按 (updated_at, id) 增量读取（analytics_export.py）
+ALTER TABLE timer_sessions ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+CREATE INDEX IF NOT EXISTS idx_timer_sessions_updated ON timer_sessions (updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_user_daily_logs_updated ON user_daily_logs (updated_at, id);
 
 -- 8. 创建更新时间触发器
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -109,6 +117,11 @@ CREATE TRIGGER update_user_daily_logs_updated_at
     BEFORE UPDATE ON user_daily_logs 
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
+DROP TRIGGER IF EXISTS update_timer_sessions_updated_at ON timer_sessions;
+CREATE TRIGGER update_timer_sessions_updated_at 
+    BEFORE UPDATE ON timer_sessions 
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
 -- 9. 插入初始数据
 
 -- 插入音轨数据
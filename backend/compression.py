@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 响应压缩
+按 Accept-Encoding 协商压缩 JSON/文本响应：安装了 brotli 时优先 br，否则 gzip；
+历史记录、统计这类重复字段很多的 JSON 一般能压到原来的 1/5 ~ 1/10，弱网下的移动端收益最大
+
+- 小于 COMPRESSION_MIN_SIZE 字节的响应不压缩（压缩头和 CPU 开销不划算）
+- 只压缩一次性返回的响应；流式响应（SSE 对话等）原样透传，避免缓冲打断逐块推送
+- 已经带 Content-Encoding 的响应、图片/音频等已压缩格式不再压缩
+- 超过 COMPRESSION_OFFLOAD_SIZE 的响应在线程池里压缩，不阻塞事件循环
+
+使用方法：
+from compression import install_compression
+install_compression(app)
+"""
+
+import os
+import gzip
+import asyncio
+from typing import Dict, List, Optional, Sequence
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from metrics import REGISTRY
+from tracing import span
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 没有 brotli 时只提供 gzip
+    brotli = None
+
+COMPRESSION_BYTES = REGISTRY.counter("aura_response_compression_bytes_total", "压缩前后的响应字节数",
+                                     ["encoding", "stage"])
+
+# 这些类型不压缩：流式推送，或本身已经是压缩格式
+EXCLUDED_CONTENT_TYPES = ("text/event-stream", "image/", "audio/", "video/", "application/zip",
+                          "application/gzip", "application/octet-stream")
+
+
+def available_encodings() -> List[str]:
+    """服务端支持的编码，按优先级排列"""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """'gzip, br;q=0.9, *;q=0' -> {"gzip": 1.0, "br": 0.9, "*": 0.0}"""
+    weights = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+    return weights
+
+
+def negotiate_encoding(header: str, encodings: Sequence[str] = None) -> Optional[str]:
+    """选出客户端接受且权重最高的编码；权重相同时按服务端优先级，都不接受时返回 None"""
+    weights = parse_accept_encoding(header or "")
+    best, best_q = None, 0.0
+    for encoding in encodings or available_encodings():
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """对一次性返回的大响应做 gzip/br 压缩"""
+
+    def __init__(self, app, minimum_size: int = None, gzip_level: int = None, brotli_quality: int = None,
+                 offload_size: int = None):
+        self.app = app
+        self.minimum_size = minimum_size if minimum_size is not None else \
+            int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+        self.gzip_level = gzip_level or int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+        self.brotli_quality = brotli_quality or int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+        self.offload_size = offload_size or int(os.getenv("COMPRESSION_OFFLOAD_SIZE", "262144"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(self, encoding, send))
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+
+class _CompressingSend:
+    """包装 send：暂存响应头，看到第一个 body 消息后决定是否压缩"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start = None
+        self.decided = False
+
+    def _compressible(self, headers: Headers, body: bytes, more_body: bool) -> bool:
+        if more_body or len(body) < self.middleware.minimum_size:
+            return False
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "")
+        return not any(content_type.startswith(excluded) for excluded in EXCLUDED_CONTENT_TYPES)
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.decided:
+            await self.send(message)
+            return
+
+        self.decided = True
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        headers = MutableHeaders(raw=self.start["headers"])
+        if not self._compressible(headers, body, more_body):
+            await self.send(self.start)
+            await self.send(message)
+            return
+
+        with span("response.compress", kind="cpu", encoding=self.encoding, bytes=len(body)):
+            if len(body) >= self.middleware.offload_size:
+                loop = asyncio.get_running_loop()
+                compressed = await loop.run_in_executor(None, self.middleware.compress, body, self.encoding)
+            else:
+                compressed = self.middleware.compress(body, self.encoding)
+        COMPRESSION_BYTES.inc(len(body), encoding=self.encoding, stage="in")
+        COMPRESSION_BYTES.inc(len(compressed), encoding=self.encoding, stage="out")
+
+        headers["Content-Encoding"] = self.encoding
+        headers["Content-Length"] = str(len(compressed))
+        headers.add_vary_header("Accept-Encoding")
+        await self.send(self.start)
+        await self.send({"type": "http.response.body", "body": compressed})
+
+
+def install_compression(app, **options):
+    """为应用注册响应压缩中间件；应在其他中间件之后、install_tracing 之前调用"""
+    app.add_middleware(CompressionMiddleware, **options)
@@ -4,27 +4,294 @@ AURA STUDIO - 数据库操作逻辑
 包含所有API接口的数据库增删查改操作
 """
 
-import asyncpg
 import bcrypt
+import copy
 import uuid
-from datetime import datetime, date, timedelta
-from typing import List, Dict, Optional, Any
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Optional, Any, Tuple
 import json
+from functools import lru_cache
 
+from metrics import instrument_methods
+from db_pool import create_pool, statement, route_read, RecentWrites
+from clock import Clock, get_clock, elapsed_seconds, local_date
+from storage_engine import Repository, plan_timer_events, summarize_timer_stats, format_daily_log, format_week
+from field_projection import HISTORY_FIELDS, DAILY_FIELDS, WEEKLY_FIELDS, source_columns
+
+logger = logging.getLogger(__name__)
+
+# 会话历史的输出字段 -> SELECT 列和取值函数；只查询请求的字段，用不到的表不 JOIN
+HISTORY_SELECT = {
+    "session_id": "ts.id",
+    "timer_type": "tt.name AS timer_name, tt.display_name AS timer_display_name",
+    "audio_name": "at.name AS audio_name",
+    "planned_duration": "ts.planned_duration",
+    "actual_duration": "ts.actual_duration",
+    "started_at": "ts.started_at",
+    "ended_at": "ts.ended_at",
+    "completed": "ts.completed",
+}
+HISTORY_FORMAT = {
+    "session_id": lambda s: str(s['id']),
+    "timer_type": lambda s: {"name": s['timer_name'], "display_name": s['timer_display_name']},
+    "audio_name": lambda s: s['audio_name'],
+    "planned_duration": lambda s: s['planned_duration'],
+    "actual_duration": lambda s: s['actual_duration'],
+    "started_at": lambda s: s['started_at'].isoformat(),
+    "ended_at": lambda s: s['ended_at'].isoformat() if s['ended_at'] else None,
+    "completed": lambda s: s['completed'],
+}
+
+# ==================== 热点查询 ====================
+# SQL 文本固定，asyncpg 在每个连接上只准备一次；名称用于 aura_db_query_duration_seconds
+
+TIMER_TYPES_SQL = statement("timer_types", """
+    SELECT tt.id, tt.name, tt.display_name, tt.default_duration,
+           tt.description, tt.background_image, tt.default_audio_track_id,
+           at.name as default_audio_name, at.file_path as default_audio_path
+    FROM timer_types tt
+    LEFT JOIN audio_tracks at ON tt.default_audio_track_id = at.id
+    WHERE tt.is_active = TRUE
+    ORDER BY tt.id
+""")
+AUDIO_TRACKS_SQL = statement("audio_tracks", """
+    SELECT id, name, file_path, created_at
+    FROM audio_tracks
+    WHERE is_active = TRUE
+    ORDER BY id
+""")
+SESSION_BY_ID_SQL = statement("session_by_id", """
+    SELECT ts.id, ts.timer_type_id, tt.name, ts.planned_duration,
+           ts.audio_track_id, ts.started_at
+    FROM timer_sessions ts JOIN timer_types tt ON ts.timer_type_id = tt.id
+    WHERE ts.id = $1 AND ts.user_id = $2
+""")
+OPEN_SESSION_ID_SQL = statement("open_session_id", """
+    SELECT id FROM timer_sessions
+    WHERE user_id = $1 AND ended_at IS NULL AND completed = FALSE
+""")
+TIMER_TYPE_SQL = statement("timer_type", """
+    SELECT name, default_duration, default_audio_track_id
+    FROM timer_types WHERE id = $1 AND is_active = TRUE
+""")
+INSERT_SESSION_RETURNING_SQL = statement("insert_session", """
+    INSERT INTO timer_sessions (
+        id, user_id, timer_type_id, audio_track_id, planned_duration,
+        started_at, created_at
+    ) VALUES ($1, $2, $3, $4, $5, $6, NOW())
+    RETURNING id
+""")
+CURRENT_SESSION_SQL = statement("current_session", """
+    SELECT ts.id, ts.timer_type_id, ts.audio_track_id, ts.planned_duration,
+           ts.started_at, ts.created_at,
+           tt.name as timer_name, tt.display_name as timer_display_name,
+           at.name as audio_name, at.file_path as audio_path
+    FROM timer_sessions ts
+    JOIN timer_types tt ON ts.timer_type_id = tt.id
+    LEFT JOIN audio_tracks at ON ts.audio_track_id = at.id
+    WHERE ts.user_id = $1 AND ts.ended_at IS NULL AND ts.completed = FALSE
+    ORDER BY ts.started_at DESC
+    LIMIT 1
+""")
+LATEST_OPEN_SESSION_SQL = statement("latest_open_session", """
+    SELECT id, started_at, planned_duration
+    FROM timer_sessions
+    WHERE user_id = $1 AND ended_at IS NULL AND completed = FALSE
+    ORDER BY started_at DESC LIMIT 1
+""")
+SESSION_STATE_SQL = statement("session_state", """
+    SELECT started_at, planned_duration, ended_at, actual_duration, completed
+    FROM timer_sessions
+    WHERE id = $1 AND user_id = $2
+""")
+COMPLETE_SESSION_SQL = statement("complete_session", """
+    UPDATE timer_sessions
+    SET ended_at = $1, actual_duration = $2, completed = TRUE
+    WHERE id = $3
+""")
+TIMER_STATS_SQL = statement("timer_stats", """
+    SELECT
+        tt.id,
+        tt.name,
+        tt.display_name,
+        tt.description,
+        tt.background_image,
+        COUNT(ts.id) as usage_count,
+        COUNT(ts.id) FILTER (WHERE ts.completed = TRUE) as completed_count,
+        COALESCE(SUM(ts.actual_duration) FILTER (WHERE ts.completed = TRUE), 0) as total_duration,
+        COALESCE(AVG(ts.actual_duration) FILTER (WHERE ts.completed = TRUE), 0) as avg_duration
+    FROM timer_types tt
+    LEFT JOIN timer_sessions ts ON tt.id = ts.timer_type_id AND ts.user_id = $1
+    WHERE tt.is_active = TRUE
+    GROUP BY tt.id, tt.name, tt.display_name, tt.description, tt.background_image
+    ORDER BY tt.id
+""")
+GENERATE_DAILY_LOG_SQL = statement("generate_daily_log", "SELECT generate_daily_log($1, $2)")
+DAILY_LOG_SQL = statement("daily_log", """
+    SELECT * FROM user_daily_logs
+    WHERE user_id = $1 AND log_date = $2
+""")
+INSERT_CHAT_MESSAGE_SQL = statement("insert_chat_message", """
+    INSERT INTO chat_messages (
+        user_id, guide_id, role, content, session_id, created_at
+    ) VALUES ($1, $2, $3, $4, $5, NOW())
+    RETURNING id, created_at
+""")
+# 两条查询都按 idx_chat_messages_conversation (user_id, guide_id, created_at DESC, id DESC) 顺序读取，不需要排序
+CHAT_HISTORY_SQL = statement("chat_history", """
+    SELECT id, role, content, created_at
+    FROM chat_messages
+    WHERE user_id = $1 AND guide_id = $2
+    ORDER BY created_at DESC, id DESC
+    LIMIT $3
+""")
+CHAT_HISTORY_BEFORE_SQL = statement("chat_history_before", """
+    SELECT id, role, content, created_at
+    FROM chat_messages
+    WHERE user_id = $1 AND guide_id = $2 AND (created_at, id) < ($3, $4)
+    ORDER BY created_at DESC, id DESC
+    LIMIT $5
+""")
+HEALTH_CHECK_SQL = statement("health_check", "SELECT 1")
+SYNC_AUTH_USER_SQL = statement("sync_auth_user", """
+    INSERT INTO users (id, email, username, password_hash, last_login_at)
+    VALUES ($1, $2, $3, 'supabase_auth_user', $4)
+    ON CONFLICT (id) DO UPDATE SET last_login_at = EXCLUDED.last_login_at
+    RETURNING id, email, username, avatar_url, created_at, last_login_at
+""")
+LOCK_BATCH_SESSIONS_SQL = statement("lock_batch_sessions", """
+    SELECT id, user_id, started_at, ended_at, completed, planned_duration, actual_duration
+    FROM timer_sessions
+    WHERE (user_id = $1 AND ended_at IS NULL AND completed = FALSE) OR id = ANY($2::uuid[])
+    FOR UPDATE
+""")
+INSERT_SESSION_SQL = statement("batch_insert_session", """
+    INSERT INTO timer_sessions (
+        id, user_id, timer_type_id, audio_track_id, planned_duration,
+        started_at, created_at
+    ) VALUES ($1, $2, $3, $4, $5, $6, NOW())
+""")
+UPDATE_SESSION_SQL = statement("batch_update_session", """
+    UPDATE timer_sessions
+    SET ended_at = $1, actual_duration = $2, completed = $3
+    WHERE id = $4
+""")
+SESSION_MARKER_SQL = statement("session_marker", """
+    SELECT COUNT(*) AS total,
+           COUNT(ended_at) AS ended,
+           COUNT(*) FILTER (WHERE completed) AS completed,
+           MAX(started_at) AS latest
+    FROM timer_sessions WHERE user_id = $1
+""")
+SESSION_FACTS_SQL = statement("session_facts", """
+    SELECT EXTRACT(EPOCH FROM started_at)::bigint, COALESCE(actual_duration, 0),
+           timer_type_id, completed
+    FROM timer_sessions WHERE user_id = $1
+    ORDER BY started_at
+""")
+OPEN_SESSIONS_SQL = statement("open_sessions", """
+    SELECT id, user_id, started_at, planned_duration
+    FROM timer_sessions
+    WHERE ended_at IS NULL AND completed = FALSE
+    ORDER BY started_at, id
+    LIMIT $1
+""")
+OPEN_SESSIONS_AFTER_SQL = statement("open_sessions_after", """
+    SELECT id, user_id, started_at, planned_duration
+    FROM timer_sessions
+    WHERE ended_at IS NULL AND completed = FALSE AND (started_at, id) > ($2, $3)
+    ORDER BY started_at, id
+    LIMIT $1
+""")
+CLOSE_OVERDUE_SQL = statement("close_overdue_sessions", """
+    UPDATE timer_sessions ts
+    SET ended_at = c.ended_at, actual_duration = c.actual_duration, completed = FALSE
+    FROM unnest($1::uuid[], $2::timestamptz[], $3::int[]) AS c(id, ended_at, actual_duration)
+    WHERE ts.id = c.id AND ts.ended_at IS NULL AND ts.completed = FALSE
+    RETURNING ts.id, ts.user_id, ts.started_at
+""")
+
+
+@lru_cache(maxsize=None)
+def daily_stats_sql(columns: Tuple[str, ...]) -> str:
+    """每种列组合生成一次 SQL 文本，列名来自 DAILY_FIELDS 白名单"""
+    return statement("daily_stats", f"""
+    SELECT {", ".join(columns)} FROM user_daily_logs
+    WHERE user_id = $1 AND log_date BETWEEN $2 AND $3
+    ORDER BY log_date DESC
+""")
+
+
+@lru_cache(maxsize=None)
+def weekly_stats_sql(columns: Tuple[str, ...]) -> str:
+    """只汇总请求的字段需要的列"""
+    sums = "".join(f",\n        SUM({column}) as {column}" for column in columns)
+    return statement("weekly_stats", f"""
+    SELECT
+        DATE_TRUNC('week', log_date)::date as week_start{sums}
+    FROM user_daily_logs
+    WHERE user_id = $1 AND log_date >= $2
+    GROUP BY DATE_TRUNC('week', log_date)
+    ORDER BY week_start DESC
+""")
+
+
+@lru_cache(maxsize=None)
+def sessions_history_sql(fields: Tuple[str, ...], by_timer_type: bool) -> str:
+    """fields 按 HISTORY_SELECT 的规范顺序传入，同一组字段无论请求顺序如何都是同一条语句"""
+    query = f"""
+    SELECT {", ".join(HISTORY_SELECT[field] for field in fields)}
+    FROM timer_sessions ts"""
+    if "timer_type" in fields or by_timer_type:
+        query += "\n    JOIN timer_types tt ON ts.timer_type_id = tt.id"
+    if "audio_name" in fields:
+        query += "\n    LEFT JOIN audio_tracks at ON ts.audio_track_id = at.id"
+    query += "\n    WHERE ts.user_id = $1"
+    if by_timer_type:
+        query += " AND tt.name = $2\n    ORDER BY ts.started_at DESC LIMIT $3\n"
+    else:
+        query += "\n    ORDER BY ts.started_at DESC LIMIT $2\n"
+    return statement("sessions_history", query)
+
+
+@instrument_methods("db", "postgres")
 class DatabaseOperations:
-    def __init__(self, connection_string: str):
+    def __init__(self, connection_string: str, clock: Clock = None, read_connection_string: str = None):
         self.connection_string = connection_string
+        # 只读副本（可选）：统计、历史、对话记录等只读查询走副本，写入和刚写入过的用户的读取走主库
+        self.read_connection_string = read_connection_string
         self.pool = None
+        self.read_pool = None
+        self.recent_writes = RecentWrites()
+        self._clock = clock
+
+    @property
+    def clock(self) -> Clock:
+        """未指定时钟时使用全局时钟，测试可以通过 set_clock 替换"""
+        return self._clock or get_clock()
     
     async def init_pool(self):
-        """初始化数据库连接池"""
-        self.pool = await asyncpg.create_pool(self.connection_string)
+        """初始化数据库连接池；只读副本连不上时只记录日志，所有查询走主库"""
+        self.pool = await create_pool(self.connection_string)
+        if self.read_connection_string:
+            try:
+                self.read_pool = await create_pool(self.read_connection_string, name="replica")
+            except Exception as e:
+                logger.warning(f"只读副本连接池创建失败，读取全部走主库: {e}")
     
     async def close_pool(self):
         """关闭数据库连接池"""
+        if self.read_pool:
+            await self.read_pool.close()
         if self.pool:
             await self.pool.close()
 
+    def _reader(self, user_id: str = None):
+        """只读查询使用的连接池：有副本且该用户最近没有写入时走副本"""
+        return route_read(self.pool, self.read_pool, self.recent_writes, user_id)
+
     # ==================== 用户认证相关 ====================
     
     async def register_user(self, email: str, username: str, password: str, avatar_url: str = None) -> Dict[str, Any]:
@@ -54,7 +321,7 @@ class DatabaseOperations:
                 "user_id": str(user_id),
                 "email": email,
                 "username": username,
-                "created_at": datetime.now().isoformat()
+                "created_at": self.clock.now().isoformat()
             }
     
     async def login_user(self, email: str, password: str) -> Dict[str, Any]:
@@ -118,16 +385,8 @@ class DatabaseOperations:
         获取计时器类型列表
         GET /api/timer/types
         """
-        async with self.pool.acquire() as conn:
-            timer_types = await conn.fetch("""
-                SELECT tt.id, tt.name, tt.display_name, tt.default_duration, 
-                       tt.description, tt.background_image, tt.default_audio_track_id,
-                       at.name as default_audio_name, at.file_path as default_audio_path
-                FROM timer_types tt
-                LEFT JOIN audio_tracks at ON tt.default_audio_track_id = at.id
-                WHERE tt.is_active = TRUE
-                ORDER BY tt.id
-            """)
+        async with self._reader().acquire() as conn:
+            timer_types = await conn.fetch(TIMER_TYPES_SQL)
             
             return [
                 {
@@ -151,13 +410,8 @@ class DatabaseOperations:
         获取音轨列表
         GET /api/audio/tracks
         """
-        async with self.pool.acquire() as conn:
-            tracks = await conn.fetch("""
-                SELECT id, name, file_path, created_at
-                FROM audio_tracks
-                WHERE is_active = TRUE
-                ORDER BY id
-            """)
+        async with self._reader().acquire() as conn:
+            tracks = await conn.fetch(AUDIO_TRACKS_SQL)
             
             return [
                 {
@@ -172,26 +426,38 @@ class DatabaseOperations:
     # ==================== 计时器会话相关 ====================
     
     async def start_timer_session(self, user_id: str, timer_type_id: int, 
-                                audio_track_id: int = None, planned_duration: int = None) -> Dict[str, Any]:
+                                audio_track_id: int = None, planned_duration: int = None,
+                                exclusive: bool = True, session_id: str = None,
+                                started_at: datetime = None) -> Dict[str, Any]:
         """
         开始计时器会话
         POST /api/timer/start
+
+        exclusive 为 True 时，已有进行中的会话会被拒绝；
+        指定 session_id 时按主键幂等，重复调用返回已有会话
         """
         async with self.pool.acquire() as conn:
+            if session_id:
+                existing = await conn.fetchrow(SESSION_BY_ID_SQL, uuid.UUID(session_id), uuid.UUID(user_id))
+                if existing:
+                    return {
+                        "session_id": str(existing['id']),
+                        "timer_type_id": existing['timer_type_id'],
+                        "timer_type": existing['name'],
+                        "planned_duration": existing['planned_duration'],
+                        "audio_track_id": existing['audio_track_id'],
+                        "started_at": existing['started_at'].isoformat()
+                    }
+
             # 检查是否有未完成的会话
-            existing_session = await conn.fetchrow("""
-                SELECT id FROM timer_sessions 
-                WHERE user_id = $1 AND ended_at IS NULL AND completed = FALSE
-            """, uuid.UUID(user_id))
-            
-            if existing_session:
-                raise ValueError("您有未完成的计时器会话，请先结束当前会话")
+            if exclusive:
+                existing_session = await conn.fetchrow(OPEN_SESSION_ID_SQL, uuid.UUID(user_id))
+                
+                if existing_session:
+                    raise ValueError("您有未完成的计时器会话，请先结束当前会话")
             
             # 获取计时器类型信息
-            timer_type = await conn.fetchrow("""
-                SELECT name, default_duration, default_audio_track_id
-                FROM timer_types WHERE id = $1 AND is_active = TRUE
-            """, timer_type_id)
+            timer_type = await conn.fetchrow(TIMER_TYPE_SQL, timer_type_id)
             
             if not timer_type:
                 raise ValueError("计时器类型不存在")
@@ -200,21 +466,20 @@ class DatabaseOperations:
             final_duration = planned_duration or timer_type['default_duration']
             final_audio_id = audio_track_id or timer_type['default_audio_track_id']
             
-            # 创建新会话
-            session_id = await conn.fetchval("""
-                INSERT INTO timer_sessions (
-                    user_id, timer_type_id, audio_track_id, planned_duration,
-                    started_at, created_at
-                ) VALUES ($1, $2, $3, $4, NOW(), NOW())
-                RETURNING id
-            """, uuid.UUID(user_id), timer_type_id, final_audio_id, final_duration)
+            # 创建新会话，开始时间取应用时钟，保证与完成时的计算使用同一时间源
+            started_at = started_at or self.clock.now()
+            session_id = await conn.fetchval(
+                INSERT_SESSION_RETURNING_SQL, uuid.UUID(session_id) if session_id else uuid.uuid4(),
+                uuid.UUID(user_id), timer_type_id, final_audio_id, final_duration, started_at)
+            self.recent_writes.mark(user_id)
             
             return {
                 "session_id": str(session_id),
+                "timer_type_id": timer_type_id,
                 "timer_type": timer_type['name'],
                 "planned_duration": final_duration,
                 "audio_track_id": final_audio_id,
-                "started_at": datetime.now().isoformat()
+                "started_at": started_at.isoformat()
             }
     
     async def get_current_session(self, user_id: str) -> Optional[Dict[str, Any]]:
@@ -223,27 +488,17 @@ class DatabaseOperations:
         GET /api/timer/current
         """
         async with self.pool.acquire() as conn:
-            session = await conn.fetchrow("""
-                SELECT ts.id, ts.timer_type_id, ts.audio_track_id, ts.planned_duration,
-                       ts.started_at, ts.created_at,
-                       tt.name as timer_name, tt.display_name as timer_display_name,
-                       at.name as audio_name, at.file_path as audio_path
-                FROM timer_sessions ts
-                JOIN timer_types tt ON ts.timer_type_id = tt.id
-                LEFT JOIN audio_tracks at ON ts.audio_track_id = at.id
-                WHERE ts.user_id = $1 AND ts.ended_at IS NULL AND ts.completed = FALSE
-                ORDER BY ts.started_at DESC
-                LIMIT 1
-            """, uuid.UUID(user_id))
+            session = await conn.fetchrow(CURRENT_SESSION_SQL, uuid.UUID(user_id))
             
             if not session:
                 return None
             
             # 计算已运行时间
-            elapsed_seconds = int((datetime.now() - session['started_at']).total_seconds())
+            elapsed = elapsed_seconds(session['started_at'], self.clock.now())
             
             return {
                 "session_id": str(session['id']),
+                "timer_type_id": session['timer_type_id'],
                 "timer_type": {
                     "id": session['timer_type_id'],
                     "name": session['timer_name'],
@@ -255,25 +510,22 @@ class DatabaseOperations:
                     "file_path": session['audio_path']
                 } if session['audio_track_id'] else None,
                 "planned_duration": session['planned_duration'],
-                "elapsed_time": elapsed_seconds,
+                "elapsed_time": elapsed,
                 "started_at": session['started_at'].isoformat()
             }
     
     async def complete_timer_session(self, user_id: str, session_id: str = None, 
-                                   actual_duration: int = None) -> Dict[str, Any]:
+                                   actual_duration: int = None, ended_at: datetime = None) -> Dict[str, Any]:
         """
         完成计时器会话
         PUT /api/timer/complete
+
+        已完成的会话重复完成时返回原结果，不覆盖结束时间
         """
         async with self.pool.acquire() as conn:
             # 如果没有指定session_id，找到当前进行中的会话
             if not session_id:
-                current_session = await conn.fetchrow("""
-                    SELECT id, started_at, planned_duration
-                    FROM timer_sessions 
-                    WHERE user_id = $1 AND ended_at IS NULL AND completed = FALSE
-                    ORDER BY started_at DESC LIMIT 1
-                """, uuid.UUID(user_id))
+                current_session = await conn.fetchrow(LATEST_OPEN_SESSION_SQL, uuid.UUID(user_id))
                 
                 if not current_session:
                     raise ValueError("没有找到进行中的计时器会话")
@@ -282,32 +534,32 @@ class DatabaseOperations:
                 started_at = current_session['started_at']
                 planned_duration = current_session['planned_duration']
             else:
-                session_data = await conn.fetchrow("""
-                    SELECT started_at, planned_duration
-                    FROM timer_sessions 
-                    WHERE id = $1 AND user_id = $2
-                """, uuid.UUID(session_id), uuid.UUID(user_id))
+                session_data = await conn.fetchrow(SESSION_STATE_SQL, uuid.UUID(session_id), uuid.UUID(user_id))
                 
                 if not session_data:
                     raise ValueError("会话不存在或无权限访问")
+                if session_data['completed'] and session_data['ended_at']:
+                    return {
+                        "session_id": session_id,
+                        "planned_duration": session_data['planned_duration'],
+                        "actual_duration": session_data['actual_duration'],
+                        "completed_at": session_data['ended_at'].isoformat()
+                    }
                 
                 started_at = session_data['started_at']
                 planned_duration = session_data['planned_duration']
             
             # 计算实际时长
-            end_time = datetime.now()
+            end_time = ended_at or self.clock.now()
             if actual_duration is None:
-                actual_duration = int((end_time - started_at).total_seconds())
+                actual_duration = elapsed_seconds(started_at, end_time)
             
             # 更新会话记录
-            await conn.execute("""
-                UPDATE timer_sessions 
-                SET ended_at = $1, actual_duration = $2, completed = TRUE
-                WHERE id = $3
-            """, end_time, actual_duration, uuid.UUID(session_id))
+            await conn.execute(COMPLETE_SESSION_SQL, end_time, actual_duration, uuid.UUID(session_id))
+            self.recent_writes.mark(user_id)
             
-            # 触发日志生成（异步处理）
-            await self.generate_daily_log(user_id, end_time.date())
+            # 触发日志生成：数据库函数按开始日期归档会话，跨午夜的会话要更新开始那天的日志
+            await self.generate_daily_log(user_id, local_date(started_at))
             
             return {
                 "session_id": session_id,
@@ -323,26 +575,10 @@ class DatabaseOperations:
         获取用户计时器类型使用统计
         GET /api/user/timer-stats/{user_id}
         """
-        async with self.pool.acquire() as conn:
-            stats = await conn.fetch("""
-                SELECT 
-                    tt.id,
-                    tt.name,
-                    tt.display_name,
-                    tt.description,
-                    tt.background_image,
-                    COUNT(ts.id) as usage_count,
-                    COUNT(ts.id) FILTER (WHERE ts.completed = TRUE) as completed_count,
-                    COALESCE(SUM(ts.actual_duration) FILTER (WHERE ts.completed = TRUE), 0) as total_duration,
-                    COALESCE(AVG(ts.actual_duration) FILTER (WHERE ts.completed = TRUE), 0) as avg_duration
-                FROM timer_types tt
-                LEFT JOIN timer_sessions ts ON tt.id = ts.timer_type_id AND ts.user_id = $1
-                WHERE tt.is_active = TRUE
-                GROUP BY tt.id, tt.name, tt.display_name, tt.description, tt.background_image
-                ORDER BY tt.id
-            """, uuid.UUID(user_id))
+        async with self._reader(user_id).acquire() as conn:
+            stats = await conn.fetch(TIMER_STATS_SQL, uuid.UUID(user_id))
             
-            return [
+            return summarize_timer_stats([
                 {
                     "timer_type": {
                         "id": stat['id'],
@@ -354,11 +590,10 @@ class DatabaseOperations:
                     "usage_count": stat['usage_count'],
                     "completed_count": stat['completed_count'],
                     "total_duration": stat['total_duration'],
-                    "avg_duration": int(stat['avg_duration']) if stat['avg_duration'] else 0,
-                    "total_duration_formatted": f"{stat['total_duration'] // 60}分{stat['total_duration'] % 60}秒" if stat['total_duration'] > 0 else "0分0秒"
+                    "avg_duration": int(stat['avg_duration']) if stat['avg_duration'] else 0
                 }
                 for stat in stats
-            ]
+            ])
     
     async def generate_daily_log(self, user_id: str, target_date: date = None) -> Dict[str, Any]:
         """
@@ -366,20 +601,15 @@ class DatabaseOperations:
         POST /api/stats/generate-daily-log
         """
         if target_date is None:
-            target_date = date.today()
+            target_date = self.clock.today()
         
         async with self.pool.acquire() as conn:
             # 调用数据库存储过程生成日志
-            await conn.execute(
-                "SELECT generate_daily_log($1, $2)",
-                uuid.UUID(user_id), target_date
-            )
+            await conn.execute(GENERATE_DAILY_LOG_SQL, uuid.UUID(user_id), target_date)
+            self.recent_writes.mark(user_id)
             
             # 获取生成的日志
-            daily_log = await conn.fetchrow("""
-                SELECT * FROM user_daily_logs
-                WHERE user_id = $1 AND log_date = $2
-            """, uuid.UUID(user_id), target_date)
+            daily_log = await conn.fetchrow(DAILY_LOG_SQL, uuid.UUID(user_id), target_date)
             
             if not daily_log:
                 raise ValueError("日志生成失败")
@@ -404,142 +634,51 @@ class DatabaseOperations:
                 "updated_at": daily_log['updated_at'].isoformat()
             }
     
-    async def get_daily_stats(self, user_id: str, start_date: date = None, 
-                            end_date: date = None) -> List[Dict[str, Any]]:
+    async def get_daily_stats(self, user_id: str, start_date: date = None, end_date: date = None,
+                              fields: Tuple[str, ...] = None) -> List[Dict[str, Any]]:
         """
         获取每日统计数据
         GET /api/stats/daily
         """
         if start_date is None:
-            start_date = date.today() - timedelta(days=7)  # 默认最近7天
+            start_date = self.clock.today() - timedelta(days=7)  # 默认最近7天
         if end_date is None:
-            end_date = date.today()
+            end_date = self.clock.today()
+        query = daily_stats_sql(tuple(source_columns(fields, DAILY_FIELDS)))
         
-        async with self.pool.acquire() as conn:
-            daily_logs = await conn.fetch("""
-                SELECT * FROM user_daily_logs
-                WHERE user_id = $1 AND log_date BETWEEN $2 AND $3
-                ORDER BY log_date DESC
-            """, uuid.UUID(user_id), start_date, end_date)
+        async with self._reader(user_id).acquire() as conn:
+            daily_logs = await conn.fetch(query, uuid.UUID(user_id), start_date, end_date)
             
-            return [
-                {
-                    "log_date": log['log_date'].isoformat(),
-                    "total_focus_time": log['total_focus_time'],
-                    "total_sessions": log['total_sessions'],
-                    "completed_sessions": log['completed_sessions'],
-                    "deep_work": {
-                        "count": log['deep_work_count'],
-                        "time": log['deep_work_time']
-                    },
-                    "break": {
-                        "count": log['break_count'],
-                        "time": log['break_time']
-                    },
-                    "roundtable": {
-                        "count": log['roundtable_count'],
-                        "time": log['roundtable_time']
-                    },
-                    "created_at": log['created_at'].isoformat(),
-                    "updated_at": log['updated_at'].isoformat()
-                }
-                for log in daily_logs
-            ]
+            return [format_daily_log(log, fields) for log in daily_logs]
     
-    async def get_weekly_stats(self, user_id: str, weeks_count: int = 4) -> List[Dict[str, Any]]:
+    async def get_weekly_stats(self, user_id: str, weeks_count: int = 4,
+                               fields: Tuple[str, ...] = None) -> List[Dict[str, Any]]:
         """
         获取每周统计数据
         GET /api/stats/weekly
         """
-        end_date = date.today()
+        end_date = self.clock.today()
         start_date = end_date - timedelta(weeks=weeks_count)
+        query = weekly_stats_sql(tuple(source_columns(fields, WEEKLY_FIELDS)))
         
-        async with self.pool.acquire() as conn:
-            weekly_data = await conn.fetch("""
-                SELECT 
-                    DATE_TRUNC('week', log_date)::date as week_start,
-                    SUM(total_focus_time) as total_focus_time,
-                    SUM(total_sessions) as total_sessions,
-                    SUM(completed_sessions) as completed_sessions,
-                    SUM(deep_work_count) as deep_work_count,
-                    SUM(deep_work_time) as deep_work_time,
-                    SUM(break_count) as break_count,
-                    SUM(break_time) as break_time,
-                    SUM(roundtable_count) as roundtable_count,
-                    SUM(roundtable_time) as roundtable_time
-                FROM user_daily_logs
-                WHERE user_id = $1 AND log_date >= $2
-                GROUP BY DATE_TRUNC('week', log_date)
-                ORDER BY week_start DESC
-            """, uuid.UUID(user_id), start_date)
+        async with self._reader(user_id).acquire() as conn:
+            weekly_data = await conn.fetch(query, uuid.UUID(user_id), start_date)
             
-            return [
-                {
-                    "week_start": week['week_start'].isoformat(),
-                    "week_end": (week['week_start'] + timedelta(days=6)).isoformat(),
-                    "total_focus_time": week['total_focus_time'],
-                    "total_sessions": week['total_sessions'],
-                    "completed_sessions": week['completed_sessions'],
-                    "deep_work": {
-                        "count": week['deep_work_count'],
-                        "time": week['deep_work_time']
-                    },
-                    "break": {
-                        "count": week['break_count'],
-                        "time": week['break_time']
-                    },
-                    "roundtable": {
-                        "count": week['roundtable_count'],
-                        "time": week['roundtable_time']
-                    }
-                }
-                for week in weekly_data
-            ]
+            return [format_week(week['week_start'], week, fields) for week in weekly_data]
     
-    async def get_user_sessions_history(self, user_id: str, limit: int = 50, 
-                                      timer_type: str = None) -> List[Dict[str, Any]]:
+    async def get_user_sessions_history(self, user_id: str, limit: int = 50, timer_type: str = None,
+                                        fields: Tuple[str, ...] = None) -> List[Dict[str, Any]]:
         """
         获取用户计时器会话历史
         GET /api/timer/sessions/history
         """
-        async with self.pool.acquire() as conn:
-            query = """
-                SELECT ts.id, ts.planned_duration, ts.actual_duration, ts.started_at, 
-                       ts.ended_at, ts.completed,
-                       tt.name as timer_name, tt.display_name as timer_display_name,
-                       at.name as audio_name
-                FROM timer_sessions ts
-                JOIN timer_types tt ON ts.timer_type_id = tt.id
-                LEFT JOIN audio_tracks at ON ts.audio_track_id = at.id
-                WHERE ts.user_id = $1
-            """
-            params = [uuid.UUID(user_id)]
-            
-            if timer_type:
-                query += " AND tt.name = $2"
-                params.append(timer_type)
-            
-            query += " ORDER BY ts.started_at DESC LIMIT $" + str(len(params) + 1)
-            params.append(limit)
-            
+        fields = fields or tuple(HISTORY_FIELDS)
+        query = sessions_history_sql(tuple(field for field in HISTORY_SELECT if field in fields), bool(timer_type))
+        params = [uuid.UUID(user_id)] + ([timer_type] if timer_type else []) + [limit]
+        async with self._reader(user_id).acquire() as conn:
             sessions = await conn.fetch(query, *params)
             
-            return [
-                {
-                    "session_id": str(session['id']),
-                    "timer_type": {
-                        "name": session['timer_name'],
-                        "display_name": session['timer_display_name']
-                    },
-                    "audio_name": session['audio_name'],
-                    "planned_duration": session['planned_duration'],
-                    "actual_duration": session['actual_duration'],
-                    "started_at": session['started_at'].isoformat(),
-                    "ended_at": session['ended_at'].isoformat() if session['ended_at'] else None,
-                    "completed": session['completed']
-                }
-                for session in sessions
-            ]
+            return [{field: HISTORY_FORMAT[field](session) for field in fields} for session in sessions]
 
     # ==================== 向导对话相关 ====================
     
@@ -553,37 +692,32 @@ class DatabaseOperations:
         # 可以后续添加到数据库设计中
         
         async with self.pool.acquire() as conn:
-            message_id = await conn.fetchval("""
-                INSERT INTO chat_messages (
-                    user_id, guide_id, role, content, session_id, created_at
-                ) VALUES ($1, $2, $3, $4, $5, NOW())
-                RETURNING id
-            """, uuid.UUID(user_id), guide_id, role, content, 
-                uuid.UUID(session_id) if session_id else None)
+            row = await conn.fetchrow(INSERT_CHAT_MESSAGE_SQL, uuid.UUID(user_id), guide_id, role, content,
+                                      uuid.UUID(session_id) if session_id else None)
+            self.recent_writes.mark(user_id)
             
             return {
-                "message_id": str(message_id),
+                "message_id": str(row['id']),
                 "user_id": user_id,
                 "guide_id": guide_id,
                 "role": role,
                 "content": content,
-                "created_at": datetime.now().isoformat()
+                "created_at": row['created_at'].isoformat()  # 用数据库时间，分页游标与表中的值一致
             }
     
-    async def get_chat_history(self, user_id: str, guide_id: str, 
-                             limit: int = 20) -> List[Dict[str, Any]]:
+    async def get_chat_history(self, user_id: str, guide_id: str, limit: int = 20,
+                             before: Tuple[datetime, str] = None) -> List[Dict[str, Any]]:
         """
         获取与指定向导的对话历史
         GET /api/chat/history
+        before 为 (created_at, message_id) 时只返回该消息之前的消息（游标分页）
         """
-        async with self.pool.acquire() as conn:
-            messages = await conn.fetch("""
-                SELECT id, role, content, created_at
-                FROM chat_messages
-                WHERE user_id = $1 AND guide_id = $2
-                ORDER BY created_at DESC
-                LIMIT $3
-            """, uuid.UUID(user_id), guide_id, limit)
+        async with self._reader(user_id).acquire() as conn:
+            if before is None:
+                messages = await conn.fetch(CHAT_HISTORY_SQL, uuid.UUID(user_id), guide_id, limit)
+            else:
+                messages = await conn.fetch(CHAT_HISTORY_BEFORE_SQL, uuid.UUID(user_id), guide_id,
+                                            before[0], uuid.UUID(before[1]), limit)
             
             return [
                 {
@@ -595,11 +729,183 @@ class DatabaseOperations:
                 for msg in reversed(messages)  # 返回时按时间正序
             ]
 
+class _PinnedPool:
+    """acquire() 总是返回同一个已取出的连接，用于在指定连接上执行仓库方法"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def acquire(self):
+        return self
+
+    async def __aenter__(self):
+        return self.conn
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+# 不存在的用户：预热查询走完整的语句准备和类型解析，但不返回数据
+WARMUP_USER_ID = "00000000-0000-0000-0000-000000000000"
+
+# 预热时在每个连接上执行一遍的热点只读查询
+WARMUP_QUERIES = (
+    lambda ops: ops.get_timer_types(),
+    lambda ops: ops.get_audio_tracks(),
+    lambda ops: ops.get_current_session(WARMUP_USER_ID),
+    lambda ops: ops.get_user_timer_stats(WARMUP_USER_ID),
+    lambda ops: ops.get_daily_stats(WARMUP_USER_ID),
+    lambda ops: ops.get_weekly_stats(WARMUP_USER_ID),
+    lambda ops: ops.get_user_sessions_history(WARMUP_USER_ID),
+    lambda ops: ops.get_session_marker(WARMUP_USER_ID),
+)
+
+
+@instrument_methods("db", "postgres")
+class PostgresRepository(DatabaseOperations, Repository):
+    """asyncpg 存储引擎"""
+
+    name = "postgres"
+
+    async def init(self):
+        await self.init_pool()
+
+    async def close(self):
+        await self.close_pool()
+
+    async def health_check(self) -> bool:
+        try:
+            async with self.pool.acquire() as conn:
+                await conn.fetchval(HEALTH_CHECK_SQL)
+            return True
+        except Exception:
+            return False
+
+    async def warm_up(self, connections: int = 0) -> Dict[str, Any]:
+        """主库和只读副本各同时取出 connections 个连接（不足时连接池会新建），在每个连接上执行一遍热点查询，
+        填充 asyncpg 的语句缓存和类型编解码器，首批请求不再付出 prepare 和类型查询的往返"""
+        warmed = 0
+        for pool in (self.pool, self.read_pool):
+            if pool is not None:
+                warmed += await self._warm_pool(pool, connections)
+        return {"connections": warmed, "statements": len(WARMUP_QUERIES)}
+
+    async def _warm_pool(self, pool, connections: int) -> int:
+        connections = min(connections or pool.get_min_size(), pool.get_max_size())
+        acquired = await asyncio.gather(*(pool.acquire() for _ in range(connections)), return_exceptions=True)
+        held = [conn for conn in acquired if not isinstance(conn, BaseException)]
+        try:
+            if len(held) < len(acquired):
+                raise next(conn for conn in acquired if isinstance(conn, BaseException))
+            await asyncio.gather(*(self._warm_connection(conn) for conn in held))
+        finally:
+            for conn in held:
+                await pool.release(conn)
+        return len(held)
+
+    async def _warm_connection(self, conn):
+        pinned = copy.copy(self)
+        pinned.pool = _PinnedPool(conn)
+        pinned.read_pool = None
+        for query in WARMUP_QUERIES:
+            try:
+                await query(pinned)
+            except Exception as e:
+                logger.debug(f"预热查询失败: {e}")
+
+    async def sync_auth_user(self, auth_user_id: str, email: str, username: str = None) -> Dict[str, Any]:
+        """Supabase Auth 用户没有本地密码，password_hash 使用与 SupabaseClient 相同的标记"""
+        async with self.pool.acquire() as conn:
+            user = await conn.fetchrow(SYNC_AUTH_USER_SQL, uuid.UUID(auth_user_id), email,
+                                       username or email.split("@")[0], self.clock.now())
+            
+            return {
+                "user_id": str(user['id']),
+                "email": user['email'],
+                "username": user['username'],
+                "avatar_url": user['avatar_url'],
+                "created_at": user['created_at'].isoformat(),
+                "last_login_at": user['last_login_at'].isoformat()
+            }
+
+    async def _apply_timer_batch(self, user_id: str, batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """整批事件在一个事务中写入；锁住该用户进行中的会话和批内引用的会话，避免并发批次交错"""
+        referenced = [uuid.UUID(e["session_id"]) for e in batch if e["session_id"]]
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                rows = await conn.fetch(LOCK_BATCH_SESSIONS_SQL, uuid.UUID(user_id), referenced)
+                foreign = {str(row['id']) for row in rows if str(row['user_id']) != user_id}
+                clash = next((e["index"] for e in batch if e["session_id"] in foreign), None)
+                if clash:
+                    raise ValueError(f"第 {clash} 个事件: 会话不存在或无权限访问")
+
+                operations, results, log_dates = plan_timer_events(
+                    batch, {str(row['id']): {**dict(row), "id": str(row['id'])} for row in rows})
+                for operation in operations:
+                    if operation[0] == "insert":
+                        session = operation[1]
+                        await conn.execute(INSERT_SESSION_SQL, uuid.UUID(session["id"]), uuid.UUID(user_id),
+                                           session["timer_type_id"], session["audio_track_id"],
+                                           session["planned_duration"], session["started_at"])
+                    else:
+                        _, session_id, changes = operation
+                        await conn.execute(UPDATE_SESSION_SQL, changes["ended_at"], changes["actual_duration"],
+                                           changes["completed"], uuid.UUID(session_id))
+
+                # 每个受影响的日期只重建一次日志，和会话写入在同一个事务里
+                for log_date in log_dates:
+                    await conn.execute(GENERATE_DAILY_LOG_SQL, uuid.UUID(user_id), log_date)
+        self.recent_writes.mark(user_id)
+
+        return {"results": results, "log_dates": [d.isoformat() for d in log_dates]}
+
+    async def get_session_marker(self, user_id: str) -> Tuple:
+        """一次聚合（走 (user_id, started_at) 索引）：任一会话开始、结束或完成都会改变结果"""
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow(SESSION_MARKER_SQL, uuid.UUID(user_id))
+            return (row['total'], row['ended'], row['completed'], row['latest'])
+
+    async def get_session_facts(self, user_id: str) -> List[Tuple[int, int, int, bool]]:
+        # 与 get_session_marker 读同一个库：副本落后时按主库的新标记缓存旧数据，直到下次会话变化前都不会更正
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(SESSION_FACTS_SQL, uuid.UUID(user_id))
+            return [tuple(row) for row in rows]
+
+    async def get_open_sessions(self, limit: int = 1000, after: Tuple[datetime, str] = None) -> List[Dict[str, Any]]:
+        """走 idx_timer_sessions_open 部分索引，只扫描进行中的会话；after 为 (started_at, id) 键集游标"""
+        async with self.pool.acquire() as conn:
+            if after is None:
+                rows = await conn.fetch(OPEN_SESSIONS_SQL, limit)
+            else:
+                rows = await conn.fetch(OPEN_SESSIONS_AFTER_SQL, limit, after[0], uuid.UUID(after[1]))
+            return [
+                {"session_id": str(row['id']), "user_id": str(row['user_id']),
+                 "started_at": row['started_at'], "planned_duration": row['planned_duration']}
+                for row in rows
+            ]
+
+    async def close_overdue_sessions(self, closures: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """一条 UPDATE 关闭整批会话，日志按 (用户, 日期) 去重后在同一事务中重建"""
+        if not closures:
+            return []
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                rows = await conn.fetch(CLOSE_OVERDUE_SQL, [uuid.UUID(c["session_id"]) for c in closures],
+                                        [c["ended_at"] for c in closures], [c["actual_duration"] for c in closures])
+
+                for user_id, log_date in sorted({(row['user_id'], local_date(row['started_at'])) for row in rows}):
+                    await conn.execute(GENERATE_DAILY_LOG_SQL, user_id, log_date)
+
+        for row in rows:
+            self.recent_writes.mark(row['user_id'])
+        closed_ids = {str(row['id']) for row in rows}
+        return [c for c in closures if c["session_id"] in closed_ids]
+
 # ==================== 使用示例和初始化 ====================
 
-async def init_database_operations(connection_string: str) -> DatabaseOperations:
+async def init_database_operations(connection_string: str, clock: Clock = None) -> DatabaseOperations:
     """初始化数据库操作实例"""
-    db_ops = DatabaseOperations(connection_string)
+    db_ops = DatabaseOperations(connection_string, clock=clock)
     await db_ops.init_pool()
     return db_ops
 
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - asyncpg 连接池配置与指标
+连接池大小、空闲连接回收、语句超时和语句缓存都从环境变量读取；热点查询用 statement()
+登记名称，按名称统计每条语句的耗时，同时统计取连接的等待时间和连接池使用率，
+压测时可以直接看出是连接池不够（等待时间上升、in_use 贴近 max）还是 SQL 本身慢
+
+- DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE：连接池最小/最大连接数
+- DB_POOL_MAX_INACTIVE_LIFETIME：空闲连接超过该秒数后关闭（0 表示不回收）
+- DB_POOL_ACQUIRE_TIMEOUT：取连接最多等待的秒数，超时抛出 asyncio.TimeoutError
+- DB_STATEMENT_TIMEOUT：服务端 statement_timeout（秒），慢查询由数据库中止，不占着连接
+- DB_STATEMENT_CACHE_SIZE：每个连接缓存的预备语句数；经 PgBouncer 事务模式连接时设为 0
+
+读写分离（可选）：配置 DATABASE_READ_URL 后，统计、历史、对话记录等只读查询走只读副本，
+写入始终走主库。用户写入后 DB_READ_YOUR_WRITES_WINDOW 秒内该用户的读取仍走主库，
+避免副本复制延迟导致刚写入的数据读不到；窗口应不小于副本的复制延迟。
+多个 worker 时下一个请求多半落到别的 worker，所以写入标记由客户端携带：install_read_your_writes
+在有写入的响应上设置短期 Cookie（aura_rw，值为窗口结束时间），带着该 Cookie 的请求在任何 worker
+上都读主库；进程内的记录只覆盖同一 worker 内的后续读取。跨域的浏览器请求需要带凭据
+（fetch 的 credentials: "include"）才会发送 Cookie，否则只有单 worker 部署能保证读到自己的写入。
+副本取连接失败时本次读取回退到主库
+
+asyncpg 对带参数的查询按 SQL 文本在每个连接上缓存预备语句（服务端命名语句），同一文本
+第二次执行只发送 Bind/Execute；因此热点查询的 SQL 文本必须固定，动态拼接的查询要按
+规范顺序生成，避免同一查询产生多个文本把缓存挤满
+
+使用方法：
+from db_pool import create_pool, statement
+
+CURRENT_SESSION_SQL = statement("current_session", "SELECT ... WHERE user_id = $1")
+pool = await create_pool(dsn)
+async with pool.acquire() as conn:
+    row = await conn.fetchrow(CURRENT_SESSION_SQL, user_id)
+"""
+
+import os
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.cookies import SimpleCookie
+from typing import Any, Dict, Optional
+
+import asyncpg
+
+from metrics import REGISTRY
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+POOL_ACQUIRE_SECONDS = REGISTRY.histogram(
+    "aura_db_pool_acquire_seconds", "从连接池取连接的等待时间", ["pool"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+POOL_ACQUIRE_TIMEOUTS = REGISTRY.counter(
+    "aura_db_pool_acquire_timeouts_total", "取连接等待超时次数", ["pool"])
+POOL_CONNECTIONS = REGISTRY.gauge(
+    "aura_db_pool_connections", "连接池连接数（state: size/idle/in_use/waiting/max）", ["pool", "state"],
+    multiprocess_mode="sum")
+QUERY_LATENCY = REGISTRY.histogram(
+    "aura_db_query_duration_seconds", "单条 SQL 语句耗时（未登记名称的语句记为 other）", ["statement"])
+QUERY_ERRORS = REGISTRY.counter(
+    "aura_db_query_errors_total", "SQL 语句执行异常数", ["statement"])
+DB_READS = REGISTRY.counter(
+    "aura_db_reads_total", "只读查询的路由结果（pool: primary/replica，reason: 原因）", ["pool", "reason"])
+
+# SQL 文本 -> 语句名称
+STATEMENTS: Dict[str, str] = {}
+
+
+def statement(name: str, sql: str) -> str:
+    """登记热点查询的名称并原样返回 SQL 文本"""
+    STATEMENTS[sql] = name
+    return sql
+
+
+def statement_name(sql: str) -> str:
+    return STATEMENTS.get(sql, "other")
+
+
+@contextmanager
+def _timed_statement(sql: str):
+    name = statement_name(sql)
+    started = time.perf_counter()
+    try:
+        with span(f"sql.{name}", kind="db"):
+            yield
+    except BaseException:
+        QUERY_ERRORS.inc(statement=name)
+        raise
+    finally:
+        QUERY_LATENCY.observe(time.perf_counter() - started, statement=name)
+
+
+class TimedConnection(asyncpg.Connection):
+    """按语句名称统计 fetch/fetchrow/fetchval/execute 耗时的连接"""
+
+    async def fetch(self, query, *args, **kwargs):
+        with _timed_statement(query):
+            return await super().fetch(query, *args, **kwargs)
+
+    async def fetchrow(self, query, *args, **kwargs):
+        with _timed_statement(query):
+            return await super().fetchrow(query, *args, **kwargs)
+
+    async def fetchval(self, query, *args, **kwargs):
+        with _timed_statement(query):
+            return await super().fetchval(query, *args, **kwargs)
+
+    async def execute(self, query, *args, **kwargs):
+        with _timed_statement(query):
+            return await super().execute(query, *args, **kwargs)
+
+
+def pool_options() -> Dict[str, Any]:
+    """从环境变量读取 asyncpg.create_pool 参数"""
+    options = {
+        "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+        "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+        "max_inactive_connection_lifetime": float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", "300")),
+        "statement_cache_size": int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256")),
+        "connection_class": TimedConnection,
+        "server_settings": {"application_name": os.getenv("DB_APPLICATION_NAME", "aura-studio")},
+    }
+    options["min_size"] = min(options["min_size"], options["max_size"])
+    statement_timeout = float(os.getenv("DB_STATEMENT_TIMEOUT", "15"))
+    if statement_timeout > 0:
+        # 服务端超时单位为毫秒；客户端超时稍长，数据库先中止语句，连接仍可复用
+        options["server_settings"]["statement_timeout"] = str(int(statement_timeout * 1000))
+        options["command_timeout"] = statement_timeout + 5
+    return options
+
+
+class MeteredPool:
+    """包装 asyncpg 连接池：统计取连接等待时间，并在取出/归还时刷新使用率；其他方法透传"""
+
+    def __init__(self, pool, name: str = "primary", acquire_timeout: float = None):
+        self._pool = pool
+        self.name = name
+        self.acquire_timeout = acquire_timeout or float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "10"))
+        self.waiting = 0
+
+    def __getattr__(self, item):
+        return getattr(self._pool, item)
+
+    def acquire(self, timeout: float = None) -> "_MeteredAcquire":
+        """与 asyncpg 相同，既可以 await 也可以 async with"""
+        return _MeteredAcquire(self, timeout or self.acquire_timeout)
+
+    async def release(self, conn):
+        await self._pool.release(conn)
+        self.update_gauges()
+
+    async def _acquire(self, timeout: float):
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            with span("db.pool.acquire", kind="db_pool", pool=self.name):
+                return await self._pool.acquire(timeout=timeout)
+        except asyncio.TimeoutError:
+            POOL_ACQUIRE_TIMEOUTS.inc(pool=self.name)
+            raise
+        finally:
+            self.waiting -= 1
+            POOL_ACQUIRE_SECONDS.observe(time.perf_counter() - started, pool=self.name)
+            self.update_gauges()
+
+    def update_gauges(self):
+        size, idle = self._pool.get_size(), self._pool.get_idle_size()
+        POOL_CONNECTIONS.set(size, pool=self.name, state="size")
+        POOL_CONNECTIONS.set(idle, pool=self.name, state="idle")
+        POOL_CONNECTIONS.set(size - idle, pool=self.name, state="in_use")
+        POOL_CONNECTIONS.set(self.waiting, pool=self.name, state="waiting")
+        POOL_CONNECTIONS.set(self._pool.get_max_size(), pool=self.name, state="max")
+
+    def stats(self) -> Dict[str, int]:
+        size, idle = self._pool.get_size(), self._pool.get_idle_size()
+        return {"size": size, "idle": idle, "in_use": size - idle, "waiting": self.waiting,
+                "max": self._pool.get_max_size()}
+
+
+class _MeteredAcquire:
+    def __init__(self, pool: MeteredPool, timeout: float):
+        self.pool = pool
+        self.timeout = timeout
+        self.conn = None
+
+    def __await__(self):
+        return self.pool._acquire(self.timeout).__await__()
+
+    async def __aenter__(self):
+        self.conn = await self.pool._acquire(self.timeout)
+        return self.conn
+
+    async def __aexit__(self, *exc_info):
+        conn, self.conn = self.conn, None
+        await self.pool.release(conn)
+        return False
+
+
+async def create_pool(dsn: str, name: str = "primary", **overrides) -> MeteredPool:
+    """按环境变量配置创建连接池；overrides 覆盖单个参数"""
+    pool = await asyncpg.create_pool(dsn, **{**pool_options(), **overrides})
+    metered = MeteredPool(pool, name)
+    metered.update_gauges()
+    return metered
+
+
+# ==================== 读写分离 ====================
+
+READ_YOUR_WRITES_COOKIE = "aura_rw"
+
+# 当前请求的客户端携带的写入窗口结束时间（Unix 时间戳），以及本次请求中写入后的窗口结束时间；
+# 由 ReadYourWritesMiddleware 在每个请求开始时设置
+_client_wrote_until: ContextVar[float] = ContextVar("aura_client_wrote_until", default=0.0)
+_request_writes: ContextVar[Optional[Dict[str, float]]] = ContextVar("aura_request_writes", default=None)
+
+
+class RecentWrites:
+    """记录每个用户最近一次写入的时间，窗口内的读取需要读到自己的写入
+
+    进程内记录之外，请求中的写入还会通过 Cookie 交给客户端（见 ReadYourWritesMiddleware）
+    """
+
+    def __init__(self, window: float = None, max_users: int = 100000):
+        self.window = window if window is not None else float(os.getenv("DB_READ_YOUR_WRITES_WINDOW", "5"))
+        self.max_users = max_users
+        self._writes: Dict[str, float] = {}
+
+    def mark(self, user_id) -> None:
+        if self.window <= 0:
+            return
+        now = time.monotonic()
+        self._writes.pop(str(user_id), None)
+        self._writes[str(user_id)] = now
+        if len(self._writes) > self.max_users:
+            self.prune(now)
+        request_writes = _request_writes.get()
+        if request_writes is not None:
+            request_writes["until"] = time.time() + self.window
+
+    def recent(self, user_id) -> bool:
+        if _client_wrote_until.get() > time.time():
+            return True
+        written = self._writes.get(str(user_id))
+        return written is not None and time.monotonic() - written < self.window
+
+    def prune(self, now: float = None) -> None:
+        """字典按写入时间有序，从最早的开始删除过期记录"""
+        now = now or time.monotonic()
+        for user_id, written in list(self._writes.items()):
+            if now - written < self.window:
+                break
+            del self._writes[user_id]
+
+
+class ReadYourWritesMiddleware:
+    """读取请求携带的写入 Cookie，请求中有写入时在响应上设置 Cookie（纯 ASGI，不缓冲响应）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_writes: Dict[str, float] = {}
+        client_token = _client_wrote_until.set(_cookie_until(scope))
+        writes_token = _request_writes.set(request_writes)
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and "until" in request_writes:
+                until = request_writes["until"]
+                cookie = (f"{READ_YOUR_WRITES_COOKIE}={until:.3f}; Max-Age={max(1, int(until - time.time()) + 1)}; "
+                          f"Path=/; HttpOnly; SameSite=Lax")
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_cookie)
+        finally:
+            _request_writes.reset(writes_token)
+            _client_wrote_until.reset(client_token)
+
+
+def _cookie_until(scope) -> float:
+    for name, value in scope.get("headers", []):
+        if name == b"cookie":
+            morsel = SimpleCookie(value.decode("latin-1")).get(READ_YOUR_WRITES_COOKIE)
+            if morsel is not None:
+                try:
+                    return float(morsel.value)
+                except ValueError:
+                    return 0.0
+    return 0.0
+
+
+def install_read_your_writes(app):
+    """让读取自己写入的保证跨 worker 生效（配置了 DATABASE_READ_URL 的应用调用）"""
+    app.add_middleware(ReadYourWritesMiddleware)
+
+
+# 副本取连接时的这些异常回退到主库
+REPLICA_UNAVAILABLE = (OSError, asyncio.TimeoutError, asyncpg.PostgresConnectionError,
+                       asyncpg.CannotConnectNowError)
+
+
+class ReplicaRead:
+    """在副本上执行一次读取，取不到连接时回退到主库；用法与连接池相同：async with route.acquire() as conn"""
+
+    def __init__(self, replica, primary):
+        self.replica = replica
+        self.primary = primary
+        self._pool = None
+        self._conn = None
+
+    def acquire(self) -> "ReplicaRead":
+        return self
+
+    async def __aenter__(self):
+        try:
+            self._conn = await self.replica.acquire()
+            self._pool = self.replica
+        except REPLICA_UNAVAILABLE as e:
+            DB_READS.inc(pool="primary", reason="replica_unavailable")
+            logger.warning(f"只读副本不可用，回退到主库: {e or type(e).__name__}")
+            self._conn = await self.primary.acquire()
+            self._pool = self.primary
+        else:
+            DB_READS.inc(pool="replica", reason="routed")
+        return self._conn
+
+    async def __aexit__(self, *exc_info):
+        conn, self._conn = self._conn, None
+        await self._pool.release(conn)
+        return False
+
+
+def route_read(primary, replica, recent_writes: RecentWrites, user_id=None):
+    """只读查询使用的连接池：没有副本或该用户刚写入过时用主库，否则用副本"""
+    if replica is None:
+        return primary
+    if user_id is not None and recent_writes.recent(user_id):
+        DB_READS.inc(pool="primary", reason="read_your_writes")
+        return primary
+    return ReplicaRead(replica, primary)
+
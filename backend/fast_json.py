@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 快速 JSON 响应
+FastAPI 默认对返回的 dict 先做一遍 jsonable_encoder（逐个字段递归复制），再用标准库 json 编码；
+历史记录和统计这类几百行的响应，大部分时间花在这两步上
+
+- FastJSONResponse：用 orjson 编码（未安装时回退到标准库 json），作为应用的 default_response_class
+- ok()：接口直接返回 FastJSONResponse，FastAPI 不再做 jsonable_encoder 和响应校验；
+  只用于数据来自数据库或服务端自己构造的接口
+- datetime/date/UUID/dataclass 由 orjson 原生编码，asyncpg Record、Decimal、pydantic 模型、
+  supabase_integration 的紧凑行对象（to_dict，未解析的时间字段原样输出）在 _default 中处理，
+  输出与 jsonable_encoder + json.dumps 的结果一致
+
+使用方法：
+from fast_json import FastJSONResponse, ok
+
+app = FastAPI(default_response_class=FastJSONResponse)
+return ok(result, "计时器已开始")
+"""
+
+import json
+import dataclasses
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Mapping, Optional
+from uuid import UUID
+
+from fastapi.responses import JSONResponse
+
+from tracing import span
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 没有 orjson 时使用标准库
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    """orjson 和标准库都不能直接编码的类型"""
+    if isinstance(obj, Decimal):
+        # 与 jsonable_encoder 一致：整数值编码为 int
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    if isinstance(obj, timedelta):
+        return obj.total_seconds()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, Mapping) or (hasattr(obj, "items") and hasattr(obj, "keys")):
+        # asyncpg.Record 不是 Mapping，但有 items()
+        return dict(obj.items())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _stdlib_default(obj: Any) -> Any:
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, UUID):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    return _default(obj)
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=_OPTIONS)
+else:
+    def dumps(content: Any) -> bytes:
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"),
+                          default=_stdlib_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """用 orjson 编码的 JSON 响应"""
+
+    def render(self, content: Any) -> bytes:
+        with span("json.encode", kind="cpu"):
+            return dumps(content)
+
+
+def ok(data: Any = None, message: Optional[str] = None, status_code: int = 200,
+       headers: Optional[Dict[str, str]] = None) -> FastJSONResponse:
+    """统一的成功响应 {"success": true, "data": ..., "message": ...}，直接编码不经过 jsonable_encoder"""
+    content = {"success": True, "data": data}
+    if message is not None:
+        content["message"] = message
+    return FastJSONResponse(content, status_code=status_code, headers=headers)
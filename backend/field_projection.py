@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 接口字段投影
+历史记录和统计接口支持 fields=a,b,c 只返回需要的字段；所需的列下推到
+SQL SELECT / PostgREST select，数据库少读、网络少传、服务端少编码
+
+每个接口的可选字段表：输出字段 -> 计算它所需的源表列（timer_sessions / user_daily_logs）
+
+使用方法：
+from field_projection import HISTORY_FIELDS, parse_fields, source_columns
+
+fields = parse_fields("started_at,actual_duration", HISTORY_FIELDS)
+columns = source_columns(fields, HISTORY_FIELDS, always=("id",))
+"""
+
+from typing import Any, Collection, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+# GET /api/timer/sessions/history/{user_id}
+HISTORY_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "session_id": ("id",),
+    "timer_type": ("timer_type_id",),
+    "audio_name": ("audio_track_id",),
+    "planned_duration": ("planned_duration",),
+    "actual_duration": ("actual_duration",),
+    "started_at": ("started_at",),
+    "ended_at": ("ended_at",),
+    "completed": ("completed",),
+}
+
+# GET /api/stats/daily/{user_id}
+DAILY_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "log_date": ("log_date",),
+    "total_focus_time": ("total_focus_time",),
+    "total_sessions": ("total_sessions",),
+    "completed_sessions": ("completed_sessions",),
+    "deep_work": ("deep_work_count", "deep_work_time"),
+    "break": ("break_count", "break_time"),
+    "roundtable": ("roundtable_count", "roundtable_time"),
+    "created_at": ("created_at",),
+    "updated_at": ("updated_at",),
+}
+
+# GET /api/stats/weekly/{user_id}；周起止日期由 log_date 分组得到
+WEEKLY_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "week_start": (),
+    "week_end": (),
+    **{name: columns for name, columns in DAILY_FIELDS.items() if name not in ("log_date", "created_at", "updated_at")},
+}
+
+
+def parse_fields(raw: Optional[str], allowed: Collection[str]) -> Optional[Tuple[str, ...]]:
+    """'a, b,a' -> ("a", "b")；未指定或为空时返回 None（全部字段），未知字段抛出 ValueError"""
+    if raw is None:
+        return None
+    fields = tuple(dict.fromkeys(name.strip() for name in raw.split(",") if name.strip()))
+    if not fields:
+        return None
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise ValueError(f"未知字段: {', '.join(unknown)}（可选: {', '.join(allowed)}）")
+    return fields
+
+
+def source_columns(fields: Optional[Sequence[str]], allowed: Mapping[str, Sequence[str]],
+                   always: Iterable[str] = ()) -> List[str]:
+    """输出字段所需的源表列（去重，保持顺序）；fields 为 None 时为全部字段所需的列"""
+    columns = list(dict.fromkeys(always))
+    for name in fields or allowed:
+        for column in allowed[name]:
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+
+def project(rows: List[Dict[str, Any]], fields: Optional[Sequence[str]]) -> List[Dict[str, Any]]:
+    """只保留 fields 中的字段；fields 为 None 时原样返回"""
+    if not fields:
+        return rows
+    return [{name: row.get(name) for name in fields} for row in rows]
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 专注分析
+把用户的全部会话载入紧凑的 NumPy 数组（开始时间戳、实际时长、类型、是否完成），
+用向量化运算计算连续专注天数、周内小时热力图、时长分位数和完成率趋势
+
+- 一个会话在数组中只占 15 字节（int64 + int32 + int16 + bool），几年的历史也只有几百 KB
+- 结果按用户缓存，键为会话变化标记（Repository.get_session_marker）和当天日期：
+  没有新会话时只需一次轻量查询；同一用户的并发请求合并为一次计算（single-flight）
+- 日期和小时按 APP_TIMEZONE 计算，与 user_daily_logs.log_date 口径一致
+- 统计只计入已完成的会话（与每日日志中的专注时长一致），完成率和热力图的会话数包含所有会话
+
+使用方法：
+from focus_insights import FocusInsights
+
+insights = FocusInsights(lambda: repository)
+result = await insights.get(user_id)
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone, tzinfo
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from clock import Clock, get_clock, load_timezone, local_date
+from metrics import REGISTRY
+from tracing import span
+from llm_singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+INSIGHTS_REQUESTS = REGISTRY.counter("aura_insights_requests_total", "专注分析请求（按缓存命中情况）", ["result"])
+INSIGHTS_COMPUTE = REGISTRY.histogram("aura_insights_compute_seconds", "专注分析的计算耗时")
+
+EPOCH = date(1970, 1, 1)
+DAY = 86400
+PERCENTILES = (50, 75, 90, 95)
+WEEKDAYS = ("周一", "周二", "周三", "周四", "周五", "周六", "周日")
+
+
+class SessionArrays:
+    """按开始时间升序的会话列数组"""
+
+    __slots__ = ("start", "duration", "type_id", "completed")
+
+    def __init__(self, facts: Sequence[Tuple[int, int, int, bool]]):
+        table = np.array(facts, dtype=np.int64).reshape(-1, 4)
+        self.start = table[:, 0]
+        self.duration = table[:, 1].astype(np.int32)
+        self.type_id = table[:, 2].astype(np.int16)
+        self.completed = table[:, 3].astype(bool)
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.__slots__)
+
+
+def utc_offsets(start: np.ndarray, tz: tzinfo) -> np.ndarray:
+    """每个时间戳在 tz 中的 UTC 偏移（秒）
+
+    只对每个 UTC 日的零点查一次时区；当天偏移有变化（夏令时切换日）的少数会话再逐个查
+    """
+    if tz is timezone.utc or len(start) == 0:
+        return np.zeros(len(start), dtype=np.int64)
+
+    def offset(ts: int) -> int:
+        return int(datetime.fromtimestamp(ts, tz).utcoffset().total_seconds())
+
+    days = start // DAY
+    first = int(days.min())
+    grid = np.array([offset((first + i) * DAY) for i in range(int(days.max()) - first + 2)], dtype=np.int64)
+    index = days - first
+    offsets = grid[index]
+    for i in np.flatnonzero(grid[index] != grid[index + 1]):
+        offsets[i] = offset(int(start[i]))
+    return offsets
+
+
+def day_to_date(day: int) -> date:
+    return EPOCH + timedelta(days=int(day))
+
+
+def focus_streaks(days: np.ndarray, today: int) -> Dict[str, Any]:
+    """连续专注天数：days 为有已完成会话的本地日序号（可重复、无序）"""
+    active = np.unique(days)
+    if len(active) == 0:
+        return {"current": 0, "longest": 0, "longest_start": None, "longest_end": None, "active_days": 0}
+    breaks = np.flatnonzero(np.diff(active) != 1)
+    starts = np.r_[0, breaks + 1]
+    ends = np.r_[breaks, len(active) - 1]
+    lengths = ends - starts + 1
+    best = int(np.argmax(lengths))
+    # 今天还没有专注不算中断：昨天结束的连续天数仍是当前连续天数
+    current = int(lengths[-1]) if active[-1] >= today - 1 else 0
+    return {
+        "current": current,
+        "longest": int(lengths[best]),
+        "longest_start": day_to_date(active[starts[best]]).isoformat(),
+        "longest_end": day_to_date(active[ends[best]]).isoformat(),
+        "active_days": int(len(active)),
+    }
+
+
+def hour_of_week_heatmap(local: np.ndarray, days: np.ndarray, duration: np.ndarray,
+                         completed: np.ndarray) -> Dict[str, Any]:
+    """7×24 热力图：行是周一到周日，列是开始时间的小时"""
+    # 1970-01-01 是周四，(day + 3) % 7 使周一为 0
+    slot = ((days + 3) % 7) * 24 + (local % DAY) // 3600
+    minutes = np.bincount(slot[completed], weights=duration[completed], minlength=168) / 60.0
+    sessions = np.bincount(slot, minlength=168)
+    peak = int(np.argmax(minutes)) if minutes.any() else None
+    return {
+        "focus_minutes": np.round(minutes).astype(int).reshape(7, 24).tolist(),
+        "sessions": sessions.reshape(7, 24).tolist(),
+        "peak": {"weekday": WEEKDAYS[peak // 24], "hour": peak % 24,
+                 "focus_minutes": int(round(minutes[peak]))} if peak is not None else None,
+    }
+
+
+def duration_percentiles(durations: np.ndarray) -> Optional[Dict[str, Any]]:
+    if len(durations) == 0:
+        return None
+    values = np.percentile(durations, PERCENTILES)
+    result = {f"p{p}": int(round(v)) for p, v in zip(PERCENTILES, values)}
+    result["mean"] = int(round(float(durations.mean())))
+    result["count"] = int(len(durations))
+    return result
+
+
+def completion_trend(days: np.ndarray, duration: np.ndarray, completed: np.ndarray, today: int,
+                     weeks: int) -> List[Dict[str, Any]]:
+    """最近 weeks 周（周一开始）每周的会话数、完成数、完成率和专注时长"""
+    week = (days + 3) // 7
+    first = (today + 3) // 7 - weeks + 1
+    rel = week - first
+    in_range = (rel >= 0) & (rel < weeks)
+    total = np.bincount(rel[in_range], minlength=weeks)
+    done = np.bincount(rel[in_range & completed], minlength=weeks)
+    focus = np.bincount(rel[in_range & completed], weights=duration[in_range & completed], minlength=weeks)
+    return [
+        {
+            "week_start": day_to_date((first + i) * 7 - 3).isoformat(),
+            "sessions": int(total[i]),
+            "completed": int(done[i]),
+            "completion_rate": round(float(done[i]) / total[i] * 100, 1) if total[i] else None,
+            "focus_seconds": int(focus[i]),
+        }
+        for i in range(weeks)
+    ]
+
+
+def compute_insights(facts: Sequence[Tuple[int, int, int, bool]], today: date, type_names: Dict[int, str],
+                     tz: tzinfo = None, weeks: int = 12) -> Dict[str, Any]:
+    """由会话明细计算全部分析结果"""
+    arrays = SessionArrays(facts)
+    tz = tz or load_timezone()
+    local = arrays.start + utc_offsets(arrays.start, tz)
+    days = local // DAY
+    today_index = (today - EPOCH).days
+    completed = arrays.completed
+    done_durations = arrays.duration[completed]
+
+    by_type = {}
+    for type_id in np.unique(arrays.type_id):
+        mask = arrays.type_id == type_id
+        name = type_names.get(int(type_id), str(int(type_id)))
+        by_type[name] = {
+            "sessions": int(mask.sum()),
+            "completed": int((mask & completed).sum()),
+            "durations": duration_percentiles(arrays.duration[mask & completed]),
+        }
+
+    total = len(arrays)
+    return {
+        "totals": {
+            "sessions": total,
+            "completed": int(completed.sum()),
+            "completion_rate": round(float(completed.sum()) / total * 100, 1) if total else 0,
+            "focus_seconds": int(done_durations.sum()),
+            "first_session": day_to_date(days[0]).isoformat() if total else None,
+        },
+        "streak": focus_streaks(days[completed], today_index),
+        "heatmap": hour_of_week_heatmap(local, days, arrays.duration, completed),
+        "durations": {"overall": duration_percentiles(done_durations), "by_type": by_type},
+        "completion_trend": completion_trend(days, arrays.duration, completed, today_index, weeks),
+    }
+
+
+class FocusInsights:
+    """按用户缓存的专注分析；缓存满时淘汰最久未访问的用户"""
+
+    def __init__(self, get_repository: Callable[[], Any], max_users: int = None, ttl: float = None,
+                 weeks: int = 12, clock: Clock = None):
+        self.get_repository = get_repository
+        self.max_users = max_users or int(os.getenv("INSIGHTS_CACHE_USERS", "1024"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("INSIGHTS_CACHE_TTL", "600"))
+        self.weeks = weeks
+        self._clock = clock
+        self._cache: "OrderedDict[str, Tuple[Any, float, Dict[str, Any]]]" = OrderedDict()
+        self._flights = SingleFlight()
+
+    @property
+    def clock(self) -> Clock:
+        return self._clock or get_clock()
+
+    def invalidate(self, user_id: str):
+        self._cache.pop(user_id, None)
+
+    async def get(self, user_id: str) -> Dict[str, Any]:
+        repository = self.get_repository()
+        today = local_date(self.clock.now())
+        key = (await repository.get_session_marker(user_id), today)
+        cached = self._cache.get(user_id)
+        if cached is not None and cached[0] == key and time.monotonic() - cached[1] < self.ttl:
+            self._cache.move_to_end(user_id)
+            INSIGHTS_REQUESTS.inc(result="hit")
+            return cached[2]
+
+        INSIGHTS_REQUESTS.inc(result="miss")
+        return await self._flights.do(f"{user_id}/{key!r}", lambda: self._compute(repository, user_id, key, today))
+
+    async def _compute(self, repository, user_id: str, key, today: date) -> Dict[str, Any]:
+        facts = await repository.get_session_facts(user_id)
+        type_names = {t["id"]: t["name"] for t in await repository.get_timer_types()}
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        with span("insights.compute", kind="cpu", sessions=len(facts)):
+            insights = await loop.run_in_executor(None, compute_insights, facts, today, type_names, None, self.weeks)
+        INSIGHTS_COMPUTE.observe(time.perf_counter() - started)
+        result = {"user_id": user_id, "date": today.isoformat(), **insights}
+
+        self._cache[user_id] = (key, time.monotonic(), result)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_users:
+            self._cache.popitem(last=False)
+        return result
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 生产环境 gunicorn 配置
+所有参数都从环境变量（backend/.env）读取，由 production_runner.py 或直接调用：
+
+gunicorn -c gunicorn_conf.py
+
+主要环境变量：
+APP_MODULE            应用入口，默认 main:app
+HOST / PORT           监听地址
+WEB_CONCURRENCY       worker 数；不设置时按 CPU 核数计算 (2 * 核数 + 1)
+MAX_WORKERS           worker 数上限
+PRELOAD_APP           是否在 master 中预加载应用，默认开启
+MAX_REQUESTS          每个 worker 处理多少请求后回收，0 表示不回收
+MAX_REQUESTS_JITTER   回收阈值的随机抖动，避免所有 worker 同时重启
+GRACEFUL_TIMEOUT      重启/停止时等待进行中请求的秒数
+WORKER_TIMEOUT        worker 无响应多少秒后被 master 杀掉
+METRICS_MULTIPROC_DIR 多 worker 指标汇总目录，多于一个 worker 时默认 /tmp/aura-metrics
+
+指标：每个 worker 的指标只在自己的进程内，Prometheus 抓取 /metrics 时只会落到其中一个 worker。
+多 worker 时各 worker 定期把指标写入 METRICS_MULTIPROC_DIR，/metrics 汇总整个目录
+（计数器、直方图求和，仪表按 multiprocess_mode 合并），见 metrics.py
+"""
+
+import os
+import random
+import multiprocessing
+
+from dotenv import load_dotenv
+
+import worker_health
+
+load_dotenv()
+
+
+def _int_env(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _bool_env(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def default_workers(cores: int, max_workers: int = 0) -> int:
+    """按核数计算 worker 数；Ark 和 bcrypt 调用会阻塞事件循环，所以按 2 * 核数 + 1 预留余量"""
+    workers = cores * 2 + 1
+    if max_workers > 0:
+        workers = min(workers, max_workers)
+    return max(workers, 1)
+
+
+# ==================== 进程 ====================
+
+wsgi_app = os.getenv("APP_MODULE", "main:app")
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = _int_env("WEB_CONCURRENCY", 0) or default_workers(
+    multiprocessing.cpu_count(), _int_env("MAX_WORKERS", 0))
+# 应用按 worker 数平分全局配额（如 llm_admission 的 LLM_GLOBAL_RATE），配置文件在加载应用之前执行
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+# 预加载：应用代码在 master 中只导入一次，worker fork 后共享只读内存页。
+# 数据库连接池、HTTP 客户端等可变资源必须在 worker 的 startup 事件中创建
+preload_app = _bool_env("PRELOAD_APP", True)
+
+# ==================== 网络 ====================
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+backlog = _int_env("BACKLOG", 2048)
+keepalive = _int_env("KEEPALIVE", 5)
+
+# ==================== 回收和超时 ====================
+
+max_requests = _int_env("MAX_REQUESTS", 5000)
+max_requests_jitter = _int_env("MAX_REQUESTS_JITTER", 500)
+timeout = _int_env("WORKER_TIMEOUT", 120)
+graceful_timeout = _int_env("GRACEFUL_TIMEOUT", 30)
+
+# ==================== 管理 ====================
+
+pidfile = os.getenv("GUNICORN_PIDFILE", "/tmp/aura-backend.pid")
+proc_name = os.getenv("GUNICORN_PROC_NAME", "aura-backend")
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+errorlog = os.getenv("GUNICORN_ERROR_LOG", "-")
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+daemon = _bool_env("GUNICORN_DAEMON", False)
+
+
+# ==================== 钩子 ====================
+
+def on_starting(server):
+    """master 启动时清理已退出进程遗留的 worker 状态文件
+
+    滚动重启期间旧 master 的 worker 仍在运行，它们的状态文件需要保留。
+    生产环境默认开启启动预热（STARTUP_WARMUP=0 可关闭）：worker 预热完成后才标记为就绪，
+    production_runner.py 的滚动重启等新 worker 全部就绪后才停止旧 worker
+    """
+    os.environ.setdefault("STARTUP_WARMUP", "1")
+    worker_health.remove_stale_statuses()
+    if workers > 1:
+        os.environ.setdefault("METRICS_MULTIPROC_DIR", "/tmp/aura-metrics")
+        import metrics
+        metrics.archive_dead_workers()
+    server.log.info("AURA STUDIO 启动: %s 个 worker, preload=%s", workers, preload_app)
+
+
+def post_fork(server, worker):
+    """worker fork 后重置进程内状态，保证各 worker 之间不共享可变数据"""
+    random.seed()
+
+    worker_health.WORKER_STATE.reset(max_requests=max_requests)
+    worker_health.WORKER_STATE.write_status(force=True)
+
+    try:
+        import metrics
+        metrics.PROCESS_START_TIME.set(worker_health.WORKER_STATE.started_at)
+        metrics.start_multiprocess()
+    except ImportError:
+        pass
+
+    server.log.info("worker %s 已启动", worker.pid)
+
+
+def worker_exit(server, worker):
+    worker_health.WORKER_STATE.remove_status()
+    if os.getenv("METRICS_MULTIPROC_DIR"):
+        import metrics
+        metrics.write_snapshot()
+
+
+def child_exit(server, worker):
+    """worker 退出（包括被强制杀掉）时由 master 清理其状态文件，并把它的计数并入指标归档"""
+    status_dir = worker_health.status_dir()
+    try:
+        os.remove(os.path.join(status_dir, f"worker-{worker.pid}.json"))
+    except OSError:
+        pass
+    if os.getenv("METRICS_MULTIPROC_DIR"):
+        import metrics
+        metrics.archive_dead_workers(pids=[worker.pid])
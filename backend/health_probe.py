@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 依赖探测与存活/就绪检查
+负载均衡器的探测请求不再直接查询数据库：后台任务每隔 HEALTH_PROBE_INTERVAL 秒
+探测一次各个依赖（数据库、Ark 等），结果缓存在进程内，检查接口立即返回
+
+- GET /api/health/live：进程和事件循环是否在工作，不访问任何依赖
+- GET /api/health/ready：关键依赖最近一次探测都正常且结果未过期时返回 200，否则 503；
+  非关键依赖（如 Ark，未配置时对话使用模拟回复）只报告状态，不影响就绪
+- 单次探测超过 HEALTH_PROBE_TIMEOUT 秒记为失败，慢依赖不会拖慢检查接口
+
+使用方法：
+from health_probe import health_prober, install_health_probes, probe_ark
+
+health_prober.register("database", lambda: repository.health_check())
+health_prober.register("ark", probe_ark, critical=False)
+install_health_probes(app)
+health_prober.start()  # 在 startup 事件中、依赖初始化之后调用
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from metrics import REGISTRY
+from llm_client import ark_configured, DEFAULT_BASE_URL
+
+logger = logging.getLogger(__name__)
+
+DEPENDENCY_UP = REGISTRY.gauge("aura_dependency_up", "依赖最近一次探测是否正常（1 正常，0 异常）", ["dependency"])
+DEPENDENCY_LATENCY = REGISTRY.gauge("aura_dependency_probe_seconds", "依赖最近一次探测的耗时", ["dependency"])
+
+# 检查函数返回 True 正常、False 异常、None 跳过（未配置）；抛出异常记为异常
+Check = Callable[[], Awaitable[Optional[bool]]]
+
+
+class HealthProber:
+    """后台定期探测依赖并缓存结果"""
+
+    def __init__(self, interval: float = None, timeout: float = None, stale_after: float = None):
+        self.interval = interval or float(os.getenv("HEALTH_PROBE_INTERVAL", "10"))
+        self.timeout = timeout or float(os.getenv("HEALTH_PROBE_TIMEOUT", "3"))
+        # 超过该时间没有新的探测结果（探测任务卡住或已停止）视为未就绪
+        self.stale_after = stale_after or self.interval * 3 + self.timeout
+        self.started_at = time.time()
+        self._checks: Dict[str, Tuple[Check, bool]] = {}
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        # 应用在 startup 事件末尾（启动预热之后）调用 start()，此前始终未就绪
+        self.started = False
+
+    def register(self, name: str, check: Check, critical: bool = True):
+        """注册依赖检查；同名检查后注册的覆盖先注册的"""
+        self._checks[name] = (check, critical)
+        self._results.pop(name, None)
+
+    async def _probe(self, name: str, check: Check, critical: bool) -> Dict[str, Any]:
+        started = time.perf_counter()
+        error = None
+        try:
+            healthy = await asyncio.wait_for(check(), timeout=self.timeout)
+            status = "skipped" if healthy is None else "up" if healthy else "down"
+        except asyncio.TimeoutError:
+            status, error = "down", f"探测超时（{self.timeout:g}s）"
+        except Exception as e:
+            status, error = "down", str(e) or type(e).__name__
+        latency = time.perf_counter() - started
+
+        previous = self._results.get(name, {})
+        failures = previous.get("consecutive_failures", 0) + 1 if status == "down" else 0
+        if status == "down" and previous.get("status") != "down":
+            logger.warning(f"依赖探测失败: {name}: {error or '检查未通过'}")
+        elif status == "up" and previous.get("status") == "down":
+            logger.info(f"依赖已恢复: {name}")
+        DEPENDENCY_UP.set(0 if status == "down" else 1, dependency=name)
+        DEPENDENCY_LATENCY.set(latency, dependency=name)
+        return {
+            "status": status,
+            "critical": critical,
+            "latency_ms": round(latency * 1000, 1),
+            "checked_at": time.time(),
+            "consecutive_failures": failures,
+            "error": error,
+        }
+
+    async def probe_once(self) -> Dict[str, Dict[str, Any]]:
+        """并发探测所有依赖并更新缓存"""
+        checks = list(self._checks.items())
+        results = await asyncio.gather(*(self._probe(name, check, critical) for name, (check, critical) in checks))
+        for (name, _), result in zip(checks, results):
+            self._results[name] = result
+        return self.snapshot()
+
+    def result(self, name: str) -> Optional[Dict[str, Any]]:
+        return self._results.get(name)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        now = time.time()
+        return {
+            name: {**result, "age_seconds": round(now - result["checked_at"], 1)}
+            for name, result in self._results.items()
+        }
+
+    def liveness(self) -> Dict[str, Any]:
+        return {"status": "alive", "pid": os.getpid(), "uptime_seconds": round(time.time() - self.started_at, 1)}
+
+    def readiness(self) -> Tuple[bool, Dict[str, Any]]:
+        """(是否就绪, 报告)；只使用缓存的探测结果"""
+        dependencies = self.snapshot()
+        reasons = [] if self.started else ["启动中：预热未完成"]
+        for name, (_, critical) in self._checks.items():
+            result = dependencies.get(name)
+            if not critical:
+                continue
+            if result is None:
+                reasons.append(f"{name}: 尚未探测")
+            elif result["status"] == "down":
+                reasons.append(f"{name}: {result['error'] or '检查未通过'}")
+            elif result["age_seconds"] > self.stale_after:
+                reasons.append(f"{name}: 探测结果已过期（{result['age_seconds']:g}s）")
+        ready = not reasons
+        return ready, {"status": "ready" if ready else "not_ready", "reasons": reasons, "dependencies": dependencies}
+
+    async def _run(self):
+        while True:
+            try:
+                await self.probe_once()
+            except Exception as e:
+                logger.error(f"依赖探测任务出错: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """启动后台探测任务（在事件循环中、依赖初始化之后调用）"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        self.started = True
+
+    async def close(self):
+        self.started = False
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+async def probe_ark() -> Optional[bool]:
+    """Ark 接口可达性：不带密钥请求模型列表，非 5xx 响应即说明 DNS、TLS 和服务正常，不消耗 token"""
+    if not ark_configured():
+        return None
+    base_url = os.getenv("ARK_BASE_URL", DEFAULT_BASE_URL).rstrip("/")
+    async with httpx.AsyncClient(timeout=httpx.Timeout(10.0)) as client:
+        response = await client.get(f"{base_url}/models")
+    return response.status_code < 500
+
+
+# 进程内共享的探测器，各应用在启动时注册自己的依赖
+health_prober = HealthProber()
+
+router = APIRouter()
+
+
+@router.get("/api/health/live", summary="存活检查")
+async def liveness():
+    """进程存活即返回 200，不访问任何依赖"""
+    return health_prober.liveness()
+
+
+@router.get("/api/health/ready", summary="就绪检查")
+async def readiness():
+    """关键依赖的缓存探测结果都正常时返回 200，否则 503"""
+    ready, report = health_prober.readiness()
+    return JSONResponse(report, status_code=200 if ready else 503)
+
+
+def install_health_probes(app):
+    """为应用注册存活/就绪检查接口"""
+    app.include_router(router, tags=["健康检查"])
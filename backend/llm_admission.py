@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - LLM 调用准入控制
+在调用 Ark 之前做两层限流：
+1. 每个用户一个令牌桶，单个用户刷接口时直接返回 429，不占用共享配额
+2. 全局令牌桶 + 并发上限保护上游配额；容量不足时进入有界等待队列，
+   按截止时间先到先服务，预计已经来不及完成的请求提前丢弃（503）
+
+被拒绝的请求都带 Retry-After 响应头
+
+使用方法：
+from llm_admission import llm_admission, admission_key, install_admission
+install_admission(app)
+
+async with llm_admission.admit(admission_key(http_request), cost=len(guides)):
+    completion = ark_client.chat.completions.create(...)
+
+配置（环境变量）：
+LLM_USER_RATE / LLM_USER_BURST        每个用户每秒补充的令牌数 / 桶容量
+LLM_GLOBAL_RATE / LLM_GLOBAL_BURST    整个部署每秒补充的令牌数 / 桶容量，按 worker 数（WEB_CONCURRENCY）平分
+LLM_MAX_CONCURRENCY                   每个 worker 同时进行的上游调用数
+LLM_MAX_QUEUE                         每个 worker 的等待队列长度上限
+LLM_REQUEST_DEADLINE                  请求从到达到拿到结果的时间预算（秒）
+
+每个 worker 进程有自己的令牌桶。全局配额按 worker 数平分，各 worker 合计不超过上游配额；
+用户令牌桶不共享，请求分散到多个 worker 时单个用户的实际上限最多为 worker 数倍
+"""
+
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Callable, List, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from metrics import REGISTRY
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_DECISIONS = REGISTRY.counter(
+    "aura_llm_admission_total", "LLM 准入结果（admitted/user_limited/queue_full/shed）", ["outcome"])
+ADMISSION_QUEUE_DEPTH = REGISTRY.gauge("aura_llm_admission_queue_depth", "等待上游容量的请求数", multiprocess_mode="sum")
+ADMISSION_WAIT = REGISTRY.histogram(
+    "aura_llm_admission_wait_seconds", "请求在准入队列中的等待时间",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+
+class AdmissionRejected(Exception):
+    """请求未被准入
+
+    status_code 为 429（单个用户超限）或 503（全局过载），retry_after 为建议的重试秒数
+    """
+
+    def __init__(self, reason: str, retry_after: float, status_code: int = 503):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    """令牌桶：按 rate 持续补充，最多积累 capacity 个令牌"""
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def time_until(self, cost: float, now: float) -> float:
+        """还需要等多少秒才有 cost 个令牌；cost 超过容量时按容量计算"""
+        self._refill(now)
+        cost = min(cost, self.capacity)
+        if self.tokens >= cost:
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (cost - self.tokens) / self.rate
+
+    def try_take(self, cost: float, now: float) -> bool:
+        if self.time_until(cost, now) > 0:
+            return False
+        self.tokens -= min(cost, self.capacity)
+        return True
+
+
+class _Waiter:
+    __slots__ = ("deadline", "cost", "future", "enqueued_at")
+
+    def __init__(self, deadline: float, cost: float, future: asyncio.Future, enqueued_at: float):
+        self.deadline = deadline
+        self.cost = cost
+        self.future = future
+        self.enqueued_at = enqueued_at
+
+
+class AdmissionController:
+    """LLM 调用准入控制器（单个事件循环内使用）"""
+
+    def __init__(self, user_rate: float = 0.2, user_burst: float = 6,
+                 global_rate: float = 5.0, global_burst: float = 20,
+                 max_concurrency: int = 8, max_queue: int = 64,
+                 deadline: float = 30.0, max_users: int = 10000,
+                 time_func: Callable[[], float] = time.monotonic):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.max_users = max_users
+        self.time = time_func
+
+        self.global_bucket = TokenBucket(global_rate, global_burst, time_func())
+        self._user_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._queue: List[tuple] = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        # 上游调用耗时的指数移动平均，用来判断排队的请求是否还来得及
+        self.expected_service_time = 0.0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        """全局配额按 WEB_CONCURRENCY 平分给每个 worker；gunicorn_conf.py 在未设置时写入实际 worker 数"""
+        workers = max(int(os.getenv("WEB_CONCURRENCY") or 1), 1)
+        return cls(
+            user_rate=float(os.getenv("LLM_USER_RATE", "0.2")),
+            user_burst=float(os.getenv("LLM_USER_BURST", "6")),
+            global_rate=float(os.getenv("LLM_GLOBAL_RATE", "5")) / workers,
+            # 桶容量至少为 1，否则任何调用都拿不到令牌
+            global_burst=max(float(os.getenv("LLM_GLOBAL_BURST", "20")) / workers, 1.0),
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+            max_queue=int(os.getenv("LLM_MAX_QUEUE", "64")),
+            deadline=float(os.getenv("LLM_REQUEST_DEADLINE", "30")),
+        )
+
+    # ==================== 状态 ====================
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for entry in self._queue if not entry[2].future.done())
+
+    def snapshot(self) -> dict:
+        return {
+            "in_flight": self._in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "global_tokens": round(self.global_bucket.tokens, 2),
+            "expected_service_time": round(self.expected_service_time, 3),
+            "tracked_users": len(self._user_buckets),
+        }
+
+    # ==================== 准入 ====================
+
+    def _user_bucket(self, key: str, now: float) -> TokenBucket:
+        bucket = self._user_buckets.get(key)
+        if bucket is None:
+            bucket = self._user_buckets[key] = TokenBucket(self.user_rate, self.user_burst, now)
+            if len(self._user_buckets) > self.max_users:
+                self._user_buckets.popitem(last=False)
+        else:
+            self._user_buckets.move_to_end(key)
+        return bucket
+
+    def _can_start(self, cost: float, now: float) -> bool:
+        return self._in_flight < self.max_concurrency and self.global_bucket.time_until(cost, now) == 0
+
+    def _start(self, cost: float, now: float):
+        self.global_bucket.try_take(cost, now)
+        self._in_flight += 1
+
+    def _estimated_wait(self) -> float:
+        """排队请求大致还要等多久，用于 Retry-After"""
+        per_slot = self.expected_service_time or 1.0
+        return per_slot * (1 + len(self._queue) / max(self.max_concurrency, 1))
+
+    def _reject(self, reason: str, retry_after: float, status_code: int) -> AdmissionRejected:
+        ADMISSION_DECISIONS.inc(outcome=reason)
+        return AdmissionRejected(reason, retry_after, status_code)
+
+    async def acquire(self, key: str, cost: float = 1, timeout: Optional[float] = None):
+        """申请一次上游调用的准入，成功后必须调用 release()"""
+        now = self.time()
+        deadline = now + (timeout if timeout is not None else self.deadline)
+
+        user_bucket = self._user_bucket(key, now)
+        wait = user_bucket.time_until(cost, now)
+        if wait > 0:
+            raise self._reject("user_limited", wait, 429)
+
+        if deadline - now < self.expected_service_time:
+            raise self._reject("shed", self._estimated_wait(), 503)
+
+        if not self._queue and self._can_start(cost, now):
+            user_bucket.try_take(cost, now)
+            self._start(cost, now)
+            ADMISSION_DECISIONS.inc(outcome="admitted")
+            return
+
+        if self.queue_depth >= self.max_queue:
+            raise self._reject("queue_full", self._estimated_wait(), 503)
+
+        # 先扣用户令牌，避免同一用户用排队绕过限流；被丢弃时退还
+        user_bucket.try_take(cost, now)
+        waiter = _Waiter(deadline, cost, asyncio.get_running_loop().create_future(), now)
+        heapq.heappush(self._queue, (deadline, next(self._seq), waiter))
+        ADMISSION_QUEUE_DEPTH.set(self.queue_depth)
+        self._dispatch()
+
+        future = waiter.future
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=max(deadline - self.time(), 0))
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # 调用方被取消：已经拿到名额就归还，否则退出队列
+            if future.done() and future.exception() is None:
+                self.release()
+            else:
+                future.cancel()
+            raise
+        finally:
+            ADMISSION_QUEUE_DEPTH.set(self.queue_depth)
+
+        # 超时和分配名额可能同时发生，以 future 的最终状态为准
+        if not future.done():
+            future.cancel()
+            user_bucket.tokens = min(user_bucket.capacity, user_bucket.tokens + cost)
+            raise self._reject("shed", self._estimated_wait(), 503)
+        if future.exception() is not None:
+            user_bucket.tokens = min(user_bucket.capacity, user_bucket.tokens + cost)
+            raise future.exception()
+        ADMISSION_WAIT.observe(self.time() - waiter.enqueued_at)
+        ADMISSION_DECISIONS.inc(outcome="admitted")
+
+    def release(self, service_time: Optional[float] = None):
+        """上游调用结束，归还并发名额"""
+        self._in_flight = max(self._in_flight - 1, 0)
+        if service_time is not None:
+            if self.expected_service_time == 0:
+                self.expected_service_time = service_time
+            else:
+                self.expected_service_time = 0.8 * self.expected_service_time + 0.2 * service_time
+        self._dispatch()
+
+    def _dispatch(self):
+        """把空出的容量分给截止时间最早、且仍来得及完成的等待者"""
+        now = self.time()
+        while self._queue:
+            deadline, _, waiter = self._queue[0]
+            if waiter.future.done():
+                heapq.heappop(self._queue)
+                continue
+            if deadline - now < self.expected_service_time:
+                heapq.heappop(self._queue)
+                waiter.future.set_exception(self._reject("shed", self._estimated_wait(), 503))
+                continue
+            if self._in_flight >= self.max_concurrency:
+                break
+            wait = self.global_bucket.time_until(waiter.cost, now)
+            if wait > 0:
+                self._schedule_wakeup(wait)
+                break
+            heapq.heappop(self._queue)
+            self._start(waiter.cost, now)
+            waiter.future.set_result(None)
+        ADMISSION_QUEUE_DEPTH.set(self.queue_depth)
+
+    def _schedule_wakeup(self, delay: float):
+        if self._wakeup is not None and not self._wakeup.cancelled():
+            return
+        loop = asyncio.get_running_loop()
+
+        def wake():
+            self._wakeup = None
+            self._dispatch()
+
+        self._wakeup = loop.call_later(delay, wake)
+
+    @asynccontextmanager
+    async def admit(self, key: str, cost: float = 1, timeout: Optional[float] = None):
+        """准入上下文：进入时申请，退出时归还并记录上游耗时"""
+        with span("llm.admission", kind="llm_queue"):
+            await self.acquire(key, cost, timeout)
+        start = self.time()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            # 失败的调用耗时不代表正常服务时间，不计入估计
+            self.release(None if failed else self.time() - start)
+
+
+# ==================== FastAPI 集成 ====================
+
+llm_admission = AdmissionController.from_env()
+
+
+def admission_key(request: Request) -> str:
+    """限流维度：登录用户按用户 ID，匿名请求按客户端 IP"""
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        try:
+            from supabase_auth import get_supabase_auth
+            user = get_supabase_auth().verify_token(authorization[7:])
+            if user:
+                return f"user:{user.user_id}"
+        except ValueError:
+            # 未配置 JWT 密钥时退回按 IP 限流
+            pass
+    client = request.client.host if request.client else "unknown"
+    return f"ip:{client}"
+
+
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    detail = "请求过于频繁，请稍后再试" if exc.status_code == 429 else "AI 服务繁忙，请稍后再试"
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": detail, "reason": exc.reason},
+        headers={"Retry-After": exc.retry_after_header},
+    )
+
+
+def install_admission(app):
+    """注册 AdmissionRejected -> 429/503 + Retry-After 的异常处理"""
+    app.add_exception_handler(AdmissionRejected, admission_rejected_handler)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 火山引擎 Ark 客户端
+volcenginesdkarkruntime 导入较慢（约 0.5 秒），因此在第一次调用时才导入并创建客户端，
+进程内复用同一个实例
+
+使用方法：
+from llm_client import get_ark_client, ark_configured
+
+ark_client = get_ark_client()
+if ark_client:
+    completion = ark_client.chat.completions.create(...)
+"""
+
+import os
+import logging
+import threading
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://ark.cn-beijing.volces.com/api/v3"
+
+_ark_client: Optional[Any] = None
+_lock = threading.Lock()
+
+
+def ark_configured() -> bool:
+    """是否配置了 Ark API 密钥（不会创建客户端）"""
+    return bool(os.getenv("API_KEY"))
+
+
+def get_ark_client():
+    """获取 Ark 客户端，未配置 API_KEY 时返回 None"""
+    global _ark_client
+    if _ark_client is not None:
+        return _ark_client
+    if not ark_configured():
+        return None
+
+    with _lock:
+        if _ark_client is None:
+            import volcenginesdkarkruntime
+
+            # 重试和超时由 llm_resilience 统一处理，避免 SDK 内部重试叠加
+            _ark_client = volcenginesdkarkruntime.Ark(
+                api_key=os.getenv("API_KEY"),
+                base_url=os.getenv("ARK_BASE_URL", DEFAULT_BASE_URL),
+                max_retries=0
+            )
+            logger.info("Ark 客户端初始化成功")
+    return _ark_client
+
+
+def reset_ark_client():
+    """关闭并丢弃当前客户端（关闭 worker、测试或重新加载配置时使用）"""
+    global _ark_client
+    with _lock:
+        client, _ark_client = _ark_client, None
+    if client is not None:
+        try:
+            client.close()
+        except Exception as e:
+            logger.warning(f"关闭 Ark 客户端失败: {e}")
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - Ark 调用容错
+包装同步的 ark_client.chat.completions.create：
+1. 在专用线程池中执行，不阻塞事件循环
+2. 超时、连接错误、429 和 5xx 按指数退避 + 全抖动重试（对话补全没有副作用，可以安全重试），
+   上游返回 Retry-After 时至少等待这么久
+3. 可选的对冲请求：单次调用超过近期延迟的某个分位数仍未返回时，再发一个相同请求，先返回的为准
+4. 熔断器：连续失败达到阈值后打开，冷却期内直接抛出 CircuitOpenError，
+   调用方改用本地模拟回复；冷却结束后放行一个探测请求，成功则恢复
+
+熔断器状态通过 /api/health 的 llm_circuit 字段查看
+
+使用方法：
+from llm_resilience import llm_resilience, CircuitOpenError
+
+try:
+    completion = await llm_resilience.call(ark_client.chat.completions.create, model=..., messages=...)
+except CircuitOpenError:
+    reply = generate_smart_mock_response(...)
+
+配置（环境变量）：
+LLM_MAX_RETRIES                 失败后的最多重试次数
+LLM_RETRY_BASE_DELAY            退避基数（秒），第 n 次重试最多等待 base * 2^n
+LLM_RETRY_MAX_DELAY             单次退避上限（秒）；Retry-After 超过它时不再重试
+LLM_ATTEMPT_TIMEOUT             单次调用超时（秒）
+LLM_HEDGE_PERCENTILE            对冲阈值分位数，例如 95；0 表示关闭（默认）
+LLM_BREAKER_FAILURES            连续失败多少次后熔断
+LLM_BREAKER_RESET_SECONDS       熔断冷却时间（秒）
+LLM_THREADS                     执行 Ark 调用的线程数
+"""
+
+import os
+import time
+import random
+import asyncio
+import functools
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from metrics import REGISTRY, track_dependency
+
+logger = logging.getLogger(__name__)
+
+LLM_RETRIES = REGISTRY.counter("aura_llm_retries_total", "Ark 调用重试次数", ["reason"])
+LLM_HEDGES = REGISTRY.counter("aura_llm_hedges_total", "对冲请求（launched/won）", ["outcome"])
+LLM_BREAKER_STATE = REGISTRY.gauge("aura_llm_breaker_state", "Ark 熔断器状态（0 关闭，1 半开，2 打开）")
+LLM_BREAKER_REJECTIONS = REGISTRY.counter("aura_llm_breaker_rejections_total", "熔断期间直接拒绝的调用数")
+
+# 值得重试的 HTTP 状态码：超时、冲突、限流和服务端错误
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，调用没有发往上游"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Ark 熔断中，{retry_after:.0f} 秒后重试")
+        self.retry_after = retry_after
+
+
+def status_code_of(exc: BaseException) -> Optional[int]:
+    """Ark SDK（与 OpenAI SDK 一致）的 APIStatusError 带 status_code"""
+    status = getattr(exc, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """判断异常是否是暂时性的上游故障"""
+    if isinstance(exc, CircuitOpenError):
+        return False
+    status = status_code_of(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    # APIConnectionError / APITimeoutError / httpx.ConnectTimeout 等没有状态码
+    name = type(exc).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+def retry_after_of(exc: BaseException) -> Optional[float]:
+    """读取上游响应中的 Retry-After（秒）"""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """连续失败计数熔断器：closed -> open -> half_open -> closed"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    _GAUGE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 time_func: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.time = time_func
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.opened_count = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning(f"Ark 熔断器 {self.state} -> {state}")
+        self.state = state
+        LLM_BREAKER_STATE.set(self._GAUGE_VALUES[state])
+
+    def retry_after(self) -> float:
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - self.time())
+
+    def allow(self) -> bool:
+        """是否放行一次调用；冷却结束后只放行一个探测请求"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.time() - self.opened_at >= self.reset_timeout:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._probe_in_flight = False
+            if self.state == self.OPEN:
+                return
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.opened_at = self.time()
+                self.opened_count += 1
+                self._set_state(self.OPEN)
+
+    def release_probe(self):
+        """探测请求被取消或以不可重试的错误结束时归还名额，不改变状态"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "opened_count": self.opened_count,
+            "retry_after": round(self.retry_after(), 1),
+        }
+
+
+class ResilientCaller:
+    """重试、对冲和熔断组合在一起的调用器"""
+
+    def __init__(self, max_retries: int = 2, base_delay: float = 0.5, max_delay: float = 8.0,
+                 attempt_timeout: float = 60.0, hedge_percentile: float = 0.0,
+                 hedge_min_samples: int = 20, breaker: Optional[CircuitBreaker] = None,
+                 threads: int = 16, sleep: Callable[[float], Any] = asyncio.sleep,
+                 rng: Optional[random.Random] = None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.threads = threads
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+        self.latencies = deque(maxlen=500)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ResilientCaller":
+        return cls(
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+            base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5")),
+            max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", "8")),
+            attempt_timeout=float(os.getenv("LLM_ATTEMPT_TIMEOUT", "60")),
+            hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "0")),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+                reset_timeout=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+            ),
+            threads=int(os.getenv("LLM_THREADS", "16")),
+        )
+
+    # ---------- 线程池 ----------
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="ark-call")
+        return self._executor
+
+    def shutdown(self):
+        """关闭线程池（不等待仍在进行的调用）"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    # ---------- 退避和对冲阈值 ----------
+
+    def backoff(self, attempt: int, exc: BaseException) -> Optional[float]:
+        """第 attempt 次重试前的等待时间；Retry-After 超过上限时返回 None 表示放弃"""
+        delay = self.rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        retry_after = retry_after_of(exc)
+        if retry_after is not None:
+            if retry_after > self.max_delay:
+                return None
+            delay = max(delay, retry_after)
+        return delay
+
+    def hedge_delay(self) -> Optional[float]:
+        """对冲阈值：近期成功调用延迟的 hedge_percentile 分位数；样本不足或未开启时返回 None"""
+        if self.hedge_percentile <= 0 or len(self.latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))
+        return ordered[index]
+
+    # ---------- 调用 ----------
+
+    async def _attempt(self, call: Callable[[], Any], operation: str):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        with track_dependency("llm", operation):
+            result = await asyncio.wait_for(loop.run_in_executor(self._get_executor(), call),
+                                            self.attempt_timeout)
+        self.latencies.append(time.perf_counter() - start)
+        return result
+
+    async def _hedged(self, call: Callable[[], Any], operation: str):
+        primary = asyncio.ensure_future(self._attempt(call, operation))
+        delay = self.hedge_delay()
+        if delay is None:
+            return await primary
+
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                LLM_HEDGES.inc(outcome="launched")
+                pending.add(asyncio.ensure_future(self._attempt(call, operation)))
+
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            LLM_HEDGES.inc(outcome="won")
+                        # 落后的请求在线程里无法中止，让它自然结束并丢弃结果
+                        for other in pending:
+                            other.add_done_callback(_discard_result)
+                        pending = set()
+                        return task.result()
+                    error = task.exception()
+            raise error
+        except asyncio.CancelledError:
+            for task in pending:
+                task.cancel()
+            raise
+
+    async def call(self, fn: Callable[..., Any], *args, operation: str = "ark.chat.completions", **kwargs):
+        """调用同步函数 fn(*args, **kwargs)
+
+        熔断中抛出 CircuitOpenError；重试期间熔断器被其他请求打开时不再重试，同样抛出
+        CircuitOpenError（__cause__ 为最后一次的异常）；重试耗尽后抛出最后一次的异常
+        """
+        if not self.breaker.allow():
+            LLM_BREAKER_REJECTIONS.inc()
+            raise CircuitOpenError(self.breaker.retry_after())
+        is_probe = self.breaker.state == CircuitBreaker.HALF_OPEN
+
+        call = functools.partial(fn, *args, **kwargs)
+        attempt = 0
+        try:
+            while True:
+                try:
+                    result = await self._hedged(call, operation)
+                except Exception as exc:
+                    if not is_retryable(exc):
+                        # 400/401 或本地错误不说明上游是否恢复：不改变熔断器状态，只归还探测名额
+                        if is_probe:
+                            self.breaker.release_probe()
+                        raise
+                    delay = self.backoff(attempt, exc) if attempt < self.max_retries else None
+                    if delay is None:
+                        self.breaker.record_failure()
+                        raise
+                    self._raise_if_open(exc)
+                    status = status_code_of(exc)
+                    LLM_RETRIES.inc(reason=str(status) if status else type(exc).__name__)
+                    logger.warning(f"Ark 调用失败（第 {attempt + 1} 次），{delay:.2f}s 后重试: {exc}")
+                    await self.sleep(delay)
+                    self._raise_if_open(exc)
+                    attempt += 1
+                    continue
+                self.breaker.record_success()
+                return result
+        except asyncio.CancelledError:
+            if is_probe:
+                self.breaker.release_probe()
+            raise
+
+    def _raise_if_open(self, exc: BaseException):
+        """重试前熔断器已被其他请求打开：记一次失败并按熔断处理，调用方会回退到模拟回复"""
+        if self.breaker.state == CircuitBreaker.OPEN:
+            self.breaker.record_failure()
+            LLM_BREAKER_REJECTIONS.inc()
+            raise CircuitOpenError(self.breaker.retry_after()) from exc
+
+    def snapshot(self) -> dict:
+        hedge_delay = self.hedge_delay()
+        return {
+            **self.breaker.snapshot(),
+            "max_retries": self.max_retries,
+            "hedge_after_seconds": round(hedge_delay, 3) if hedge_delay is not None else None,
+        }
+
+
+def _discard_result(task: asyncio.Future):
+    if not task.cancelled():
+        task.exception()
+
+
+# 进程内共享的调用器，熔断状态在同一 worker 的所有请求间共享
+llm_resilience = ResilientCaller.from_env()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 相同 LLM 请求合并（single-flight）
+多个用户同时发出完全相同的对话请求时（例如大家打开圆桌时的默认问题），
+只向 Ark 发一次请求，所有等待者共享同一个结果
+
+- 键由模型、消息列表（包含向导系统提示词）和其他生成参数的哈希组成
+- 只合并正在进行的请求，完成后立即移除，不做结果缓存
+- 上游调用在独立任务中运行：单个等待者取消只影响它自己，
+  全部等待者都取消时才取消上游调用；上游出错时所有等待者收到同一个异常
+- stream() 用于流式响应：后加入的订阅者先回放已收到的分片，再继续接收新分片
+
+- 准入控制在合并之后：只有发起上游调用的 leader 经过 admit，follower 不占并发名额、不消耗令牌；
+  leader 被拒绝（429/503）时，follower 不承担别人的拒绝，重新按自己的身份发起或加入请求
+
+使用方法：
+from llm_singleflight import create_completion
+
+completion = await create_completion(ark_client.chat.completions.create,
+                                     admit=lambda: llm_admission.admit(admission_key(http_request)),
+                                     model=..., messages=...)
+"""
+
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Any, AsyncContextManager, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from metrics import REGISTRY
+from llm_resilience import llm_resilience
+from llm_admission import AdmissionRejected
+
+logger = logging.getLogger(__name__)
+
+LLM_COALESCED = REGISTRY.counter(
+    "aura_llm_singleflight_total", "相同请求合并（leader 发起上游调用，follower 共享结果）", ["role"])
+
+
+def request_key(**params) -> str:
+    """生成请求的合并键；参数顺序不影响结果"""
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """一次正在进行的上游调用"""
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class _StreamFlight:
+    """一次正在进行的流式调用，保存已收到的分片供后加入者回放"""
+
+    def __init__(self):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: BaseException = None
+        self.changed = asyncio.Event()
+        self.subscribers = 0
+        self.task: asyncio.Future = None
+
+    def publish(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class SingleFlight:
+    """按键合并正在进行的异步调用"""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._streams: Dict[str, _StreamFlight] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights) + len(self._streams)
+
+    def has_flight(self, key: str) -> bool:
+        """key 是否有正在进行的非流式调用（新的相同请求会合并进去）"""
+        return key in self._flights
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """执行 factory()，相同 key 的并发调用共享同一次执行的结果"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(self._flights, key, flight))
+            LLM_COALESCED.inc(role="leader")
+        else:
+            LLM_COALESCED.inc(role="follower")
+
+        flight.waiters += 1
+        try:
+            # shield：等待者被取消时不连带取消共享的上游调用
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """流式版本：相同 key 的订阅者共享同一个上游分片流"""
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = _StreamFlight()
+            flight.task = asyncio.ensure_future(self._pump(flight, factory))
+            self._streams[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(self._streams, key, flight))
+            LLM_COALESCED.inc(role="leader")
+        else:
+            LLM_COALESCED.inc(role="follower")
+
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(flight.chunks):
+                    yield flight.chunks[index]
+                    index += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.changed.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.task.done():
+                # 所有订阅者都离开了（断开连接或取消），停止上游流
+                flight.task.cancel()
+
+    @staticmethod
+    async def _pump(flight: _StreamFlight, factory: Callable[[], AsyncIterator[Any]]):
+        try:
+            async for chunk in factory():
+                flight.chunks.append(chunk)
+                flight.publish()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            flight.publish()
+
+    @staticmethod
+    def _forget(flights: dict, key: str, flight):
+        if flights.get(key) is flight:
+            del flights[key]
+
+
+# 进程内共享
+llm_singleflight = SingleFlight()
+
+
+async def create_completion(create: Callable[..., Any],
+                            admit: Optional[Callable[[], AsyncContextManager]] = None, **params) -> Any:
+    """经过合并、准入、重试和熔断的 Ark 非流式对话补全
+
+    相同参数的并发调用只发一次上游请求；返回的 completion 对象由所有等待者共享，只读使用。
+    admit 返回准入上下文（如 llm_admission.admit(key)），只在本调用成为 leader 时进入
+    """
+    key = request_key(**params)
+    led = False
+
+    async def lead():
+        nonlocal led
+        led = True
+        if admit is None:
+            return await llm_resilience.call(create, **params)
+        async with admit():
+            return await llm_resilience.call(create, **params)
+
+    while True:
+        try:
+            return await llm_singleflight.do(key, lead)
+        except AdmissionRejected:
+            if led:
+                raise
+            # 加入的请求在 leader 的准入处被拒绝，与本请求无关：重新发起或加入新的请求
+
+
+def completion_in_flight(**params) -> bool:
+    """相同参数的请求是否正在进行；用于预先按实际需要发起的上游调用数申请准入"""
+    return llm_singleflight.has_flight(request_key(**params))
@@ -0,0 +1,559 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 端到端负载和延迟基准测试
+驱动真实的 FastAPI 应用（main.py / main_supabase.py / api_routes.py），
+按真实的请求组合回放流量，统计每个路由的 RPS 和 p50/p95/p99 延迟
+
+运行模式：
+- inprocess: 在当前进程内通过 ASGI 直接调用应用，数据库使用内存替身，Ark 使用本地模拟服务
+- uvicorn:   启动 uvicorn 子进程（可多 worker），其余同上
+- 指定 --base-url 时直接压测已经运行的服务
+
+示例：
+python load_benchmark.py --target api_routes --mix mixed --users 50 --duration 30
+python load_benchmark.py --target main --mix chat --ark-profile typical --save-baseline baselines/main_chat.json
+python load_benchmark.py --target api_routes --compare baselines/api_routes_mixed.json --tolerance 0.15
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import asyncio
+import argparse
+import importlib
+import platform
+import subprocess
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple, Any
+
+import httpx
+
+# 添加当前目录到路径（追加到末尾，避免本目录的模块遮蔽同名第三方包）
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+
+
+# ==================== 请求定义 ====================
+
+@dataclass
+class VirtualUser:
+    """虚拟用户状态"""
+    user_id: str
+    has_open_session: bool = False
+
+
+# 请求构造函数返回：(路由标签, 方法, 路径, 查询参数, JSON 请求体)
+RequestSpec = Tuple[str, str, str, Optional[Dict[str, Any]], Optional[Dict[str, Any]]]
+
+CHAT_QUESTIONS = ["如何提高工作效率？", "帮我脑暴一个AR博物馆项目", "我有点累了，想放松一下", "什么是真正的创造力？"]
+
+
+def op_timer_cycle(user: VirtualUser, rng: random.Random) -> RequestSpec:
+    """开始或完成计时器，模拟一个完整的使用周期"""
+    if user.has_open_session:
+        return ("PUT /api/timer/complete", "PUT", "/api/timer/complete",
+                {"user_id": user.user_id}, {"actual_duration": rng.randint(60, 5400)})
+    return ("POST /api/timer/start", "POST", "/api/timer/start",
+            {"user_id": user.user_id}, {"timer_type_id": rng.choice([1, 2, 3]), "planned_duration": 1800})
+
+
+def op_timer_current(user: VirtualUser, rng: random.Random) -> RequestSpec:
+    return ("GET /api/timer/current/{user_id}", "GET", f"/api/timer/current/{user.user_id}", None, None)
+
+
+def op_timer_stats(user: VirtualUser, rng: random.Random) -> RequestSpec:
+    return ("GET /api/user/timer-stats/{user_id}", "GET", f"/api/user/timer-stats/{user.user_id}", None, None)
+
+
+def op_daily_stats(user: VirtualUser, rng: random.Random) -> RequestSpec:
+    return ("GET /api/stats/daily/{user_id}", "GET", f"/api/stats/daily/{user.user_id}", None, None)
+
+
+def op_weekly_stats(user: VirtualUser, rng: random.Random) -> RequestSpec:
+    return ("GET /api/stats/weekly/{user_id}", "GET", f"/api/stats/weekly/{user.user_id}", None, None)
+
+
+def op_history(user: VirtualUser, rng: random.Random) -> RequestSpec:
+    return ("GET /api/timer/sessions/history/{user_id}", "GET",
+            f"/api/timer/sessions/history/{user.user_id}", {"limit": 50}, None)
+
+
+def op_timer_types(user: VirtualUser, rng: random.Random) -> RequestSpec:
+    return ("GET /api/timer/types", "GET", "/api/timer/types", None, None)
+
+
+def op_chat(user: VirtualUser, rng: random.Random) -> RequestSpec:
+    body = {
+        "guide_id": rng.choice(["roundtable", "work", "break"]),
+        "messages": [{"role": "user", "content": rng.choice(CHAT_QUESTIONS)}],
+    }
+    return ("POST /api/openai/chat", "POST", "/api/openai/chat", None, body)
+
+
+def op_multi_chat(user: VirtualUser, rng: random.Random) -> RequestSpec:
+    body = {
+        "guides": ["borges", "calvino", "benjamin", "foucault"],
+        "messages": [{"role": "user", "content": rng.choice(CHAT_QUESTIONS)}],
+    }
+    return ("POST /api/openai/multi-chat", "POST", "/api/openai/multi-chat", None, body)
+
+
+OPERATIONS: Dict[str, Callable[[VirtualUser, random.Random], RequestSpec]] = {
+    "timer_cycle": op_timer_cycle,
+    "timer_current": op_timer_current,
+    "timer_stats": op_timer_stats,
+    "daily_stats": op_daily_stats,
+    "weekly_stats": op_weekly_stats,
+    "history": op_history,
+    "timer_types": op_timer_types,
+    "chat": op_chat,
+    "multi_chat": op_multi_chat,
+}
+
+# 请求组合（权重），参考前端计时器页面和统计弹窗的调用频率
+MIXES: Dict[str, Dict[str, int]] = {
+    "timer": {"timer_cycle": 6, "timer_current": 4},
+    "dashboard": {"timer_stats": 4, "daily_stats": 4, "weekly_stats": 1, "history": 1, "timer_current": 2},
+    "chat": {"chat": 8, "multi_chat": 2},
+    "mixed": {"timer_cycle": 3, "timer_current": 3, "timer_stats": 2, "daily_stats": 2,
+              "history": 1, "timer_types": 1, "chat": 1, "multi_chat": 1},
+}
+
+# 各应用支持的请求和健康检查路径
+TARGETS: Dict[str, Dict[str, Any]] = {
+    "main": {
+        "health": "/api/health",
+        "operations": {"chat", "multi_chat"},
+    },
+    "main_supabase": {
+        "health": "/api/health",
+        "operations": {"timer_cycle", "timer_current", "timer_stats", "daily_stats", "timer_types", "chat"},
+    },
+    "api_routes": {
+        "health": "/health",
+        "operations": {"timer_cycle", "timer_current", "timer_stats", "daily_stats", "weekly_stats",
+                       "history", "timer_types", "chat"},
+    },
+}
+
+
+def resolve_mix(target: str, mix: str) -> Dict[str, int]:
+    """过滤掉目标应用不支持的请求"""
+    supported = TARGETS[target]["operations"]
+    weights = {name: w for name, w in MIXES[mix].items() if name in supported}
+    if not weights:
+        raise ValueError(f"应用 {target} 不支持请求组合 {mix}")
+    return weights
+
+
+# ==================== 统计 ====================
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """线性插值百分位数，sorted_values 需已排序"""
+    if not sorted_values:
+        return 0.0
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    position = (len(sorted_values) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+@dataclass
+class RouteStats:
+    """单个路由的延迟样本和状态码计数"""
+    latencies_ms: List[float] = field(default_factory=list)
+    status_counts: Dict[str, int] = field(default_factory=dict)
+    errors: int = 0
+
+    def record(self, latency_ms: float, status: str):
+        self.latencies_ms.append(latency_ms)
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        if not status.isdigit() or int(status) >= 400:
+            self.errors += 1
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        values = sorted(self.latencies_ms)
+        count = len(values)
+        return {
+            "count": count,
+            "errors": self.errors,
+            "error_rate": round(self.errors / count, 4) if count else 0.0,
+            "rps": round(count / elapsed, 2) if elapsed > 0 else 0.0,
+            "mean_ms": round(sum(values) / count, 2) if count else 0.0,
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+            "max_ms": round(values[-1], 2) if values else 0.0,
+            "status_counts": dict(sorted(self.status_counts.items())),
+        }
+
+
+class LoadRecorder:
+    def __init__(self):
+        self.routes: Dict[str, RouteStats] = {}
+
+    def record(self, route: str, latency_ms: float, status: str):
+        self.routes.setdefault(route, RouteStats()).record(latency_ms, status)
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        total = RouteStats()
+        for stats in self.routes.values():
+            total.latencies_ms.extend(stats.latencies_ms)
+            total.errors += stats.errors
+            for status, n in stats.status_counts.items():
+                total.status_counts[status] = total.status_counts.get(status, 0) + n
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "total": total.summary(elapsed),
+            "routes": {route: stats.summary(elapsed) for route, stats in sorted(self.routes.items())},
+        }
+
+
+# ==================== 负载生成 ====================
+
+@dataclass
+class LoadConfig:
+    weights: Dict[str, int]
+    users: int = 20
+    concurrency: int = 20
+    duration: float = 10.0
+    max_requests: Optional[int] = None
+    rate: Optional[float] = None        # 开环模式下的目标到达率（请求/秒）
+    think_time: float = 0.0
+    seed: int = 42
+
+
+async def issue_request(client: httpx.AsyncClient, user: VirtualUser, op_name: str,
+                        rng: random.Random, recorder: LoadRecorder, scheduled_at: Optional[float] = None):
+    """发送一个请求并记录延迟
+
+    开环模式传入 scheduled_at，从计划发送时间开始计时，避免协调遗漏（coordinated omission）
+    """
+    route, method, path, params, body = OPERATIONS[op_name](user, rng)
+    start = scheduled_at if scheduled_at is not None else time.perf_counter()
+    try:
+        response = await client.request(method, path, params=params, json=body)
+        status = str(response.status_code)
+        if op_name == "timer_cycle" and response.status_code < 400:
+            user.has_open_session = method == "POST"
+        elif op_name == "timer_cycle" and response.status_code == 400:
+            # 状态与服务端不一致（例如已有未完成会话），切换状态后继续
+            user.has_open_session = not user.has_open_session
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    recorder.record(route, (time.perf_counter() - start) * 1000, status)
+
+
+async def run_load(client: httpx.AsyncClient, config: LoadConfig) -> Dict[str, Any]:
+    """运行负载，返回统计摘要"""
+    rng = random.Random(config.seed)
+    users = [VirtualUser(user_id=str(uuid.UUID(int=rng.getrandbits(128), version=4))) for _ in range(config.users)]
+    names = list(config.weights)
+    weights = [config.weights[n] for n in names]
+    recorder = LoadRecorder()
+    issued = 0
+
+    def next_op() -> str:
+        return rng.choices(names, weights=weights)[0]
+
+    def budget_left(now: float) -> bool:
+        if config.max_requests is not None and issued >= config.max_requests:
+            return False
+        return now < deadline
+
+    started = time.perf_counter()
+    deadline = started + config.duration
+
+    if config.rate:
+        # 开环：按泊松过程到达，最多 concurrency 个请求同时在途
+        semaphore = asyncio.Semaphore(config.concurrency)
+        tasks = set()
+        next_at = started
+
+        async def fire(user: VirtualUser, op_name: str, scheduled_at: float):
+            async with semaphore:
+                await issue_request(client, user, op_name, rng, recorder, scheduled_at)
+
+        while budget_left(next_at):
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.create_task(fire(rng.choice(users), next_op(), next_at))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            issued += 1
+            next_at += rng.expovariate(config.rate)
+        if tasks:
+            await asyncio.gather(*tasks)
+    else:
+        # 闭环：concurrency 个 worker 轮流代表不同用户发送请求
+        async def worker(index: int):
+            nonlocal issued
+            cursor = index
+            while budget_left(time.perf_counter()):
+                issued += 1
+                user = users[cursor % len(users)]
+                cursor += config.concurrency
+                await issue_request(client, user, next_op(), rng, recorder)
+                if config.think_time:
+                    await asyncio.sleep(rng.expovariate(1.0 / config.think_time))
+
+        await asyncio.gather(*(worker(i) for i in range(config.concurrency)))
+
+    return recorder.summary(time.perf_counter() - started)
+
+
+# ==================== 本地替身和应用启动 ====================
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_mock_ark(profile: str, error_rate: float = 0.0, rate_limit_rate: float = 0.0) -> str:
+    """在后台线程中启动本地 Ark 模拟服务，返回 base_url"""
+    import uvicorn
+    from mock_ark_server import MockArkConfig, create_app
+
+    port = _free_port()
+    config = MockArkConfig(profile=profile, error_rate=error_rate, rate_limit_rate=rate_limit_rate, seed=0)
+    server = uvicorn.Server(uvicorn.Config(create_app(config), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("本地 Ark 模拟服务启动超时")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/api/v3"
+
+
+def prepare_environment(ark_base_url: Optional[str]):
+    """为应用导入准备环境变量（必须在导入应用模块之前调用）"""
+    os.environ.setdefault("SUPABASE_URL", "https://bench.supabase.co")
+    os.environ.setdefault("SUPABASE_ANON_KEY", "bench-anon-key")
+    os.environ.setdefault("SUPABASE_JWT_SECRET", "bench-jwt-secret")
+    # 压测的虚拟用户都来自同一个 IP，默认放宽 LLM 准入限制；需要测准入控制时显式设置
+    os.environ.setdefault("LLM_USER_RATE", "1000")
+    os.environ.setdefault("LLM_USER_BURST", "1000")
+    os.environ.setdefault("LLM_GLOBAL_RATE", "1000")
+    os.environ.setdefault("LLM_GLOBAL_BURST", "1000")
+    os.environ.setdefault("LLM_MAX_CONCURRENCY", "256")
+    os.environ.setdefault("LLM_MAX_QUEUE", "1024")
+    if ark_base_url:
+        os.environ["API_KEY"] = "mock-key"
+        os.environ["ARK_BASE_URL"] = ark_base_url
+    else:
+        os.environ.pop("API_KEY", None)
+
+
+def create_benchmark_app(target: str = None, db_latency: float = None):
+    """导入目标应用并装配内存数据库替身
+
+    同时作为 uvicorn --factory 的入口，参数从 BENCH_TARGET / BENCH_DB_LATENCY 读取
+    """
+    target = target or os.getenv("BENCH_TARGET", "api_routes")
+    if db_latency is None:
+        db_latency = float(os.getenv("BENCH_DB_LATENCY", "0"))
+
+    module = importlib.import_module(target)
+    from local_standins import InMemoryStore
+    from storage_engine import MemoryRepository
+
+    # 启动事件只在存储引擎为空时创建，这里预先放入内存引擎
+    repository = MemoryRepository(InMemoryStore(latency=db_latency))
+    if hasattr(module, "repository"):
+        module.repository = repository
+    if hasattr(module, "db_ops"):
+        module.db_ops = repository
+
+    return module.app
+
+
+class UvicornProcess:
+    """以子进程方式运行 uvicorn，可指定 worker 数"""
+
+    def __init__(self, target: str, workers: int, db_latency: float):
+        self.port = _free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        env = dict(os.environ, BENCH_TARGET=target, BENCH_DB_LATENCY=str(db_latency), PYTHONPATH=BACKEND_DIR)
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "load_benchmark:create_benchmark_app", "--factory",
+             "--host", "127.0.0.1", "--port", str(self.port), "--workers", str(workers), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env,
+        )
+
+    def wait_ready(self, health_path: str, timeout: float = 30.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("uvicorn 进程启动失败")
+            try:
+                if httpx.get(self.base_url + health_path, timeout=1.0).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError("等待 uvicorn 就绪超时")
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+# ==================== 报告和基线 ====================
+
+def print_report(title: str, summary: Dict[str, Any]):
+    print(f"\n📊 {title}（耗时 {summary['elapsed_seconds']}s）")
+    header = f"{'路由':<42}{'请求数':>8}{'错误':>7}{'RPS':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+    print(header)
+    print("-" * len(header))
+    rows = list(summary["routes"].items()) + [("TOTAL", summary["total"])]
+    for route, s in rows:
+        print(f"{route:<42}{s['count']:>8}{s['errors']:>7}{s['rps']:>9.1f}"
+              f"{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['max_ms']:>9.1f}")
+    print("（延迟单位：毫秒）")
+
+
+def compare_to_baseline(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """与基线比较，返回回归项描述列表
+
+    - p95/p99 延迟上升超过 tolerance 比例
+    - RPS 下降超过 tolerance 比例
+    - 错误率上升超过 1 个百分点
+    """
+    regressions = []
+    base_routes = dict(baseline["routes"], TOTAL=baseline["total"])
+    current_routes = dict(current["routes"], TOTAL=current["total"])
+    for route, base in base_routes.items():
+        now = current_routes.get(route)
+        if now is None:
+            regressions.append(f"{route}: 本次运行缺少该路由")
+            continue
+        for metric in ("p95_ms", "p99_ms"):
+            if base[metric] > 0 and now[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{route}: {metric} {base[metric]} -> {now[metric]}")
+        if base["rps"] > 0 and now["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{route}: rps {base['rps']} -> {now['rps']}")
+        if now["error_rate"] > base["error_rate"] + 0.01:
+            regressions.append(f"{route}: error_rate {base['error_rate']} -> {now['error_rate']}")
+    return regressions
+
+
+def build_result(args: argparse.Namespace, summary: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "meta": {
+            "target": args.target,
+            "mix": args.mix,
+            "mode": "external" if args.base_url else args.mode,
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "rate": args.rate,
+            "ark_profile": args.ark_profile,
+            "db_latency": args.db_latency,
+            "python": platform.python_version(),
+            "host": platform.node(),
+            "created_at": datetime.now().isoformat(),
+        },
+        **summary,
+    }
+
+
+async def execute(args: argparse.Namespace) -> Dict[str, Any]:
+    config = LoadConfig(
+        weights=resolve_mix(args.target, args.mix),
+        users=args.users,
+        concurrency=args.concurrency,
+        duration=args.duration,
+        max_requests=args.requests,
+        rate=args.rate,
+        think_time=args.think_time,
+        seed=args.seed,
+    )
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    timeout = httpx.Timeout(args.timeout)
+
+    if args.base_url:
+        async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=timeout) as client:
+            return await run_load(client, config)
+
+    ark_base_url = None if args.ark_profile == "none" else start_mock_ark(args.ark_profile, args.ark_error_rate)
+    prepare_environment(ark_base_url)
+
+    if args.mode == "uvicorn":
+        server = UvicornProcess(args.target, args.workers, args.db_latency)
+        try:
+            server.wait_ready(TARGETS[args.target]["health"])
+            async with httpx.AsyncClient(base_url=server.base_url, limits=limits, timeout=timeout) as client:
+                return await run_load(client, config)
+        finally:
+            server.stop()
+
+    app = create_benchmark_app(args.target, args.db_latency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=timeout) as client:
+        return await run_load(client, config)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="AURA STUDIO 负载和延迟基准测试")
+    parser.add_argument("--target", choices=sorted(TARGETS), default="api_routes", help="被测应用")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed", help="请求组合")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--base-url", help="压测已运行的服务，例如 http://127.0.0.1:8000")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn 模式下的 worker 数")
+    parser.add_argument("--users", type=int, default=20, help="虚拟用户数")
+    parser.add_argument("--concurrency", type=int, default=20, help="并发数（开环模式下为最大在途请求数）")
+    parser.add_argument("--duration", type=float, default=10.0, help="持续时间（秒）")
+    parser.add_argument("--requests", type=int, help="最大请求数")
+    parser.add_argument("--rate", type=float, help="开环模式：目标到达率（请求/秒）")
+    parser.add_argument("--think-time", type=float, default=0.0, help="闭环模式：请求间平均思考时间（秒）")
+    parser.add_argument("--timeout", type=float, default=60.0, help="单个请求超时（秒）")
+    parser.add_argument("--ark-profile", default="fast", help="本地 Ark 模拟服务的延迟配置，none 表示不配置 Ark（使用应用内置 mock）")
+    parser.add_argument("--ark-error-rate", type=float, default=0.0, help="本地 Ark 模拟服务的错误率")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="内存数据库替身每次访问的模拟延迟（秒）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="保存完整结果 JSON")
+    parser.add_argument("--save-baseline", help="将本次结果保存为基线")
+    parser.add_argument("--compare", help="与基线文件比较")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的回归比例")
+    args = parser.parse_args(argv)
+
+    summary = asyncio.run(execute(args))
+    result = build_result(args, summary)
+    print_report(f"{args.target} / {args.mix}", result)
+
+    for path in filter(None, [args.output, args.save_baseline]):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已保存: {path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(result, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ 发现 {len(regressions)} 项性能回归（容忍度 {args.tolerance:.0%}）：")
+            for item in regressions:
+                print(f"   - {item}")
+            return 1
+        print(f"\n✅ 与基线相比没有性能回归（容忍度 {args.tolerance:.0%}）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,581 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 本地数据库替身
+在内存中实现 SupabaseClient 和 DatabaseOperations 的接口，
+让压测和本地测试可以驱动真实的 FastAPI 应用而不依赖 Supabase/Postgres
+
+可以通过 latency 参数为每次"数据库访问"加入固定延迟，模拟网络往返
+"""
+
+import uuid
+import asyncio
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Optional, Any, Tuple
+
+from supabase_integration import User, TimerSession, DailyLog
+from metrics import instrument_methods
+from clock import Clock, get_clock, elapsed_seconds, local_date
+from field_projection import project
+
+# 与 complete_database_setup.sql 中的初始数据保持一致
+DEFAULT_AUDIO_TRACKS = [
+    {"id": 1, "name": "定风波", "file_path": "/audio/邓翊群 - 定风波.mp3", "is_active": True},
+    {"id": 2, "name": "Luv Sic", "file_path": "/audio/Nujabes - Luv (Sic) Grand Finale Part 6 (Remix).mp3", "is_active": True},
+    {"id": 3, "name": "Générique", "file_path": "/audio/Miles Davis - Générique.mp3", "is_active": True},
+]
+
+DEFAULT_TIMER_TYPES = [
+    {"id": 1, "name": "focus", "display_name": "聚焦", "default_duration": 90,
+     "description": "聚焦光线、语言或者太空垃圾", "background_image": "/images/deep-work.png",
+     "default_audio_track_id": 1, "is_active": True},
+    {"id": 2, "name": "inspire", "display_name": "播种", "default_duration": 30,
+     "description": "播种灵感、种子或者一个怪念头", "background_image": "/images/break.png",
+     "default_audio_track_id": 2, "is_active": True},
+    {"id": 3, "name": "talk", "display_name": "篝火", "default_duration": 60,
+     "description": "与向导进行沉浸式对话的空间", "background_image": "/images/roundtable.png",
+     "default_audio_track_id": 3, "is_active": True},
+]
+
+# 计时器类型名 -> 日志字段前缀，对应数据库函数 generate_daily_log
+LOG_FIELD_PREFIX = {"focus": "deep_work", "inspire": "break", "talk": "roundtable"}
+
+
+class InMemoryStore:
+    """内存数据存储，两个替身共享同一份数据"""
+
+    def __init__(self, latency: float = 0.0, clock: Clock = None):
+        self.latency = latency
+        self._clock = clock
+        self.users: Dict[str, Dict[str, Any]] = {}
+        self.sessions: Dict[str, Dict[str, Any]] = {}
+        self.daily_logs: Dict[tuple, Dict[str, Any]] = {}
+        self.chat_messages: List[Dict[str, Any]] = []
+        self.timer_types = {t["id"]: dict(t) for t in DEFAULT_TIMER_TYPES}
+        self.audio_tracks = {t["id"]: dict(t) for t in DEFAULT_AUDIO_TRACKS}
+
+    @property
+    def clock(self) -> Clock:
+        return self._clock or get_clock()
+
+    async def round_trip(self):
+        """模拟一次数据库往返"""
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        else:
+            await asyncio.sleep(0)
+
+    def ensure_user(self, user_id: str, email: str = None, username: str = None) -> Dict[str, Any]:
+        if user_id not in self.users:
+            now = self.clock.now()
+            self.users[user_id] = {
+                "id": user_id,
+                "email": email or f"{user_id[:8]}@bench.local",
+                "username": username or f"user-{user_id[:8]}",
+                "password_hash": "",
+                "avatar_url": None,
+                "created_at": now,
+                "last_login_at": now,
+            }
+        return self.users[user_id]
+
+    def user_sessions(self, user_id: str) -> List[Dict[str, Any]]:
+        sessions = [s for s in self.sessions.values() if s["user_id"] == user_id]
+        sessions.sort(key=lambda s: s["started_at"], reverse=True)
+        return sessions
+
+    def open_session(self, user_id: str) -> Optional[Dict[str, Any]]:
+        for session in self.user_sessions(user_id):
+            if session["ended_at"] is None and not session["completed"]:
+                return session
+        return None
+
+    def open_sessions(self, after: Tuple[datetime, str] = None) -> List[Dict[str, Any]]:
+        """所有用户进行中的会话，按 (开始时间, id) 升序；after 为 (started_at, id) 时只返回其后的"""
+        sessions = [s for s in self.sessions.values() if s["ended_at"] is None and not s["completed"]
+                    and (after is None or (s["started_at"], s["id"]) > after)]
+        sessions.sort(key=lambda s: (s["started_at"], s["id"]))
+        return sessions
+
+    def session_marker(self, user_id: str) -> Tuple:
+        """与数据库实现一致：(会话数, 已结束数, 已完成数, 最近开始时间)"""
+        sessions = self.user_sessions(user_id)
+        return (len(sessions), sum(1 for s in sessions if s["ended_at"] is not None),
+                sum(1 for s in sessions if s["completed"]), sessions[0]["started_at"] if sessions else None)
+
+    def session_facts(self, user_id: str) -> List[Tuple[int, int, int, bool]]:
+        """(开始时间戳, 实际时长, 类型, 是否完成)，按开始时间升序"""
+        return [(int(s["started_at"].timestamp()), s["actual_duration"] or 0, s["timer_type_id"], s["completed"])
+                for s in reversed(self.user_sessions(user_id))]
+
+    def conversation(self, user_id: str, guide_id: str, limit: int,
+                     before: Tuple[datetime, str] = None) -> List[Dict[str, Any]]:
+        """before 之前最近的 limit 条消息，时间正序；同一时间的消息按写入顺序（数据库中按 id）"""
+        messages = [m for m in self.chat_messages if m["user_id"] == user_id and m["guide_id"] == guide_id]
+        if before is not None:
+            index = next((i for i, m in enumerate(messages) if m["message_id"] == before[1]), None)
+            messages = messages[:index] if index is not None else [
+                m for m in messages if datetime.fromisoformat(m["created_at"]) < before[0]]
+        return messages[-limit:]
+
+    def rebuild_daily_log(self, user_id: str, target_date: date) -> Dict[str, Any]:
+        """按数据库函数 generate_daily_log 的规则重建某天的日志"""
+        day_sessions = [
+            s for s in self.sessions.values()
+            if s["user_id"] == user_id and local_date(s["started_at"]) == target_date
+        ]
+        log = {
+            "id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{user_id}/{target_date}")),
+            "user_id": user_id,
+            "log_date": target_date,
+            "total_sessions": len(day_sessions),
+            "completed_sessions": sum(1 for s in day_sessions if s["completed"]),
+            "total_focus_time": sum(s["actual_duration"] or 0 for s in day_sessions if s["completed"]),
+        }
+        for type_name, prefix in LOG_FIELD_PREFIX.items():
+            typed = [s for s in day_sessions if self.timer_types[s["timer_type_id"]]["name"] == type_name]
+            log[f"{prefix}_count"] = len(typed)
+            log[f"{prefix}_time"] = sum(s["actual_duration"] or 0 for s in typed if s["completed"])
+
+        now = self.clock.now()
+        existing = self.daily_logs.get((user_id, target_date))
+        log["created_at"] = existing["created_at"] if existing else now
+        log["updated_at"] = now
+        self.daily_logs[(user_id, target_date)] = log
+        return log
+
+    def timer_stats(self, user_id: str) -> List[Dict[str, Any]]:
+        stats = []
+        for timer_type in sorted(self.timer_types.values(), key=lambda t: t["id"]):
+            if not timer_type["is_active"]:
+                continue
+            typed = [s for s in self.user_sessions(user_id) if s["timer_type_id"] == timer_type["id"]]
+            completed = [s for s in typed if s["completed"]]
+            total = sum(s["actual_duration"] or 0 for s in completed)
+            stats.append({
+                "timer_type": timer_type,
+                "usage_count": len(typed),
+                "completed_count": len(completed),
+                "total_duration": total,
+                "avg_duration": int(total / len(completed)) if completed else 0,
+            })
+        return stats
+
+
+@instrument_methods("db", "memory")
+class InMemorySupabaseClient:
+    """SupabaseClient 的内存替身，返回与真实客户端相同的数据模型"""
+
+    def __init__(self, store: InMemoryStore = None):
+        self.store = store or InMemoryStore()
+
+    @property
+    def clock(self) -> Clock:
+        return self.store.clock
+
+    @staticmethod
+    def _to_user(row: Dict[str, Any]) -> User:
+        return User.from_row(row)
+
+    @staticmethod
+    def _to_session(row: Dict[str, Any]) -> TimerSession:
+        return TimerSession.from_row(row)
+
+    async def sync_auth_user(self, auth_user_id: str, email: str, username: str = None) -> Optional[User]:
+        await self.store.round_trip()
+        row = self.store.ensure_user(auth_user_id, email, username or email.split("@")[0])
+        row["last_login_at"] = self.store.clock.now()
+        return self._to_user(row)
+
+    async def create_user(self, email: str, username: str, password: str) -> Optional[User]:
+        await self.store.round_trip()
+        if any(u["email"] == email for u in self.store.users.values()):
+            return None
+        row = self.store.ensure_user(str(uuid.uuid4()), email, username)
+        row["password_hash"] = password
+        return self._to_user(row)
+
+    async def authenticate_user(self, email: str, password: str) -> Optional[User]:
+        await self.store.round_trip()
+        for row in self.store.users.values():
+            if row["email"] == email and row["password_hash"] == password:
+                row["last_login_at"] = self.store.clock.now()
+                return self._to_user(row)
+        return None
+
+    async def get_user_by_id(self, user_id: str) -> Optional[User]:
+        await self.store.round_trip()
+        row = self.store.users.get(user_id)
+        return self._to_user(row) if row else None
+
+    async def start_timer_session(self, user_id: str, timer_type_id: int,
+                                  planned_duration: int, audio_track_id: Optional[int] = None,
+                                  session_id: Optional[str] = None,
+                                  started_at: Optional[datetime] = None) -> Optional[str]:
+        await self.store.round_trip()
+        self.store.ensure_user(user_id)
+        if session_id in self.store.sessions:
+            # 与数据库主键冲突一致：插入失败
+            return None
+        session_id = session_id or str(uuid.uuid4())
+        self.store.sessions[session_id] = {
+            "id": session_id,
+            "user_id": user_id,
+            "timer_type_id": timer_type_id,
+            "audio_track_id": audio_track_id,
+            "planned_duration": planned_duration,
+            "actual_duration": None,
+            "started_at": started_at or self.store.clock.now(),
+            "ended_at": None,
+            "completed": False,
+        }
+        return session_id
+
+    async def end_timer_session(self, session_id: str, actual_duration: int, completed: bool = True,
+                                ended_at: Optional[datetime] = None) -> bool:
+        await self.store.round_trip()
+        session = self.store.sessions.get(session_id)
+        if not session:
+            return False
+        session.update(actual_duration=actual_duration, ended_at=ended_at or self.store.clock.now(),
+                       completed=completed)
+        return True
+
+    async def get_user_sessions(self, user_id: str, limit: int = 50, columns: str = "*") -> List[TimerSession]:
+        # 内存数据不按列读取，columns 只为与 SupabaseClient 接口一致
+        await self.store.round_trip()
+        return [self._to_session(s) for s in self.store.user_sessions(user_id)[:limit]]
+
+    async def get_sessions(self, session_ids: List[str]) -> List[TimerSession]:
+        await self.store.round_trip()
+        return [self._to_session(self.store.sessions[sid]) for sid in session_ids if sid in self.store.sessions]
+
+    async def get_open_sessions(self, limit: int = 1000, after: Tuple[datetime, str] = None) -> List[TimerSession]:
+        await self.store.round_trip()
+        return [self._to_session(s) for s in self.store.open_sessions(after)[:limit]]
+
+    async def close_open_sessions(self, closures: List[Dict[str, Any]]) -> List[TimerSession]:
+        # 与 SupabaseClient 一样两次往返：条件更新认领仍在进行中的会话，再写入各自的结束时间和时长
+        await self.store.round_trip()
+        claimed = [self.store.sessions[c["session_id"]] for c in closures
+                   if c["session_id"] in self.store.sessions
+                   and self.store.sessions[c["session_id"]]["ended_at"] is None
+                   and not self.store.sessions[c["session_id"]]["completed"]]
+        await self.store.round_trip()
+        by_id = {c["session_id"]: c for c in closures}
+        for session in claimed:
+            closure = by_id[session["id"]]
+            session.update(actual_duration=closure["actual_duration"], ended_at=closure["ended_at"], completed=False)
+        return [self._to_session(s) for s in claimed]
+
+    async def generate_daily_log(self, user_id: str, target_date: date = None) -> bool:
+        await self.store.round_trip()
+        self.store.rebuild_daily_log(user_id, target_date or self.store.clock.today())
+        return True
+
+    async def get_session_marker(self, user_id: str) -> Tuple:
+        await self.store.round_trip()
+        sessions = self.store.user_sessions(user_id)
+        latest = sessions[0] if sessions else {}
+        return (len(sessions), latest.get("started_at"), latest.get("ended_at"), latest.get("completed"))
+
+    async def get_session_facts(self, user_id: str) -> List[Tuple[int, int, int, bool]]:
+        await self.store.round_trip()
+        return self.store.session_facts(user_id)
+
+    async def get_user_daily_logs(self, user_id: str, days: int = 7, columns: str = "*") -> List[DailyLog]:
+        await self.store.round_trip()
+        start_date = self.store.clock.today() - timedelta(days=days)
+        logs = [
+            log for (uid, log_date), log in self.store.daily_logs.items()
+            if uid == user_id and log_date >= start_date
+        ]
+        logs.sort(key=lambda log: log["log_date"], reverse=True)
+        return [DailyLog.from_row(log) for log in logs]
+
+    async def get_timer_types(self) -> List[Dict[str, Any]]:
+        await self.store.round_trip()
+        return [dict(t) for t in self.store.timer_types.values() if t["is_active"]]
+
+    async def get_audio_tracks(self) -> List[Dict[str, Any]]:
+        await self.store.round_trip()
+        return [dict(t) for t in self.store.audio_tracks.values() if t["is_active"]]
+
+    async def get_user_timer_stats(self, user_id: str) -> List[Dict[str, Any]]:
+        await self.store.round_trip()
+        stats = self.store.timer_stats(user_id)
+        for stat in stats:
+            stat["completion_rate"] = round(stat["completed_count"] / stat["usage_count"] * 100, 1) if stat["usage_count"] else 0
+        return stats
+
+    async def save_chat_message(self, user_id: str, guide_id: str, role: str,
+                                content: str, session_id: str = None) -> Optional[Dict[str, Any]]:
+        await self.store.round_trip()
+        message = {
+            "message_id": str(uuid.uuid4()), "user_id": user_id, "guide_id": guide_id, "role": role,
+            "content": content, "created_at": self.store.clock.now().isoformat()
+        }
+        self.store.chat_messages.append(message)
+        return {"id": message["message_id"], "session_id": session_id,
+                **{k: v for k, v in message.items() if k != "message_id"}}
+
+    async def get_chat_history(self, user_id: str, guide_id: str, limit: int = 20,
+                               before: Tuple[datetime, str] = None) -> List[Dict[str, Any]]:
+        await self.store.round_trip()
+        return [{"id": m["message_id"], "role": m["role"], "content": m["content"], "created_at": m["created_at"]}
+                for m in self.store.conversation(user_id, guide_id, limit, before)]
+
+    async def health_check(self) -> bool:
+        await self.store.round_trip()
+        return True
+
+
+@instrument_methods("db", "memory")
+class InMemoryDatabaseOperations:
+    """DatabaseOperations 的内存替身，返回与 asyncpg 版本相同结构的字典"""
+
+    def __init__(self, store: InMemoryStore = None):
+        self.store = store or InMemoryStore()
+
+    async def init_pool(self):
+        pass
+
+    async def close_pool(self):
+        pass
+
+    async def register_user(self, email: str, username: str, password: str, avatar_url: str = None) -> Dict[str, Any]:
+        await self.store.round_trip()
+        if any(u["email"] == email for u in self.store.users.values()):
+            raise ValueError("邮箱已被注册")
+        row = self.store.ensure_user(str(uuid.uuid4()), email, username)
+        row.update(password_hash=password, avatar_url=avatar_url)
+        return {"user_id": row["id"], "email": email, "username": username, "created_at": row["created_at"].isoformat()}
+
+    async def login_user(self, email: str, password: str) -> Dict[str, Any]:
+        await self.store.round_trip()
+        for row in self.store.users.values():
+            if row["email"] == email:
+                if row["password_hash"] != password:
+                    raise ValueError("密码错误")
+                row["last_login_at"] = self.store.clock.now()
+                return {
+                    "user_id": row["id"], "email": row["email"], "username": row["username"],
+                    "avatar_url": row["avatar_url"], "created_at": row["created_at"].isoformat()
+                }
+        raise ValueError("用户不存在")
+
+    async def get_user_profile(self, user_id: str) -> Dict[str, Any]:
+        await self.store.round_trip()
+        row = self.store.users.get(user_id)
+        if not row:
+            raise ValueError("用户不存在")
+        return {
+            "user_id": row["id"], "email": row["email"], "username": row["username"],
+            "avatar_url": row["avatar_url"], "created_at": row["created_at"].isoformat(),
+            "last_login_at": row["last_login_at"].isoformat() if row["last_login_at"] else None
+        }
+
+    async def get_timer_types(self) -> List[Dict[str, Any]]:
+        await self.store.round_trip()
+        result = []
+        for t in sorted(self.store.timer_types.values(), key=lambda t: t["id"]):
+            audio = self.store.audio_tracks.get(t["default_audio_track_id"])
+            result.append({
+                "id": t["id"], "name": t["name"], "display_name": t["display_name"],
+                "default_duration": t["default_duration"], "description": t["description"],
+                "background_image": t["background_image"],
+                "default_audio": {"id": audio["id"], "name": audio["name"], "file_path": audio["file_path"]} if audio else None
+            })
+        return result
+
+    async def get_audio_tracks(self) -> List[Dict[str, Any]]:
+        await self.store.round_trip()
+        return [{"id": t["id"], "name": t["name"], "file_path": t["file_path"], "created_at": None}
+                for t in self.store.audio_tracks.values()]
+
+    async def start_timer_session(self, user_id: str, timer_type_id: int,
+                                  audio_track_id: int = None, planned_duration: int = None,
+                                  exclusive: bool = True, session_id: str = None,
+                                  started_at: datetime = None) -> Dict[str, Any]:
+        await self.store.round_trip()
+        existing = self.store.sessions.get(session_id) if session_id else None
+        if existing and existing["user_id"] == user_id:
+            return {
+                "session_id": existing["id"], "timer_type_id": existing["timer_type_id"],
+                "timer_type": self.store.timer_types[existing["timer_type_id"]]["name"],
+                "planned_duration": existing["planned_duration"],
+                "audio_track_id": existing["audio_track_id"], "started_at": existing["started_at"].isoformat()
+            }
+        if exclusive and self.store.open_session(user_id):
+            raise ValueError("您有未完成的计时器会话，请先结束当前会话")
+        timer_type = self.store.timer_types.get(timer_type_id)
+        if not timer_type:
+            raise ValueError("计时器类型不存在")
+        self.store.ensure_user(user_id)
+        session_id = session_id or str(uuid.uuid4())
+        started_at = started_at or self.store.clock.now()
+        final_duration = planned_duration or timer_type["default_duration"]
+        final_audio_id = audio_track_id or timer_type["default_audio_track_id"]
+        self.store.sessions[session_id] = {
+            "id": session_id, "user_id": user_id, "timer_type_id": timer_type_id,
+            "audio_track_id": final_audio_id, "planned_duration": final_duration,
+            "actual_duration": None, "started_at": started_at, "ended_at": None, "completed": False,
+        }
+        return {
+            "session_id": session_id, "timer_type_id": timer_type_id, "timer_type": timer_type["name"],
+            "planned_duration": final_duration,
+            "audio_track_id": final_audio_id, "started_at": started_at.isoformat()
+        }
+
+    async def get_current_session(self, user_id: str) -> Optional[Dict[str, Any]]:
+        await self.store.round_trip()
+        session = self.store.open_session(user_id)
+        if not session:
+            return None
+        timer_type = self.store.timer_types[session["timer_type_id"]]
+        return {
+            "session_id": session["id"],
+            "timer_type_id": timer_type["id"],
+            "timer_type": {"id": timer_type["id"], "name": timer_type["name"], "display_name": timer_type["display_name"]},
+            "audio_track": None,
+            "planned_duration": session["planned_duration"],
+            "elapsed_time": elapsed_seconds(session["started_at"], self.store.clock.now()),
+            "started_at": session["started_at"].isoformat()
+        }
+
+    async def complete_timer_session(self, user_id: str, session_id: str = None,
+                                     actual_duration: int = None, ended_at: datetime = None) -> Dict[str, Any]:
+        await self.store.round_trip()
+        session = self.store.sessions.get(session_id) if session_id else self.store.open_session(user_id)
+        if not session or session["user_id"] != user_id:
+            raise ValueError("没有找到进行中的计时器会话" if not session_id else "会话不存在或无权限访问")
+        if session["completed"] and session["ended_at"]:
+            return {
+                "session_id": session["id"], "planned_duration": session["planned_duration"],
+                "actual_duration": session["actual_duration"], "completed_at": session["ended_at"].isoformat()
+            }
+        end_time = ended_at or self.store.clock.now()
+        if actual_duration is None:
+            actual_duration = elapsed_seconds(session["started_at"], end_time)
+        session.update(ended_at=end_time, actual_duration=actual_duration, completed=True)
+        self.store.rebuild_daily_log(user_id, local_date(session["started_at"]))
+        return {
+            "session_id": session["id"], "planned_duration": session["planned_duration"],
+            "actual_duration": actual_duration, "completed_at": end_time.isoformat()
+        }
+
+    async def get_user_timer_stats(self, user_id: str) -> List[Dict[str, Any]]:
+        await self.store.round_trip()
+        result = []
+        for stat in self.store.timer_stats(user_id):
+            t = stat["timer_type"]
+            total = stat["total_duration"]
+            result.append({
+                "timer_type": {k: t[k] for k in ("id", "name", "display_name", "description", "background_image")},
+                "usage_count": stat["usage_count"],
+                "completed_count": stat["completed_count"],
+                "total_duration": total,
+                "avg_duration": stat["avg_duration"],
+                "total_duration_formatted": f"{total // 60}分{total % 60}秒" if total > 0 else "0分0秒"
+            })
+        return result
+
+    @staticmethod
+    def _format_log(log: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "log_date": log["log_date"].isoformat(),
+            "total_focus_time": log["total_focus_time"],
+            "total_sessions": log["total_sessions"],
+            "completed_sessions": log["completed_sessions"],
+            "deep_work": {"count": log["deep_work_count"], "time": log["deep_work_time"]},
+            "break": {"count": log["break_count"], "time": log["break_time"]},
+            "roundtable": {"count": log["roundtable_count"], "time": log["roundtable_time"]},
+            "created_at": log["created_at"].isoformat(),
+            "updated_at": log["updated_at"].isoformat()
+        }
+
+    async def generate_daily_log(self, user_id: str, target_date: date = None) -> Dict[str, Any]:
+        await self.store.round_trip()
+        log = self.store.rebuild_daily_log(user_id, target_date or self.store.clock.today())
+        result = self._format_log(log)
+        del result["created_at"]
+        return result
+
+    async def get_daily_stats(self, user_id: str, start_date: date = None, end_date: date = None,
+                              fields: Tuple[str, ...] = None) -> List[Dict[str, Any]]:
+        await self.store.round_trip()
+        start_date = start_date or self.store.clock.today() - timedelta(days=7)
+        end_date = end_date or self.store.clock.today()
+        logs = [
+            log for (uid, log_date), log in self.store.daily_logs.items()
+            if uid == user_id and start_date <= log_date <= end_date
+        ]
+        logs.sort(key=lambda log: log["log_date"], reverse=True)
+        return project([self._format_log(log) for log in logs], fields)
+
+    async def get_weekly_stats(self, user_id: str, weeks_count: int = 4,
+                               fields: Tuple[str, ...] = None) -> List[Dict[str, Any]]:
+        await self.store.round_trip()
+        start_date = self.store.clock.today() - timedelta(weeks=weeks_count)
+        weeks: Dict[date, Dict[str, int]] = {}
+        for (uid, log_date), log in self.store.daily_logs.items():
+            if uid != user_id or log_date < start_date:
+                continue
+            week_start = log_date - timedelta(days=log_date.weekday())
+            totals = weeks.setdefault(week_start, {})
+            for key, value in log.items():
+                if isinstance(value, int):
+                    totals[key] = totals.get(key, 0) + value
+        return project([
+            {
+                "week_start": week_start.isoformat(),
+                "week_end": (week_start + timedelta(days=6)).isoformat(),
+                "total_focus_time": t.get("total_focus_time", 0),
+                "total_sessions": t.get("total_sessions", 0),
+                "completed_sessions": t.get("completed_sessions", 0),
+                "deep_work": {"count": t.get("deep_work_count", 0), "time": t.get("deep_work_time", 0)},
+                "break": {"count": t.get("break_count", 0), "time": t.get("break_time", 0)},
+                "roundtable": {"count": t.get("roundtable_count", 0), "time": t.get("roundtable_time", 0)}
+            }
+            for week_start, t in sorted(weeks.items(), reverse=True)
+        ], fields)
+
+    async def get_user_sessions_history(self, user_id: str, limit: int = 50, timer_type: str = None,
+                                        fields: Tuple[str, ...] = None) -> List[Dict[str, Any]]:
+        await self.store.round_trip()
+        result = []
+        for session in self.store.user_sessions(user_id):
+            t = self.store.timer_types[session["timer_type_id"]]
+            if timer_type and t["name"] != timer_type:
+                continue
+            audio = self.store.audio_tracks.get(session["audio_track_id"])
+            result.append({
+                "session_id": session["id"],
+                "timer_type": {"name": t["name"], "display_name": t["display_name"]},
+                "audio_name": audio["name"] if audio else None,
+                "planned_duration": session["planned_duration"],
+                "actual_duration": session["actual_duration"],
+                "started_at": session["started_at"].isoformat(),
+                "ended_at": session["ended_at"].isoformat() if session["ended_at"] else None,
+                "completed": session["completed"]
+            })
+            if len(result) >= limit:
+                break
+        return project(result, fields)
+
+    async def save_chat_message(self, user_id: str, guide_id: str, role: str,
+                                content: str, session_id: str = None) -> Dict[str, Any]:
+        await self.store.round_trip()
+        message = {
+            "message_id": str(uuid.uuid4()), "user_id": user_id, "guide_id": guide_id,
+            "role": role, "content": content, "created_at": self.store.clock.now().isoformat()
+        }
+        self.store.chat_messages.append(message)
+        return message
+
+    async def get_chat_history(self, user_id: str, guide_id: str, limit: int = 20,
+                               before: Tuple[datetime, str] = None) -> List[Dict[str, Any]]:
+        await self.store.round_trip()
+        return [
+            {k: m[k] for k in ("message_id", "role", "content", "created_at")}
+            for m in self.store.conversation(user_id, guide_id, limit, before)
+        ]
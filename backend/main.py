@@ -1,7 +1,6 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import volcenginesdkarkruntime
 import os
 from dotenv import load_dotenv
 from typing import List, Optional
@@ -12,6 +11,19 @@ import asyncio
 # 导入认证相关模块
 from protected_routes import router as protected_router
 from supabase_integration import get_client
+from storage_engine import SupabaseRepository
+from timer_events import install_timer_push, today_stats
+from metrics import install_metrics
+from fast_json import FastJSONResponse
+from compression import install_compression
+from tracing import install_tracing
+from worker_health import install_worker_health
+from health_probe import health_prober, install_health_probes, probe_ark
+from llm_client import get_ark_client, ark_configured
+from startup_warmup import install_lifecycle
+from llm_admission import llm_admission, admission_key, install_admission, AdmissionRejected
+from llm_resilience import llm_resilience, CircuitOpenError
+from llm_singleflight import create_completion, completion_in_flight
 
 # 加载环境变量
 load_dotenv()
@@ -24,7 +36,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="AURA STUDIO API",
     description="AURA STUDIO 梦境管理局 API 服务",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # 配置CORS
@@ -37,16 +50,53 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求指标，Prometheus 抓取 /metrics
+install_metrics(app)
+install_worker_health(app)
+install_health_probes(app)
+install_lifecycle(app)
+install_admission(app)
+install_compression(app)
+install_tracing(app)
+
 # 🔐 注册认证保护的路由
 # 这些路由需要 JWT Token 认证才能访问
 app.include_router(protected_router, tags=["认证保护的API"])
 
-# 配置火山引擎Ark客户端
-ark_api_key = os.getenv("API_KEY")
-if not ark_api_key:
+
+async def timer_snapshot(user_id: str):
+    """计时器推送连接建立时发送一次的快照；受保护路由开始/结束会话时推送变化"""
+    repository = SupabaseRepository(await get_client())
+    current = await repository.get_current_session(user_id)
+    return {"type": "snapshot", "current": current, **await today_stats(repository, user_id)}
+
+
+install_timer_push(app, timer_snapshot)
+
+# 火山引擎Ark客户端在第一次对话请求时创建，见 llm_client.py
+if not ark_configured():
     logger.warning("API_KEY not found in environment variables")
-else:
-    ark_client = volcenginesdkarkruntime.Ark(api_key=ark_api_key)
+
+
+async def check_supabase():
+    client = await get_client()
+    return await client.health_check()
+
+
+# 依赖探测：后台定期检查 Supabase（认证路由使用）和 Ark；未配置 Supabase 时不影响就绪
+health_prober.register("supabase", check_supabase, critical=bool(os.getenv("SUPABASE_URL")))
+health_prober.register("ark", probe_ark, critical=False)
+
+
+@app.on_event("startup")
+async def startup_event():
+    """启动后台依赖探测"""
+    health_prober.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await health_prober.close()
 
 # 数据模型
 class ChatMessage(BaseModel):
@@ -290,14 +340,14 @@ async def root():
     return {"message": "AURA STUDIO API is running", "status": "healthy"}
 
 @app.post("/api/openai/chat", response_model=OpenAIChatResponse)
-async def get_guide_ai_reply(request: OpenAIChatRequest):
+async def get_guide_ai_reply(request: OpenAIChatRequest, http_request: Request):
     """
     获取向导AI回复
     
     根据技术设计文档实现的向导对话接口，使用DeepSeek-R1-Distill-Qwen-7B模型
     """
     try:
-        if not ark_api_key:
+        if not ark_configured():
             # Mock response when ARK API key is not configured
             logger.warning("ARK API key not configured, returning mock response")
             
@@ -327,11 +377,19 @@ async def get_guide_ai_reply(request: OpenAIChatRequest):
                 "content": msg.content
             })
         
-        # 调用火山引擎Ark API (DeepSeek-R1-Distill-Qwen-32B模型)
-        completion = ark_client.chat.completions.create(
-            model=os.getenv("ARK_MODEL", "deepseek-r1-distill-qwen-32b-250120"),
-            messages=messages
-        )
+        # 调用火山引擎Ark API (DeepSeek-R1-Distill-Qwen-32B模型)；相同请求合并，只有发起上游调用的请求经过准入控制
+        try:
+            completion = await create_completion(
+                get_ark_client().chat.completions.create,
+                admit=lambda: llm_admission.admit(admission_key(http_request)),
+                model=os.getenv("ARK_MODEL", "deepseek-r1-distill-qwen-32b-250120"),
+                messages=messages
+            )
+        except CircuitOpenError as e:
+            # Ark 连续失败，熔断期间直接使用本地模拟回复
+            logger.warning(f"{e}，返回模拟回复")
+            user_message = request.messages[-1].content.lower() if request.messages else ""
+            return OpenAIChatResponse(reply=generate_smart_mock_response(request.guide_id, user_message, request.messages))
         
         assistant_response = completion.choices[0].message.content.strip()
         
@@ -339,6 +397,8 @@ async def get_guide_ai_reply(request: OpenAIChatRequest):
         
         return OpenAIChatResponse(reply=assistant_response)
         
+    except AdmissionRejected:
+        raise
     except Exception as e:
         logger.error(f"Ark API error: {str(e)}")
         # 如果API调用失败，返回友好的错误信息
@@ -359,20 +419,39 @@ async def get_guide_ai_reply(request: OpenAIChatRequest):
             )
 
 @app.post("/api/openai/multi-chat", response_model=MultiGuideChatResponse)
-async def get_multi_guide_replies(request: MultiGuideChatRequest):
+async def get_multi_guide_replies(request: MultiGuideChatRequest, http_request: Request):
     """
     获取多个向导的AI回复
     
     允许同时向多个向导提问，获取不同角度的回答
     """
+    admitted_at = None
+    admitted_cost = 0
+    valid_guides = [guide_id for guide_id in request.guides if guide_id in GUIDE_PROMPTS]
+    model = os.getenv("ARK_MODEL", "deepseek-r1-distill-qwen-32b-250120")
+    # 各向导的对话消息：系统提示词 + 用户提供的对话历史
+    guide_messages = {
+        guide_id: [{"role": "system", "content": GUIDE_PROMPTS[guide_id]}]
+                  + [{"role": msg.role, "content": msg.content} for msg in request.messages]
+        for guide_id in valid_guides
+    }
     try:
         replies = []
         
+        if ark_configured() and valid_guides:
+            # 一次准入覆盖需要发起上游调用的向导，令牌消耗等于这些向导数，避免中途被限流只返回部分回复；
+            # 能合并进正在进行的相同请求的向导不占配额
+            admitted_cost = sum(1 for guide_id in valid_guides
+                                if not completion_in_flight(model=model, messages=guide_messages[guide_id]))
+            if admitted_cost:
+                await llm_admission.acquire(admission_key(http_request), cost=admitted_cost)
+                admitted_at = llm_admission.time()
+        
         for guide_id in request.guides:
             if guide_id not in GUIDE_PROMPTS:
                 continue
                 
-            if not ark_api_key:
+            if not ark_configured():
                 # Mock response when ARK API key is not configured
                 user_message = ""
                 if request.messages:
@@ -400,26 +479,20 @@ async def get_multi_guide_replies(request: MultiGuideChatRequest):
                     reply=reply
                 ))
             else:
-                # 获取对应向导的系统提示词
-                system_prompt = GUIDE_PROMPTS.get(guide_id, GUIDE_PROMPTS["default"])
-                
-                # 构建对话消息
-                messages = [{"role": "system", "content": system_prompt}]
-                
-                # 添加用户提供的对话历史
-                for msg in request.messages:
-                    messages.append({
-                        "role": msg.role,
-                        "content": msg.content
-                    })
-                
-                # 调用火山引擎Ark API
-                completion = ark_client.chat.completions.create(
-                    model=os.getenv("ARK_MODEL", "deepseek-r1-distill-qwen-32b-250120"),
-                    messages=messages
-                )
-                
-                assistant_response = completion.choices[0].message.content.strip()
+                # 调用火山引擎Ark API（已在上面统一准入），熔断期间使用本地模拟回复
+                try:
+                    completion = await create_completion(
+                        get_ark_client().chat.completions.create,
+                        model=model,
+                        messages=guide_messages[guide_id]
+                    )
+                    assistant_response = completion.choices[0].message.content.strip()
+                except CircuitOpenError:
+                    user_message = request.messages[-1].content.lower() if request.messages else ""
+                    if guide_id in ["borges", "calvino", "benjamin", "foucault"]:
+                        assistant_response = generate_master_mock_response(guide_id, user_message)
+                    else:
+                        assistant_response = generate_smart_mock_response(guide_id, user_message, request.messages)
                 
                 # 获取向导名称
                 guide_names = {
@@ -440,12 +513,17 @@ async def get_multi_guide_replies(request: MultiGuideChatRequest):
         
         return MultiGuideChatResponse(replies=replies)
         
+    except AdmissionRejected:
+        raise
     except Exception as e:
         logger.error(f"Multi-guide API error: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=f"Multi-guide AI service error: {str(e)}"
             )
+    finally:
+        if admitted_at is not None:
+            llm_admission.release((llm_admission.time() - admitted_at) / admitted_cost)
 
 @app.get("/api/health")
 async def health_check():
@@ -454,9 +532,11 @@ async def health_check():
         "status": "healthy",
         "service": "AURA STUDIO API",
         "version": "1.0.0",
-        "ark_configured": bool(ark_api_key),
+        "ark_configured": ark_configured(),
         "model": os.getenv("ARK_MODEL", "deepseek-r1-distill-qwen-32b-250120"),
-        "available_guides": list(GUIDE_PROMPTS.keys())
+        "available_guides": list(GUIDE_PROMPTS.keys()),
+        "llm_circuit": llm_resilience.snapshot(),
+        "dependencies": health_prober.snapshot()
     }
 
 if __name__ == "__main__":
@@ -4,20 +4,33 @@ AURA STUDIO - 基于 Supabase 的API服务
 不需要 asyncpg，直接使用 Supabase 客户端
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional, Dict, Any
-from datetime import date, datetime, timezone
+from typing import List, Literal, Optional, Dict, Any
+from datetime import date, datetime
 import os
 from dotenv import load_dotenv
 import logging
 
-# 导入 Supabase 集成
-from supabase_integration import SupabaseClient, get_client
-
-# 导入原有的向导配置
-import volcenginesdkarkruntime
+# 数据访问统一走存储引擎，默认 Supabase
+from storage_engine import Repository, open_repository
+from timer_journal import JournaledTimerWrites, open_journal
+from timer_events import timer_hub, install_timer_push, publish_session_change, sse_events, today_stats
+from session_reaper import SessionReaper
+from focus_insights import FocusInsights
+from metrics import install_metrics
+from fast_json import FastJSONResponse, ok
+from compression import install_compression
+from tracing import install_tracing
+from field_projection import DAILY_FIELDS, parse_fields
+from worker_health import install_worker_health
+from health_probe import health_prober, install_health_probes, probe_ark
+from llm_client import get_ark_client, ark_configured
+from startup_warmup import install_lifecycle, warm_up_repository
+from llm_admission import llm_admission, admission_key, install_admission, AdmissionRejected
+from llm_resilience import llm_resilience
+from llm_singleflight import create_completion
 
 # 加载环境变量
 load_dotenv()
@@ -30,7 +43,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="AURA STUDIO API - Supabase版",
     description="AURA STUDIO 灵感工作间 - 基于 Supabase 的 API 服务",
-    version="3.0.0"
+    version="3.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # 配置CORS
@@ -43,28 +57,62 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 全局 Supabase 客户端
-supabase_client: SupabaseClient = None
+# 请求指标，Prometheus 抓取 /metrics
+install_metrics(app)
+install_worker_health(app)
+install_health_probes(app)
+install_lifecycle(app)
+install_admission(app)
+install_compression(app)
+install_tracing(app)
+
+# 全局存储引擎，启动时按 STORAGE_ENGINE（默认 supabase）创建，初始化失败时抛出异常（STORAGE_FALLBACK=memory 时回退到内存引擎，仅开发用）
+repository: Repository = None
+
+# 计时器开始/完成的写入入口：数据库慢或不可达时先写本地日志，恢复后由后台任务重放
+timer_writes = JournaledTimerWrites(lambda: repository)
+
+# 超时会话回收：客户端消失后，会话在计划结束时间加宽限期后自动关闭
+session_reaper = SessionReaper(lambda: repository, on_closed=lambda closed: notify_sessions_closed(closed))
 
-# 配置火山引擎Ark客户端
-ark_api_key = os.getenv("API_KEY")
-if ark_api_key:
-    ark_client = volcenginesdkarkruntime.Ark(api_key=ark_api_key)
-else:
+# 专注分析：按用户缓存，会话有变化时才重新计算
+focus_insights = FocusInsights(lambda: repository)
+
+# 依赖探测：后台定期检查存储引擎和 Ark，健康检查接口只读缓存结果；
+# 启用计时器日志时数据库改为非关键依赖（见 startup_event）
+health_prober.register("database", lambda: repository.health_check())
+health_prober.register("ark", probe_ark, critical=False)
+
+# 配置火山引擎Ark客户端，第一次对话请求时创建，见 llm_client.py
+if not ark_configured():
     logger.warning("API_KEY not found, using mock responses")
-    ark_client = None
 
 @app.on_event("startup")
 async def startup_event():
-    """应用启动时初始化 Supabase 连接"""
-    global supabase_client
-    try:
-        supabase_client = await get_client()
-        logger.info("✅ Supabase 客户端初始化成功")
-    except Exception as e:
-        logger.error(f"❌ Supabase 客户端初始化失败: {e}")
-        supabase_client = None
-        logger.warning("⚠️ 将使用模拟模式运行")
+    """应用启动时初始化存储引擎"""
+    global repository
+    if repository is None:
+        repository = await open_repository(default_engine="supabase")
+        await warm_up_repository(repository)
+    if timer_writes.journal is None:
+        timer_writes.journal = open_journal()
+    if timer_writes.journal is not None:
+        # 数据库不可达时计时器写入进本地日志、对话不访问数据库，worker 仍能服务：
+        # 数据库只报告状态，就绪改为要求日志可写，避免数据库故障时负载均衡器摘掉所有 worker
+        health_prober.register("database", lambda: repository.health_check(), critical=False)
+        health_prober.register("timer_journal", lambda: timer_writes.journal.writable())
+    timer_writes.start_replay()
+    session_reaper.start()
+    health_prober.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时停止日志重放并释放存储引擎连接"""
+    await health_prober.close()
+    await session_reaper.close()
+    await timer_writes.close()
+    if repository:
+        await repository.close()
 
 # ==================== 数据模型定义 ====================
 
@@ -98,6 +146,19 @@ class TimerCompleteRequest(BaseModel):
     session_id: Optional[str] = None
     actual_duration: Optional[int] = None
 
+class TimerEvent(BaseModel):
+    type: Literal["start", "complete", "end"]
+    session_id: Optional[str] = None
+    timer_type_id: Optional[int] = None
+    planned_duration: Optional[int] = None
+    audio_track_id: Optional[int] = None
+    actual_duration: Optional[int] = None
+    completed: bool = True
+    occurred_at: Optional[datetime] = None
+
+class TimerEventBatchRequest(BaseModel):
+    events: List[TimerEvent]
+
 class UserSyncRequest(BaseModel):
     auth_user_id: str
     email: EmailStr
@@ -152,7 +213,7 @@ def generate_mock_response(guide_id: str, user_message: str) -> str:
 @app.get("/", summary="API根路径")
 async def root():
     """API根路径，返回系统状态"""
-    db_status = "已连接" if supabase_client else "模拟模式"
+    db_status = "内存模式" if not repository or repository.name == "memory" else "已连接"
     return {
         "message": "AURA STUDIO API - Supabase版",
         "version": "3.0.0",
@@ -163,23 +224,26 @@ async def root():
 
 @app.get("/api/health", summary="健康检查")
 async def health_check():
-    """系统健康检查"""
+    """系统健康检查（数据库状态来自后台探测的缓存结果）"""
     try:
-        if supabase_client:
-            # 测试 Supabase 连接
-            is_healthy = await supabase_client.health_check()
-            db_status = "healthy" if is_healthy else "unhealthy"
+        if repository:
+            probe = health_prober.result("database")
+            db_status = "unknown" if probe is None else "healthy" if probe["status"] == "up" else "unhealthy"
         else:
-            db_status = "mock_mode"
+            db_status = "not_initialized"
         
         return {
             "status": "healthy",
             "service": "AURA STUDIO API",
             "version": "3.0.0",
-            "ark_configured": ark_client is not None,
+            "ark_configured": ark_configured(),
             "model": "deepseek-r1-distill-qwen-32b-250120",
             "available_guides": ["roundtable", "borges", "calvino", "benjamin", "foucault", "work", "break", "default"],
             "database": db_status,
+            "storage_engine": repository.name if repository else None,
+            "timer_journal": await timer_writes.snapshot(),
+            "llm_circuit": llm_resilience.snapshot(),
+            "dependencies": health_prober.snapshot(),
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
@@ -193,11 +257,12 @@ async def health_check():
 # ==================== 向导对话接口 ====================
 
 @app.post("/api/openai/chat", response_model=OpenAIChatResponse, summary="向导对话")
-async def get_guide_ai_reply(request: OpenAIChatRequest):
+async def get_guide_ai_reply(request: OpenAIChatRequest, http_request: Request):
     """与向导进行对话"""
     try:
         user_message = request.messages[-1].content if request.messages else ""
         
+        ark_client = get_ark_client()
         if ark_client:
             # 使用真实的AI服务
             try:
@@ -208,8 +273,10 @@ async def get_guide_ai_reply(request: OpenAIChatRequest):
                 for msg in request.messages:
                     messages.append({"role": msg.role, "content": msg.content})
                 
-                # 调用 Ark API
-                completion = ark_client.chat.completions.create(
+                # 调用 Ark API（相同请求合并，只有发起上游调用的请求经过准入控制）
+                completion = await create_completion(
+                    ark_client.chat.completions.create,
+                    admit=lambda: llm_admission.admit(admission_key(http_request)),
                     model="deepseek-r1-distill-qwen-32b-250120",
                     messages=messages,
                     temperature=0.7,
@@ -218,6 +285,8 @@ async def get_guide_ai_reply(request: OpenAIChatRequest):
                 
                 reply = completion.choices[0].message.content
                 
+            except AdmissionRejected:
+                raise
             except Exception as e:
                 logger.warning(f"AI 服务调用失败，使用模拟回复: {e}")
                 reply = generate_mock_response(request.guide_id, user_message)
@@ -227,6 +296,8 @@ async def get_guide_ai_reply(request: OpenAIChatRequest):
         
         return OpenAIChatResponse(reply=reply)
         
+    except AdmissionRejected:
+        raise
     except Exception as e:
         logger.error(f"向导对话失败: {e}")
         raise HTTPException(status_code=500, detail=f"向导对话失败: {str(e)}")
@@ -251,90 +322,58 @@ async def options_login():
 @app.post("/api/auth/sync", summary="同步认证用户")
 async def sync_auth_user(request: UserSyncRequest):
     """同步 Supabase Auth 用户到后端 users 表"""
-    if not supabase_client:
-        # 模拟模式
-        return {
-            "success": True,
-            "data": {
-                "id": request.auth_user_id,
-                "email": request.email,
-                "username": request.username or request.email.split('@')[0],
-                "created_at": datetime.now().isoformat()
-            },
-            "message": "用户同步成功（模拟模式）"
-        }
-    
     try:
         logger.info(f"收到用户同步请求: {request.email} (ID: {request.auth_user_id})")
         
-        user = await supabase_client.sync_auth_user(
+        user = await repository.sync_auth_user(
             auth_user_id=request.auth_user_id,
             email=request.email,
             username=request.username
         )
         
-        if user:
-            logger.info(f"用户同步成功: {user.email}")
-            return {
-                "success": True,
-                "data": {
-                    "id": user.id,
-                    "email": user.email,
-                    "username": user.username,
-                    "created_at": user.created_at.isoformat() if user.created_at else None
-                },
-                "message": "用户同步成功"
-            }
-        else:
-            logger.error("sync_auth_user 返回 None")
-            raise HTTPException(status_code=400, detail="用户同步失败：无法创建或获取用户")
+        logger.info(f"用户同步成功: {user['email']}")
+        return {
+            "success": True,
+            "data": {
+                "id": user["user_id"],
+                "email": user["email"],
+                "username": user["username"],
+                "created_at": user["created_at"]
+            },
+            "message": "用户同步成功"
+        }
             
-    except HTTPException:
-        # 重新抛出HTTP异常
-        raise
+    except ValueError as e:
+        logger.error(f"用户同步失败: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"用户同步异常: {e}")
         logger.error(f"异常类型: {type(e)}")
-        logger.error(f"异常详情: {str(e)}")
         raise HTTPException(status_code=500, detail=f"用户同步失败: {str(e)}")
 
 @app.post("/api/auth/register", summary="用户注册")
 async def register_user(request: UserRegisterRequest):
     """用户注册"""
-    if not supabase_client:
-        # 模拟模式
+    try:
+        user = await repository.register_user(
+            email=request.email,
+            username=request.username,
+            password=request.password,
+            avatar_url=request.avatar_url
+        )
         return {
             "success": True,
             "data": {
-                "id": "mock-user-id",
-                "email": request.email,
-                "username": request.username,
-                "created_at": datetime.now().isoformat()
+                "id": user["user_id"],
+                "email": user["email"],
+                "username": user["username"],
+                "created_at": user["created_at"]
             },
-            "message": "注册成功（模拟模式）"
+            "message": "注册成功"
         }
-    
-    try:
-        user = await supabase_client.create_user(
-            email=request.email,
-            username=request.username,
-            password=request.password
-        )
-        
-        if user:
-            return {
-                "success": True,
-                "data": {
-                    "id": user.id,
-                    "email": user.email,
-                    "username": user.username,
-                    "created_at": user.created_at.isoformat() if user.created_at else None
-                },
-                "message": "注册成功"
-            }
-        else:
-            raise HTTPException(status_code=400, detail="邮箱已存在或注册失败")
             
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"注册失败: {e}")
         raise HTTPException(status_code=500, detail=f"注册失败: {str(e)}")
@@ -342,39 +381,24 @@ async def register_user(request: UserRegisterRequest):
 @app.post("/api/auth/login", summary="用户登录")
 async def login_user(request: UserLoginRequest):
     """用户登录"""
-    if not supabase_client:
-        # 模拟模式
+    try:
+        user = await repository.login_user(
+            email=request.email,
+            password=request.password
+        )
         return {
             "success": True,
             "data": {
-                "id": "mock-user-id",
-                "email": request.email,
-                "username": "MockUser",
-                "last_login_at": datetime.now().isoformat()
+                "id": user["user_id"],
+                "email": user["email"],
+                "username": user["username"],
+                "last_login_at": user.get("last_login_at")
             },
-            "message": "登录成功（模拟模式）"
+            "message": "登录成功"
         }
-    
-    try:
-        user = await supabase_client.authenticate_user(
-            email=request.email,
-            password=request.password
-        )
-        
-        if user:
-            return {
-                "success": True,
-                "data": {
-                    "id": user.id,
-                    "email": user.email,
-                    "username": user.username,
-                    "last_login_at": user.last_login_at.isoformat() if user.last_login_at else None
-                },
-                "message": "登录成功"
-            }
-        else:
-            raise HTTPException(status_code=401, detail="邮箱或密码错误")
             
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e))
     except Exception as e:
         logger.error(f"登录失败: {e}")
         raise HTTPException(status_code=500, detail=f"登录失败: {str(e)}")
@@ -384,41 +408,9 @@ async def login_user(request: UserLoginRequest):
 @app.get("/api/timer/types", summary="获取计时器类型")
 async def get_timer_types():
     """获取所有计时器类型"""
-    if not supabase_client:
-        # 返回模拟数据
-        return {
-            "success": True,
-            "data": [
-                {
-                    "id": 1,
-                    "name": "focus",
-                    "display_name": "聚焦",
-                    "default_duration": 90,
-                    "description": "聚焦光线、语言或者太空垃圾",
-                    "background_image": "/images/deep-work.png"
-                },
-                {
-                    "id": 2,
-                    "name": "inspire",
-                    "display_name": "播种",
-                    "default_duration": 30,
-                    "description": "播种灵感、种子或者一个怪念头",
-                    "background_image": "/images/break.png"
-                },
-                {
-                    "id": 3,
-                    "name": "talk",
-                    "display_name": "篝火",
-                    "default_duration": 60,
-                    "description": "与向导进行沉浸式对话的空间",
-                    "background_image": "/images/roundtable.png"
-                }
-            ]
-        }
-    
     try:
-        result = await supabase_client.get_timer_types()
-        return {"success": True, "data": result}
+        result = await repository.get_timer_types()
+        return ok(result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取计时器类型失败: {str(e)}")
 
@@ -427,41 +419,22 @@ async def get_timer_types():
 @app.post("/api/timer/start", summary="开始计时器会话")
 async def start_timer_session(user_id: str, request: TimerStartRequest):
     """开始新的计时器会话"""
-    if not supabase_client:
-        # 模拟模式
-        return {
-            "success": True,
-            "data": {
-                "session_id": f"mock-session-{user_id}-{datetime.now().strftime('%Y%m%d%H%M%S')}",
-                "timer_type_id": request.timer_type_id,
-                "planned_duration": request.planned_duration or 90,
-                "started_at": datetime.now().isoformat()
-            },
-            "message": "计时器已开始（模拟模式）"
-        }
-    
     try:
-        session_id = await supabase_client.start_timer_session(
+        # 前端刷新页面后可能留下未结束的会话，这里不强制单会话
+        result = await timer_writes.start(
             user_id=user_id,
             timer_type_id=request.timer_type_id,
             planned_duration=request.planned_duration or 90,
-            audio_track_id=request.audio_track_id
+            audio_track_id=request.audio_track_id,
+            exclusive=False
         )
-        
-        if session_id:
-            return {
-                "success": True,
-                "data": {
-                    "session_id": session_id,
-                    "timer_type_id": request.timer_type_id,
-                    "planned_duration": request.planned_duration or 90,
-                    "started_at": datetime.now().isoformat()
-                },
-                "message": "计时器已开始"
-            }
-        else:
-            raise HTTPException(status_code=400, detail="无法创建计时器会话")
+        message = "计时器已开始（已暂存，数据库恢复后同步）" if result.get("queued") else "计时器已开始"
+        session_reaper.schedule(result["session_id"], user_id, result["started_at"], result["planned_duration"])
+        timer_hub.publish(user_id, {"type": "session_started", "session": result})
+        return ok(result, message)
             
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"启动计时器失败: {e}")
         raise HTTPException(status_code=500, detail=f"启动计时器失败: {str(e)}")
@@ -469,36 +442,12 @@ async def start_timer_session(user_id: str, request: TimerStartRequest):
 @app.get("/api/timer/current/{user_id}", summary="获取当前进行中的会话")
 async def get_current_session(user_id: str):
     """获取用户当前进行中的计时器会话"""
-    if not supabase_client:
-        # 模拟模式 - 返回无会话
-        return {"success": True, "data": None, "message": "没有进行中的会话（模拟模式）"}
-    
     try:
-        # 查询当前用户进行中的会话
-        sessions = await supabase_client.get_user_sessions(user_id, limit=1)
-        current_session = None
-        
-        for session in sessions:
-            if not session.completed and session.ended_at is None:
-                # 计算已运行时间 - 确保时区一致性
-                now_utc = datetime.now(timezone.utc)
-                started_at_utc = session.started_at
-                if started_at_utc.tzinfo is None:
-                    started_at_utc = started_at_utc.replace(tzinfo=timezone.utc)
-                elapsed_seconds = int((now_utc - started_at_utc).total_seconds())
-                current_session = {
-                    "session_id": session.id,
-                    "timer_type_id": session.timer_type_id,
-                    "planned_duration": session.planned_duration,
-                    "elapsed_time": elapsed_seconds,
-                    "started_at": session.started_at.isoformat()
-                }
-                break
-        
+        current_session = await timer_writes.current(user_id)
         if current_session:
-            return {"success": True, "data": current_session}
+            return ok(current_session)
         else:
-            return {"success": True, "data": None, "message": "没有进行中的会话"}
+            return ok(None, "没有进行中的会话")
             
     except Exception as e:
         logger.error(f"获取当前会话失败: {e}")
@@ -506,188 +455,123 @@ async def get_current_session(user_id: str):
 
 @app.put("/api/timer/complete", summary="完成计时器会话")
 async def complete_timer_session(user_id: str, request: TimerCompleteRequest):
-    """完成当前的计时器会话"""
-    if not supabase_client:
-        # 模拟模式
-        return {
-            "success": True,
-            "data": {
-                "session_id": request.session_id or "mock-session-id",
-                "actual_duration": request.actual_duration or 1800,
-                "completed_at": datetime.now(timezone.utc).isoformat()
-            },
-            "message": "计时器会话已完成（模拟模式）"
-        }
-    
+    """完成当前的计时器会话，并更新会话开始那天的日志"""
     try:
-        # 如果没有指定session_id，找到当前进行中的会话
-        target_session_id = request.session_id
-        if not target_session_id:
-            sessions = await supabase_client.get_user_sessions(user_id, limit=10)
-            for session in sessions:
-                if not session.completed and session.ended_at is None:
-                    target_session_id = session.id
-                    break
-            
-            if not target_session_id:
-                raise HTTPException(status_code=400, detail="没有找到进行中的计时器会话")
-        
-        # 计算实际时长（如果没有提供）
-        actual_duration = request.actual_duration
-        if actual_duration is None:
-            # 获取会话开始时间来计算实际时长
-            sessions = await supabase_client.get_user_sessions(user_id, limit=50)
-            target_session = None
-            for session in sessions:
-                if session.id == target_session_id:
-                    target_session = session
-                    break
-            
-            if target_session:
-                # 确保时区一致性
-                now_utc = datetime.now(timezone.utc)
-                started_at_utc = target_session.started_at
-                if started_at_utc.tzinfo is None:
-                    started_at_utc = started_at_utc.replace(tzinfo=timezone.utc)
-                actual_duration = int((now_utc - started_at_utc).total_seconds())
-            else:
-                actual_duration = 1800  # 默认30分钟
-        
-        # 结束会话
-        success = await supabase_client.end_timer_session(
-            session_id=target_session_id,
-            actual_duration=actual_duration,
-            completed=True
+        result = await timer_writes.complete(
+            user_id=user_id,
+            session_id=request.session_id,
+            actual_duration=request.actual_duration
         )
-        
-        if success:
-            # 生成每日日志
-            await supabase_client.generate_daily_log(user_id)
-            
-            return {
-                "success": True,
-                "data": {
-                    "session_id": target_session_id,
-                    "actual_duration": actual_duration,
-                    "completed_at": datetime.now(timezone.utc).isoformat()
-                },
-                "message": "计时器会话已完成"
-            }
-        else:
-            raise HTTPException(status_code=400, detail="无法完成计时器会话")
+        message = "计时器会话已完成（已暂存，数据库恢复后同步）" if result.get("queued") else "计时器会话已完成"
+        if result.get("session_id"):
+            session_reaper.cancel(result["session_id"])
+        await publish_stats_update(user_id, {"type": "session_completed", "session": result},
+                                   include_stats=not result.get("queued"))
+        return ok(result, message)
             
-    except HTTPException:
-        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"完成会话失败: {e}")
         raise HTTPException(status_code=500, detail=f"完成会话失败: {str(e)}")
 
+@app.post("/api/timer/events/batch", summary="批量提交计时器事件")
+async def apply_timer_events(user_id: str, request: TimerEventBatchRequest):
+    """按顺序批量应用开始/完成/结束事件（离线队列、多设备同步）
+
+    整批校验，任一事件不合法时整批不写入；每个受影响的日期只重建一次日志。
+    Supabase 引擎中途写入失败时返回 200，失败和未写入的事件 status 为 failed / skipped，可原样重新提交
+    """
+    try:
+        result = await repository.apply_timer_events(
+            user_id=user_id,
+            events=[event.model_dump() for event in request.events]
+        )
+        for event in result["results"]:
+            if event["type"] == "start" and event["status"] == "created":
+                session_reaper.schedule(event["session_id"], user_id, event["started_at"], event["planned_duration"])
+            elif event["type"] != "start" and event["status"] in ("updated", "duplicate"):
+                session_reaper.cancel(event["session_id"])
+        await publish_stats_update(user_id, {"type": "events_applied", **result}, include_stats=bool(result["log_dates"]))
+        return ok(result, f"已处理 {len(result['results'])} 个计时器事件")
+            
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"批量处理计时器事件失败: {e}")
+        raise HTTPException(status_code=500, detail=f"批量处理计时器事件失败: {str(e)}")
+
+# ==================== 实时推送接口 ====================
+
+async def publish_stats_update(user_id: str, message: Dict[str, Any], include_stats: bool = True):
+    """推送会话变化；有订阅者时附带最新统计"""
+    await publish_session_change(user_id, message, repository if include_stats else None)
+
+async def notify_sessions_closed(closed: List[Dict[str, Any]]):
+    """超时会话被自动关闭后通知对应用户的页面"""
+    by_user: Dict[str, List[Dict[str, Any]]] = {}
+    for session in closed:
+        by_user.setdefault(session["user_id"], []).append({
+            "session_id": session["session_id"],
+            "actual_duration": session["actual_duration"],
+            "ended_at": session["ended_at"].isoformat()
+        })
+    for user_id, sessions in by_user.items():
+        await publish_stats_update(user_id, {"type": "sessions_closed", "sessions": sessions})
+
+async def timer_snapshot(user_id: str) -> Dict[str, Any]:
+    """连接建立时发送一次的快照，之后只推送变化"""
+    current = await timer_writes.current(user_id)
+    return {"type": "snapshot", "current": current, **await today_stats(repository, user_id)}
+
+def sse_timer_events(user_id: str):
+    return sse_events(user_id, timer_snapshot)
+
+install_timer_push(app, timer_snapshot)
+
 # ==================== 统计数据接口 ====================
 
 @app.get("/api/user/timer-stats/{user_id}", summary="获取用户计时器使用统计")
 async def get_user_timer_stats(user_id: str):
     """获取用户计时器类型使用统计"""
-    if not supabase_client:
-        # 返回模拟统计数据
-        return {
-            "success": True,
-            "data": [
-                {
-                    "timer_type": {
-                        "id": 1,
-                        "name": "focus",
-                        "display_name": "聚焦",
-                        "description": "聚焦光线、语言或者太空垃圾",
-                        "background_image": "/images/deep-work.png"
-                    },
-                    "usage_count": 15,
-                    "completed_count": 12,
-                    "total_duration": 20700,  # 345分钟 = 5.75小时
-                    "avg_duration": 1725,     # 28.75分钟平均
-                    "total_duration_formatted": "5小时45分钟"
-                },
-                {
-                    "timer_type": {
-                        "id": 2,
-                        "name": "inspire",
-                        "display_name": "播种",
-                        "description": "播种灵感、种子或者一个怪念头",
-                        "background_image": "/images/break.png"
-                    },
-                    "usage_count": 8,
-                    "completed_count": 6,
-                    "total_duration": 2700,   # 45分钟
-                    "avg_duration": 450,      # 7.5分钟平均
-                    "total_duration_formatted": "45分钟"
-                },
-                {
-                    "timer_type": {
-                        "id": 3,
-                        "name": "talk",
-                        "display_name": "篝火",
-                        "description": "与向导进行沉浸式对话的空间",
-                        "background_image": "/images/roundtable.png"
-                    },
-                    "usage_count": 5,
-                    "completed_count": 4,
-                    "total_duration": 3600,   # 1小时
-                    "avg_duration": 900,      # 15分钟平均
-                    "total_duration_formatted": "1小时0分钟"
-                }
-            ]
-        }
-    
     try:
-        # 使用真实的统计查询
-        stats_data = await supabase_client.get_user_timer_stats(user_id)
-        return {"success": True, "data": stats_data}
+        stats_data = await repository.get_user_timer_stats(user_id)
+        return ok(stats_data)
         
     except Exception as e:
         logger.error(f"获取用户计时器统计失败: {e}")
         raise HTTPException(status_code=500, detail=f"获取用户计时器统计失败: {str(e)}")
 
 @app.get("/api/stats/daily/{user_id}", summary="获取每日统计")
-async def get_daily_stats(user_id: str, start_date: Optional[date] = None, end_date: Optional[date] = None):
-    """获取每日统计数据"""
-    if not supabase_client:
-        # 返回模拟统计数据
-        return {
-            "success": True,
-            "data": [
-                {
-                    "log_date": date.today().isoformat(),
-                    "total_focus_time": 3600,
-                    "total_sessions": 3,
-                    "completed_sessions": 2,
-                    "deep_work": {"count": 1, "time": 1800},
-                    "break": {"count": 1, "time": 900},
-                    "roundtable": {"count": 1, "time": 900}
-                }
-            ]
-        }
-    
+async def get_daily_stats(user_id: str, start_date: Optional[date] = None, end_date: Optional[date] = None,
+                          fields: Optional[str] = None):
+    """获取每日统计数据，fields=log_date,total_focus_time 只返回指定字段"""
     try:
-        # 这里可以实现真实的每日统计查询
-        daily_logs = await supabase_client.get_user_daily_logs(user_id, days=7)
-        
-        result = []
-        for log in daily_logs:
-            result.append({
-                "log_date": log.log_date.isoformat(),
-                "total_focus_time": log.total_focus_time,
-                "total_sessions": log.total_sessions,
-                "completed_sessions": log.completed_sessions,
-                "deep_work": {"count": log.deep_work_count, "time": log.deep_work_time},
-                "break": {"count": log.break_count, "time": log.break_time},
-                "roundtable": {"count": log.roundtable_count, "time": log.roundtable_time}
-            })
-        
-        return {"success": True, "data": result}
+        result = await repository.get_daily_stats(
+            user_id=user_id,
+            start_date=start_date,
+            end_date=end_date,
+            fields=parse_fields(fields, DAILY_FIELDS)
+        )
+        return ok(result)
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"获取每日统计失败: {e}")
         raise HTTPException(status_code=500, detail=f"获取每日统计失败: {str(e)}")
 
+@app.get("/api/stats/insights/{user_id}", summary="获取专注分析")
+async def get_focus_insights(user_id: str):
+    """连续专注天数、周内小时热力图、时长分位数和完成率趋势"""
+    try:
+        result = await focus_insights.get(user_id)
+        return ok(result)
+        
+    except Exception as e:
+        logger.error(f"获取专注分析失败: {e}")
+        raise HTTPException(status_code=500, detail=f"获取专注分析失败: {str(e)}")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=False) 
\ No newline at end of file
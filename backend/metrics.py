@@ -0,0 +1,538 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 请求级指标
+记录每个路由的请求数、状态码和延迟直方图，并分别统计数据库和 LLM 调用耗时，
+通过 /metrics 以 Prometheus 文本格式导出
+
+使用方法：
+from metrics import install_metrics, track_dependency
+install_metrics(app)
+
+with track_dependency("llm", "ark.chat.completions"):
+    completion = ark_client.chat.completions.create(...)
+
+多 worker（gunicorn）时每个进程有自己的 REGISTRY，单个 worker 只能导出自己的数据。
+设置 METRICS_MULTIPROC_DIR 后（gunicorn_conf.py 在多 worker 时自动设置）：
+- 每个 worker 每 METRICS_FLUSH_INTERVAL 秒把自己的指标写入 metrics-<pid>.json
+- /metrics 汇总目录中的全部文件：计数器和直方图按进程求和，仪表按各自的 multiprocess_mode 合并
+- 已退出 worker 的计数器和直方图由 master 并入 metrics-archive.json，总数不会因 worker 回收而回退；
+  它们的仪表不再导出
+"""
+
+import os
+import json
+import time
+import fcntl
+import functools
+import inspect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Match
+
+from tracing import span
+
+# 默认延迟分桶（秒），覆盖从缓存命中到慢速 LLM 调用
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+MULTIPROC_DIR_ENV = "METRICS_MULTIPROC_DIR"
+FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+ARCHIVE_FILE = "metrics-archive.json"
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            samples = [[list(k), v] for k, v in self._values.items()]
+        return {"type": self.type_name, "help": self.help_text, "labelnames": list(self.labelnames),
+                "samples": samples}
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    type_name = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值
+
+    multiprocess_mode 决定多 worker 汇总方式：all 每个 worker 一条（加 pid 标签），
+    sum / max / min 合并为一条；只统计仍在运行的 worker
+    """
+    type_name = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), multiprocess_mode: str = "all"):
+        if multiprocess_mode not in ("all", "sum", "max", "min"):
+            raise ValueError(f"未知的 multiprocess_mode: {multiprocess_mode}")
+        super().__init__(name, help_text, labelnames)
+        self.multiprocess_mode = multiprocess_mode
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def snapshot(self) -> Dict:
+        return dict(super().snapshot(), mode=self.multiprocess_mode)
+
+    def merge(self, key: LabelValues, value: float):
+        """按 multiprocess_mode 合并另一个 worker 的值"""
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = value
+            elif self.multiprocess_mode == "sum":
+                self._values[key] += value
+            elif self.multiprocess_mode == "max":
+                self._values[key] = max(self._values[key], value)
+            elif self.multiprocess_mode == "min":
+                self._values[key] = min(self._values[key], value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    """延迟直方图，分桶计数为累计值（符合 Prometheus 约定）"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * len(self.buckets)
+                self._sums[key] = 0.0
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    counts[i] += 1
+                    break
+            self._sums[key] += value
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            samples = [[list(k), list(v), self._sums[k]] for k, v in self._counts.items()]
+        return {"type": self.type_name, "help": self.help_text, "labelnames": list(self.labelnames),
+                "buckets": list(self.buckets[:-1]), "samples": samples}
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+            self._sums.clear()
+
+    def merge(self, key: LabelValues, counts: Sequence[int], total: float):
+        with self._lock:
+            merged = self._counts.setdefault(key, [0] * len(self.buckets))
+            for i, n in enumerate(counts):
+                merged[i] += n
+            self._sums[key] = self._sums.get(key, 0.0) + total
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            items = sorted((k, list(v), self._sums[k]) for k, v in self._counts.items())
+        for key, counts, total in items:
+            cumulative = 0
+            for upper, n in zip(self.buckets, counts):
+                cumulative += n
+                le = "+Inf" if upper == float("inf") else repr(float(upper))
+                labels = _format_labels(self.labelnames, key, ("le", le))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+              multiprocess_mode: str = "all") -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames, multiprocess_mode))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+
+# ==================== 多 worker 汇总 ====================
+
+def multiproc_dir() -> Optional[str]:
+    return os.getenv(MULTIPROC_DIR_ENV) or None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _write_json(path: str, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_snapshot(registry: "MetricsRegistry" = None, directory: str = None, pid: int = None):
+    """把本进程的指标写入 metrics-<pid>.json；写失败不影响请求"""
+    directory = directory or multiproc_dir()
+    if not directory:
+        return
+    pid = pid or os.getpid()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        _write_json(os.path.join(directory, f"metrics-{pid}.json"),
+                    {"pid": pid, "metrics": (registry or REGISTRY).snapshot()})
+    except OSError:
+        pass
+
+
+def _merge(registry: "MetricsRegistry", snapshot: Dict[str, Dict], pid: Optional[int], gauges: bool):
+    for name, data in snapshot.items():
+        labelnames = data["labelnames"]
+        if data["type"] == "counter":
+            metric = registry.counter(name, data["help"], labelnames)
+            for key, value in data["samples"]:
+                metric.inc(value, **dict(zip(labelnames, key)))
+        elif data["type"] == "histogram":
+            metric = registry.histogram(name, data["help"], labelnames, data["buckets"])
+            for key, counts, total in data["samples"]:
+                metric.merge(tuple(key), counts, total)
+        elif gauges:
+            mode = data.get("mode", "all")
+            if mode == "all":
+                metric = registry.gauge(name, data["help"], labelnames + ["pid"])
+                for key, value in data["samples"]:
+                    metric.set(value, **dict(zip(labelnames, key)), pid=pid)
+                continue
+            metric = registry.gauge(name, data["help"], labelnames, mode)
+            for key, value in data["samples"]:
+                metric.merge(tuple(key), value)
+
+
+def collect(directory: str) -> "MetricsRegistry":
+    """汇总目录中全部 worker 和归档的指标；已退出 worker 的仪表不再导出"""
+    merged = MetricsRegistry()
+    if not os.path.isdir(directory):
+        return merged
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith("metrics-") and name.endswith(".json")):
+            continue
+        data = _read_json(os.path.join(directory, name))
+        if not data:
+            continue
+        pid = data.get("pid")
+        _merge(merged, data["metrics"], pid, gauges=pid is not None and _pid_alive(pid))
+    return merged
+
+
+def archive_dead_workers(directory: str = None, pids: Sequence[int] = ()):
+    """把已退出 worker（或指定 pid）的计数器和直方图并入归档文件并删除其快照；由 gunicorn master 调用
+
+    滚动重启时新旧 master 可能同时归档，用文件锁串行化
+    """
+    directory = directory or multiproc_dir()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".archive.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive = MetricsRegistry()
+        archive_path = os.path.join(directory, ARCHIVE_FILE)
+        existing = _read_json(archive_path)
+        if existing:
+            _merge(archive, existing["metrics"], None, gauges=False)
+        dead = []
+        for name in os.listdir(directory):
+            pid = name[len("metrics-"):-len(".json")]
+            if not (name.startswith("metrics-") and name.endswith(".json") and pid.isdigit()):
+                continue
+            pid = int(pid)
+            if pid in pids or not _pid_alive(pid):
+                data = _read_json(os.path.join(directory, name))
+                if data:
+                    _merge(archive, data["metrics"], pid, gauges=False)
+                dead.append(name)
+        if not dead:
+            return
+        _write_json(archive_path, {"pid": None, "metrics": archive.snapshot()})
+        for name in dead:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def start_multiprocess(registry: "MetricsRegistry" = None, interval: float = FLUSH_INTERVAL):
+    """worker fork 后调用：清空从 master 继承的计数，并在后台线程中定期写入本进程的快照
+
+    preload 时 master 导入模块期间记录的计数会被每个 worker 继承，不清空会在汇总时重复 N 次
+    """
+    registry = registry or REGISTRY
+    if not multiproc_dir():
+        return
+    for metric in registry._metrics.values():
+        if not isinstance(metric, Gauge):
+            metric.clear()
+    write_snapshot(registry)
+
+    def flush():
+        while True:
+            time.sleep(interval)
+            write_snapshot(registry)
+
+    threading.Thread(target=flush, name="metrics-flush", daemon=True).start()
+
+
+# ==================== 全局指标 ====================
+
+REGISTRY = MetricsRegistry()
+
+PROCESS_START_TIME = REGISTRY.gauge("aura_process_start_time_seconds", "进程启动时间（Unix 时间戳）")
+PROCESS_START_TIME.set(time.time())
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "aura_http_requests_total", "HTTP 请求数", ["method", "route", "status"])
+HTTP_LATENCY = REGISTRY.histogram(
+    "aura_http_request_duration_seconds", "HTTP 请求耗时", ["method", "route"])
+HTTP_IN_PROGRESS = REGISTRY.gauge(
+    "aura_http_requests_in_progress", "正在处理的 HTTP 请求数", ["method"], multiprocess_mode="sum")
+
+DEPENDENCY_LATENCY = REGISTRY.histogram(
+    "aura_dependency_duration_seconds", "外部依赖调用耗时（component: db/llm）", ["component", "operation"])
+DEPENDENCY_ERRORS = REGISTRY.counter(
+    "aura_dependency_errors_total", "外部依赖调用异常数", ["component", "operation"])
+
+
+# ==================== 依赖调用计时 ====================
+
+@contextmanager
+def track_dependency(component: str, operation: str):
+    """统计一次数据库或 LLM 调用的耗时，异常时同时计数；在请求中时同时记录一个追踪 span"""
+    start = time.perf_counter()
+    try:
+        with span(f"{component}.{operation}", kind=component):
+            yield
+    except BaseException:
+        DEPENDENCY_ERRORS.inc(component=component, operation=operation)
+        raise
+    finally:
+        DEPENDENCY_LATENCY.observe(time.perf_counter() - start, component=component, operation=operation)
+
+
+# 当前所在的被计时方法的组件；同一组件的方法互相调用（如子类调用 super()、complete 调用内部写入）
+# 时只统计最外层调用，避免一次操作被计数和计时多次
+_instrumented: ContextVar[Optional[str]] = ContextVar("aura_instrumented_component", default=None)
+
+
+def instrument_methods(component: str, prefix: str):
+    """类装饰器：为所有公开的异步方法加上依赖调用计时；嵌套在同一组件的计时调用中时不重复统计
+
+    @instrument_methods("db", "supabase")
+    class SupabaseClient: ...
+    """
+    def decorator(cls):
+        for name, method in list(vars(cls).items()):
+            if name.startswith("_") or not inspect.iscoroutinefunction(method):
+                continue
+            setattr(cls, name, _timed(method, component, f"{prefix}.{name}"))
+        return cls
+    return decorator
+
+
+def _timed(method, component: str, operation: str):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        if _instrumented.get() == component:
+            return await method(*args, **kwargs)
+        token = _instrumented.set(component)
+        try:
+            with track_dependency(component, operation):
+                return await method(*args, **kwargs)
+        finally:
+            _instrumented.reset(token)
+    return wrapper
+
+
+# ==================== HTTP 中间件 ====================
+
+def _route_template(scope) -> str:
+    """取匹配到的路由模板（如 /api/timer/current/{user_id}），避免把路径参数变成标签"""
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+
+    app = scope.get("app")
+    for candidate in getattr(getattr(app, "router", None), "routes", []):
+        match, _ = candidate.matches(scope)
+        if match == Match.FULL:
+            return candidate.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """记录每个请求的路由、状态码和耗时（纯 ASGI 实现，不影响流式响应）"""
+
+    def __init__(self, app, exclude_paths: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.exclude_paths = set(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc(method=method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_PROGRESS.dec(method=method)
+            route = _route_template(scope)
+            HTTP_REQUESTS.inc(method=method, route=route, status=str(status_holder["status"]))
+            HTTP_LATENCY.observe(elapsed, method=method, route=route)
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    """Prometheus 抓取接口；多 worker 模式下先写入本进程的最新快照，再汇总所有 worker"""
+    directory = multiproc_dir()
+    if directory:
+        write_snapshot()
+        text = collect(directory).render()
+    else:
+        text = REGISTRY.render()
+    return Response(text, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def install_metrics(app, path: str = "/metrics"):
+    """为应用注册指标中间件和 /metrics 接口"""
+    app.add_middleware(MetricsMiddleware, exclude_paths=(path,))
+    app.add_route(path, metrics_endpoint, methods=["GET"], include_in_schema=False)
@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 本地 Ark/OpenAI 兼容模拟服务
+用于对话链路的吞吐量和尾延迟测试，完全离线运行
+
+特性：
+- 兼容 /api/v3/chat/completions（Ark）和 /v1/chat/completions（OpenAI）
+- 支持流式（SSE）和非流式响应
+- 可配置的延迟分布：首 token 延迟（TTFT）+ 逐 token 延迟
+- 按概率注入 500 错误和 429 限流（带 Retry-After）
+- 返回 usage 中的 token 统计，并在 /mock/stats 汇总
+
+运行方式：
+python mock_ark_server.py --port 8100 --profile typical
+然后在 backend/.env 中设置：
+ARK_BASE_URL=http://127.0.0.1:8100/api/v3
+API_KEY=mock-key
+"""
+
+import os
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import logging
+from dataclasses import dataclass, field, asdict
+from typing import List, Dict, Any, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# ==================== 延迟分布 ====================
+
+@dataclass
+class LatencyDistribution:
+    """延迟分布（单位：秒）
+
+    kind 可选：
+    - fixed:       params = [value]
+    - uniform:     params = [low, high]
+    - normal:      params = [mean, stddev]
+    - lognormal:   params = [median, sigma]  长尾分布，最接近真实 LLM 延迟
+    - exponential: params = [mean]
+    """
+    kind: str = "fixed"
+    params: List[float] = field(default_factory=lambda: [0.0])
+
+    def sample(self, rng: random.Random) -> float:
+        """采样一个延迟值，保证非负"""
+        p = self.params
+        if self.kind == "fixed":
+            value = p[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            value = rng.gauss(p[0], p[1])
+        elif self.kind == "lognormal":
+            value = p[0] * math.exp(rng.gauss(0.0, p[1])) if p[0] > 0 else 0.0
+        elif self.kind == "exponential":
+            value = rng.expovariate(1.0 / p[0]) if p[0] > 0 else 0.0
+        else:
+            raise ValueError(f"未知的延迟分布类型: {self.kind}")
+        return max(0.0, value)
+
+    def describe(self) -> str:
+        return f"{self.kind}:{','.join(str(v) for v in self.params)}"
+
+
+def parse_distribution(spec: str) -> LatencyDistribution:
+    """解析延迟分布描述，例如 "lognormal:0.6,0.5" 或 "0.2"（固定值）"""
+    spec = spec.strip()
+    if ":" not in spec:
+        return LatencyDistribution("fixed", [float(spec)])
+
+    kind, _, raw_params = spec.partition(":")
+    params = [float(v) for v in raw_params.split(",") if v.strip()]
+    expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exponential": 1}
+    if kind not in expected:
+        raise ValueError(f"未知的延迟分布类型: {kind}")
+    if len(params) != expected[kind]:
+        raise ValueError(f"{kind} 分布需要 {expected[kind]} 个参数，实际为 {len(params)}")
+    return LatencyDistribution(kind, params)
+
+
+@dataclass
+class LatencyProfile:
+    """延迟配置：首 token 延迟 + 每个输出 token 的延迟"""
+    ttft: LatencyDistribution
+    per_token: LatencyDistribution
+
+
+# 预置延迟配置，数值参考线上 deepseek-r1-distill-qwen-32b 的观测
+LATENCY_PROFILES: Dict[str, LatencyProfile] = {
+    "instant": LatencyProfile(
+        ttft=LatencyDistribution("fixed", [0.0]),
+        per_token=LatencyDistribution("fixed", [0.0]),
+    ),
+    "fast": LatencyProfile(
+        ttft=LatencyDistribution("lognormal", [0.15, 0.3]),
+        per_token=LatencyDistribution("uniform", [0.002, 0.006]),
+    ),
+    "typical": LatencyProfile(
+        ttft=LatencyDistribution("lognormal", [0.6, 0.4]),
+        per_token=LatencyDistribution("normal", [0.02, 0.005]),
+    ),
+    "slow": LatencyProfile(
+        ttft=LatencyDistribution("lognormal", [2.0, 0.5]),
+        per_token=LatencyDistribution("normal", [0.05, 0.01]),
+    ),
+    "long_tail": LatencyProfile(
+        ttft=LatencyDistribution("lognormal", [0.6, 1.0]),
+        per_token=LatencyDistribution("lognormal", [0.02, 0.6]),
+    ),
+}
+
+
+# ==================== 服务配置和统计 ====================
+
+@dataclass
+class MockArkConfig:
+    """模拟服务配置"""
+    profile: str = "typical"
+    ttft: Optional[str] = None          # 覆盖 profile 的 TTFT 分布
+    per_token: Optional[str] = None     # 覆盖 profile 的逐 token 分布
+    error_rate: float = 0.0             # 返回 500 的概率
+    rate_limit_rate: float = 0.0        # 返回 429 的概率
+    retry_after: int = 1                # 429 响应的 Retry-After 秒数
+    reply_tokens: int = 120             # 默认回复长度（token 数）
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "MockArkConfig":
+        """从环境变量读取配置"""
+        seed = os.getenv("MOCK_ARK_SEED")
+        return cls(
+            profile=os.getenv("MOCK_ARK_PROFILE", "typical"),
+            ttft=os.getenv("MOCK_ARK_TTFT") or None,
+            per_token=os.getenv("MOCK_ARK_PER_TOKEN") or None,
+            error_rate=float(os.getenv("MOCK_ARK_ERROR_RATE", "0")),
+            rate_limit_rate=float(os.getenv("MOCK_ARK_RATE_LIMIT_RATE", "0")),
+            retry_after=int(os.getenv("MOCK_ARK_RETRY_AFTER", "1")),
+            reply_tokens=int(os.getenv("MOCK_ARK_REPLY_TOKENS", "120")),
+            seed=int(seed) if seed else None,
+        )
+
+    def latency_profile(self) -> LatencyProfile:
+        if self.profile not in LATENCY_PROFILES:
+            raise ValueError(f"未知的延迟配置: {self.profile}，可选: {', '.join(LATENCY_PROFILES)}")
+        base = LATENCY_PROFILES[self.profile]
+        return LatencyProfile(
+            ttft=parse_distribution(self.ttft) if self.ttft else base.ttft,
+            per_token=parse_distribution(self.per_token) if self.per_token else base.per_token,
+        )
+
+
+@dataclass
+class MockArkStats:
+    """请求统计"""
+    requests: int = 0
+    streamed_requests: int = 0
+    injected_errors: int = 0
+    rate_limited: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+# ==================== Token 估算和回复生成 ====================
+
+def _is_cjk(char: str) -> bool:
+    return "一" <= char <= "鿿" or "　" <= char <= "〿" or "＀" <= char <= "￯"
+
+
+def tokenize(text: str) -> List[str]:
+    """粗略切分 token：中文按字，其他按空白分词后每 4 个字符一个 token
+
+    与真实分词器不同，但数量级一致，足够用于吞吐量估算
+    """
+    tokens: List[str] = []
+    buffer = ""
+    for char in text:
+        if _is_cjk(char) or char.isspace() or char in "\n，。！？":
+            if buffer:
+                tokens.extend(buffer[i:i + 4] for i in range(0, len(buffer), 4))
+                buffer = ""
+            tokens.append(char)
+        else:
+            buffer += char
+    if buffer:
+        tokens.extend(buffer[i:i + 4] for i in range(0, len(buffer), 4))
+    return tokens
+
+
+def count_tokens(text: str) -> int:
+    """估算文本的 token 数（不计空白）"""
+    return sum(1 for token in tokenize(text) if not token.isspace())
+
+
+MOCK_REPLY_SENTENCES = [
+    "这是一个很有趣的问题，让我们从几个角度来思考。",
+    "首先，明确你真正想要达成的目标。",
+    "其次，把大的任务拆解成可以在一个专注时段内完成的小步骤。",
+    "在这个由符号构成的迷宫中，每一条路径都通向新的可能。",
+    "保持专注的秘诀是一次只做一件事，并给自己留出休息的时间。",
+    "创造力如同一颗种子，需要在想象的土壤中慢慢生根发芽。",
+    "你可以先尝试一个最小的版本，再根据反馈逐步完善。",
+]
+
+
+def generate_reply_tokens(messages: List[Dict[str, Any]], max_tokens: int) -> List[str]:
+    """根据对话生成确定性的模拟回复 token 序列"""
+    last_user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    start = len(last_user) % len(MOCK_REPLY_SENTENCES)
+
+    tokens: List[str] = []
+    index = start
+    while len(tokens) < max_tokens:
+        tokens.extend(tokenize(MOCK_REPLY_SENTENCES[index % len(MOCK_REPLY_SENTENCES)]))
+        index += 1
+    return tokens[:max_tokens]
+
+
+# ==================== 应用工厂 ====================
+
+def create_app(config: Optional[MockArkConfig] = None) -> FastAPI:
+    """创建模拟 Ark 服务应用
+
+    每个应用实例拥有独立的配置、随机数生成器和统计数据，
+    方便在同一进程中并行运行多个不同配置的模拟服务
+    """
+    config = config or MockArkConfig.from_env()
+    rng = random.Random(config.seed)
+    stats = MockArkStats()
+    state = {"config": config, "profile": config.latency_profile()}
+
+    app = FastAPI(
+        title="AURA STUDIO Mock Ark",
+        description="本地 Ark/OpenAI 兼容模拟服务，用于压测",
+        version="1.0.0",
+    )
+    app.state.mock_stats = stats
+    app.state.mock_state = state
+
+    def error_response(status_code: int, code: str, message: str, headers: Optional[Dict[str, str]] = None):
+        return JSONResponse(
+            status_code=status_code,
+            content={"error": {"code": code, "message": message, "type": code}},
+            headers=headers,
+        )
+
+    def pick_fault(request: Request) -> Optional[str]:
+        """决定本次请求是否注入故障，请求头 X-Mock-Fault 可强制指定"""
+        forced = request.headers.get("x-mock-fault")
+        if forced:
+            return forced
+        cfg: MockArkConfig = state["config"]
+        roll = rng.random()
+        if roll < cfg.rate_limit_rate:
+            return "429"
+        if roll < cfg.rate_limit_rate + cfg.error_rate:
+            return "500"
+        return None
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        cfg: MockArkConfig = state["config"]
+        profile: LatencyProfile = state["profile"]
+        stats.requests += 1
+
+        fault = pick_fault(request)
+        if fault == "429":
+            stats.rate_limited += 1
+            return error_response(
+                429, "RateLimitExceeded",
+                "Mock rate limit exceeded, please try again later",
+                headers={"Retry-After": str(cfg.retry_after)},
+            )
+        if fault == "500":
+            stats.injected_errors += 1
+            return error_response(500, "InternalServiceError", "Mock internal error")
+
+        messages = body.get("messages", [])
+        model = body.get("model", "mock-model")
+        max_tokens = int(body.get("max_tokens") or cfg.reply_tokens)
+        reply_tokens = generate_reply_tokens(messages, min(max_tokens, cfg.reply_tokens))
+
+        prompt_tokens = sum(count_tokens(str(m.get("content", ""))) for m in messages)
+        completion_tokens = sum(1 for t in reply_tokens if not t.isspace())
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        stats.prompt_tokens += prompt_tokens
+        stats.completion_tokens += completion_tokens
+
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        if body.get("stream"):
+            stats.streamed_requests += 1
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+            async def event_stream():
+                await asyncio.sleep(profile.ttft.sample(rng))
+                for i, token in enumerate(reply_tokens):
+                    if i > 0:
+                        await asyncio.sleep(profile.per_token.sample(rng))
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [{
+                            "index": 0,
+                            "delta": {"role": "assistant", "content": token} if i == 0 else {"content": token},
+                            "finish_reason": None,
+                        }],
+                    }
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+                final = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                }
+                yield f"data: {json.dumps(final)}\n\n"
+                if include_usage:
+                    usage_chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [],
+                        "usage": usage,
+                    }
+                    yield f"data: {json.dumps(usage_chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+        # 非流式：总延迟 = TTFT + 每个后续 token 的延迟之和
+        delay = profile.ttft.sample(rng)
+        delay += sum(profile.per_token.sample(rng) for _ in range(max(0, len(reply_tokens) - 1)))
+        await asyncio.sleep(delay)
+
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(reply_tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }
+
+    app.add_api_route("/api/v3/chat/completions", chat_completions, methods=["POST"], summary="Ark 兼容对话接口")
+    app.add_api_route("/v1/chat/completions", chat_completions, methods=["POST"], summary="OpenAI 兼容对话接口")
+
+    @app.get("/mock/stats", summary="模拟服务统计")
+    async def get_stats():
+        return {
+            "config": asdict(state["config"]),
+            "latency": {
+                "ttft": state["profile"].ttft.describe(),
+                "per_token": state["profile"].per_token.describe(),
+            },
+            "stats": asdict(stats),
+        }
+
+    @app.post("/mock/config", summary="运行时修改配置")
+    async def update_config(changes: Dict[str, Any]):
+        """压测过程中动态调整错误率或延迟配置，例如模拟上游故障"""
+        current = asdict(state["config"])
+        unknown = set(changes) - set(current)
+        if unknown:
+            return error_response(400, "InvalidParameter", f"未知配置项: {', '.join(sorted(unknown))}")
+        current.update(changes)
+        new_config = MockArkConfig(**current)
+        try:
+            new_profile = new_config.latency_profile()
+        except ValueError as e:
+            return error_response(400, "InvalidParameter", str(e))
+        state["config"], state["profile"] = new_config, new_profile
+        logger.info(f"模拟服务配置已更新: {changes}")
+        return {"config": asdict(new_config)}
+
+    @app.post("/mock/reset", summary="重置统计")
+    async def reset_stats():
+        for name, value in asdict(MockArkStats()).items():
+            setattr(stats, name, value)
+        return {"stats": asdict(stats)}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AURA STUDIO 本地 Ark 模拟服务")
+    parser.add_argument("--host", default=os.getenv("MOCK_ARK_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MOCK_ARK_PORT", "8100")))
+    parser.add_argument("--profile", choices=sorted(LATENCY_PROFILES), help="预置延迟配置")
+    parser.add_argument("--ttft", help='首 token 延迟分布，例如 "lognormal:0.6,0.4"')
+    parser.add_argument("--per-token", help='逐 token 延迟分布，例如 "normal:0.02,0.005"')
+    parser.add_argument("--error-rate", type=float, help="注入 500 错误的概率")
+    parser.add_argument("--rate-limit-rate", type=float, help="注入 429 限流的概率")
+    parser.add_argument("--reply-tokens", type=int, help="默认回复长度")
+    parser.add_argument("--seed", type=int, help="随机种子，便于复现")
+    args = parser.parse_args()
+
+    config = MockArkConfig.from_env()
+    for name in ("profile", "ttft", "per_token", "error_rate", "rate_limit_rate", "reply_tokens", "seed"):
+        value = getattr(args, name)
+        if value is not None:
+            setattr(config, name, value)
+
+    import uvicorn
+    logger.info(f"启动模拟 Ark 服务: http://{args.host}:{args.port}/api/v3 (profile={config.profile})")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
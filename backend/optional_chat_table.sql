@@ -14,10 +14,17 @@ CREATE TABLE chat_messages (
 );
 
 -- 创建索引
-CREATE INDEX idx_chat_messages_user_guide ON chat_messages (user_id, guide_id);
+-- 对话历史按 (user_id, guide_id) 过滤、按 (created_at, id) 倒序分页，索引顺序与查询一致，不需要排序
+CREATE INDEX IF NOT EXISTS idx_chat_messages_conversation ON chat_messages (user_id, guide_id, created_at DESC, id DESC);
+-- 分析数据导出按 created_at 增量读取
 CREATE INDEX idx_chat_messages_created_at ON chat_messages (created_at);
 CREATE INDEX idx_chat_messages_session ON chat_messages (session_id);
 
+-- 已有数据的库升级：在线建新索引后删除被它覆盖的旧索引（CONCURRENTLY 不能在事务中执行）
+-- CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_chat_messages_conversation
+--     ON chat_messages (user_id, guide_id, created_at DESC, id DESC);
+-- DROP INDEX CONCURRENTLY IF EXISTS idx_chat_messages_user_guide;
+
 -- RLS策略
 ALTER TABLE chat_messages ENABLE ROW LEVEL SECURITY;
 CREATE POLICY "用户只能查看自己的对话" ON chat_messages FOR SELECT USING (auth.uid() = user_id);
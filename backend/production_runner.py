@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 生产环境进程管理
+基于 gunicorn + UvicornWorker 运行多个 worker，配置见 gunicorn_conf.py
+
+使用方法：
+python production_runner.py start            # 前台启动（pm2/systemd 托管）
+python production_runner.py start --daemon   # 后台启动
+python production_runner.py reload           # 零停机滚动重启（加载新代码）
+python production_runner.py status           # 查看 master 和各 worker 状态
+python production_runner.py stop             # 优雅停止
+
+滚动重启流程（preload 模式下 HUP 不会重新导入代码，因此使用 USR2）：
+1. 向旧 master 发送 USR2，启动加载新代码的新 master，监听套接字被继承，不中断连接
+2. 等待新 master 的全部 worker 完成 startup 事件并写出就绪状态
+3. 向旧 master 发送 TERM，旧 worker 处理完进行中的请求后退出
+新 worker 在超时时间内未就绪时终止新 master，旧进程继续提供服务
+"""
+
+import os
+import sys
+import time
+import signal
+import argparse
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+
+import gunicorn_conf
+from worker_health import read_worker_statuses, pid_alive
+
+
+def read_pid(path: str) -> Optional[int]:
+    try:
+        with open(path) as f:
+            pid = int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+    return pid if pid_alive(pid) else None
+
+
+def master_pid() -> Optional[int]:
+    return read_pid(gunicorn_conf.pidfile)
+
+
+def workers_of(master: int, statuses: Optional[List[Dict]] = None) -> List[Dict]:
+    statuses = read_worker_statuses() if statuses is None else statuses
+    return [s for s in statuses if s.get("ppid") == master and pid_alive(s["pid"])]
+
+
+def wait_for(predicate, timeout: float, interval: float = 0.5) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return predicate()
+
+
+# ==================== 命令 ====================
+
+def cmd_start(args) -> int:
+    if master_pid():
+        print(f"❌ 服务已在运行 (master pid {master_pid()})")
+        return 1
+
+    argv = ["gunicorn", "-c", os.path.join(BACKEND_DIR, "gunicorn_conf.py")]
+    if args.daemon:
+        argv.append("--daemon")
+    print(f"🚀 启动 {gunicorn_conf.wsgi_app}: {gunicorn_conf.workers} 个 worker, 监听 {gunicorn_conf.bind}")
+    os.chdir(BACKEND_DIR)
+    if not args.daemon:
+        os.execvp(argv[0], argv)
+
+    import subprocess
+    subprocess.check_call(argv)
+    if not wait_for(lambda: len(workers_of(master_pid() or -1)) >= gunicorn_conf.workers, args.timeout):
+        print("⚠️ 部分 worker 未在超时时间内启动，请检查日志")
+        return 1
+    print(f"✅ 已启动 (master pid {master_pid()})")
+    return 0
+
+
+def cmd_reload(args) -> int:
+    old_master = master_pid()
+    if not old_master:
+        print("❌ 服务未运行")
+        return 1
+
+    print(f"🔄 滚动重启: 旧 master {old_master}")
+    os.kill(old_master, signal.SIGUSR2)
+
+    def find_new_master() -> Optional[int]:
+        # 新 master 在旧 master 退出前写 <pidfile>.2，旧版本 gunicorn 则把旧 pid 移到 .oldbin
+        pid = read_pid(gunicorn_conf.pidfile + ".2") or master_pid()
+        return pid if pid and pid != old_master else None
+
+    if not wait_for(lambda: find_new_master() is not None, args.timeout):
+        print("❌ 新 master 未启动，保持旧进程运行")
+        return 1
+    new_master = find_new_master()
+
+    def new_workers_ready():
+        ready = [s for s in workers_of(new_master) if s.get("ready")]
+        return len(ready) >= gunicorn_conf.workers
+
+    if not wait_for(new_workers_ready, args.timeout):
+        print(f"❌ 新 worker 未就绪，终止新 master {new_master}，旧进程继续服务")
+        os.kill(new_master, signal.SIGTERM)
+        return 1
+
+    print(f"✅ 新 master {new_master} 的 {gunicorn_conf.workers} 个 worker 已就绪，优雅停止旧 master")
+    os.kill(old_master, signal.SIGTERM)
+    wait_for(lambda: not pid_alive(old_master), gunicorn_conf.graceful_timeout + 5)
+    return 0
+
+
+def cmd_stop(args) -> int:
+    pid = master_pid()
+    if not pid:
+        print("ℹ️ 服务未运行")
+        return 0
+    os.kill(pid, signal.SIGTERM)
+    if wait_for(lambda: not pid_alive(pid), gunicorn_conf.graceful_timeout + 5):
+        print("🛑 已停止")
+        return 0
+    print("⚠️ 优雅停止超时，强制结束")
+    os.kill(pid, signal.SIGKILL)
+    return 1
+
+
+def cmd_status(args) -> int:
+    pid = master_pid()
+    if not pid:
+        print("❌ 服务未运行")
+        return 1
+
+    workers = workers_of(pid)
+    print(f"master pid {pid}, worker {len(workers)}/{gunicorn_conf.workers}")
+    print(f"{'pid':>8} {'就绪':>4} {'运行(s)':>10} {'请求数':>8} {'处理中':>6} {'内存(MB)':>9} {'心跳(s前)':>10}")
+    now = time.time()
+    for status in workers:
+        print(f"{status['pid']:>8} {'是' if status.get('ready') else '否':>4} "
+              f"{now - status['started_at']:>10.0f} {status['requests_served']:>8} "
+              f"{status['in_flight']:>6} {status['rss_mb']:>9.1f} {now - status['heartbeat']:>10.0f}")
+    return 0 if len(workers) >= gunicorn_conf.workers else 1
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="AURA STUDIO 生产环境进程管理")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    start = sub.add_parser("start", help="启动服务")
+    start.add_argument("--daemon", action="store_true", help="后台运行")
+    start.add_argument("--timeout", type=float, default=60, help="等待 worker 启动的秒数")
+
+    reload = sub.add_parser("reload", help="零停机滚动重启")
+    reload.add_argument("--timeout", type=float, default=60, help="等待新 worker 就绪的秒数")
+
+    sub.add_parser("stop", help="优雅停止")
+    sub.add_parser("status", help="查看状态")
+
+    args = parser.parse_args(argv)
+    handlers = {"start": cmd_start, "reload": cmd_reload, "stop": cmd_stop, "status": cmd_status}
+    return handlers[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,6 +11,10 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List, Optional
 from supabase_auth import get_current_user, get_optional_user, AuthenticatedUser
 from supabase_integration import get_client
+from storage_engine import SupabaseRepository
+from timer_events import timer_hub, publish_session_change
+from fast_json import ok
+from field_projection import parse_fields
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,6 +22,14 @@ logger = logging.getLogger(__name__)
 # 创建路由器
 router = APIRouter(prefix="/api", tags=["认证保护的路由"])
 
+# 列表接口返回的字段（可以用 fields= 只取其中一部分）；datetime/date 由 orjson 直接编码为 ISO 格式，不需要逐行 isoformat()
+SESSION_FIELDS = ("id", "timer_type_id", "planned_duration", "actual_duration", "started_at", "ended_at", "completed")
+DAILY_LOG_FIELDS = ("log_date", "total_focus_time", "total_sessions", "completed_sessions", "deep_work_count",
+                    "deep_work_time", "break_count", "break_time", "roundtable_count", "roundtable_time")
+# 构造 TimerSession / DailyLog 必需的列，按字段投影查询时总是 select
+SESSION_KEYS = ("id", "user_id", "timer_type_id")
+DAILY_LOG_KEYS = ("id", "user_id", "log_date")
+
 
 @router.get("/profile")
 async def get_user_profile(
@@ -51,7 +63,8 @@ async def get_user_profile(
 @router.get("/timer/sessions")
 async def get_user_timer_sessions(
     current_user: AuthenticatedUser = Depends(get_current_user),
-    limit: int = 20
+    limit: int = 20,
+    fields: Optional[str] = None
 ):
     """获取用户的计时器会话历史
     
@@ -59,7 +72,13 @@ async def get_user_timer_sessions(
     1. 使用认证用户的 ID 查询数据
     2. 确保用户只能访问自己的数据
     3. 与 Supabase 集成模块配合使用
+    4. fields=started_at,actual_duration 只查询和返回指定字段
     """
+    try:
+        selected = parse_fields(fields, SESSION_FIELDS) or SESSION_FIELDS
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
     try:
         # 获取 Supabase 客户端
         client = await get_client()
@@ -67,30 +86,18 @@ async def get_user_timer_sessions(
         # 使用认证用户的 ID 查询会话数据
         sessions = await client.get_user_sessions(
             user_id=current_user.user_id,
-            limit=limit
+            limit=limit,
+            columns=",".join(dict.fromkeys(SESSION_KEYS + selected))
         )
         
         # 转换数据格式以便前端使用
-        session_data = []
-        for session in sessions:
-            session_data.append({
-                "id": session.id,
-                "timer_type_id": session.timer_type_id,
-                "planned_duration": session.planned_duration,
-                "actual_duration": session.actual_duration,
-                "started_at": session.started_at.isoformat() if session.started_at else None,
-                "ended_at": session.ended_at.isoformat() if session.ended_at else None,
-                "completed": session.completed
-            })
+        session_data = [{field: getattr(session, field) for field in selected} for session in sessions]
         
-        return {
-            "success": True,
-            "data": {
-                "sessions": session_data,
-                "total": len(session_data),
-                "user_id": current_user.user_id
-            }
-        }
+        return ok({
+            "sessions": session_data,
+            "total": len(session_data),
+            "user_id": current_user.user_id
+        })
         
     except Exception as e:
         logger.error(f"获取用户会话失败: {e}")
@@ -127,15 +134,14 @@ async def start_timer_session(
         )
         
         if session_id:
-            return {
-                "success": True,
-                "data": {
-                    "session_id": session_id,
-                    "user_id": current_user.user_id,
-                    "timer_type_id": timer_type_id,
-                    "planned_duration": planned_duration
-                }
+            session = {
+                "session_id": session_id,
+                "user_id": current_user.user_id,
+                "timer_type_id": timer_type_id,
+                "planned_duration": planned_duration
             }
+            timer_hub.publish(current_user.user_id, {"type": "session_started", "session": session})
+            return {"success": True, "data": session}
         else:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -192,6 +198,13 @@ async def end_timer_session(
         if success:
             # 生成或更新每日日志
             await client.generate_daily_log(current_user.user_id)
+            # 推送给该用户打开的页面（/ws/timer、/api/timer/stream），附带更新后的统计
+            await publish_session_change(
+                current_user.user_id,
+                {"type": "session_completed",
+                 "session": {"session_id": session_id, "actual_duration": actual_duration, "completed": completed}},
+                SupabaseRepository(client)
+            )
             
             return {
                 "success": True,
@@ -222,12 +235,18 @@ async def end_timer_session(
 @router.get("/logs/daily")
 async def get_daily_logs(
     days: int = 7,
-    current_user: AuthenticatedUser = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user),
+    fields: Optional[str] = None
 ):
     """获取用户的每日日志
     
-    这个路由展示了如何获取用户的统计数据
+    这个路由展示了如何获取用户的统计数据，fields= 只查询和返回指定字段
     """
+    try:
+        selected = parse_fields(fields, DAILY_LOG_FIELDS) or DAILY_LOG_FIELDS
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
     try:
         # 获取 Supabase 客户端
         client = await get_client()
@@ -235,33 +254,18 @@ async def get_daily_logs(
         # 获取用户的每日日志
         logs = await client.get_user_daily_logs(
             user_id=current_user.user_id,
-            days=days
+            days=days,
+            columns=",".join(dict.fromkeys(DAILY_LOG_KEYS + selected))
         )
         
         # 转换数据格式
-        log_data = []
-        for log in logs:
-            log_data.append({
-                "log_date": log.log_date.isoformat(),
-                "total_focus_time": log.total_focus_time,
-                "total_sessions": log.total_sessions,
-                "completed_sessions": log.completed_sessions,
-                "deep_work_count": log.deep_work_count,
-                "deep_work_time": log.deep_work_time,
-                "break_count": log.break_count,
-                "break_time": log.break_time,
-                "roundtable_count": log.roundtable_count,
-                "roundtable_time": log.roundtable_time
-            })
+        log_data = [{field: getattr(log, field) for field in selected} for log in logs]
         
-        return {
-            "success": True,
-            "data": {
-                "logs": log_data,
-                "total_days": len(log_data),
-                "user_id": current_user.user_id
-            }
-        }
+        return ok({
+            "logs": log_data,
+            "total_days": len(log_data),
+            "user_id": current_user.user_id
+        })
         
     except Exception as e:
         logger.error(f"获取每日日志失败: {e}")
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 超时计时器会话回收
+客户端关闭页面或断网后，已开始的会话会一直处于进行中；回收任务在
+started_at + planned_duration + 宽限期 之后把它们标记为未完成结束（completed=False），
+actual_duration 记为计划时长，ended_at 记为计划结束时间，不计入专注时长
+
+- 截止时间放在最小堆里，任务只在最早的截止时间到达时醒来，不做全表扫描
+- 新会话开始时 schedule()，正常完成时 cancel()（惰性删除，出堆时跳过）
+- 到期的会话按批关闭，每批每个 (用户, 日期) 只重建一次日志
+- 启动时以及每隔 SESSION_REAPER_RELOAD 秒通过进行中会话的部分索引按 (started_at, id) 分页重新加载，
+  覆盖重启前开始的会话和其他 worker 开始的会话；关闭是条件更新，多个 worker 同时回收也不会重复
+- 数据库不可用时加载或关闭失败，按指数退避（带抖动，上限 max_sleep）重试，成功后恢复按截止时间唤醒
+
+使用方法：
+from session_reaper import SessionReaper
+
+reaper = SessionReaper(lambda: repository)
+await reaper.load()
+reaper.start()
+reaper.schedule(session_id, user_id, started_at, planned_duration)
+"""
+
+import os
+import heapq
+import random
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from clock import Clock, get_clock, ensure_utc
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# 每个 worker 都会重新加载全部进行中的会话，取最大值而不是求和
+REAPER_SCHEDULED = REGISTRY.gauge("aura_session_reaper_scheduled", "等待超时回收的进行中会话数",
+                                  multiprocess_mode="max")
+REAPER_CLOSED = REGISTRY.counter("aura_session_reaper_closed_total", "超时后被自动关闭的会话数")
+
+
+class SessionReaper:
+    """按截止时间回收超时会话"""
+
+    def __init__(self, get_repository: Callable[[], Any], grace: float = None, batch_size: int = None,
+                 reload_interval: float = None, max_sleep: float = 60.0, clock: Clock = None,
+                 on_closed: Callable[[List[Dict[str, Any]]], Awaitable[None]] = None, page_size: int = None,
+                 retry_base: float = 1.0, rng: Optional[random.Random] = None):
+        self.get_repository = get_repository
+        self.grace = grace if grace is not None else float(os.getenv("SESSION_REAPER_GRACE", "1800"))
+        self.batch_size = batch_size or int(os.getenv("SESSION_REAPER_BATCH", "200"))
+        # 不超过 PostgREST 默认的 max-rows（1000），否则每页会被截断
+        self.page_size = page_size or int(os.getenv("SESSION_REAPER_PAGE", "1000"))
+        self.reload_interval = reload_interval if reload_interval is not None else \
+            float(os.getenv("SESSION_REAPER_RELOAD", "600"))
+        self.max_sleep = max_sleep
+        # 加载或关闭失败后的等待：retry_base * 2^(连续失败次数 - 1)，带抖动，不超过 max_sleep
+        self.retry_base = retry_base
+        self.rng = rng or random.Random()
+        self._failures = 0
+        self._clock = clock
+        self.on_closed = on_closed
+        # (截止时间, session_id)；_deadlines 为权威记录，堆中与之不一致的条目在出堆时跳过
+        self._heap: List[tuple] = []
+        self._deadlines: Dict[str, datetime] = {}
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loaded_at: Optional[datetime] = None
+
+    @property
+    def clock(self) -> Clock:
+        return self._clock or get_clock()
+
+    @property
+    def scheduled(self) -> int:
+        return len(self._deadlines)
+
+    def deadline_of(self, started_at: datetime, planned_duration: int) -> datetime:
+        return ensure_utc(started_at) + timedelta(seconds=(planned_duration or 0) + self.grace)
+
+    def schedule(self, session_id: str, user_id: str, started_at, planned_duration: int):
+        """登记进行中的会话；重复登记同一会话会覆盖原截止时间"""
+        if isinstance(started_at, str):
+            started_at = datetime.fromisoformat(started_at)
+        started_at = ensure_utc(started_at)
+        deadline = self.deadline_of(started_at, planned_duration)
+        self._sessions[session_id] = {"session_id": session_id, "user_id": user_id,
+                                      "started_at": started_at, "planned_duration": planned_duration or 0}
+        if self._deadlines.get(session_id) == deadline:
+            # 重新加载时已登记的会话不再重复入堆
+            return
+        self._deadlines[session_id] = deadline
+        heapq.heappush(self._heap, (deadline, session_id))
+        REAPER_SCHEDULED.set(self.scheduled)
+        # 新的截止时间早于当前等待的时间时唤醒任务
+        if self._wakeup is not None and self._heap[0][1] == session_id:
+            self._wakeup.set()
+
+    def cancel(self, session_id: str):
+        """会话已正常结束"""
+        if self._deadlines.pop(session_id, None) is not None:
+            self._sessions.pop(session_id, None)
+            REAPER_SCHEDULED.set(self.scheduled)
+
+    def next_deadline(self) -> Optional[datetime]:
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def _pop_due(self, now: datetime) -> List[Dict[str, Any]]:
+        due = []
+        while len(due) < self.batch_size:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > now:
+                break
+            _, session_id = heapq.heappop(self._heap)
+            self._deadlines.pop(session_id, None)
+            due.append(self._sessions.pop(session_id))
+        REAPER_SCHEDULED.set(self.scheduled)
+        return due
+
+    async def load(self) -> int:
+        """从数据库按 (started_at, session_id) 分页加载所有进行中的会话"""
+        repository, after, total = self.get_repository(), None, 0
+        while True:
+            sessions = await repository.get_open_sessions(limit=self.page_size, after=after)
+            for session in sessions:
+                self.schedule(session["session_id"], session["user_id"], session["started_at"],
+                              session["planned_duration"])
+            total += len(sessions)
+            if len(sessions) < self.page_size:
+                break
+            after = (sessions[-1]["started_at"], sessions[-1]["session_id"])
+        self._loaded_at = self.clock.now()
+        return total
+
+    async def reap_once(self) -> int:
+        """关闭所有已到期的会话，返回关闭数"""
+        total = 0
+        while True:
+            due = self._pop_due(self.clock.now())
+            if not due:
+                return total
+            closures = [
+                {**session,
+                 "ended_at": session["started_at"] + timedelta(seconds=session["planned_duration"]),
+                 "actual_duration": session["planned_duration"]}
+                for session in due
+            ]
+            try:
+                closed = await self.get_repository().close_overdue_sessions(closures)
+            except Exception:
+                # 数据库暂时不可用：放回堆里，下次再试
+                for session in due:
+                    self.schedule(**{k: session[k] for k in ("session_id", "user_id", "started_at",
+                                                                "planned_duration")})
+                raise
+            REAPER_CLOSED.inc(len(closed))
+            total += len(closed)
+            if closed:
+                logger.info(f"已自动关闭 {len(closed)} 个超时会话")
+                if self.on_closed is not None:
+                    await self.on_closed(closed)
+
+    def retry_delay(self) -> float:
+        """连续失败后的等待时间：指数增长，在上限的一半到上限之间随机，避免多个 worker 同时重试"""
+        ceiling = min(self.max_sleep, self.retry_base * (2 ** (self._failures - 1)))
+        return self.rng.uniform(ceiling / 2, ceiling)
+
+    async def _run(self):
+        while True:
+            try:
+                now = self.clock.now()
+                if self._loaded_at is None or (now - self._loaded_at).total_seconds() >= self.reload_interval:
+                    await self.load()
+                await self.reap_once()
+                self._failures = 0
+            except Exception as e:
+                self._failures += 1
+                delay = self.retry_delay()
+                logger.error(f"超时会话回收失败（连续 {self._failures} 次），{delay:.1f} 秒后重试: {e}")
+                # 失败放回的会话截止时间已过，不能按截止时间等待；退避期间新登记的会话也不提前唤醒
+                await asyncio.sleep(delay)
+                continue
+
+            deadline = self.next_deadline()
+            delay = self.max_sleep
+            if deadline is not None:
+                delay = min(delay, max(0.0, (deadline - self.clock.now()).total_seconds()))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """启动后台回收任务（在事件循环中调用）"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 启动预热
+Supabase 客户端、JWT 认证和 Ark 客户端都在第一次使用时才创建。
+设置 STARTUP_WARMUP=1 后，worker 会在 startup 阶段（接收请求之前）提前创建它们，
+把首个请求的冷启动开销移到启动阶段；默认关闭，导入和测试收集保持轻量
+
+- 客户端创建后各发一次轻量请求，DNS 解析和 TLS 握手在启动阶段完成，连接留在客户端的连接池中
+- 存储引擎打开后调用 warm_up_repository()：预先建立 WARMUP_DB_CONNECTIONS 个数据库连接、
+  在每个连接上准备热点查询，并填充参考数据缓存
+- 预热在 startup 事件中完成，之后 worker 才标记为就绪（worker_health）、依赖探测才开始
+  （health_probe），滚动重启时新 worker 接到的第一批请求不再有冷启动延迟
+
+使用方法：
+from startup_warmup import install_lifecycle, warm_up_repository
+install_lifecycle(app)
+await warm_up_repository(repository)  # 在应用自己的 startup 事件中、打开存储引擎之后
+"""
+
+import os
+import time
+import asyncio
+import inspect
+import logging
+from typing import Awaitable, Callable, Dict, List, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+WarmupStep = Callable[[], Union[None, Awaitable[None]]]
+
+_steps: List[Tuple[str, WarmupStep]] = []
+
+
+def warmup_enabled() -> bool:
+    return os.getenv("STARTUP_WARMUP", "").lower() in ("1", "true", "yes", "on")
+
+
+def register_warmup(name: str, step: WarmupStep):
+    """注册一个预热步骤，同名步骤只保留最后一次注册"""
+    global _steps
+    _steps = [(n, s) for n, s in _steps if n != name]
+    _steps.append((name, step))
+
+
+async def run_warmup() -> Dict[str, float]:
+    """依次执行预热步骤，返回每一步的耗时（秒）
+
+    单个步骤失败只记录日志，不阻止应用启动；对应的单例会在第一次请求时再尝试创建
+    """
+    durations = {}
+    for name, step in list(_steps):
+        start = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(step):
+                await step()
+            else:
+                # 同步步骤通常包含较慢的模块导入，放到线程中避免阻塞事件循环
+                await asyncio.get_running_loop().run_in_executor(None, step)
+            durations[name] = time.perf_counter() - start
+            logger.info(f"预热完成: {name} ({durations[name] * 1000:.0f}ms)")
+        except Exception as e:
+            durations[name] = time.perf_counter() - start
+            logger.warning(f"预热失败: {name}: {e}")
+    return durations
+
+
+async def warm_up_repository(repository) -> Dict[str, float]:
+    """预热存储引擎（连接池、热点语句、参考数据缓存），未开启预热时直接返回"""
+    if not warmup_enabled() or repository is None:
+        return {}
+    connections = int(os.getenv("WARMUP_DB_CONNECTIONS", "0"))
+    start = time.perf_counter()
+    try:
+        summary = await repository.warm_up(connections)
+        logger.info(f"预热完成: {repository.name} 存储引擎 {summary} "
+                    f"({(time.perf_counter() - start) * 1000:.0f}ms)")
+    except Exception as e:
+        logger.warning(f"预热失败: {repository.name} 存储引擎: {e}")
+    return {"repository": time.perf_counter() - start}
+
+
+# ==================== 默认步骤 ====================
+
+async def _warm_supabase_client():
+    from supabase_integration import get_client
+    client = await get_client()
+    # 发一次轻量查询，提前完成 DNS 解析和 TLS 握手
+    await client.health_check()
+
+
+def _warm_supabase_auth():
+    from supabase_auth import get_supabase_auth
+    get_supabase_auth()
+
+
+def _warm_ark_client():
+    from llm_client import get_ark_client
+    client = get_ark_client()
+    # SDK 内部的 httpx 客户端：不带密钥请求模型列表，握手后的连接留在其连接池中，不消耗 token
+    http = getattr(client, "_client", None)
+    if http is not None:
+        http.get(str(client.base_url).rstrip("/") + "/models")
+
+
+register_warmup("supabase_client", _warm_supabase_client)
+register_warmup("supabase_auth", _warm_supabase_auth)
+register_warmup("ark_client", _warm_ark_client)
+
+
+def _release_singletons():
+    """关闭 worker 时关闭并丢弃各单例，Supabase / Ark 客户端的 HTTP 连接池随之关闭
+
+    这些客户端都在 worker 中第一次使用或预热时才创建，preload 的 master 不持有连接，fork 后不会共享
+    """
+    from supabase_integration import reset_client
+    from supabase_auth import reset_supabase_auth
+    from llm_client import reset_ark_client
+    from llm_resilience import llm_resilience
+
+    reset_client()
+    reset_supabase_auth()
+    reset_ark_client()
+    llm_resilience.shutdown()
+
+
+def install_lifecycle(app):
+    """注册启动预热（可选）和关闭时的单例释放"""
+
+    async def on_startup():
+        if warmup_enabled():
+            durations = await run_warmup()
+            logger.info(f"启动预热总耗时 {sum(durations.values()) * 1000:.0f}ms")
+
+    async def on_shutdown():
+        _release_singletons()
+
+    app.on_event("startup")(on_startup)
+    app.on_event("shutdown")(on_shutdown)
@@ -21,6 +21,8 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
+from tracing import traced
+
 # 加载环境变量
 load_dotenv()
 
@@ -79,6 +81,7 @@ class SupabaseAuth:
         
         logger.info("Supabase 认证模块初始化成功")
     
+    @traced("auth.verify_jwt", kind="cpu")
     def verify_token(self, token: str) -> Optional[AuthenticatedUser]:
         """验证 JWT Token 并提取用户信息
         
@@ -172,9 +175,42 @@ class SupabaseAuth:
             return None
 
 
-# 创建全局认证实例
-# 这个实例会在整个应用中重复使用
-supabase_auth = SupabaseAuth()
+# 全局认证实例，第一次验证 Token 时创建并在整个应用中重复使用
+# 延迟创建可以避免缺少环境变量时导入本模块直接失败
+_supabase_auth: Optional[SupabaseAuth] = None
+
+
+def get_supabase_auth() -> SupabaseAuth:
+    """获取全局认证实例（首次调用时创建）"""
+    global _supabase_auth
+    if _supabase_auth is None:
+        _supabase_auth = SupabaseAuth()
+    return _supabase_auth
+
+
+def _require_supabase_auth() -> SupabaseAuth:
+    """在请求中获取认证实例，配置缺失时返回 503 而不是 500"""
+    try:
+        return get_supabase_auth()
+    except ValueError as e:
+        logger.error(f"认证模块未配置: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="认证服务未配置"
+        )
+
+
+def reset_supabase_auth():
+    """丢弃当前认证实例，下次调用时重新读取环境变量"""
+    global _supabase_auth
+    _supabase_auth = None
+
+
+def __getattr__(name: str):
+    # 兼容旧代码 from supabase_auth import supabase_auth
+    if name == "supabase_auth":
+        return get_supabase_auth()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # 创建 FastAPI HTTP Bearer 安全方案
 # 这个对象用于从请求头中自动提取 Authorization 信息
@@ -207,7 +243,7 @@ async def get_current_user(
         HTTPException: 认证失败时抛出 401 异常
     """
     # 验证 Token
-    user = supabase_auth.verify_token(credentials.credentials)
+    user = _require_supabase_auth().verify_token(credentials.credentials)
     
     if user is None:
         # 认证失败，抛出 401 未授权异常
@@ -237,7 +273,7 @@ async def get_optional_user(
     if credentials is None:
         return None
     
-    return supabase_auth.verify_token(credentials.credentials)
+    return _require_supabase_auth().verify_token(credentials.credentials)
 
 
 # 便捷函数
@@ -253,7 +289,7 @@ def verify_jwt_token(token: str) -> Optional[Dict[str, Any]]:
     Returns:
         Optional[Dict[str, Any]]: Token 的 payload 信息，验证失败返回 None
     """
-    user = supabase_auth.verify_token(token)
+    user = get_supabase_auth().verify_token(token)
     if user:
         return user.dict()
     return None
@@ -283,7 +319,7 @@ async def example_usage():
     sample_token = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9..."
     
     # 验证 Token
-    user = supabase_auth.verify_token(sample_token)
+    user = get_supabase_auth().verify_token(sample_token)
     
     if user:
         print(f"认证成功! 用户: {user.email}, ID: {user.user_id}")
@@ -13,15 +13,20 @@ AURA STUDIO - Supabase 数据库集成模块
 
 import os
 import uuid
+import asyncio
 import logging
 from datetime import datetime, date, timedelta, timezone
-from typing import List, Optional, Dict, Any
-from dataclasses import dataclass
-from supabase import create_client, Client
+from typing import List, Optional, Dict, Any, Tuple, TYPE_CHECKING
 from postgrest.exceptions import APIError
 import bcrypt
 from dotenv import load_dotenv
 
+from metrics import instrument_methods
+from clock import Clock, get_clock, day_bounds, ensure_utc
+
+if TYPE_CHECKING:
+    from supabase import Client
+
 # 加载环境变量
 load_dotenv()
 
@@ -30,53 +35,149 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-@dataclass
-class User:
+def parse_timestamp(value: str) -> datetime:
+    """PostgREST 返回的 ISO 时间字符串"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+class LazyTemporal:
+    """行对象上的时间/日期字段
+
+    槽位里先保存 PostgREST 返回的原始字符串，第一次读取属性时才解析并写回；
+    只需要把时间原样返回给前端时用 row.iso(name)，完全不解析
+    """
+
+    __slots__ = ("slot", "parse")
+
+    def __init__(self, parse=parse_timestamp):
+        self.parse = parse
+        self.slot = None
+
+    def __set_name__(self, owner, name):
+        self.slot = "_" + name
+
+    def __get__(self, row, owner=None):
+        if row is None:
+            return self
+        value = getattr(row, self.slot)
+        if isinstance(value, str):
+            value = self.parse(value)
+            setattr(row, self.slot, value)
+        return value
+
+    def __set__(self, row, value):
+        setattr(row, self.slot, value)
+
+
+class CompactRow:
+    """带 __slots__ 的行对象：每行不创建 __dict__，时间字段延迟解析
+
+    FIELDS 按构造参数顺序列出字段，DEFAULTS 为可选字段的默认值；
+    子类的 __slots__ 中延迟字段以下划线开头，同名属性为 LazyTemporal。
+    和 dataclass 一样，__init__ 和 from_row 在定义子类时按字段生成，逐行构造时没有循环和字典开销
+    """
+
+    __slots__ = ()
+    FIELDS: Tuple[str, ...] = ()
+    DEFAULTS: Dict[str, Any] = {}
+    _SLOT_OF: Dict[str, str] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._SLOT_OF = {
+            name: vars(cls)[name].slot if isinstance(vars(cls).get(name), LazyTemporal) else name
+            for name in cls.FIELDS
+        }
+        params = ", ".join(f"{name}=_defaults[{name!r}]" if name in cls.DEFAULTS else name for name in cls.FIELDS)
+        assigns = "".join(f"\n    self.{cls._SLOT_OF[name]} = {name}" for name in cls.FIELDS) or "\n    pass"
+        reads = "".join(
+            f"\n    self.{cls._SLOT_OF[name]} = "
+            + (f"row.get({name!r}, _defaults[{name!r}])" if name in cls.DEFAULTS else f"row[{name!r}]")
+            for name in cls.FIELDS)
+        source = (f"def __init__(self, {params}):{assigns}\n"
+                  f"def from_row(row):\n    self = _new(_cls){reads}\n    return self\n")
+        namespace = {"_defaults": cls.DEFAULTS, "_new": object.__new__, "_cls": cls}
+        exec(source, namespace)
+        cls.__init__ = namespace["__init__"]
+        cls.from_row = staticmethod(namespace["from_row"])
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]):
+        """直接由 PostgREST 返回的行构造（忽略多余的列），时间字段不解析；子类定义时生成"""
+        raise NotImplementedError
+
+    def iso(self, name: str) -> Optional[str]:
+        """时间/日期字段的 ISO 字符串；还没解析过时直接返回原始字符串"""
+        value = getattr(self, self._SLOT_OF[name])
+        if value is None:
+            return None
+        if isinstance(value, str):
+            return value[:-1] + '+00:00' if value.endswith('Z') else value
+        return value.isoformat()
+
+    def to_dict(self, raw: bool = True) -> Dict[str, Any]:
+        """raw=True 时时间字段保持原样（未解析时为字符串），False 时解析为 datetime/date"""
+        if raw:
+            return {name: getattr(self, slot) for name, slot in self._SLOT_OF.items()}
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.FIELDS)
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS)
+        return f"{type(self).__name__}({values})"
+
+
+class User(CompactRow):
     """用户数据模型"""
-    id: str
-    email: str
-    username: str
-    avatar_url: Optional[str] = None
-    created_at: Optional[datetime] = None
-    last_login_at: Optional[datetime] = None
+    __slots__ = ("id", "email", "username", "avatar_url", "_created_at", "_last_login_at")
+    FIELDS = ("id", "email", "username", "avatar_url", "created_at", "last_login_at")
+    DEFAULTS = {"avatar_url": None, "created_at": None, "last_login_at": None}
+
+    created_at = LazyTemporal()
+    last_login_at = LazyTemporal()
 
 
-@dataclass
-class TimerSession:
+class TimerSession(CompactRow):
     """计时器会话数据模型"""
-    id: str
-    user_id: str
-    timer_type_id: int
-    audio_track_id: Optional[int] = None
-    planned_duration: int = 0
-    actual_duration: Optional[int] = None
-    started_at: datetime = None
-    ended_at: Optional[datetime] = None
-    completed: bool = False
-
-
-@dataclass
-class DailyLog:
+    __slots__ = ("id", "user_id", "timer_type_id", "audio_track_id", "planned_duration", "actual_duration",
+                 "_started_at", "_ended_at", "completed")
+    FIELDS = ("id", "user_id", "timer_type_id", "audio_track_id", "planned_duration", "actual_duration",
+              "started_at", "ended_at", "completed")
+    DEFAULTS = {"audio_track_id": None, "planned_duration": 0, "actual_duration": None, "started_at": None,
+                "ended_at": None, "completed": False}
+
+    started_at = LazyTemporal()
+    ended_at = LazyTemporal()
+
+
+class DailyLog(CompactRow):
     """用户日志数据模型"""
-    id: str
-    user_id: str
-    log_date: date
-    total_focus_time: int = 0
-    total_sessions: int = 0
-    completed_sessions: int = 0
-    deep_work_count: int = 0
-    deep_work_time: int = 0
-    break_count: int = 0
-    break_time: int = 0
-    roundtable_count: int = 0
-    roundtable_time: int = 0
+    __slots__ = ("id", "user_id", "_log_date", "total_focus_time", "total_sessions", "completed_sessions",
+                 "deep_work_count", "deep_work_time", "break_count", "break_time", "roundtable_count",
+                 "roundtable_time")
+    FIELDS = ("id", "user_id", "log_date", "total_focus_time", "total_sessions", "completed_sessions",
+              "deep_work_count", "deep_work_time", "break_count", "break_time", "roundtable_count",
+              "roundtable_time")
+    DEFAULTS = {name: 0 for name in FIELDS[3:]}
+
+    log_date = LazyTemporal(date.fromisoformat)
 
 
+@instrument_methods("db", "supabase")
 class SupabaseClient:
     """Supabase 数据库客户端封装类"""
     
-    def __init__(self):
-        """初始化 Supabase 客户端"""
+    def __init__(self, clock: Clock = None):
+        """初始化 Supabase 客户端
+
+        Args:
+            clock: 时间来源，默认使用全局时钟（测试中可传入 VirtualClock）
+        """
+        self._clock = clock
         self.supabase_url = os.getenv("SUPABASE_URL")
         self.supabase_anon_key = os.getenv("SUPABASE_ANON_KEY")
         self.supabase_service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
@@ -89,15 +190,39 @@ class SupabaseClient:
             raise ValueError("SUPABASE_URL 必须是有效的 HTTPS URL")
         
         try:
+            # supabase 包导入较慢，延迟到第一次创建客户端时
+            from supabase import create_client
+
             # 创建客户端实例
-            self.client: Client = create_client(self.supabase_url, self.supabase_anon_key)
-            self.admin_client: Client = create_client(self.supabase_url, self.supabase_service_key) if self.supabase_service_key else None
+            self.client: "Client" = create_client(self.supabase_url, self.supabase_anon_key)
+            self.admin_client: "Client" = create_client(self.supabase_url, self.supabase_service_key) if self.supabase_service_key else None
             
             logger.info("Supabase 客户端初始化成功")
         except Exception as e:
             logger.error(f"Supabase 客户端初始化失败: {e}")
             raise
     
+    @property
+    def clock(self) -> Clock:
+        return self._clock or get_clock()
+
+    def close(self):
+        """关闭 supabase-py 客户端持有的 HTTP 连接池（PostgREST、Auth，以及用到过的 Storage / Functions）"""
+        for client in (self.client, getattr(self, "admin_client", None)):
+            if client is None:
+                continue
+            sessions = [getattr(getattr(client, "_postgrest", None), "session", None),
+                        getattr(getattr(client, "_storage", None), "session", None),
+                        getattr(getattr(client, "_functions", None), "_client", None),
+                        getattr(getattr(client, "auth", None), "_http_client", None)]
+            for session in sessions:
+                if session is None:
+                    continue
+                try:
+                    session.close()
+                except Exception as e:
+                    logger.warning(f"关闭 Supabase 连接失败: {e}")
+    
     def _hash_password(self, password: str) -> str:
         """密码哈希加密"""
         salt = bcrypt.gensalt()
@@ -134,12 +259,12 @@ class SupabaseClient:
                         # 更新现有用户的ID
                         client.table("users").update({
                             "id": auth_user_id,
-                            "last_login_at": datetime.now(timezone.utc).isoformat()
+                            "last_login_at": self.clock.now().isoformat()
                         }).eq("email", email).execute()
                     else:
                         # ID相同，只更新最后登录时间
                         client.table("users").update({
-                            "last_login_at": datetime.now(timezone.utc).isoformat()
+                            "last_login_at": self.clock.now().isoformat()
                         }).eq("id", auth_user_id).execute()
                     
                     return User(
@@ -147,8 +272,8 @@ class SupabaseClient:
                         email=existing_user["email"],
                         username=existing_user["username"],
                         avatar_url=existing_user.get("avatar_url"),
-                        created_at=datetime.fromisoformat(existing_user["created_at"].replace('Z', '+00:00')) if existing_user.get("created_at") else None,
-                        last_login_at=datetime.now(timezone.utc)
+                        created_at=existing_user.get("created_at"),
+                        last_login_at=self.clock.now()
                     )
             except Exception as e:
                 logger.info(f"邮箱查找异常: {e}")
@@ -164,7 +289,7 @@ class SupabaseClient:
                     
                     # 更新最后登录时间
                     client.table("users").update({
-                        "last_login_at": datetime.now(timezone.utc).isoformat()
+                        "last_login_at": self.clock.now().isoformat()
                     }).eq("id", auth_user_id).execute()
                     
                     return User(
@@ -172,8 +297,8 @@ class SupabaseClient:
                         email=user_data["email"],
                         username=user_data["username"],
                         avatar_url=user_data.get("avatar_url"),
-                        created_at=datetime.fromisoformat(user_data["created_at"].replace('Z', '+00:00')) if user_data.get("created_at") else None,
-                        last_login_at=datetime.now(timezone.utc)
+                        created_at=user_data.get("created_at"),
+                        last_login_at=self.clock.now()
                     )
             except Exception as e:
                 logger.info(f"ID查找异常: {e}")
@@ -185,8 +310,8 @@ class SupabaseClient:
                 "email": email,
                 "username": username or email.split('@')[0],  # 如果没有用户名，使用邮箱前缀
                 "password_hash": "supabase_auth_user",  # 标记为Supabase认证用户
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "last_login_at": datetime.now(timezone.utc).isoformat()
+                "created_at": self.clock.now().isoformat(),
+                "last_login_at": self.clock.now().isoformat()
             }
             
             result = client.table("users").insert(user_data).execute()
@@ -199,7 +324,7 @@ class SupabaseClient:
                     email=user_info["email"],
                     username=user_info["username"],
                     avatar_url=user_info.get("avatar_url"),
-                    created_at=datetime.fromisoformat(user_info["created_at"].replace('Z', '+00:00'))
+                    created_at=user_info.get("created_at")
                 )
             else:
                 logger.error("插入用户数据失败：未返回数据")
@@ -225,7 +350,7 @@ class SupabaseClient:
                 "email": email,
                 "username": username,
                 "password_hash": self._hash_password(password),
-                "created_at": datetime.now().isoformat()
+                "created_at": self.clock.now().isoformat()
             }
             
             result = self.client.table("users").insert(user_data).execute()
@@ -238,7 +363,7 @@ class SupabaseClient:
                     email=user_info["email"],
                     username=user_info["username"],
                     avatar_url=user_info.get("avatar_url"),
-                    created_at=datetime.fromisoformat(user_info["created_at"].replace('Z', '+00:00'))
+                    created_at=user_info.get("created_at")
                 )
             
         except APIError as e:
@@ -264,7 +389,7 @@ class SupabaseClient:
             
             # 更新最后登录时间
             self.client.table("users").update({
-                "last_login_at": datetime.now(timezone.utc).isoformat()
+                "last_login_at": self.clock.now().isoformat()
             }).eq("id", user_data["id"]).execute()
             
             logger.info(f"用户登录成功: {email}")
@@ -273,8 +398,8 @@ class SupabaseClient:
                 email=user_data["email"],
                 username=user_data["username"],
                 avatar_url=user_data.get("avatar_url"),
-                created_at=datetime.fromisoformat(user_data["created_at"].replace('Z', '+00:00')) if user_data.get("created_at") else None,
-                last_login_at=datetime.now(timezone.utc)
+                created_at=user_data.get("created_at"),
+                last_login_at=self.clock.now()
             )
             
         except APIError as e:
@@ -293,8 +418,8 @@ class SupabaseClient:
                     email=user_data["email"],
                     username=user_data["username"],
                     avatar_url=user_data.get("avatar_url"),
-                    created_at=datetime.fromisoformat(user_data["created_at"].replace('Z', '+00:00')) if user_data.get("created_at") else None,
-                    last_login_at=datetime.fromisoformat(user_data["last_login_at"].replace('Z', '+00:00')) if user_data.get("last_login_at") else None
+                    created_at=user_data.get("created_at"),
+                    last_login_at=user_data.get("last_login_at")
                 )
             
             return None
@@ -303,21 +428,33 @@ class SupabaseClient:
             logger.error(f"获取用户信息失败: {e}")
             return None
     
+    async def _execute(self, query):
+        """在线程池中执行 PostgREST 请求
+
+        supabase-py 的同步客户端在事件循环上执行会阻塞所有请求，调用方的 asyncio 超时也无法生效
+        （例如计时器写入超时后转入本地日志）；计时器写入路径和它依赖的查询都经过这里
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, query.execute)
+
     # ==================== 计时器会话管理 ====================
     
     async def start_timer_session(self, user_id: str, timer_type_id: int, 
-                                 planned_duration: int, audio_track_id: Optional[int] = None) -> Optional[str]:
-        """开始新的计时器会话"""
+                                 planned_duration: int, audio_track_id: Optional[int] = None,
+                                 session_id: Optional[str] = None,
+                                 started_at: Optional[datetime] = None) -> Optional[str]:
+        """开始新的计时器会话，session_id / started_at 未指定时由数据库和应用时钟生成"""
         try:
             session_data = {
                 "user_id": user_id,
                 "timer_type_id": timer_type_id,
                 "audio_track_id": audio_track_id,
                 "planned_duration": planned_duration,
-                "started_at": datetime.now(timezone.utc).isoformat()
+                "started_at": (started_at or self.clock.now()).isoformat()
             }
+            if session_id:
+                session_data["id"] = session_id
             
-            result = self.client.table("timer_sessions").insert(session_data).execute()
+            result = await self._execute(self.client.table("timer_sessions").insert(session_data))
             
             if result.data:
                 session_id = result.data[0]["id"]
@@ -330,16 +467,17 @@ class SupabaseClient:
             logger.error(f"开始计时器会话失败: {e}")
             return None
     
-    async def end_timer_session(self, session_id: str, actual_duration: int, completed: bool = True) -> bool:
+    async def end_timer_session(self, session_id: str, actual_duration: int, completed: bool = True,
+                                ended_at: Optional[datetime] = None) -> bool:
         """结束计时器会话"""
         try:
             update_data = {
                 "actual_duration": actual_duration,
-                "ended_at": datetime.now(timezone.utc).isoformat(),
+                "ended_at": (ended_at or self.clock.now()).isoformat(),
                 "completed": completed
             }
             
-            result = self.client.table("timer_sessions").update(update_data).eq("id", session_id).execute()
+            result = await self._execute(self.client.table("timer_sessions").update(update_data).eq("id", session_id))
             
             if result.data:
                 logger.info(f"计时器会话结束: {session_id}")
@@ -351,55 +489,165 @@ class SupabaseClient:
             logger.error(f"结束计时器会话失败: {e}")
             return False
     
-    async def get_user_sessions(self, user_id: str, limit: int = 50) -> List[TimerSession]:
-        """获取用户的计时器会话记录"""
+    @staticmethod
+    def _session_from_row(session_data: Dict[str, Any]) -> TimerSession:
+        # 时间字段保留原始字符串，用到时才解析
+        return TimerSession.from_row(session_data)
+
+    async def get_user_sessions(self, user_id: str, limit: int = 50, columns: str = "*") -> List[TimerSession]:
+        """获取用户的计时器会话记录；columns 为 PostgREST select 列表，须包含 id、user_id、timer_type_id"""
         try:
-            result = self.client.table("timer_sessions")\
-                .select("*")\
+            query = self.client.table("timer_sessions")\
+                .select(columns)\
                 .eq("user_id", user_id)\
                 .order("started_at", desc=True)\
-                .limit(limit)\
-                .execute()
+                .limit(limit)
+            result = await self._execute(query)
             
-            sessions = []
-            for session_data in result.data:
-                sessions.append(TimerSession(
-                    id=session_data["id"],
-                    user_id=session_data["user_id"],
-                    timer_type_id=session_data["timer_type_id"],
-                    audio_track_id=session_data.get("audio_track_id"),
-                    planned_duration=session_data["planned_duration"],
-                    actual_duration=session_data.get("actual_duration"),
-                    started_at=datetime.fromisoformat(session_data["started_at"].replace('Z', '+00:00')),
-                    ended_at=datetime.fromisoformat(session_data["ended_at"].replace('Z', '+00:00')) if session_data.get("ended_at") else None,
-                    completed=session_data.get("completed", False)
-                ))
-            
-            return sessions
+            return [self._session_from_row(session_data) for session_data in result.data]
             
         except APIError as e:
             logger.error(f"获取用户会话失败: {e}")
             return []
+
+    async def get_sessions(self, session_ids: List[str]) -> List[TimerSession]:
+        """按 id 获取会话（不限用户），用于批量事件校验会话归属"""
+        if not session_ids:
+            return []
+        try:
+            query = self.client.table("timer_sessions")\
+                .select("*")\
+                .in_("id", list(session_ids))
+            result = await self._execute(query)
+            return [self._session_from_row(session_data) for session_data in result.data]
+
+        except APIError as e:
+            logger.error(f"获取会话失败: {e}")
+            raise
+
+    async def get_open_sessions(self, limit: int = 1000, after: Tuple[datetime, str] = None) -> List[TimerSession]:
+        """获取所有用户进行中的会话，按 (开始时间, id) 升序（走 idx_timer_sessions_open 部分索引）
+
+        只读取超时回收用到的列；PostgREST 的 max-rows 会截断大结果，调用方用 after=(started_at, id) 分页
+        """
+        try:
+            query = self.client.table("timer_sessions")\
+                .select("id, user_id, timer_type_id, started_at, planned_duration")\
+                .is_("ended_at", "null")\
+                .eq("completed", False)
+            if after is not None:
+                iso = ensure_utc(after[0]).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+                query = query.or_(f'started_at.gt."{iso}",and(started_at.eq."{iso}",id.gt.{after[1]})')
+            query = query\
+                .order("started_at")\
+                .order("id")\
+                .limit(limit)
+            result = await self._execute(query)
+            
+            return [self._session_from_row(session_data) for session_data in result.data]
+            
+        except APIError as e:
+            logger.error(f"获取进行中的会话失败: {e}")
+            raise
+
+    async def close_open_sessions(self, closures: List[Dict[str, Any]]) -> List[TimerSession]:
+        """把整批仍在进行中的会话标记为未完成结束，返回实际关闭的会话
+
+        closures: [{session_id, ended_at, actual_duration}]。PATCH 只能给所有行写同一组值，所以分两次请求：
+        先用一条条件 UPDATE（id IN ... AND ended_at IS NULL）认领仍在进行中的会话，已被结束的会话不会被修改；
+        再用一条 upsert 写入每个会话各自的结束时间和时长。第二步失败时已认领的会话保留认领时写入的结束时间
+        """
+        if not closures:
+            return []
+        try:
+            query = self.client.table("timer_sessions")\
+                .update({"ended_at": self.clock.now().isoformat(), "completed": False})\
+                .in_("id", [c["session_id"] for c in closures])\
+                .is_("ended_at", "null")\
+                .eq("completed", False)
+            claimed = (await self._execute(query)).data
+            if not claimed:
+                return []
+
+            by_id = {c["session_id"]: c for c in closures}
+            rows = [
+                {**row, "ended_at": by_id[row["id"]]["ended_at"].isoformat(),
+                 "actual_duration": by_id[row["id"]]["actual_duration"]}
+                for row in claimed
+            ]
+            await self._execute(self.client.table("timer_sessions").upsert(rows, on_conflict="id"))
+            return [self._session_from_row(row) for row in rows]
+            
+        except APIError as e:
+            logger.error(f"关闭超时会话失败: {e}")
+            raise
+
+    async def get_session_marker(self, user_id: str) -> Tuple:
+        """(会话数, 已结束数, 已完成数, 最近开始时间)，作为分析缓存的变化标记，与 Postgres 引擎的 SESSION_MARKER_SQL 一致
+
+        只看最近一条会话时，旧会话被补结束（例如超时回收）不会改变标记；三个计数请求并发发出
+        """
+        try:
+            total, ended, completed = await asyncio.gather(
+                self._execute(self.client.table("timer_sessions")
+                              .select("started_at", count="exact")
+                              .eq("user_id", user_id)
+                              .order("started_at", desc=True)
+                              .limit(1)),
+                self._execute(self.client.table("timer_sessions")
+                              .select("id", count="exact", head=True)
+                              .eq("user_id", user_id)
+                              .not_.is_("ended_at", "null")),
+                self._execute(self.client.table("timer_sessions")
+                              .select("id", count="exact", head=True)
+                              .eq("user_id", user_id)
+                              .eq("completed", True)))
+            latest = total.data[0]["started_at"] if total.data else None
+            return (total.count, ended.count, completed.count, latest)
+            
+        except APIError as e:
+            logger.error(f"获取会话标记失败: {e}")
+            raise
+
+    async def get_session_facts(self, user_id: str, page_size: int = 1000) -> List[Tuple[int, int, int, bool]]:
+        """用户全部会话的 (开始时间戳, 实际时长, 类型, 是否完成)，按开始时间升序分页拉取"""
+        facts = []
+        try:
+            while True:
+                result = await self._execute(self.client.table("timer_sessions")
+                    .select("started_at,actual_duration,timer_type_id,completed")
+                    .eq("user_id", user_id)
+                    .order("started_at")
+                    .range(len(facts), len(facts) + page_size - 1))
+                for row in result.data:
+                    facts.append((int(parse_timestamp(row["started_at"]).timestamp()), row.get("actual_duration") or 0,
+                                  row["timer_type_id"], bool(row.get("completed"))))
+                if len(result.data) < page_size:
+                    return facts
+            
+        except APIError as e:
+            # 不返回不完整的明细，避免被缓存
+            logger.error(f"获取会话明细失败: {e}")
+            raise
     
     # ==================== 日志和统计功能 ====================
     
     async def generate_daily_log(self, user_id: str, target_date: date = None) -> bool:
         """生成用户每日日志"""
         if target_date is None:
-            target_date = date.today()
+            target_date = self.clock.today()
         
         try:
-            # 查询当日的会话数据
-            start_datetime = datetime.combine(target_date, datetime.min.time()).replace(tzinfo=timezone.utc)
-            end_datetime = datetime.combine(target_date, datetime.max.time()).replace(tzinfo=timezone.utc)
+            # 查询当日的会话数据，日界按 APP_TIMEZONE 计算，左闭右开
+            start_datetime, end_datetime = day_bounds(target_date)
             
             # 获取当日会话
-            sessions_result = self.client.table("timer_sessions")\
+            query = self.client.table("timer_sessions")\
                 .select("*, timer_types(*)")\
                 .eq("user_id", user_id)\
                 .gte("started_at", start_datetime.isoformat())\
-                .lte("started_at", end_datetime.isoformat())\
-                .execute()
+                .lt("started_at", end_datetime.isoformat())
+            sessions_result = await self._execute(query)
             
             # 统计数据
             total_sessions = len(sessions_result.data)
@@ -426,9 +674,9 @@ class SupabaseClient:
             }
             
             # 插入或更新日志
-            result = self.client.table("user_daily_logs")\
-                .upsert(log_data, on_conflict="user_id,log_date")\
-                .execute()
+            query = self.client.table("user_daily_logs")\
+                .upsert(log_data, on_conflict="user_id,log_date")
+            result = await self._execute(query)
             
             if result.data:
                 logger.info(f"每日日志生成成功: {user_id} - {target_date}")
@@ -440,36 +688,19 @@ class SupabaseClient:
             logger.error(f"生成每日日志失败: {e}")
             return False
     
-    async def get_user_daily_logs(self, user_id: str, days: int = 7) -> List[DailyLog]:
-        """获取用户的每日日志"""
+    async def get_user_daily_logs(self, user_id: str, days: int = 7, columns: str = "*") -> List[DailyLog]:
+        """获取用户的每日日志；columns 为 PostgREST select 列表，须包含 id、user_id、log_date"""
         try:
-            start_date = date.today() - timedelta(days=days)
+            start_date = self.clock.today() - timedelta(days=days)
             
             result = self.client.table("user_daily_logs")\
-                .select("*")\
+                .select(columns)\
                 .eq("user_id", user_id)\
                 .gte("log_date", start_date.isoformat())\
                 .order("log_date", desc=True)\
                 .execute()
             
-            logs = []
-            for log_data in result.data:
-                logs.append(DailyLog(
-                    id=log_data["id"],
-                    user_id=log_data["user_id"],
-                    log_date=date.fromisoformat(log_data["log_date"]),
-                    total_focus_time=log_data.get("total_focus_time", 0),
-                    total_sessions=log_data.get("total_sessions", 0),
-                    completed_sessions=log_data.get("completed_sessions", 0),
-                    deep_work_count=log_data.get("deep_work_count", 0),
-                    deep_work_time=log_data.get("deep_work_time", 0),
-                    break_count=log_data.get("break_count", 0),
-                    break_time=log_data.get("break_time", 0),
-                    roundtable_count=log_data.get("roundtable_count", 0),
-                    roundtable_time=log_data.get("roundtable_time", 0)
-                ))
-            
-            return logs
+            return [DailyLog.from_row(log_data) for log_data in result.data]
             
         except APIError as e:
             logger.error(f"获取用户日志失败: {e}")
@@ -480,10 +711,10 @@ class SupabaseClient:
     async def get_timer_types(self) -> List[Dict[str, Any]]:
         """获取所有计时器类型"""
         try:
-            result = self.client.table("timer_types")\
+            query = self.client.table("timer_types")\
                 .select("*")\
-                .eq("is_active", True)\
-                .execute()
+                .eq("is_active", True)
+            result = await self._execute(query)
             
             return result.data
             
@@ -494,10 +725,10 @@ class SupabaseClient:
     async def get_audio_tracks(self) -> List[Dict[str, Any]]:
         """获取所有音轨"""
         try:
-            result = self.client.table("audio_tracks")\
+            query = self.client.table("audio_tracks")\
                 .select("*")\
-                .eq("is_active", True)\
-                .execute()
+                .eq("is_active", True)
+            result = await self._execute(query)
             
             return result.data
             
@@ -576,14 +807,61 @@ class SupabaseClient:
             # 小于1分钟显示为 0:SS
             return f"0:{remaining_seconds:02d}"
     
+    # ==================== 向导对话记录 ====================
+    
+    async def save_chat_message(self, user_id: str, guide_id: str, role: str,
+                                content: str, session_id: str = None) -> Optional[Dict[str, Any]]:
+        """保存一条对话消息（需要 optional_chat_table.sql 中的 chat_messages 表）"""
+        try:
+            result = self.client.table("chat_messages").insert({
+                "user_id": user_id,
+                "guide_id": guide_id,
+                "role": role,
+                "content": content,
+                "session_id": session_id,
+                "created_at": self.clock.now().isoformat()
+            }).execute()
+            return result.data[0] if result.data else None
+            
+        except APIError as e:
+            logger.error(f"保存对话消息失败: {e}")
+            return None
+    
+    async def get_chat_history(self, user_id: str, guide_id: str, limit: int = 20,
+                               before: Tuple[datetime, str] = None) -> List[Dict[str, Any]]:
+        """获取与指定向导的最近对话，按时间正序返回；before 为 (created_at, id) 时只取该消息之前的"""
+        try:
+            query = self.client.table("chat_messages")\
+                .select("id, role, content, created_at")\
+                .eq("user_id", user_id)\
+                .eq("guide_id", guide_id)
+            if before is not None:
+                # 时间用 Z 结尾的 UTC 格式，避免 "+" 在查询串中被当作空格
+                iso = before[0].astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+                query = query.or_(f'created_at.lt."{iso}",and(created_at.eq."{iso}",id.lt.{before[1]})')
+            result = query\
+                .order("created_at", desc=True)\
+                .order("id", desc=True)\
+                .limit(limit)\
+                .execute()
+            return list(reversed(result.data))
+            
+        except APIError as e:
+            logger.error(f"获取对话历史失败: {e}")
+            return []
+    
     # ==================== 健康检查 ====================
     
     async def health_check(self) -> bool:
-        """检查 Supabase 连接健康状态"""
+        """检查 Supabase 连接健康状态
+
+        只取一行主键（不做 count=exact 全表计数），同步请求放到线程池执行，
+        数据库慢时不阻塞事件循环，调用方的超时也能生效
+        """
         try:
-            # 尝试简单的查询来测试连接
-            result = self.client.table("timer_types").select("count", count="exact").execute()
-            logger.info("Supabase 连接健康检查通过")
+            query = self.client.table("timer_types").select("id").limit(1)
+            await self._execute(query)
+            logger.debug("Supabase 连接健康检查通过")
             return True
         except Exception as e:
             logger.error(f"Supabase 连接健康检查失败: {e}")
@@ -599,17 +877,29 @@ class SupabaseClient:
 
 # ==================== 全局实例 ====================
 
-# 创建全局 Supabase 客户端实例
-supabase_client = SupabaseClient()
+# 全局 Supabase 客户端实例，第一次调用 get_client() 时创建，
+# 这样导入本模块不会建立 HTTP 客户端，缺少环境变量时也不会导入失败
+supabase_client: Optional[SupabaseClient] = None
 
 
 # ==================== 便捷函数 ====================
 
 async def get_client() -> SupabaseClient:
-    """获取 Supabase 客户端实例"""
+    """获取 Supabase 客户端实例（首次调用时创建）"""
+    global supabase_client
+    if supabase_client is None:
+        supabase_client = SupabaseClient()
     return supabase_client
 
 
+def reset_client():
+    """关闭并丢弃当前客户端，下次 get_client() 时重新创建"""
+    global supabase_client
+    client, supabase_client = supabase_client, None
+    if client is not None:
+        client.close()
+
+
 # ==================== 使用示例 ====================
 
 async def example_usage():
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 分析数据列式导出测试
+验证按日期分区、内存有界的分批写出、增量水位、safety_lag 以及失败时不推进水位
+"""
+
+import asyncio
+import sys
+import os
+import json
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from clock import VirtualClock
+from local_standins import InMemoryStore
+from storage_engine import MemoryRepository
+from analytics_export import EXPORT_TABLES, MemoryExportSource, PartitionedWriter, run_export, pa
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+
+
+class RecordingPart:
+    """记录写入批次的分区文件"""
+
+    def __init__(self, path, table, parts):
+        self.path = path
+        self.batches = []
+        self.closed = False
+        open(path, "w").close()
+        parts.append(self)
+
+    def write(self, rows):
+        self.batches.append(rows)
+
+    def close(self):
+        self.closed = True
+
+
+async def seed(clock, repository, days=3, per_day=5):
+    for day in range(days):
+        for _ in range(per_day):
+            await repository.start_timer_session(USER_ID, timer_type_id=1, planned_duration=60, exclusive=False)
+            clock.advance(120)
+            await repository.complete_timer_session(USER_ID, actual_duration=60)
+        await repository.save_chat_message(USER_ID, "roundtable", "user", f"day {day}")
+        clock.advance(86400 - per_day * 120)
+
+
+def test_partitions_batches_and_open_file_limit():
+    """测试按日期分区、每批不超过 batch_rows、打开的文件数有上限"""
+    clock = VirtualClock(datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc))
+    with tempfile.TemporaryDirectory() as out:
+        parts = []
+        writer = PartitionedWriter(out, EXPORT_TABLES["timer_sessions"], "run", batch_rows=2,
+                                   max_buffered_rows=4, max_open_files=2,
+                                   open_part=lambda path, table: RecordingPart(path, table, parts))
+        rows = []
+        for i in range(12):
+            started = clock.now() + timedelta(days=i % 3)
+            rows.append({"id": f"00000000-0000-0000-0000-{i:012d}", "user_id": USER_ID, "timer_type_id": 1,
+                         "planned_duration": 60, "started_at": started, "completed": False,
+                         "updated_at": started})
+        writer.write(rows)
+        files = writer.close()
+
+        assert writer.rows_written == 12
+        assert all(len(batch) <= 2 for part in parts for batch in part.batches)
+        assert all(part.closed for part in parts)
+        assert sorted({os.path.basename(os.path.dirname(f)) for f in files}) == \
+            ["date=2024-05-01", "date=2024-05-02", "date=2024-05-03"]
+        assert all(os.path.exists(f) and not f.endswith(".tmp") for f in files)
+        # 3 个分区轮流写入而只允许打开 2 个文件，被关闭的分区再写入时使用新的 part 文件
+        assert len(files) > 3
+    print("✅ 分区、分批和文件数上限")
+
+
+def test_incremental_export_with_watermark():
+    """测试增量导出只包含上次之后变化的行，safety_lag 内的行留到下次"""
+    clock = VirtualClock(datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc))
+
+    async def run():
+        store = InMemoryStore(clock=clock)
+        repository = MemoryRepository(store)
+        await seed(clock, repository)
+        source = MemoryExportSource(store)
+        with tempfile.TemporaryDirectory() as out:
+            parts = []
+            options = dict(batch_rows=4, open_part=lambda path, table: RecordingPart(path, table, parts))
+            first = await run_export(source, out, safety_lag=60, clock=clock, **options)
+            counts = {r["table"]: r["rows"] for r in first}
+            assert counts == {"timer_sessions": 15, "user_daily_logs": 3, "chat_messages": 3}
+
+            with open(os.path.join(out, "_watermarks.json"), encoding="utf-8") as f:
+                assert set(json.load(f)) == set(counts)
+
+            # 没有变化：不导出任何行
+            again = await run_export(source, out, safety_lag=60, clock=clock, **options)
+            assert all(r["rows"] == 0 for r in again)
+
+            # 新会话完成后只导出它和重建的当天日志；刚写入的聊天在 safety_lag 内，留到下次
+            await repository.start_timer_session(USER_ID, timer_type_id=2, planned_duration=30, exclusive=False)
+            clock.advance(300)
+            await repository.complete_timer_session(USER_ID, actual_duration=30)
+            clock.advance(120)
+            await repository.save_chat_message(USER_ID, "roundtable", "user", "just now")
+            incremental = {r["table"]: r["rows"]
+                           for r in await run_export(source, out, safety_lag=60, clock=clock, **options)}
+            assert incremental == {"timer_sessions": 1, "user_daily_logs": 1, "chat_messages": 0}
+
+            clock.advance(120)
+            later = {r["table"]: r["rows"] for r in await run_export(source, out, safety_lag=60, clock=clock,
+                                                                      **options)}
+            assert later["chat_messages"] == 1
+
+            # --full 忽略水位重新导出全部
+            full = {r["table"]: r["rows"] for r in await run_export(source, out, incremental=False,
+                                                                     safety_lag=60, clock=clock, **options)}
+            assert full == {"timer_sessions": 16, "user_daily_logs": 4, "chat_messages": 4}
+
+    asyncio.run(run())
+    print("✅ 增量导出")
+
+
+def test_failure_keeps_watermark_and_removes_partial_files():
+    """测试导出中途失败时不推进水位，也不留下半成品文件"""
+    clock = VirtualClock(datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc))
+
+    class BrokenSource(MemoryExportSource):
+        async def iter_batches(self, table, since, until, batch_rows):
+            async for rows in super().iter_batches(table, since, until, batch_rows):
+                yield rows
+                raise ConnectionError("connection lost")
+
+    async def run():
+        store = InMemoryStore(clock=clock)
+        await seed(clock, MemoryRepository(store), days=2)
+        with tempfile.TemporaryDirectory() as out:
+            parts = []
+            options = dict(batch_rows=2, open_part=lambda path, table: RecordingPart(path, table, parts))
+            try:
+                await run_export(BrokenSource(store), out, tables=["timer_sessions"], clock=clock, **options)
+                assert False
+            except ConnectionError:
+                pass
+            leftovers = [f for _, _, files in os.walk(out) for f in files]
+            assert leftovers == []
+            result = await run_export(MemoryExportSource(store), out, tables=["timer_sessions"], clock=clock,
+                                      **options)
+            assert result[0]["rows"] == 10 and result[0]["since"] is None
+
+    asyncio.run(run())
+    print("✅ 失败时不推进水位")
+
+
+def test_parquet_round_trip():
+    """测试写出的 Parquet 文件可以按分区读回"""
+    if pa is None:
+        print("⏭️ 未安装 pyarrow，跳过 Parquet 读回测试")
+        return
+    import pyarrow.dataset as ds
+    clock = VirtualClock(datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc))
+
+    async def run():
+        store = InMemoryStore(clock=clock)
+        await seed(clock, MemoryRepository(store))
+        with tempfile.TemporaryDirectory() as out:
+            await run_export(MemoryExportSource(store), out, clock=clock, batch_rows=4)
+            sessions = ds.dataset(os.path.join(out, "timer_sessions"), format="parquet",
+                                  partitioning="hive").to_table()
+            assert sessions.num_rows == 15
+            assert sorted(set(sessions.column("date").to_pylist())) == ["2024-05-01", "2024-05-02", "2024-05-03"]
+
+    asyncio.run(run())
+    print("✅ Parquet 读回")
+
+
+if __name__ == "__main__":
+    print("🧪 测试分析数据列式导出")
+    print("=" * 50)
+    test_partitions_batches_and_open_file_limit()
+    test_incremental_export_with_watermark()
+    test_failure_keeps_watermark_and_removes_partial_files()
+    test_parquet_round_trip()
+    print("\n🎉 所有测试通过")
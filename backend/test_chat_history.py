@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 对话历史测试
+验证游标编码、游标分页不重复不遗漏（包括同一时间的多条消息）、
+重新打开对话从缓冲返回不查询数据库，以及 PostgreSQL 引擎使用按索引顺序的分页语句
+"""
+
+import sys
+import os
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from chat_history import ChatHistory, CHAT_HISTORY_REQUESTS, decode_cursor, encode_cursor
+from clock import VirtualClock
+from db_pool import statement_name
+from local_standins import InMemoryStore
+from storage_engine import MemoryRepository
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+START = datetime(2024, 5, 1, 9, 0, tzinfo=timezone.utc)
+
+
+class CountingRepository(MemoryRepository):
+    """记录 get_chat_history 的调用参数"""
+
+    def __init__(self, store):
+        super().__init__(store)
+        self.reads = []
+
+    async def get_chat_history(self, user_id, guide_id, limit=20, before=None):
+        self.reads.append((limit, before))
+        return await super().get_chat_history(user_id, guide_id, limit, before)
+
+
+def test_cursor_round_trip():
+    """测试游标编码与解析，非法游标抛出 ValueError"""
+    created_at, message_id = decode_cursor(encode_cursor("2024-05-01T17:00:00+08:00", "abc"))
+    assert created_at == START and created_at.tzinfo is not None and message_id == "abc"
+    assert "+" not in encode_cursor(START, "abc") and "=" not in encode_cursor(START, "abc")
+    for cursor in ("not-a-cursor", "!!", encode_cursor(START, "x")[:-6]):
+        try:
+            decode_cursor(cursor)
+            raise AssertionError(f"非法游标应抛出 ValueError: {cursor}")
+        except ValueError:
+            pass
+    print("✅ 游标编码正确")
+
+
+def test_pagination_and_ring_buffer():
+    """测试分页遍历全部消息、重新打开对话不查询数据库、新消息追加到缓冲、过期后重新载入"""
+    clock = VirtualClock(START)
+    repository = CountingRepository(InMemoryStore(clock=clock))
+    history = ChatHistory(lambda: repository, turns=4, ttl=60)
+
+    async def run():
+        for i in range(7):
+            await repository.save_chat_message(USER_ID, "roundtable", "user", f"m{i}")
+            if i % 2:  # 每两条消息共用一个时间戳，验证同一时间的消息分页不重复不遗漏
+                clock.advance(timedelta(seconds=30))
+
+        # 第一页载入一个缓冲（多取一条），之后的页用游标查询
+        page = await history.page(USER_ID, "roundtable", limit=3)
+        contents = [m["content"] for m in page["messages"]]
+        assert contents == ["m4", "m5", "m6"] and repository.reads == [(5, None)]
+        pages = 1
+        while page["next_cursor"]:
+            page = await history.page(USER_ID, "roundtable", limit=3, before=page["next_cursor"])
+            contents = [m["content"] for m in page["messages"]] + contents
+            pages += 1
+        assert contents == [f"m{i}" for i in range(7)], contents
+        assert pages == 3 and repository.reads[1][0] == 4 and repository.reads[1][1] is not None
+
+        # 重新打开对话：缓冲中有 4 条，不超过 4 条的第一页不查询数据库
+        reads = len(repository.reads)
+        hits = CHAT_HISTORY_REQUESTS.get(result="hit")
+        reopened = await history.page(USER_ID, "roundtable", limit=4)
+        clock.advance(timedelta(seconds=30))
+        await history.save(USER_ID, "roundtable", "assistant", "reply")
+        latest = await history.page(USER_ID, "roundtable", limit=2)
+        assert len(repository.reads) == reads and CHAT_HISTORY_REQUESTS.get(result="hit") == hits + 2
+        assert [m["content"] for m in reopened["messages"]] == ["m3", "m4", "m5", "m6"]
+        assert [m["content"] for m in latest["messages"]] == ["m6", "reply"]
+        reads = len(repository.reads)
+        older = await history.page(USER_ID, "roundtable", limit=10, before=latest["next_cursor"])
+        assert [m["content"] for m in older["messages"]] == [f"m{i}" for i in range(6)]
+        assert older["next_cursor"] is None
+
+        # 超过缓冲大小的第一页、缓冲过期后都重新查询
+        await history.page(USER_ID, "roundtable", limit=6)
+        assert len(repository.reads) == reads + 2
+        history.ttl = 0
+        await history.page(USER_ID, "roundtable", limit=2)
+        assert len(repository.reads) == reads + 3
+
+        # 很短的对话整个在缓冲中，请求更多条也不查询数据库
+        await history.page(USER_ID, "moss", limit=20)
+        history.ttl = 60
+        empty = await history.page(USER_ID, "moss", limit=20)
+        assert empty == {"messages": [], "next_cursor": None} and len(repository.reads) == reads + 4
+
+    asyncio.run(run())
+    print("✅ 游标分页和对话缓冲正确")
+
+
+def test_postgres_keyset_statement_and_api():
+    """测试 PostgreSQL 引擎按游标使用 chat_history_before 语句，接口对非法游标返回 400"""
+    import api_routes
+    import database_operations as ops
+
+    class RecordingConnection:
+        def __init__(self):
+            self.queries = []
+
+        async def fetch(self, query, *args):
+            self.queries.append((query, args))
+            return []
+
+    conn = RecordingConnection()
+    repository = ops.PostgresRepository("postgresql://unused")
+    repository.pool = ops._PinnedPool(conn)
+    message_id = "00000000-0000-0000-0000-0000000000aa"
+
+    async def run():
+        await repository.get_chat_history(USER_ID, "roundtable", limit=3)
+        await repository.get_chat_history(USER_ID, "roundtable", limit=3, before=decode_cursor(encode_cursor(START, message_id)))
+
+    asyncio.run(run())
+    (latest, _), (before, args) = conn.queries
+    assert statement_name(latest) == "chat_history" and "ORDER BY created_at DESC, id DESC" in latest
+    assert statement_name(before) == "chat_history_before" and args[2:] == (START, ops.uuid.UUID(message_id), 3)
+
+    saved = api_routes.db_ops
+    api_routes.db_ops = MemoryRepository(InMemoryStore())
+    try:
+        client = TestClient(api_routes.app)
+        response = client.get(f"/api/chat/history/{USER_ID}/roundtable", params={"before": "bogus"})
+        assert response.status_code == 400, response.text
+        response = client.get(f"/api/chat/history/{USER_ID}/roundtable")
+        assert response.status_code == 200 and response.json()["data"] == {"messages": [], "next_cursor": None}
+    finally:
+        api_routes.db_ops = saved
+    print("✅ PostgreSQL 分页语句和接口正确")
+
+
+if __name__ == "__main__":
+    print("🧪 测试对话历史")
+    print("=" * 50)
+    test_cursor_round_trip()
+    test_pagination_and_ring_buffer()
+    test_postgres_keyset_statement_and_api()
+    print("\n🎉 所有测试通过")
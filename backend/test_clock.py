@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 时钟和计时精度测试
+用虚拟时钟驱动 main_supabase 的计时器接口（数据库使用内存替身），
+在几秒内跑完数千个会话，覆盖跨午夜和夏令时切换
+"""
+
+import asyncio
+import random
+import sys
+import os
+from collections import defaultdict
+from datetime import datetime, date, timedelta, timezone
+
+import httpx
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from clock import Clock, VirtualClock, use_clock, elapsed_seconds, local_date, day_bounds, load_timezone
+from local_standins import InMemoryStore, InMemorySupabaseClient
+from storage_engine import SupabaseRepository
+
+USER_ID = "00000000-0000-4000-8000-000000000001"
+
+
+def test_virtual_clock_and_elapsed_seconds():
+    """测试虚拟时钟前进和带/不带时区时间的混合计算"""
+    clock = VirtualClock(datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc))
+    started = clock.now()
+    clock.advance(90)
+    clock.advance(timedelta(minutes=1))
+    assert elapsed_seconds(started, clock.now()) == 150
+    assert clock.monotonic() == 150
+
+    naive_start = datetime(2024, 1, 1, 12, 0)
+    assert elapsed_seconds(naive_start, clock.now()) == 150
+
+    try:
+        clock.advance(-1)
+        assert False, "虚拟时钟不应倒退"
+    except ValueError:
+        pass
+
+    class NowOnly(Clock):
+        def now(self):
+            return clock.now()
+
+    for incomplete in (Clock, NowOnly):
+        try:
+            incomplete()
+            assert False, "未实现全部接口的时钟不应能实例化"
+        except TypeError:
+            pass
+    print("✅ 虚拟时钟正确")
+
+
+def test_day_bounds_across_dst():
+    """测试夏令时切换日的日界"""
+    berlin = load_timezone("Europe/Berlin")
+    start, end = day_bounds(date(2024, 3, 31), berlin)
+    assert end - start == timedelta(hours=23)
+    start, end = day_bounds(date(2024, 10, 27), berlin)
+    assert end - start == timedelta(hours=25)
+    start, end = day_bounds(date(2024, 10, 27), load_timezone("Asia/Shanghai"))
+    assert end - start == timedelta(hours=24)
+    assert start == datetime(2024, 10, 26, 16, 0, tzinfo=timezone.utc)
+
+    # 23:30 UTC 在上海已经是第二天
+    assert local_date(datetime(2024, 5, 1, 23, 30, tzinfo=timezone.utc), load_timezone("Asia/Shanghai")) == date(2024, 5, 2)
+    print("✅ 夏令时日界正确")
+
+
+def test_thousands_of_sessions_in_virtual_time():
+    """用虚拟时间运行数千个会话，验证时长精确到秒、日志按开始日期归档"""
+    import main_supabase
+
+    previous_tz = os.environ.get("APP_TIMEZONE")
+    os.environ["APP_TIMEZONE"] = "Europe/Berlin"
+    # 从 3 月夏令时开始前一周跑到 11 月，覆盖两次切换
+    clock = VirtualClock(datetime(2024, 3, 24, 6, 0, tzinfo=timezone.utc))
+    store = InMemoryStore(clock=clock)
+    previous_repository = main_supabase.repository
+    main_supabase.repository = SupabaseRepository(InMemorySupabaseClient(store))
+
+    rng = random.Random(42)
+    expected_by_day = defaultdict(int)
+    cross_midnight = 0
+    session_count = 2000
+
+    async def run():
+        nonlocal cross_midnight
+        transport = httpx.ASGITransport(app=main_supabase.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            for _ in range(session_count):
+                duration = rng.choice([rng.randint(1, 120), rng.randint(600, 5400), rng.randint(3600, 4 * 3600)])
+                started = clock.now()
+                resp = await client.post("/api/timer/start", params={"user_id": USER_ID},
+                                         json={"timer_type_id": rng.choice([1, 2, 3]), "planned_duration": duration})
+                assert resp.status_code == 200, resp.text
+
+                clock.advance(duration)
+                current = (await client.get(f"/api/timer/current/{USER_ID}")).json()["data"]
+                assert current["elapsed_time"] == duration
+
+                resp = await client.put("/api/timer/complete", params={"user_id": USER_ID}, json={})
+                assert resp.status_code == 200, resp.text
+                assert resp.json()["data"]["actual_duration"] == duration
+
+                start_day = local_date(started)
+                expected_by_day[start_day] += duration
+                if local_date(clock.now()) != start_day:
+                    cross_midnight += 1
+                clock.advance(rng.randint(60, 8 * 3600))
+
+    try:
+        with use_clock(clock):
+            asyncio.run(run())
+    finally:
+        main_supabase.repository = previous_repository
+        if previous_tz is None:
+            os.environ.pop("APP_TIMEZONE", None)
+        else:
+            os.environ["APP_TIMEZONE"] = previous_tz
+
+    logged_by_day = {day: log["total_focus_time"] for (_, day), log in store.daily_logs.items()}
+    assert cross_midnight > 0, "测试数据应包含跨午夜的会话"
+    assert date(2024, 3, 31) in logged_by_day and date(2024, 10, 27) in logged_by_day
+    assert logged_by_day == dict(expected_by_day)
+    assert sum(logged_by_day.values()) == sum(s["actual_duration"] for s in store.sessions.values())
+    print(f"✅ {session_count} 个会话（{cross_midnight} 个跨午夜）时长和日志归档正确")
+
+
+if __name__ == "__main__":
+    print("🧪 测试时钟和计时精度")
+    print("=" * 50)
+    test_virtual_clock_and_elapsed_seconds()
+    test_day_bounds_across_dst()
+    test_thousands_of_sessions_in_virtual_time()
+    print("\n🎉 所有测试通过")
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 紧凑行对象测试
+验证 supabase_integration 的行对象不创建 __dict__、时间字段延迟解析，以及历史接口原样输出 ISO 字符串
+"""
+
+import asyncio
+import sys
+import os
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from local_standins import InMemoryStore, InMemorySupabaseClient
+from storage_engine import SupabaseRepository
+from supabase_integration import DailyLog, TimerSession, User
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+
+
+def postgrest_row(i: int):
+    """PostgREST 返回的 timer_sessions 行（select *）"""
+    started = datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc) + timedelta(minutes=30 * i)
+    return {
+        "id": f"00000000-0000-0000-0000-{i:012d}", "user_id": USER_ID, "timer_type_id": 1, "audio_track_id": 1,
+        "planned_duration": 1500, "actual_duration": 1490, "started_at": started.isoformat(),
+        "ended_at": (started + timedelta(minutes=25)).isoformat(), "completed": True,
+        "created_at": started.isoformat(), "updated_at": started.isoformat(),
+    }
+
+
+@dataclass
+class EagerSession:
+    """改造前的 dataclass 行对象，用于比较内存占用"""
+    id: str
+    user_id: str
+    timer_type_id: int
+    audio_track_id: Optional[int] = None
+    planned_duration: int = 0
+    actual_duration: Optional[int] = None
+    started_at: datetime = None
+    ended_at: Optional[datetime] = None
+    completed: bool = False
+
+
+def test_lazy_timestamps():
+    """测试时间字段只在读取属性时解析，iso() 不解析"""
+    session = TimerSession.from_row(postgrest_row(0))
+    assert not hasattr(session, "__dict__")
+    assert session.iso("started_at") == "2024-05-01T08:00:00+00:00"
+    assert isinstance(session._started_at, str), "iso() 不应触发解析"
+
+    assert session.started_at == datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc)
+    assert isinstance(session._started_at, datetime), "解析结果应写回槽位"
+    assert session.iso("started_at") == "2024-05-01T08:00:00+00:00"
+
+    user = User.from_row({"id": "u", "email": "a@b.c", "username": "aura", "created_at": "2024-05-01T08:00:00Z",
+                          "password_hash": "x"})
+    assert user.iso("created_at") == "2024-05-01T08:00:00+00:00" and user.last_login_at is None
+    assert user.created_at.tzinfo is not None
+
+    log = DailyLog.from_row({"id": "l", "user_id": USER_ID, "log_date": "2024-05-01", "total_sessions": 3})
+    assert log.log_date == date(2024, 5, 1) and log.total_sessions == 3 and log.break_time == 0
+    assert log.to_dict(raw=False)["log_date"] == date(2024, 5, 1)
+    print("✅ 时间字段延迟解析")
+
+
+def test_constructor_compatibility():
+    """测试关键字构造、默认值、相等比较和参数检查与原 dataclass 一致"""
+    started = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    a = TimerSession(id="s", user_id=USER_ID, timer_type_id=1, started_at=started)
+    b = TimerSession("s", USER_ID, 1, started_at=started.isoformat())
+    assert a == b and a.completed is False and a.ended_at is None and a.planned_duration == 0
+    assert "TimerSession(id='s'" in repr(a)
+    for bad in (lambda: TimerSession(id="s", user_id=USER_ID), lambda: TimerSession("s", USER_ID, 1, bogus=1)):
+        try:
+            bad()
+            assert False
+        except TypeError:
+            pass
+    print("✅ 构造方式兼容")
+
+
+def test_rows_are_smaller_and_cheaper():
+    """测试每行内存占用更小，构造一页历史记录更快"""
+    rows = [postgrest_row(i) for i in range(2000)]
+    compact = TimerSession.from_row(rows[0])
+    eager = EagerSession(**{k: rows[0][k] for k in EagerSession.__dataclass_fields__})
+    assert sys.getsizeof(compact) < sys.getsizeof(eager) + sys.getsizeof(eager.__dict__)
+
+    def old_way():
+        return [EagerSession(**{**{k: row[k] for k in EagerSession.__dataclass_fields__},
+                                "started_at": datetime.fromisoformat(row["started_at"].replace('Z', '+00:00')),
+                                "ended_at": datetime.fromisoformat(row["ended_at"].replace('Z', '+00:00'))})
+                for row in rows]
+
+    def new_way():
+        return [(s.iso("started_at"), s.iso("ended_at")) for s in map(TimerSession.from_row, rows)]
+
+    def best_of(fn, repeat=5):
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - started)
+        return min(times)
+
+    old, new = best_of(lambda: [(s.started_at.isoformat(), s.ended_at.isoformat()) for s in old_way()]), best_of(new_way)
+    assert new < old, f"old {old * 1000:.1f}ms, new {new * 1000:.1f}ms"
+    print(f"✅ 2000 行：原实现 {old * 1000:.1f}ms，紧凑行 {new * 1000:.1f}ms")
+
+
+def test_history_passes_raw_iso_through():
+    """测试 Supabase 引擎的历史接口直接输出 PostgREST 的时间字符串"""
+    class RawClient(InMemorySupabaseClient):
+        async def get_user_sessions(self, user_id, limit=50, columns="*"):
+            return [TimerSession.from_row(postgrest_row(i)) for i in range(limit)]
+
+    async def run():
+        repository = SupabaseRepository(RawClient(InMemoryStore()))
+        history = await repository.get_user_sessions_history(USER_ID, limit=3)
+        assert [h["started_at"] for h in history] == [postgrest_row(i)["started_at"] for i in range(3)]
+        assert history[0]["ended_at"] == "2024-05-01T08:25:00+00:00"
+
+    asyncio.run(run())
+    print("✅ 历史接口原样输出时间")
+
+
+if __name__ == "__main__":
+    print("🧪 测试紧凑行对象")
+    print("=" * 50)
+    test_lazy_timestamps()
+    test_constructor_compatibility()
+    test_rows_are_smaller_and_cheaper()
+    test_history_passes_raw_iso_through()
+    print("\n🎉 所有测试通过")
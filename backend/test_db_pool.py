@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 数据库连接池测试
+验证连接池参数从环境变量读取、取连接等待时间和使用率指标、取连接超时计数，
+热点查询的 SQL 文本固定且登记了名称，以及只读查询路由到副本、写入后读自己的写入（跨 worker 由 Cookie 携带）
+"""
+
+import sys
+import os
+import asyncio
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import db_pool
+from db_pool import (
+    MeteredPool, RecentWrites, TimedConnection, pool_options, statement_name,
+    POOL_ACQUIRE_SECONDS, POOL_ACQUIRE_TIMEOUTS, POOL_CONNECTIONS, QUERY_LATENCY, QUERY_ERRORS, DB_READS
+)
+
+
+def test_pool_options_from_env():
+    """测试连接池参数和语句超时读取环境变量"""
+    names = ("DB_POOL_MIN_SIZE", "DB_POOL_MAX_SIZE", "DB_POOL_MAX_INACTIVE_LIFETIME",
+             "DB_STATEMENT_TIMEOUT", "DB_STATEMENT_CACHE_SIZE")
+    saved = {name: os.environ.pop(name, None) for name in names}
+    try:
+        options = pool_options()
+        assert (options["min_size"], options["max_size"]) == (2, 10)
+        assert options["server_settings"]["statement_timeout"] == "15000"
+        assert options["command_timeout"] == 20 and options["connection_class"] is TimedConnection
+
+        os.environ.update(DB_POOL_MIN_SIZE="8", DB_POOL_MAX_SIZE="4", DB_POOL_MAX_INACTIVE_LIFETIME="60",
+                          DB_STATEMENT_TIMEOUT="0", DB_STATEMENT_CACHE_SIZE="0")
+        options = pool_options()
+        assert (options["min_size"], options["max_size"]) == (4, 4)
+        assert options["max_inactive_connection_lifetime"] == 60 and options["statement_cache_size"] == 0
+        assert "statement_timeout" not in options["server_settings"] and "command_timeout" not in options
+    finally:
+        for name, value in saved.items():
+            os.environ.pop(name, None)
+            if value is not None:
+                os.environ[name] = value
+    print("✅ 连接池参数读取正确")
+
+
+class FakeAsyncpgPool:
+    """最多 max_size 个连接，用完后 acquire 排队等待"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self.idle = []
+        self.available = asyncio.Semaphore(max_size)
+
+    async def acquire(self, timeout=None):
+        await asyncio.wait_for(self.available.acquire(), timeout)
+        if self.idle:
+            return self.idle.pop()
+        self.size += 1
+        return object()
+
+    async def release(self, conn):
+        self.idle.append(conn)
+        self.available.release()
+
+    def get_size(self):
+        return self.size
+
+    def get_idle_size(self):
+        return len(self.idle)
+
+    def get_max_size(self):
+        return self.max_size
+
+
+def test_metered_pool_records_wait_and_utilization():
+    """测试连接用完时的等待时间、使用率、等待数和超时计数"""
+    name = "test_pool"
+
+    async def run():
+        pool = MeteredPool(FakeAsyncpgPool(2), name=name, acquire_timeout=0.05)
+        first = await pool.acquire()
+        async with pool.acquire():
+            assert pool.stats() == {"size": 2, "idle": 0, "in_use": 2, "waiting": 0, "max": 2}
+            assert POOL_CONNECTIONS.get(pool=name, state="in_use") == 2
+
+            waiter = asyncio.ensure_future(pool.acquire(timeout=1))
+            await asyncio.sleep(0.01)
+            assert pool.stats()["waiting"] == 1
+            await pool.release(first)
+            await waiter
+
+            try:
+                await pool.acquire()
+                raise AssertionError("连接池用完时应超时")
+            except asyncio.TimeoutError:
+                pass
+        assert pool.stats()["in_use"] == 1 and POOL_CONNECTIONS.get(pool=name, state="idle") == 1
+
+    asyncio.run(run())
+    assert POOL_ACQUIRE_SECONDS.count(pool=name) == 4
+    assert POOL_ACQUIRE_TIMEOUTS.get(pool=name) == 1
+    assert POOL_CONNECTIONS.get(pool=name, state="waiting") == 0
+    print("✅ 取连接等待时间和使用率正确")
+
+
+def test_hot_queries_are_named_and_stable():
+    """测试热点查询登记了名称，动态拼接的查询按规范顺序生成同一条 SQL"""
+    import database_operations as ops
+
+    assert statement_name(ops.CURRENT_SESSION_SQL) == "current_session"
+    assert statement_name("SELECT now()") == "other"
+    assert ops.daily_stats_sql(("log_date",)) is ops.daily_stats_sql(("log_date",))
+    assert statement_name(ops.weekly_stats_sql(("total_focus_time",))) == "weekly_stats"
+
+    class RecordingConnection:
+        def __init__(self):
+            self.queries = []
+
+        async def fetch(self, query, *args):
+            self.queries.append((query, args))
+            return []
+
+    conn = RecordingConnection()
+    repository = ops.PostgresRepository("postgresql://unused")
+    repository.pool = ops._PinnedPool(conn)
+
+    async def run():
+        await repository.get_user_sessions_history(ops.WARMUP_USER_ID, fields=("started_at", "session_id"))
+        await repository.get_user_sessions_history(ops.WARMUP_USER_ID, fields=("session_id", "started_at"))
+        await repository.get_user_sessions_history(ops.WARMUP_USER_ID, limit=5, timer_type="focus")
+
+    asyncio.run(run())
+    (first, _), (second, _), (filtered, args) = conn.queries
+    assert first is second and statement_name(first) == "sessions_history"
+    assert "tt.name = $2" in filtered and "LIMIT $3" in filtered and args[1:] == ("focus", 5)
+    print("✅ 热点查询名称和 SQL 文本固定")
+
+
+def test_statement_latency_by_name():
+    """测试按语句名称统计耗时和异常"""
+    sql = db_pool.statement("test_statement", "SELECT $1")
+
+    async def run():
+        with db_pool._timed_statement(sql):
+            await asyncio.sleep(0)
+        try:
+            with db_pool._timed_statement(sql):
+                raise RuntimeError("boom")
+        except RuntimeError:
+            pass
+
+    asyncio.run(run())
+    assert QUERY_LATENCY.count(statement="test_statement") == 2
+    assert QUERY_ERRORS.get(statement="test_statement") == 1
+    print("✅ 语句耗时按名称统计")
+
+
+class RoutingPool:
+    """记录每条语句由哪个连接池执行；down 为 True 时取连接失败"""
+
+    def __init__(self, name: str, executed: list):
+        self.name = name
+        self.executed = executed
+        self.down = False
+
+    def acquire(self):
+        """与 asyncpg 相同，既可以 await 也可以 async with"""
+        return self
+
+    async def _lease(self):
+        if self.down:
+            raise ConnectionRefusedError("replica down")
+        return self
+
+    def __await__(self):
+        return self._lease().__await__()
+
+    async def __aenter__(self):
+        return await self._lease()
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def release(self, conn):
+        pass
+
+    async def _run(self, query):
+        self.executed.append((self.name, statement_name(query)))
+
+    async def fetch(self, query, *args):
+        await self._run(query)
+        return []
+
+    async def fetchrow(self, query, *args):
+        await self._run(query)
+        return {"id": args[0], "started_at": None, "planned_duration": 1500, "name": "focus",
+                "default_duration": 1500, "default_audio_track_id": None,
+                "total": 0, "ended": 0, "completed": 0, "latest": None}
+
+    async def fetchval(self, query, *args):
+        await self._run(query)
+        return args[0]
+
+    async def execute(self, query, *args):
+        await self._run(query)
+
+
+def test_reads_route_to_replica_except_after_writes():
+    """测试只读查询走副本，写入走主库，写入后窗口内该用户的读取走主库，副本不可用时回退，
+    专注分析的标记和数据都读主库"""
+    import database_operations as ops
+    from clock import VirtualClock
+    from datetime import datetime, timezone
+
+    user, other = "00000000-0000-0000-0000-000000000001", "00000000-0000-0000-0000-000000000002"
+    executed = []
+    repository = ops.PostgresRepository("postgresql://unused",
+                                        clock=VirtualClock(datetime(2024, 5, 1, 9, 0, tzinfo=timezone.utc)))
+    repository.pool = RoutingPool("primary", executed)
+    repository.read_pool = RoutingPool("replica", executed)
+    repository.recent_writes = RecentWrites(window=0.2)
+
+    async def run():
+        await repository.get_daily_stats(user)
+        await repository.get_timer_types()
+        await repository.start_timer_session(user, timer_type_id=1, exclusive=False)
+        await repository.get_daily_stats(user)
+        await repository.get_chat_history(other, "guide")
+        await asyncio.sleep(0.25)
+        await repository.get_weekly_stats(user)
+        # 专注分析的缓存标记和数据都读主库，保证标记与数据一致
+        await repository.get_session_marker(user)
+        await repository.get_session_facts(user)
+        repository.read_pool.down = True
+        await repository.get_user_sessions_history(user)
+
+    fallbacks = DB_READS.get(pool="primary", reason="replica_unavailable")
+    asyncio.run(run())
+    assert executed == [
+        ("replica", "daily_stats"), ("replica", "timer_types"),
+        ("primary", "timer_type"), ("primary", "insert_session"),
+        ("primary", "daily_stats"), ("replica", "chat_history"),
+        ("replica", "weekly_stats"), ("primary", "session_marker"), ("primary", "session_facts"),
+        ("primary", "sessions_history"),
+    ], executed
+    assert DB_READS.get(pool="primary", reason="replica_unavailable") == fallbacks + 1
+
+    writes = RecentWrites(window=10, max_users=2)
+    for user_id in ("a", "b", "c"):
+        writes.mark(user_id)
+    assert writes.recent("a") and writes.recent("c") and not writes.recent("d")
+    assert not RecentWrites(window=0).recent("a")
+    print("✅ 读写分离路由正确")
+
+
+def test_read_your_writes_cookie_crosses_workers():
+    """测试写入的响应带上 Cookie，带着 Cookie 的读取落到另一个 worker 时也走主库"""
+    import database_operations as ops
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    user = "00000000-0000-0000-0000-000000000001"
+    executed = []
+
+    def worker(name):
+        repository = ops.PostgresRepository("postgresql://unused")
+        repository.pool = RoutingPool("primary", executed)
+        repository.read_pool = RoutingPool("replica", executed)
+        repository.recent_writes = RecentWrites(window=5)
+        app = FastAPI()
+        db_pool.install_read_your_writes(app)
+
+        @app.post("/start")
+        async def start():
+            await repository.start_timer_session(user, timer_type_id=1, exclusive=False)
+            return {"worker": name}
+
+        @app.get("/stats")
+        async def stats():
+            await repository.get_daily_stats(user)
+            return {"worker": name}
+
+        return TestClient(app)
+
+    first, second = worker("a"), worker("b")
+    response = first.post("/start")
+    assert db_pool.READ_YOUR_WRITES_COOKIE in response.headers["set-cookie"]
+    assert "set-cookie" not in second.get("/stats").headers
+    executed.clear()
+    second.get("/stats", cookies={db_pool.READ_YOUR_WRITES_COOKIE: response.cookies[db_pool.READ_YOUR_WRITES_COOKIE]})
+    second.get("/stats", cookies={db_pool.READ_YOUR_WRITES_COOKIE: "1"})  # 已过期
+    assert executed == [("primary", "daily_stats"), ("replica", "daily_stats")], executed
+    print("✅ 写入 Cookie 跨 worker 读取自己的写入")
+
+
+if __name__ == "__main__":
+    print("🧪 测试数据库连接池")
+    print("=" * 50)
+    test_pool_options_from_env()
+    test_metered_pool_records_wait_and_utilization()
+    test_hot_queries_are_named_and_stable()
+    test_statement_latency_by_name()
+    test_reads_route_to_replica_except_after_writes()
+    test_read_your_writes_cookie_crosses_workers()
+    print("\n🎉 所有测试通过")
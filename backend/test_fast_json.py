@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 快速 JSON 响应测试
+验证编码结果与 FastAPI 默认的 jsonable_encoder + json 一致，接口直接返回，以及大响应的编码速度
+"""
+
+import sys
+import os
+import json
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+import fast_json
+from fast_json import dumps, ok, _stdlib_default
+
+
+class Row:
+    """与 asyncpg.Record 一样有 keys()/items() 但不是 Mapping"""
+
+    def __init__(self, **values):
+        self._values = values
+
+    def keys(self):
+        return self._values.keys()
+
+    def items(self):
+        return self._values.items()
+
+
+@dataclass
+class Session:
+    id: str
+    started_at: datetime
+    completed: bool
+
+
+class Message(BaseModel):
+    role: str
+    content: str
+
+
+def history_payload(rows: int):
+    started = datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc)
+    return {"success": True, "data": [
+        {
+            "session_id": str(uuid.UUID(int=i)),
+            "timer_type": {"name": "focus", "display_name": "聚焦"},
+            "audio_name": "定风波",
+            "planned_duration": 1500,
+            "actual_duration": 1490,
+            "started_at": started + timedelta(minutes=30 * i),
+            "ended_at": started + timedelta(minutes=30 * i + 25),
+            "log_date": (started + timedelta(minutes=30 * i)).date(),
+            "completed": i % 5 != 0,
+        }
+        for i in range(rows)
+    ]}
+
+
+def test_matches_default_encoder():
+    """测试与 jsonable_encoder + json.dumps 的结果一致"""
+    payload = {
+        "aware": datetime(2024, 5, 1, 8, 0, 0, 123456, tzinfo=timezone.utc),
+        "naive": datetime(2024, 5, 1, 8, 0),
+        "day": date(2024, 5, 1),
+        "id": uuid.UUID(int=7),
+        "money": [Decimal("3"), Decimal("2.50")],
+        "row": Row(id=1, name="聚焦"),
+        "session": Session("s1", datetime(2024, 5, 1, tzinfo=timezone.utc), True),
+        "message": Message(role="user", content="你好"),
+        "nested": {"tags": ("a", "b"), "empty": None},
+    }
+    expected = jsonable_encoder({**payload, "row": dict(payload["row"].items())})
+    assert json.loads(dumps(payload)) == expected
+    stdlib = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=_stdlib_default)
+    assert json.loads(stdlib) == expected
+    assert "你好".encode("utf-8") in dumps(payload), "中文不转义"
+    print("✅ 编码结果一致")
+
+
+def test_endpoints_return_encoded_response():
+    """测试接口直接返回编码好的响应"""
+    from fastapi.testclient import TestClient
+    import main_supabase
+    from local_standins import InMemoryStore
+    from storage_engine import MemoryRepository
+
+    main_supabase.repository = MemoryRepository(InMemoryStore())
+    client = TestClient(main_supabase.app)
+    response = client.get("/api/timer/types")
+    assert response.status_code == 200 and response.headers["content-type"] == "application/json"
+    body = response.json()
+    assert body["success"] is True and len(body["data"]) == 3 and "message" not in body
+
+    response = ok(None, "没有进行中的会话")
+    assert json.loads(response.body) == {"success": True, "data": None, "message": "没有进行中的会话"}
+    print("✅ 接口直接返回编码好的响应")
+
+
+def test_large_payload_is_faster():
+    """测试大响应的编码速度"""
+    if fast_json.orjson is None:
+        print("⏭️ 未安装 orjson，跳过速度测试")
+        return
+    payload = history_payload(2000)
+
+    def best_of(fn, repeat=5):
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - started)
+        return min(times)
+
+    default = best_of(lambda: json.dumps(jsonable_encoder(payload), ensure_ascii=False,
+                                         separators=(",", ":")).encode("utf-8"))
+    fast = best_of(lambda: dumps(payload))
+    assert fast * 3 < default, f"default {default * 1000:.1f}ms, fast {fast * 1000:.1f}ms"
+    print(f"✅ 2000 行历史记录：默认 {default * 1000:.1f}ms，快速 {fast * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    print("🧪 测试快速 JSON 响应")
+    print("=" * 50)
+    test_matches_default_encoder()
+    test_endpoints_return_encoded_response()
+    test_large_payload_is_faster()
+    print("\n🎉 所有测试通过")
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 专注分析测试
+验证连续天数、热力图、分位数、完成率趋势的计算，夏令时下的本地时间，按会话变化失效的缓存，
+以及 Supabase 引擎的会话标记与 Postgres 引擎一致且不在事件循环上执行
+"""
+
+import asyncio
+import sys
+import os
+import time
+import random
+import threading
+from datetime import date, datetime, timedelta, timezone
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from clock import VirtualClock, load_timezone
+from local_standins import InMemoryStore
+from storage_engine import MemoryRepository
+from focus_insights import FocusInsights, compute_insights, utc_offsets
+from supabase_integration import SupabaseClient
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+UTC = timezone.utc
+TYPES = {1: "focus", 2: "inspire", 3: "talk"}
+
+
+def fact(when: datetime, duration: int, type_id: int = 1, completed: bool = True):
+    return (int(when.timestamp()), duration, type_id, completed)
+
+
+def test_streaks_heatmap_percentiles_and_trend():
+    """测试各项指标的计算结果"""
+    # 2024-05-06 是周一
+    monday = datetime(2024, 5, 6, 9, 0, tzinfo=UTC)
+    facts = [fact(monday - timedelta(days=20), 600)]                                  # 更早的单独一天
+    facts += [fact(monday + timedelta(days=d), 1500) for d in range(5)]               # 周一到周五连续 5 天
+    facts += [fact(monday + timedelta(days=7, hours=5), 3000, type_id=2)]             # 下周一 14 点
+    facts += [fact(monday + timedelta(days=8), 900, completed=False)]                 # 未完成不计入连续天数
+    facts += [fact(monday + timedelta(days=9), 1200), fact(monday + timedelta(days=10), 1800)]
+
+    result = compute_insights(facts, today=date(2024, 5, 17), type_names=TYPES, tz=UTC, weeks=3)
+
+    assert result["totals"] == {"sessions": 10, "completed": 9, "completion_rate": 90.0,
+                                "focus_seconds": 600 + 5 * 1500 + 3000 + 1200 + 1800,
+                                "first_session": "2024-04-16"}
+    streak = result["streak"]
+    assert streak["longest"] == 5 and streak["longest_start"] == "2024-05-06" and streak["longest_end"] == "2024-05-10"
+    assert streak["current"] == 2, "5-15、5-16 连续两天，今天（5-17）还没有专注不算中断"
+    assert streak["active_days"] == 9
+
+    heatmap = result["heatmap"]
+    assert heatmap["focus_minutes"][0][9] == 25 and heatmap["focus_minutes"][0][14] == 50
+    assert heatmap["sessions"][1][9] == 3, "周二 9 点：4-16、5-07 已完成 + 5-14 未完成"
+    assert heatmap["peak"] == {"weekday": "周四", "hour": 9, "focus_minutes": 55}, "5-09 的 25 分钟 + 5-16 的 30 分钟"
+
+    overall = result["durations"]["overall"]
+    assert overall["count"] == 9 and overall["p50"] == 1500
+    assert result["durations"]["by_type"]["inspire"] == {
+        "sessions": 1, "completed": 1,
+        "durations": {"p50": 3000, "p75": 3000, "p90": 3000, "p95": 3000, "mean": 3000, "count": 1}}
+
+    trend = result["completion_trend"]
+    assert [w["week_start"] for w in trend] == ["2024-04-29", "2024-05-06", "2024-05-13"]
+    assert [w["sessions"] for w in trend] == [0, 5, 4]
+    assert trend[0]["completion_rate"] is None and trend[2]["completion_rate"] == 75.0
+    print("✅ 指标计算正确")
+
+
+def test_empty_history():
+    """测试没有会话的用户"""
+    result = compute_insights([], today=date(2024, 5, 17), type_names=TYPES, tz=UTC)
+    assert result["totals"]["sessions"] == 0 and result["streak"]["current"] == 0
+    assert result["heatmap"]["peak"] is None and result["durations"]["overall"] is None
+    print("✅ 空历史")
+
+
+def test_local_time_across_dst():
+    """测试夏令时切换前后的本地偏移与逐个计算一致"""
+    berlin = load_timezone("Europe/Berlin")
+    rng = random.Random(7)
+    base = int(datetime(2024, 3, 30, tzinfo=UTC).timestamp())
+    starts = [base + rng.randrange(0, 3 * 86400) for _ in range(500)]
+    import numpy as np
+    offsets = utc_offsets(np.array(starts, dtype=np.int64), berlin)
+    expected = [int(datetime.fromtimestamp(ts, berlin).utcoffset().total_seconds()) for ts in starts]
+    assert offsets.tolist() == expected
+    assert set(expected) == {3600, 7200}
+    print("✅ 夏令时本地时间")
+
+
+def test_cache_follows_session_changes():
+    """测试缓存命中、会话变化后重新计算、并发请求合并"""
+    clock = VirtualClock(datetime(2024, 5, 6, 9, 0, tzinfo=UTC))
+
+    class CountingRepository(MemoryRepository):
+        loads = 0
+
+        async def get_session_facts(self, user_id):
+            self.loads += 1
+            return await super().get_session_facts(user_id)
+
+    async def run():
+        repository = CountingRepository(InMemoryStore(clock=clock))
+        insights = FocusInsights(lambda: repository, clock=clock)
+        await repository.start_timer_session(USER_ID, timer_type_id=1, planned_duration=1500, exclusive=False)
+        clock.advance(1500)
+        await repository.complete_timer_session(USER_ID, actual_duration=1500)
+
+        results = await asyncio.gather(*[insights.get(USER_ID) for _ in range(5)])
+        assert repository.loads == 1 and all(r is results[0] for r in results)
+        assert results[0]["totals"]["completed"] == 1
+
+        assert await insights.get(USER_ID) is results[0] and repository.loads == 1
+
+        # 新会话开始：标记变化，重新计算
+        await repository.start_timer_session(USER_ID, timer_type_id=2, planned_duration=600, exclusive=False)
+        started = await insights.get(USER_ID)
+        assert repository.loads == 2 and started["totals"]["sessions"] == 2
+
+        # 会话完成（开始时间不变）也会让标记变化
+        clock.advance(600)
+        await repository.complete_timer_session(USER_ID, actual_duration=600)
+        done = await insights.get(USER_ID)
+        assert repository.loads == 3 and done["totals"]["completed"] == 2
+
+        # 跨天后当前连续天数依赖今天，需要重新计算
+        clock.advance(86400 * 3)
+        later = await insights.get(USER_ID)
+        assert repository.loads == 4 and later["streak"]["current"] == 0
+
+    asyncio.run(run())
+    print("✅ 缓存按会话变化失效")
+
+
+def test_years_of_history_is_fast():
+    """测试多年历史的计算耗时和缓存命中耗时"""
+    rng = random.Random(42)
+    start = datetime(2020, 1, 1, tzinfo=UTC)
+    facts = sorted(
+        fact(start + timedelta(days=d, seconds=rng.randrange(0, 86400)), rng.randrange(300, 5400),
+             rng.choice([1, 2, 3]), rng.random() < 0.8)
+        for d in range(5 * 365) for _ in range(10)
+    )
+    began = time.perf_counter()
+    result = compute_insights(facts, today=date(2024, 12, 31), type_names=TYPES, tz=load_timezone("Europe/Berlin"))
+    elapsed = time.perf_counter() - began
+    assert result["totals"]["sessions"] == len(facts)
+    assert elapsed < 1.0, f"计算 {len(facts)} 个会话耗时 {elapsed:.3f}s"
+    print(f"✅ {len(facts)} 个会话计算耗时 {elapsed * 1000:.1f}ms")
+
+
+class FilteringQuery:
+    """模拟 supabase-py 的查询构造器：按调用链过滤预设的行，记录 execute() 所在线程"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.threads = []
+
+    def table(self, name):
+        return _Chain(self)
+
+
+class _Chain:
+    def __init__(self, source):
+        self.source = source
+        self.filters = []
+        self.negate = False
+        self.head = False
+        self.window = None
+        self.column, self.desc = "started_at", False
+
+    def select(self, columns, count=None, head=None):
+        self.head = bool(head)
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row, n=self.negate: (row[column] == value) != n)
+        self.negate = False
+        return self
+
+    @property
+    def not_(self):
+        self.negate = True
+        return self
+
+    def is_(self, column, value):
+        self.filters.append(lambda row, n=self.negate: (row[column] is None) != n)
+        self.negate = False
+        return self
+
+    def order(self, column, desc=False):
+        self.column, self.desc = column, desc
+        return self
+
+    def limit(self, size):
+        self.window = (0, size)
+        return self
+
+    def range(self, start, end):
+        self.window = (start, end + 1)
+        return self
+
+    def execute(self):
+        self.source.threads.append(threading.current_thread())
+        rows = sorted((r for r in self.source.rows if all(f(r) for f in self.filters)),
+                      key=lambda r: r[self.column], reverse=self.desc)
+        page = [] if self.head else rows[slice(*self.window)] if self.window else rows
+        return type("Response", (), {"data": page, "count": len(rows)})()
+
+
+def test_supabase_marker_matches_postgres():
+    """测试 Supabase 的会话标记返回 (总数, 已结束数, 已完成数, 最近开始时间)，补结束旧会话会改变标记，读取都在线程池中执行"""
+    start = datetime(2024, 5, 6, 9, 0, tzinfo=UTC)
+    rows = [{"user_id": USER_ID, "started_at": (start + timedelta(hours=i)).isoformat(), "actual_duration": 600,
+             "timer_type_id": 1, "ended_at": (start + timedelta(hours=i, minutes=10)).isoformat(), "completed": True}
+            for i in range(3)]
+    rows[0].update(ended_at=None, completed=False, actual_duration=None)
+    rows.append(dict(rows[1], user_id="someone-else"))
+    client = SupabaseClient.__new__(SupabaseClient)
+    client.client = FilteringQuery(rows)
+
+    async def run():
+        before = await client.get_session_marker(USER_ID)
+        assert before == (3, 2, 2, rows[2]["started_at"])
+        rows[0].update(ended_at=(start + timedelta(minutes=90)).isoformat())   # 例如超时回收补结束最早的会话
+        assert await client.get_session_marker(USER_ID) != before
+        facts = await client.get_session_facts(USER_ID, page_size=2)
+        assert [f[1:] for f in facts] == [(0, 1, False), (600, 1, True), (600, 1, True)]
+
+    asyncio.run(run())
+    assert client.client.threads and threading.main_thread() not in client.client.threads
+    print("✅ Supabase 会话标记与 Postgres 一致")
+
+
+if __name__ == "__main__":
+    print("🧪 测试专注分析")
+    print("=" * 50)
+    test_streaks_heatmap_percentiles_and_trend()
+    test_empty_history()
+    test_local_time_across_dst()
+    test_cache_follows_session_changes()
+    test_years_of_history_is_fast()
+    test_supabase_marker_matches_postgres()
+    print("\n🎉 所有测试通过")
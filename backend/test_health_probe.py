@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 依赖探测测试
+验证探测结果的状态、超时和连续失败计数，就绪判断只看关键依赖和结果是否过期，
+检查接口只读取缓存、不触发探测，以及启用计时器日志时数据库故障不影响就绪
+"""
+
+import sys
+import os
+import time
+import asyncio
+import tempfile
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import health_probe
+from health_probe import HealthProber, install_health_probes
+
+
+def test_probe_results_and_readiness():
+    """测试正常、失败、超时和跳过的依赖，以及非关键依赖不影响就绪"""
+    prober = HealthProber(interval=10, timeout=0.05)
+    database = {"healthy": True}
+
+    async def check_database():
+        return database["healthy"]
+
+    async def check_slow():
+        await asyncio.sleep(1)
+        return True
+
+    async def check_unconfigured():
+        return None
+
+    prober.register("database", check_database)
+    prober.register("ark", check_slow, critical=False)
+    prober.register("search", check_unconfigured)
+
+    ready, report = prober.readiness()
+    assert not ready and report["reasons"] == ["启动中：预热未完成", "database: 尚未探测", "search: 尚未探测"]
+
+    prober.started = True
+    snapshot = asyncio.run(prober.probe_once())
+    assert snapshot["database"]["status"] == "up" and snapshot["search"]["status"] == "skipped"
+    assert snapshot["ark"]["status"] == "down" and "超时" in snapshot["ark"]["error"]
+    assert snapshot["ark"]["latency_ms"] < 500
+    ready, report = prober.readiness()
+    assert ready and report["status"] == "ready", report
+
+    database["healthy"] = False
+    asyncio.run(prober.probe_once())
+    snapshot = asyncio.run(prober.probe_once())
+    assert snapshot["database"]["consecutive_failures"] == 2
+    ready, report = prober.readiness()
+    assert not ready and report["reasons"] == ["database: 检查未通过"]
+
+    database["healthy"] = True
+    asyncio.run(prober.probe_once())
+    prober._results["database"]["checked_at"] -= prober.stale_after + 1
+    ready, report = prober.readiness()
+    assert not ready and "过期" in report["reasons"][0]
+    print("✅ 探测结果和就绪判断正确")
+
+
+def test_endpoints_read_cached_results():
+    """测试存活/就绪接口只读缓存，后台任务按间隔探测"""
+    calls = []
+
+    async def check_database():
+        calls.append(time.monotonic())
+        return True
+
+    original = health_probe.health_prober
+    prober = health_probe.health_prober = HealthProber(interval=0.05, timeout=1)
+    prober.register("database", check_database)
+    app = FastAPI()
+    install_health_probes(app)
+    app.on_event("startup")(prober.start)
+    app.on_event("shutdown")(prober.close)
+    try:
+        client = TestClient(app)
+        assert client.get("/api/health/live").json()["status"] == "alive"
+        response = client.get("/api/health/ready")
+        assert response.status_code == 503 and response.json()["status"] == "not_ready"
+        assert calls == [], "检查接口不应触发探测"
+
+        with TestClient(app) as client:
+            time.sleep(0.2)
+            response = client.get("/api/health/ready")
+            assert response.status_code == 200, response.json()
+            assert response.json()["dependencies"]["database"]["status"] == "up"
+        assert len(calls) >= 2, "后台任务应按间隔重复探测"
+    finally:
+        health_probe.health_prober = original
+    print(f"✅ 接口只读缓存，后台探测 {len(calls)} 次")
+
+
+def test_database_outage_keeps_worker_ready_with_journal():
+    """测试启用计时器日志时数据库为非关键依赖：数据库不可用时仍就绪，就绪改为要求日志可写"""
+    import main_supabase
+    from local_standins import InMemoryStore
+    from storage_engine import MemoryRepository
+
+    class DownRepository(MemoryRepository):
+        async def health_check(self):
+            return False
+
+    prober = main_supabase.health_prober
+    previous = main_supabase.repository, dict(prober._checks), os.environ.get("TIMER_JOURNAL_PATH")
+    main_supabase.repository = DownRepository(InMemoryStore())
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.environ["TIMER_JOURNAL_PATH"] = os.path.join(tmp, "journal.db")
+            with TestClient(main_supabase.app) as client:
+                client.portal.call(prober.probe_once)
+                response = client.get("/api/health/ready")
+                dependencies = response.json()["dependencies"]
+                assert response.status_code == 200, response.json()
+                assert dependencies["database"]["status"] == "down" and not dependencies["database"]["critical"]
+                assert dependencies["timer_journal"]["status"] == "up" and dependencies["timer_journal"]["critical"]
+    finally:
+        main_supabase.repository, prober._checks, journal_path = previous
+        prober._results.pop("timer_journal", None)
+        if journal_path is None:
+            os.environ.pop("TIMER_JOURNAL_PATH", None)
+        else:
+            os.environ["TIMER_JOURNAL_PATH"] = journal_path
+    print("✅ 数据库故障时由计时器日志保持就绪")
+
+
+if __name__ == "__main__":
+    print("🧪 测试依赖探测")
+    print("=" * 50)
+    test_probe_results_and_readiness()
+    test_endpoints_read_cached_results()
+    test_database_outage_keeps_worker_ready_with_journal()
+    print("\n🎉 所有测试通过")
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - LLM 准入控制测试
+验证令牌桶、单用户限流、排队顺序、截止时间丢弃、429/503 响应，以及全局配额按 worker 数平分
+"""
+
+import asyncio
+import sys
+import os
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from llm_admission import TokenBucket, AdmissionController, AdmissionRejected, install_admission
+
+
+def test_token_bucket_refill():
+    """测试令牌桶的消耗和补充"""
+    bucket = TokenBucket(rate=2.0, capacity=4, now=0.0)
+    assert bucket.try_take(3, now=0.0)
+    assert not bucket.try_take(2, now=0.0)
+    assert bucket.time_until(2, now=0.0) == 0.5
+    assert bucket.try_take(2, now=0.5)
+    # 超过容量的请求按容量计算，不会永远等待
+    assert bucket.time_until(10, now=0.5) == 2.0
+    print("✅ 令牌桶正确")
+
+
+def test_user_limit_returns_retry_after():
+    """测试单个用户超限时立即拒绝并给出等待时间"""
+    async def run():
+        controller = AdmissionController(user_rate=0.5, user_burst=2, global_rate=100, global_burst=100)
+        await controller.acquire("user:a", cost=2)
+        controller.release(0.1)
+        try:
+            await controller.acquire("user:a")
+            assert False, "应当被限流"
+        except AdmissionRejected as e:
+            assert e.status_code == 429
+            assert e.retry_after_header == "2"
+        # 其他用户不受影响
+        await controller.acquire("user:b")
+        controller.release(0.1)
+
+    asyncio.run(run())
+    print("✅ 单用户限流正确")
+
+
+def test_queue_serves_earliest_deadline_and_sheds_late_requests():
+    """测试排队请求按截止时间获得名额，来不及的请求被丢弃"""
+    async def run():
+        controller = AdmissionController(global_rate=1000, global_burst=1000,
+                                         max_concurrency=1, max_queue=2)
+        await controller.acquire("holder")
+        order = []
+
+        async def waiter(name, timeout):
+            try:
+                async with controller.admit(name, timeout=timeout):
+                    order.append(name)
+                    await asyncio.sleep(0.01)
+            except AdmissionRejected as e:
+                order.append(f"{name}:{e.reason}")
+
+        late = asyncio.create_task(waiter("late", 5.0))
+        urgent = asyncio.create_task(waiter("urgent", 2.0))
+        await asyncio.sleep(0.01)
+
+        # 队列已满，新请求直接拒绝
+        try:
+            await controller.acquire("overflow")
+            assert False, "队列已满应当拒绝"
+        except AdmissionRejected as e:
+            assert e.reason == "queue_full" and e.status_code == 503
+
+        controller.release(0.01)
+        await asyncio.gather(late, urgent)
+        assert order == ["urgent", "late"]
+
+        # 预计服务时间超过剩余时间的请求在入队时就被丢弃
+        controller.expected_service_time = 5.0
+        try:
+            await controller.acquire("slow", timeout=1.0)
+            assert False, "来不及完成的请求应当被丢弃"
+        except AdmissionRejected as e:
+            assert e.reason == "shed"
+        assert controller.in_flight == 0
+
+    asyncio.run(run())
+    print("✅ 排队和丢弃正确")
+
+
+def test_cancelled_waiter_does_not_leak_capacity():
+    """测试排队中被取消的请求不会占用名额"""
+    async def run():
+        controller = AdmissionController(global_rate=1000, global_burst=1000, max_concurrency=1)
+        await controller.acquire("holder")
+        task = asyncio.create_task(controller.acquire("waiting"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        controller.release(0.01)
+        assert controller.in_flight == 0
+        await controller.acquire("next")
+        assert controller.in_flight == 1
+
+    asyncio.run(run())
+    print("✅ 取消的请求不泄漏名额")
+
+
+def test_rejection_maps_to_http_with_retry_after():
+    """测试 AdmissionRejected 转换为带 Retry-After 的 HTTP 响应"""
+    app = FastAPI()
+    install_admission(app)
+
+    @app.get("/limited")
+    async def limited(request: Request):
+        raise AdmissionRejected("user_limited", 2.3, 429)
+
+    response = TestClient(app).get("/limited")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+    print("✅ HTTP 响应正确")
+
+
+def test_global_quota_split_across_workers():
+    """测试全局速率和桶容量按 WEB_CONCURRENCY 平分，单 worker 时不变，桶容量不低于 1"""
+    names = ("WEB_CONCURRENCY", "LLM_GLOBAL_RATE", "LLM_GLOBAL_BURST")
+    saved = {name: os.environ.get(name) for name in names}
+    try:
+        os.environ.update(LLM_GLOBAL_RATE="8", LLM_GLOBAL_BURST="20")
+        for workers, rate, burst in (("", 8, 20), ("4", 2, 5), ("40", 0.2, 1)):
+            os.environ["WEB_CONCURRENCY"] = workers
+            bucket = AdmissionController.from_env().global_bucket
+            assert (bucket.rate, bucket.capacity) == (rate, burst), (workers, bucket.rate, bucket.capacity)
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    print("✅ 全局配额按 worker 数平分")
+
+
+if __name__ == "__main__":
+    print("🧪 测试 LLM 准入控制")
+    print("=" * 50)
+    test_token_bucket_refill()
+    test_user_limit_returns_retry_after()
+    test_queue_serves_earliest_deadline_and_sheds_late_requests()
+    test_cancelled_waiter_does_not_leak_capacity()
+    test_rejection_maps_to_http_with_retry_after()
+    test_global_quota_split_across_workers()
+    print("\n🎉 所有测试通过")
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - Ark 调用容错测试
+验证重试分类、Retry-After、熔断器状态切换、对冲请求，以及熔断时对话接口回退到模拟回复
+"""
+
+import asyncio
+import sys
+import os
+import time
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from llm_resilience import ResilientCaller, CircuitBreaker, CircuitOpenError, is_retryable
+
+
+class UpstreamError(Exception):
+    """模拟 Ark SDK 的 APIStatusError"""
+
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers={"retry-after": str(retry_after)} if retry_after else {})
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_caller(**kwargs):
+    sleeps = []
+
+    async def record_sleep(seconds):
+        sleeps.append(seconds)
+
+    caller = ResilientCaller(sleep=record_sleep, **kwargs)
+    return caller, sleeps
+
+
+def test_retry_classification_and_retry_after():
+    """测试暂时性错误重试、客户端错误不重试、Retry-After 作为最短等待"""
+    assert is_retryable(UpstreamError(503)) and is_retryable(UpstreamError(429))
+    assert is_retryable(TimeoutError()) and not is_retryable(UpstreamError(400))
+
+    async def run():
+        caller, sleeps = make_caller(max_retries=3, base_delay=0.1, max_delay=5)
+        failures = [UpstreamError(503), UpstreamError(429, retry_after=2)]
+
+        def flaky():
+            if failures:
+                raise failures.pop(0)
+            return "ok"
+
+        assert await caller.call(flaky) == "ok"
+        assert len(sleeps) == 2 and sleeps[0] <= 0.1 and sleeps[1] >= 2
+
+        calls = []
+
+        def bad_request():
+            calls.append(1)
+            raise UpstreamError(400)
+
+        try:
+            await caller.call(bad_request)
+            assert False, "400 不应重试"
+        except UpstreamError:
+            pass
+        assert len(calls) == 1
+
+        # Retry-After 超过退避上限时直接放弃
+        def long_limit():
+            raise UpstreamError(429, retry_after=60)
+
+        sleeps.clear()
+        try:
+            await caller.call(long_limit)
+            assert False
+        except UpstreamError:
+            pass
+        assert sleeps == []
+        caller.shutdown()
+
+    asyncio.run(run())
+    print("✅ 重试分类正确")
+
+
+def test_breaker_opens_and_recovers_through_probe():
+    """测试连续失败后熔断、冷却后单个探测请求恢复，探测以 400 或本地错误结束时保持半开"""
+    clock = FakeTime()
+
+    async def run():
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, time_func=clock)
+        caller, _ = make_caller(max_retries=0, breaker=breaker)
+        healthy = False
+
+        def upstream():
+            if not healthy:
+                raise UpstreamError(502)
+            return "ok"
+
+        for _ in range(2):
+            try:
+                await caller.call(upstream)
+            except UpstreamError:
+                pass
+        assert breaker.state == CircuitBreaker.OPEN
+
+        try:
+            await caller.call(upstream)
+            assert False, "熔断中应直接拒绝"
+        except CircuitOpenError as e:
+            assert e.retry_after == 10
+
+        clock.now = 11
+        assert breaker.allow() and not breaker.allow(), "半开状态只放行一个探测请求"
+        breaker.release_probe()
+
+        for error in (UpstreamError(400), ValueError("参数错误")):
+            def rejected():
+                raise error
+            try:
+                await caller.call(rejected)
+                assert False, "不可重试的错误应原样抛出"
+            except type(error):
+                pass
+            assert breaker.state == CircuitBreaker.HALF_OPEN and breaker.opened_count == 1
+
+        healthy = True
+        assert await caller.call(upstream) == "ok"
+        assert caller.snapshot()["state"] == "closed" and caller.snapshot()["opened_count"] == 1
+        caller.shutdown()
+
+    asyncio.run(run())
+    print("✅ 熔断器状态切换正确")
+
+
+def test_breaker_trips_during_retry():
+    """测试重试等待期间熔断器被其他请求打开时，不再重试并抛出 CircuitOpenError"""
+    clock = FakeTime()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, time_func=clock)
+    calls = []
+
+    async def other_request_fails(seconds):
+        breaker.record_failure()
+
+    def upstream():
+        calls.append(1)
+        raise UpstreamError(503)
+
+    async def run():
+        caller = ResilientCaller(max_retries=3, breaker=breaker, sleep=other_request_fails)
+        try:
+            await caller.call(upstream)
+            assert False, "熔断后应抛出 CircuitOpenError"
+        except CircuitOpenError as e:
+            assert isinstance(e.__cause__, UpstreamError) and e.retry_after == 10
+        finally:
+            caller.shutdown()
+
+    asyncio.run(run())
+    assert len(calls) == 1 and breaker.state == CircuitBreaker.OPEN
+    print("✅ 重试期间熔断正确")
+
+
+def test_hedge_wins_when_primary_is_slow():
+    """测试主请求超过延迟分位数时发出对冲请求，先返回的结果生效"""
+    async def run():
+        caller, _ = make_caller(hedge_percentile=90, hedge_min_samples=5)
+        caller.latencies.extend([0.02] * 10)
+        calls = []
+
+        def upstream():
+            calls.append(1)
+            if len(calls) == 1:
+                time.sleep(0.5)
+                return "slow"
+            return "fast"
+
+        start = time.perf_counter()
+        assert await caller.call(upstream) == "fast"
+        assert time.perf_counter() - start < 0.4
+        assert len(calls) == 2
+        caller.shutdown()
+
+    asyncio.run(run())
+    print("✅ 对冲请求正确")
+
+
+def test_chat_falls_back_to_mock_while_circuit_open():
+    """测试熔断期间 /api/openai/chat 返回模拟回复，/api/health 显示熔断状态"""
+    import main
+
+    breaker = main.llm_resilience.breaker
+    saved_client, saved_key = main.get_ark_client, os.environ.get("API_KEY")
+    os.environ["API_KEY"] = "test-key"
+    main.get_ark_client = lambda: SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=None)))
+    breaker.state, breaker.opened_at = CircuitBreaker.OPEN, breaker.time()
+    try:
+        client = TestClient(main.app)
+        response = client.post("/api/openai/chat", json={
+            "guide_id": "borges", "messages": [{"role": "user", "content": "你好"}]})
+        assert response.status_code == 200 and response.json()["reply"]
+        assert client.get("/api/health").json()["llm_circuit"]["state"] == "open"
+    finally:
+        breaker.record_success()
+        main.get_ark_client = saved_client
+        if saved_key is None:
+            os.environ.pop("API_KEY", None)
+        else:
+            os.environ["API_KEY"] = saved_key
+    print("✅ 熔断时回退到模拟回复")
+
+
+if __name__ == "__main__":
+    print("🧪 测试 Ark 调用容错")
+    print("=" * 50)
+    test_retry_classification_and_retry_after()
+    test_breaker_opens_and_recovers_through_probe()
+    test_breaker_trips_during_retry()
+    test_hedge_wins_when_primary_is_slow()
+    test_chat_falls_back_to_mock_while_circuit_open()
+    print("\n🎉 所有测试通过")
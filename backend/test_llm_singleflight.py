@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 相同 LLM 请求合并测试
+验证并发相同请求只调用一次上游、异常和取消正确释放等待者、流式分片共享，
+以及只有 leader 经过准入控制
+"""
+
+import asyncio
+import sys
+import os
+import time
+from contextlib import asynccontextmanager
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from llm_admission import AdmissionRejected
+from llm_singleflight import SingleFlight, completion_in_flight, create_completion, request_key
+
+
+def test_request_key_ignores_param_order():
+    """测试合并键与参数顺序无关，内容不同则键不同"""
+    messages = [{"role": "system", "content": "博尔赫斯"}, {"role": "user", "content": "你好"}]
+    assert request_key(model="m", messages=messages) == request_key(messages=messages, model="m")
+    assert request_key(model="m", messages=messages) != request_key(model="m", messages=messages[:1])
+    print("✅ 合并键正确")
+
+
+def test_concurrent_identical_calls_share_one_upstream_call():
+    """测试并发相同请求共享结果，出错时所有等待者收到同一个异常"""
+    async def run():
+        flight = SingleFlight()
+        calls = []
+
+        async def upstream():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "reply"
+
+        results = await asyncio.gather(*[flight.do("k", upstream) for _ in range(10)])
+        assert results == ["reply"] * 10 and len(calls) == 1
+        assert flight.in_flight == 0
+
+        # 完成后不缓存，下一次请求重新调用
+        await flight.do("k", upstream)
+        assert len(calls) == 2
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+
+        results = await asyncio.gather(*[flight.do("bad", failing) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert flight.in_flight == 0
+
+    asyncio.run(run())
+    print("✅ 并发请求合并正确")
+
+
+def test_only_flight_leader_is_admitted():
+    """测试 follower 不经过准入；leader 被拒绝时 follower 按自己的身份重新发起"""
+    admitted, calls = [], []
+    messages = [{"role": "user", "content": "今天写点什么"}]
+
+    def create(**params):
+        calls.append(1)
+        time.sleep(0.05)
+        return "reply"
+
+    def admit_as(user):
+        @asynccontextmanager
+        async def admit():
+            await asyncio.sleep(0.01)
+            if user == "blocked":
+                raise AdmissionRejected("user_limited", 1.0, 429)
+            admitted.append(user)
+            yield
+        return admit
+
+    async def run():
+        results = await asyncio.gather(*[
+            create_completion(create, admit=admit_as(f"u{i}"), model="m", messages=messages) for i in range(5)])
+        assert results == ["reply"] * 5 and admitted == ["u0"] and len(calls) == 1
+        assert not completion_in_flight(model="m", messages=messages)
+
+        results = await asyncio.gather(*[
+            create_completion(create, admit=admit_as(user), model="m", messages=messages)
+            for user in ("blocked", "u1", "u2")], return_exceptions=True)
+        assert isinstance(results[0], AdmissionRejected) and results[1:] == ["reply", "reply"], results
+        assert admitted == ["u0", "u1"] and len(calls) == 2
+
+    asyncio.run(run())
+    print("✅ 只有 leader 经过准入")
+
+
+def test_cancellation_only_stops_upstream_when_last_waiter_leaves():
+    """测试单个等待者取消不影响其他等待者，全部取消后上游调用被取消"""
+    async def run():
+        flight = SingleFlight()
+        cancelled = []
+
+        async def upstream():
+            try:
+                await asyncio.sleep(0.1)
+                return "reply"
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        first = asyncio.create_task(flight.do("k", upstream))
+        second = asyncio.create_task(flight.do("k", upstream))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "reply" and cancelled == []
+
+        a = asyncio.create_task(flight.do("k2", upstream))
+        b = asyncio.create_task(flight.do("k2", upstream))
+        await asyncio.sleep(0.01)
+        a.cancel()
+        b.cancel()
+        await asyncio.gather(a, b, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert cancelled == [1] and flight.in_flight == 0
+
+    asyncio.run(run())
+    print("✅ 取消处理正确")
+
+
+def test_stream_fan_out_replays_for_late_subscribers():
+    """测试流式分片广播，后加入的订阅者从头回放"""
+    async def run():
+        flight = SingleFlight()
+        starts = []
+
+        async def upstream():
+            starts.append(1)
+            for token in ["梦", "境", "管", "理"]:
+                await asyncio.sleep(0.01)
+                yield token
+
+        async def consume(delay):
+            await asyncio.sleep(delay)
+            return "".join([chunk async for chunk in flight.stream("k", upstream)])
+
+        results = await asyncio.gather(consume(0), consume(0.025), consume(0.035))
+        assert results == ["梦境管理"] * 3 and len(starts) == 1
+
+        async def broken():
+            yield "a"
+            raise RuntimeError("stream broke")
+
+        try:
+            [chunk async for chunk in flight.stream("bad", broken)]
+            assert False
+        except RuntimeError:
+            pass
+        await asyncio.sleep(0)
+        assert flight.in_flight == 0
+
+    asyncio.run(run())
+    print("✅ 流式分片共享正确")
+
+
+if __name__ == "__main__":
+    print("🧪 测试相同 LLM 请求合并")
+    print("=" * 50)
+    test_request_key_ignores_param_order()
+    test_concurrent_identical_calls_share_one_upstream_call()
+    test_only_flight_leader_is_admitted()
+    test_cancellation_only_stops_upstream_when_last_waiter_leaves()
+    test_stream_fan_out_replays_for_late_subscribers()
+    print("\n🎉 所有测试通过")
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 负载基准测试工具的单元测试
+验证百分位统计、请求组合和基线比较逻辑
+"""
+
+import asyncio
+import sys
+import os
+
+import httpx
+from fastapi import FastAPI
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from load_benchmark import (
+    percentile, RouteStats, LoadConfig, run_load, resolve_mix, compare_to_baseline
+)
+
+
+def test_percentile():
+    """测试百分位数计算"""
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50.5
+    assert percentile(values, 99) == 99.01
+    assert percentile([], 95) == 0.0
+    assert percentile([7.0], 99) == 7.0
+    print("✅ 百分位数计算正确")
+
+
+def test_route_stats_counts_errors():
+    """测试错误计数"""
+    stats = RouteStats()
+    stats.record(10.0, "200")
+    stats.record(20.0, "500")
+    stats.record(30.0, "ConnectError")
+    summary = stats.summary(elapsed=1.0)
+    assert summary["count"] == 3
+    assert summary["errors"] == 2
+    assert summary["rps"] == 3.0
+    print("✅ 错误计数正确")
+
+
+def test_resolve_mix_filters_unsupported():
+    """测试请求组合按应用过滤"""
+    weights = resolve_mix("main", "mixed")
+    assert set(weights) == {"chat", "multi_chat"}
+    print("✅ 请求组合过滤正确")
+
+
+def test_run_load_against_asgi_app():
+    """用一个最小应用验证负载循环和计时器状态切换"""
+    app = FastAPI()
+    open_sessions = set()
+
+    @app.post("/api/timer/start")
+    async def start(user_id: str):
+        open_sessions.add(user_id)
+        return {"success": True}
+
+    @app.put("/api/timer/complete")
+    async def complete(user_id: str):
+        open_sessions.discard(user_id)
+        return {"success": True}
+
+    @app.get("/api/timer/current/{user_id}")
+    async def current(user_id: str):
+        return {"success": True, "data": None}
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            config = LoadConfig(weights={"timer_cycle": 1, "timer_current": 1}, users=4,
+                                concurrency=4, duration=5, max_requests=200)
+            return await run_load(client, config)
+
+    summary = asyncio.run(run())
+    assert summary["total"]["count"] == 200
+    assert summary["total"]["errors"] == 0
+    starts = summary["routes"]["POST /api/timer/start"]["count"]
+    completes = summary["routes"]["PUT /api/timer/complete"]["count"]
+    assert abs(starts - completes) <= 4, "开始和完成应当交替进行"
+    print("✅ 负载循环正常")
+
+
+def test_compare_to_baseline():
+    """测试基线回归检测"""
+    def result(p95, p99, rps, error_rate=0.0):
+        route = {"p95_ms": p95, "p99_ms": p99, "rps": rps, "error_rate": error_rate}
+        return {"routes": {"GET /api/timer/types": route}, "total": route}
+
+    baseline = result(10.0, 20.0, 100.0)
+    assert compare_to_baseline(result(11.0, 21.0, 95.0), baseline, tolerance=0.2) == []
+
+    regressions = compare_to_baseline(result(15.0, 20.0, 70.0, 0.05), baseline, tolerance=0.2)
+    assert any("p95_ms" in r for r in regressions)
+    assert any("rps" in r for r in regressions)
+    assert any("error_rate" in r for r in regressions)
+    print("✅ 基线比较正确")
+
+
+if __name__ == "__main__":
+    print("🧪 测试负载基准工具")
+    print("=" * 50)
+    test_percentile()
+    test_route_stats_counts_errors()
+    test_resolve_mix_filters_unsupported()
+    test_run_load_against_asgi_app()
+    test_compare_to_baseline()
+    print("\n🎉 所有测试通过")
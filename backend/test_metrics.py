@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 请求指标测试
+验证直方图、Prometheus 文本格式和中间件的路由标签，以及多 worker 时 /metrics 汇总所有 worker 的指标
+"""
+
+import asyncio
+import sys
+import os
+import tempfile
+import subprocess
+
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import metrics
+from metrics import (
+    MetricsRegistry, install_metrics, instrument_methods, write_snapshot, collect, archive_dead_workers,
+    HTTP_REQUESTS, HTTP_LATENCY, DEPENDENCY_LATENCY, DEPENDENCY_ERRORS
+)
+
+
+def test_histogram_rendering():
+    """测试直方图的累计分桶和导出格式"""
+    registry = MetricsRegistry()
+    histogram = registry.histogram("demo_seconds", "示例", ["route"], buckets=(0.1, 1.0))
+    histogram.observe(0.05, route="/a")
+    histogram.observe(0.5, route="/a")
+    histogram.observe(5.0, route="/a")
+
+    text = registry.render()
+    assert "# TYPE demo_seconds histogram" in text
+    assert 'demo_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{route="/a",le="1.0"} 2' in text
+    assert 'demo_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'demo_seconds_count{route="/a"} 3' in text
+    print("✅ 直方图导出格式正确")
+
+
+def test_label_escaping():
+    """测试标签值转义"""
+    registry = MetricsRegistry()
+    registry.counter("demo_total", "示例", ["detail"]).inc(detail='say "hi"\n')
+    assert 'demo_total{detail="say \\"hi\\"\\n"} 1' in registry.render()
+    print("✅ 标签转义正确")
+
+
+def test_middleware_uses_route_template():
+    """测试中间件按路由模板聚合，而不是按具体路径"""
+    app = FastAPI()
+
+    @app.get("/api/demo/{user_id}")
+    async def demo(user_id: str):
+        if user_id == "missing":
+            raise HTTPException(status_code=404, detail="不存在")
+        return {"user_id": user_id}
+
+    install_metrics(app)
+    client = TestClient(app)
+    before = HTTP_LATENCY.count(method="GET", route="/api/demo/{user_id}")
+    client.get("/api/demo/u1")
+    client.get("/api/demo/u2")
+    client.get("/api/demo/missing")
+
+    assert HTTP_LATENCY.count(method="GET", route="/api/demo/{user_id}") == before + 3
+    assert HTTP_REQUESTS.get(method="GET", route="/api/demo/{user_id}", status="404") >= 1
+
+    body = client.get("/metrics").text
+    assert 'aura_http_requests_total{method="GET",route="/api/demo/{user_id}",status="200"}' in body
+    assert "/api/demo/u1" not in body
+    print("✅ 中间件路由标签正确")
+
+
+def test_instrument_methods_records_dependency_time():
+    """测试依赖调用计时和异常计数，嵌套调用不重复统计"""
+    @instrument_methods("db", "fake")
+    class FakeClient:
+        async def query(self):
+            return 42
+
+        async def broken(self):
+            raise RuntimeError("boom")
+
+        async def _private(self):
+            return 0
+
+    @instrument_methods("db", "fake_sub")
+    class FakeSubclass(FakeClient):
+        async def query(self):
+            return await super().query() + await self.nested()
+
+        async def nested(self):
+            return 1
+
+    client = FakeClient()
+    assert asyncio.run(client.query()) == 42
+    # 同一组件内嵌套的计时调用只统计最外层
+    assert asyncio.run(FakeSubclass().query()) == 43
+    assert DEPENDENCY_LATENCY.count(component="db", operation="fake_sub.query") == 1
+    assert DEPENDENCY_LATENCY.count(component="db", operation="fake_sub.nested") == 0
+    try:
+        asyncio.run(client.broken())
+    except RuntimeError:
+        pass
+
+    assert DEPENDENCY_LATENCY.count(component="db", operation="fake.query") == 1
+    assert DEPENDENCY_ERRORS.get(component="db", operation="fake.broken") == 1
+    assert DEPENDENCY_LATENCY.count(component="db", operation="fake._private") == 0
+    print("✅ 依赖调用计时正确")
+
+
+def _worker_registry(requests: int, in_progress: float, latency: float) -> MetricsRegistry:
+    registry = MetricsRegistry()
+    registry.counter("demo_requests_total", "请求数", ["route"]).inc(requests, route="/a")
+    registry.gauge("demo_in_progress", "进行中", multiprocess_mode="sum").set(in_progress)
+    registry.gauge("demo_start_time", "启动时间").set(in_progress * 100)
+    registry.histogram("demo_seconds", "耗时", buckets=(0.1, 1.0)).observe(latency)
+    return registry
+
+
+def test_multiprocess_metrics_aggregate_across_workers():
+    """测试多 worker 模式下 /metrics 汇总各 worker 的快照，已退出 worker 的计数归档后保留、仪表不再导出"""
+    directory = tempfile.mkdtemp()
+    live = os.getppid()                                       # 本进程留给 /metrics 接口写自己的快照
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    write_snapshot(_worker_registry(3, 2, 0.05), directory, pid=live)
+    write_snapshot(_worker_registry(4, 5, 0.5), directory, pid=dead.pid)
+
+    text = collect(directory).render()
+    assert 'demo_requests_total{route="/a"} 7' in text
+    assert 'demo_seconds_bucket{le="0.1"} 1' in text and 'demo_seconds_count 2' in text
+    assert "demo_in_progress 2" in text                       # 已退出 worker 的仪表不计入
+    assert f'demo_start_time{{pid="{live}"}} 200' in text and f'pid="{dead.pid}"' not in text
+
+    archive_dead_workers(directory)
+    assert set(os.listdir(directory)) == {".archive.lock", "metrics-archive.json", f"metrics-{live}.json"}
+    assert collect(directory).render() == text
+    write_snapshot(_worker_registry(1, 0, 0.05), directory, pid=12345678)
+    archive_dead_workers(directory, pids=[12345678])
+    assert 'demo_requests_total{route="/a"} 8' in collect(directory).render()
+
+    # 抓取落到任意 worker 时都返回汇总结果
+    app = FastAPI()
+    install_metrics(app)
+    os.environ[metrics.MULTIPROC_DIR_ENV] = directory
+    try:
+        text = TestClient(app).get("/metrics").text
+    finally:
+        del os.environ[metrics.MULTIPROC_DIR_ENV]
+    assert 'demo_requests_total{route="/a"} 8' in text and "# TYPE aura_http_requests_total counter" in text
+    print("✅ 多 worker 指标汇总正确")
+
+
+if __name__ == "__main__":
+    print("🧪 测试请求指标")
+    print("=" * 50)
+    test_histogram_rendering()
+    test_label_escaping()
+    test_middleware_uses_route_template()
+    test_instrument_methods_records_dependency_time()
+    test_multiprocess_metrics_aggregate_across_workers()
+    print("\n🎉 所有测试通过")
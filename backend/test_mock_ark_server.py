@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 本地 Ark 模拟服务测试
+不依赖网络，直接在进程内调用模拟服务
+"""
+
+import json
+import random
+import sys
+import os
+
+from fastapi.testclient import TestClient
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from mock_ark_server import (
+    MockArkConfig, LatencyDistribution, parse_distribution, count_tokens, create_app
+)
+
+MESSAGES = [
+    {"role": "system", "content": "你是AURA STUDIO的向导"},
+    {"role": "user", "content": "如何提高工作效率？"},
+]
+
+
+def test_parse_distribution():
+    """测试延迟分布解析"""
+    assert parse_distribution("0.25").describe() == "fixed:0.25"
+    assert parse_distribution("lognormal:0.6,0.4").kind == "lognormal"
+
+    try:
+        parse_distribution("uniform:1")
+        assert False, "参数数量错误时应抛出异常"
+    except ValueError:
+        pass
+
+    rng = random.Random(7)
+    samples = [LatencyDistribution("normal", [0.0, 1.0]).sample(rng) for _ in range(200)]
+    assert min(samples) >= 0.0, "延迟采样不应为负数"
+    print("✅ 延迟分布解析正常")
+
+
+def test_count_tokens():
+    """测试 token 估算"""
+    assert count_tokens("你好") == 2
+    assert count_tokens("hello world") == 4
+    print("✅ token 估算正常")
+
+
+def test_chat_completion_with_usage():
+    """测试非流式对话和 token 统计"""
+    client = TestClient(create_app(MockArkConfig(profile="instant", reply_tokens=30, seed=1)))
+    response = client.post("/api/v3/chat/completions", json={"model": "mock", "messages": MESSAGES})
+    assert response.status_code == 200
+
+    data = response.json()
+    assert data["choices"][0]["message"]["content"]
+    assert data["usage"]["completion_tokens"] <= 30
+    assert data["usage"]["total_tokens"] == data["usage"]["prompt_tokens"] + data["usage"]["completion_tokens"]
+
+    stats = client.get("/mock/stats").json()["stats"]
+    assert stats["requests"] == 1
+    assert stats["completion_tokens"] == data["usage"]["completion_tokens"]
+    print("✅ 非流式对话正常")
+
+
+def test_streaming_completion():
+    """测试流式响应"""
+    client = TestClient(create_app(MockArkConfig(profile="instant", reply_tokens=10, seed=1)))
+    payload = {"model": "mock", "messages": MESSAGES, "stream": True, "stream_options": {"include_usage": True}}
+    with client.stream("POST", "/v1/chat/completions", json=payload) as response:
+        assert response.status_code == 200
+        events = [line[len("data: "):] for line in response.iter_lines() if line.startswith("data: ")]
+
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(e) for e in events[:-1]]
+    content = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks if c["choices"])
+    assert content
+    assert chunks[-1]["usage"]["completion_tokens"] > 0
+    print("✅ 流式响应正常")
+
+
+def test_fault_injection():
+    """测试 429 和 500 注入"""
+    client = TestClient(create_app(MockArkConfig(profile="instant", rate_limit_rate=1.0, retry_after=3)))
+    response = client.post("/api/v3/chat/completions", json={"messages": MESSAGES})
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "3"
+
+    client.post("/mock/config", json={"rate_limit_rate": 0.0})
+    forced = client.post("/api/v3/chat/completions", json={"messages": MESSAGES}, headers={"X-Mock-Fault": "500"})
+    assert forced.status_code == 500
+
+    ok = client.post("/api/v3/chat/completions", json={"messages": MESSAGES})
+    assert ok.status_code == 200
+
+    stats = client.get("/mock/stats").json()["stats"]
+    assert stats["rate_limited"] == 1 and stats["injected_errors"] == 1
+    print("✅ 故障注入正常")
+
+
+if __name__ == "__main__":
+    print("🧪 测试本地 Ark 模拟服务")
+    print("=" * 50)
+    test_parse_distribution()
+    test_count_tokens()
+    test_chat_completion_with_usage()
+    test_streaming_completion()
+    test_fault_injection()
+    print("\n🎉 所有测试通过")
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 响应压缩和字段投影测试
+验证 Accept-Encoding 协商、大响应压缩而小响应和流式响应不压缩，
+以及 fields= 投影在各引擎中结果一致并下推到 select 列
+"""
+
+import asyncio
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from clock import VirtualClock
+from compression import install_compression, negotiate_encoding
+from fast_json import FastJSONResponse, ok
+from field_projection import HISTORY_FIELDS, parse_fields, project
+from local_standins import InMemoryStore, InMemorySupabaseClient
+from storage_engine import MemoryRepository, SupabaseRepository
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+
+
+def test_negotiate_encoding():
+    """测试按 q 值和服务端优先级选择编码"""
+    both = ["br", "gzip"]
+    assert negotiate_encoding("gzip, deflate, br", both) == "br"
+    assert negotiate_encoding("gzip;q=1.0, br;q=0.5", both) == "gzip"
+    assert negotiate_encoding("br", ["gzip"]) is None
+    assert negotiate_encoding("*;q=0.1", ["gzip"]) == "gzip"
+    assert negotiate_encoding("gzip;q=0, identity", both) is None
+    assert negotiate_encoding("", both) is None
+    print("✅ 编码协商正确")
+
+
+def test_large_json_is_compressed():
+    """测试大 JSON 响应被压缩，小响应、流式响应和不接受压缩的客户端原样返回"""
+    app = FastAPI(default_response_class=FastJSONResponse)
+    install_compression(app, minimum_size=1024)
+    started = datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc)
+    rows = [
+        {"session_id": f"00000000-0000-0000-0000-{i:012d}", "timer_type": {"name": "focus", "display_name": "聚焦"},
+         "audio_name": "定风波", "planned_duration": 1500, "actual_duration": 1490,
+         "started_at": started + timedelta(minutes=30 * i), "completed": i % 5 != 0}
+        for i in range(200)
+    ]
+
+    @app.get("/history")
+    async def history():
+        return ok(rows)
+
+    @app.get("/small")
+    async def small():
+        return ok({"status": "ok"})
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(3):
+                yield f"data: {'x' * 1000}{i}\n\n"
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    client = TestClient(app)
+    response = client.get("/history", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    compressed = int(response.headers["content-length"])
+    assert len(response.json()["data"]) == 200
+    assert compressed * 5 < len(response.content), (compressed, len(response.content))
+
+    assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/history", headers={"Accept-Encoding": "identity"}).headers
+    streamed = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in streamed.headers and streamed.text.count("data:") == 3
+    print(f"✅ 200 行历史记录：{len(response.content)} 字节压缩到 {compressed} 字节")
+
+
+def test_fields_are_projected_and_pushed_down():
+    """测试 fields 投影：两个引擎结果一致，Supabase 引擎只 select 需要的列"""
+    assert parse_fields(" started_at,completed,started_at ", HISTORY_FIELDS) == ("started_at", "completed")
+    assert parse_fields("", HISTORY_FIELDS) is None
+    try:
+        parse_fields("started_at,password_hash", HISTORY_FIELDS)
+        raise AssertionError("未知字段应被拒绝")
+    except ValueError as e:
+        assert "password_hash" in str(e)
+
+    selects = []
+
+    class RecordingClient(InMemorySupabaseClient):
+        async def get_user_sessions(self, user_id, limit=50, columns="*"):
+            selects.append(columns)
+            return await super().get_user_sessions(user_id, limit, columns)
+
+        async def get_user_daily_logs(self, user_id, days=7, columns="*"):
+            selects.append(columns)
+            return await super().get_user_daily_logs(user_id, days, columns)
+
+    history_fields = ("started_at", "actual_duration")
+    daily_fields = ("log_date", "deep_work")
+    results = []
+    for make in (lambda store: MemoryRepository(store),
+                 lambda store: SupabaseRepository(RecordingClient(store))):
+        clock = VirtualClock(datetime(2024, 5, 1, 9, 0, tzinfo=timezone.utc))
+        repository = make(InMemoryStore(clock=clock))
+
+        async def run():
+            await repository.sync_auth_user(USER_ID, "user@example.com", "aura")
+            for _ in range(3):
+                await repository.start_timer_session(USER_ID, timer_type_id=1, planned_duration=1500)
+                clock.advance(1500)
+                await repository.complete_timer_session(USER_ID)
+            return (await repository.get_user_sessions_history(USER_ID),
+                    await repository.get_user_sessions_history(USER_ID, fields=history_fields),
+                    await repository.get_daily_stats(USER_ID),
+                    await repository.get_daily_stats(USER_ID, fields=daily_fields),
+                    await repository.get_weekly_stats(USER_ID, fields=("week_start", "total_focus_time")))
+
+        full_history, history, full_daily, daily, weekly = asyncio.run(run())
+        assert history == project(full_history, history_fields) and list(history[0]) == list(history_fields)
+        assert daily == project(full_daily, daily_fields)
+        assert weekly == [{"week_start": "2024-04-29", "total_focus_time": 4500}]
+        results.append((history, daily, weekly))
+
+    assert results[0] == results[1]
+    assert "id,user_id,timer_type_id,started_at,actual_duration" in selects
+    assert "id,user_id,log_date,deep_work_count,deep_work_time" in selects
+    assert "id,user_id,log_date,total_focus_time" in selects
+
+    import main_supabase
+    main_supabase.repository = MemoryRepository(InMemoryStore())
+    response = TestClient(main_supabase.app).get(f"/api/stats/daily/{USER_ID}", params={"fields": "log_date,nope"})
+    assert response.status_code == 400 and "nope" in response.json()["detail"]
+    print("✅ 字段投影一致并下推到 select")
+
+
+if __name__ == "__main__":
+    print("🧪 测试响应压缩和字段投影")
+    print("=" * 50)
+    test_negotiate_encoding()
+    test_large_json_is_compressed()
+    test_fields_are_projected_and_pushed_down()
+    print("\n🎉 所有测试通过")
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 超时会话回收测试
+验证按截止时间顺序关闭、正常完成的会话不被回收、重启后从数据库重新加载、后台任务按时唤醒
+"""
+
+import asyncio
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from clock import VirtualClock
+from local_standins import InMemoryStore, InMemorySupabaseClient
+from storage_engine import MemoryRepository, SupabaseRepository
+from session_reaper import SessionReaper
+from supabase_integration import SupabaseClient
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+
+
+def make_repository(clock=None):
+    store = InMemoryStore(clock=clock)
+    rebuilds = []
+    original = store.rebuild_daily_log
+    store.rebuild_daily_log = lambda user_id, day: rebuilds.append((user_id, day)) or original(user_id, day)
+    return store, MemoryRepository(store), rebuilds
+
+
+def test_overdue_sessions_close_in_deadline_order():
+    """测试只关闭到期的会话，已完成的会话被跳过，每批每天只重建一次日志"""
+    clock = VirtualClock(datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc))
+
+    async def run():
+        store, repository, rebuilds = make_repository(clock)
+        reaper = SessionReaper(lambda: repository, grace=600, batch_size=2, clock=clock)
+        sessions = []
+        for planned in (300, 600, 3600):
+            started = await repository.start_timer_session(USER_ID, timer_type_id=1, planned_duration=planned,
+                                                           exclusive=False)
+            reaper.schedule(started["session_id"], USER_ID, started["started_at"], planned)
+            sessions.append(started["session_id"])
+        done = await repository.complete_timer_session(USER_ID, session_id=sessions[1])
+        reaper.cancel(done["session_id"])
+        rebuilds.clear()
+
+        clock.advance(1000)
+        assert await reaper.reap_once() == 1 and reaper.scheduled == 1
+        closed = store.sessions[sessions[0]]
+        assert not closed["completed"] and closed["actual_duration"] == 300
+        assert closed["ended_at"] == datetime(2024, 5, 1, 8, 5, tzinfo=timezone.utc)
+        assert rebuilds == [(USER_ID, closed["started_at"].date())]
+
+        clock.advance(3600)
+        assert await reaper.reap_once() == 1 and reaper.scheduled == 0
+        log = store.daily_logs[(USER_ID, closed["started_at"].date())]
+        assert log["total_sessions"] == 3 and log["completed_sessions"] == 1
+
+    asyncio.run(run())
+    print("✅ 超时会话按截止时间关闭")
+
+
+def test_reload_after_restart_and_retry_on_failure():
+    """测试重启后从数据库加载进行中的会话，数据库失败时放回等待重试"""
+    clock = VirtualClock(datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc))
+
+    async def run():
+        store, repository, _ = make_repository(clock)
+        for user in range(5):
+            await repository.start_timer_session(f"00000000-0000-0000-0000-00000000000{user}", timer_type_id=2,
+                                                 planned_duration=60)
+        # 每页 2 个：5 个会话开始时间相同，按 id 分页不重复不遗漏
+        reaper = SessionReaper(lambda: repository, grace=60, batch_size=2, clock=clock, page_size=2)
+        assert await reaper.load() == 5 and reaper.scheduled == 5
+        assert await reaper.load() == 5 and len(reaper._heap) == 5, "重复加载不应重复入堆"
+
+        clock.advance(121)
+        failing = SessionReaper(lambda: None, grace=60, clock=clock)
+        failing.schedule("s", USER_ID, clock.now(), 0)
+        clock.advance(61)
+        try:
+            await failing.reap_once()
+            assert False
+        except AttributeError:
+            pass
+        assert failing.scheduled == 1
+
+        closed = []
+
+        async def on_closed(sessions):
+            closed.extend(sessions)
+
+        reaper.on_closed = on_closed
+        assert await reaper.reap_once() == 5 and len(closed) == 5
+        assert all(not s["completed"] and s["ended_at"] for s in store.sessions.values())
+
+    asyncio.run(run())
+    print("✅ 重启后重新加载、失败后重试")
+
+
+class RecordingQuery:
+    """模拟 supabase-py 的查询构造器：记录调用链，execute() 依次返回预设的行"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def table(self, name):
+        self.requests.append([])
+        return self
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.requests[-1].append((name, args)) or self
+
+    def execute(self):
+        return type("Response", (), {"data": self.responses.pop(0)})()
+
+
+def test_supabase_pages_open_sessions_and_closes_in_two_requests():
+    """测试 Supabase 客户端按 (started_at, id) 分页只读所需列，整批关闭只用一条条件更新和一条 upsert"""
+    clock = VirtualClock(datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc))
+    start = clock.now()
+    ids = [f"00000000-0000-4000-8000-00000000000{i}" for i in range(3)]
+    rows = [{"id": sid, "user_id": USER_ID, "timer_type_id": 1, "started_at": start.isoformat(),
+             "planned_duration": 60, "ended_at": None, "completed": False} for sid in ids]
+    client = SupabaseClient.__new__(SupabaseClient)
+    client._clock = clock
+    client.client = RecordingQuery([rows[:2], rows[2:], rows[:2], []])
+    closures = [{"session_id": sid, "user_id": USER_ID, "started_at": start,
+                 "ended_at": start + timedelta(seconds=60 + i), "actual_duration": 60 + i}
+                for i, sid in enumerate(ids)]
+
+    async def run():
+        first = await client.get_open_sessions(limit=2)
+        second = await client.get_open_sessions(limit=2, after=(first[-1].started_at, first[-1].id))
+        assert [s.id for s in first + second] == ids
+        closed = await client.close_open_sessions(closures)
+        assert [s.id for s in closed] == ids[:2]
+
+    asyncio.run(run())
+    page, after, claim, upsert = client.client.requests
+    assert ("select", ("id, user_id, timer_type_id, started_at, planned_duration",)) in page
+    assert [call for call in page if call[0] == "order"] == [("order", ("started_at",)), ("order", ("id",))]
+    assert ("or_", (f'started_at.gt."2024-05-01T08:00:00.000000Z",and(started_at.eq.'
+                    f'"2024-05-01T08:00:00.000000Z",id.gt.{ids[1]})',)) in after
+    assert ("in_", ("id", ids)) in claim and ("is_", ("ended_at", "null")) in claim
+    (name, (written,)), = [call for call in upsert if call[0] == "upsert"]
+    assert [(r["ended_at"], r["actual_duration"]) for r in written] == [
+        (c["ended_at"].isoformat(), c["actual_duration"]) for c in closures[:2]]
+
+    # 内存替身：已结束的会话不会被关闭，关闭的会话按 (用户, 日期) 重建日志
+    async def reap():
+        store = InMemoryStore(clock=clock)
+        repository = SupabaseRepository(InMemorySupabaseClient(store))
+        for _ in range(3):
+            await repository.start_timer_session(USER_ID, timer_type_id=1, planned_duration=60, exclusive=False)
+        done = await repository.complete_timer_session(USER_ID)
+        reaper = SessionReaper(lambda: repository, grace=0, clock=clock, page_size=1)
+        assert await reaper.load() == 2
+        clock.advance(61)
+        assert await reaper.reap_once() == 2
+        assert all(s["ended_at"] for s in store.sessions.values())
+        assert store.sessions[done["session_id"]]["completed"]
+
+    asyncio.run(reap())
+    print("✅ Supabase 分页加载和整批关闭正确")
+
+
+def test_background_task_backs_off_while_database_is_down():
+    """测试数据库不可用时后台任务按指数退避重试，而不是立即反复调用，恢复后正常关闭"""
+    class DownRepository(MemoryRepository):
+        def __init__(self, store):
+            super().__init__(store)
+            self.calls = 0
+            self.down = True
+
+        async def close_overdue_sessions(self, closures):
+            self.calls += 1
+            if self.down:
+                raise OSError("database down")
+            return await super().close_overdue_sessions(closures)
+
+    async def run():
+        clock = VirtualClock(datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc))
+        store = InMemoryStore(clock=clock)
+        repository = DownRepository(store)
+        started = await repository.start_timer_session(USER_ID, timer_type_id=1, planned_duration=60)
+        clock.advance(61)
+        reaper = SessionReaper(lambda: repository, grace=0, reload_interval=3600, max_sleep=0.2,
+                               retry_base=0.02, clock=clock)
+        reaper.start()
+        await asyncio.sleep(0.5)
+        # 0.02 + 0.04 + 0.08 + 0.16 + 0.2 ... 半秒内最多十次左右
+        assert 2 <= repository.calls <= 12, repository.calls
+        assert reaper.scheduled == 1 and reaper._failures >= 2
+
+        repository.down = False
+        for _ in range(50):
+            await asyncio.sleep(0.02)
+            if store.sessions[started["session_id"]]["ended_at"]:
+                break
+        await reaper.close()
+        assert store.sessions[started["session_id"]]["ended_at"] is not None and reaper._failures == 0
+
+    asyncio.run(run())
+    print("✅ 数据库不可用时退避重试")
+
+
+def test_background_task_wakes_for_new_deadline():
+    """测试后台任务在新登记的截止时间到达时醒来关闭会话"""
+    async def run():
+        store, repository, _ = make_repository()
+        reaper = SessionReaper(lambda: repository, grace=0.05, reload_interval=3600, max_sleep=30)
+        reaper.start()
+        await asyncio.sleep(0.01)
+        started = await repository.start_timer_session(USER_ID, timer_type_id=1, planned_duration=0)
+        reaper.schedule(started["session_id"], USER_ID, started["started_at"], 0)
+        for _ in range(50):
+            await asyncio.sleep(0.02)
+            if store.sessions[started["session_id"]]["ended_at"]:
+                break
+        await reaper.close()
+        assert store.sessions[started["session_id"]]["ended_at"] is not None
+
+    asyncio.run(run())
+    print("✅ 后台任务按时唤醒")
+
+
+if __name__ == "__main__":
+    print("🧪 测试超时会话回收")
+    print("=" * 50)
+    test_overdue_sessions_close_in_deadline_order()
+    test_reload_after_restart_and_retry_on_failure()
+    test_supabase_pages_open_sessions_and_closes_in_two_requests()
+    test_background_task_backs_off_while_database_is_down()
+    test_background_task_wakes_for_new_deadline()
+    print("\n🎉 所有测试通过")
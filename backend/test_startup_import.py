@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 启动和导入耗时测试
+在干净的子进程中导入各个应用模块，验证：
+1. 缺少 Supabase / Ark 环境变量时导入不会失败
+2. 导入阶段不会加载 supabase、volcenginesdkarkruntime 等重量级依赖
+3. 导入耗时在预算内（IMPORT_BUDGET_SECONDS，默认 3 秒）
+以及启动预热的容错、存储引擎预热，和关闭时释放单例会关闭客户端的 HTTP 连接池
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+# 添加当前目录到路径
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BACKEND_DIR)
+
+import startup_warmup
+
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "3"))
+APP_MODULES = ["main", "main_supabase", "main_integrated"]
+HEAVY_MODULES = ["supabase", "volcenginesdkarkruntime"]
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {backend!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _import_in_clean_process(module: str) -> dict:
+    env = {"PATH": os.environ.get("PATH", ""), "HOME": os.environ.get("HOME", "")}
+    code = PROBE.format(backend=BACKEND_DIR, module=module, heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, "-c", code], env=env, cwd=BACKEND_DIR,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, f"导入 {module} 失败:\n{result.stderr[-2000:]}"
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_app_modules_import_without_env_and_within_budget():
+    """测试应用模块在没有环境变量时也能快速导入"""
+    for module in APP_MODULES:
+        report = _import_in_clean_process(module)
+        assert report["loaded"] == [], f"{module} 导入时加载了 {report['loaded']}"
+        assert report["elapsed"] < IMPORT_BUDGET_SECONDS, \
+            f"{module} 导入耗时 {report['elapsed']:.2f}s 超过预算 {IMPORT_BUDGET_SECONDS}s"
+        print(f"✅ {module} 导入耗时 {report['elapsed'] * 1000:.0f}ms")
+
+
+def test_warmup_is_opt_in_and_tolerates_failures():
+    """测试预热默认关闭，单个步骤失败不影响其他步骤"""
+    os.environ.pop("STARTUP_WARMUP", None)
+    assert startup_warmup.warmup_enabled() is False
+    os.environ["STARTUP_WARMUP"] = "1"
+    try:
+        assert startup_warmup.warmup_enabled() is True
+    finally:
+        os.environ.pop("STARTUP_WARMUP", None)
+
+    calls = []
+    saved = list(startup_warmup._steps)
+    startup_warmup._steps.clear()
+    try:
+        def broken():
+            raise ValueError("缺少配置")
+
+        async def ok():
+            calls.append("ok")
+
+        startup_warmup.register_warmup("broken", broken)
+        startup_warmup.register_warmup("ok", ok)
+        durations = asyncio.run(startup_warmup.run_warmup())
+    finally:
+        startup_warmup._steps[:] = saved
+
+    assert set(durations) == {"broken", "ok"}
+    assert calls == ["ok"]
+    print("✅ 预热步骤容错正确")
+
+
+class FakeConnection:
+    """记录执行过的语句，查询结果为空"""
+
+    def __init__(self):
+        self.statements = set()
+
+    async def _run(self, query, *args):
+        self.statements.add(" ".join(query.split()))
+
+    async def fetch(self, query, *args):
+        await self._run(query)
+        return []
+
+    async def fetchrow(self, query, *args):
+        await self._run(query)
+
+    async def fetchval(self, query, *args):
+        await self._run(query)
+
+
+class FakePool:
+    def __init__(self, size: int):
+        self.idle = [FakeConnection() for _ in range(size)]
+        self.in_use = 0
+        self.peak = 0
+
+    def get_min_size(self):
+        return len(self.idle)
+
+    def get_max_size(self):
+        return len(self.idle)
+
+    async def acquire(self):
+        await asyncio.sleep(0)
+        self.in_use += 1
+        self.peak = max(self.peak, self.in_use)
+        return self.idle.pop()
+
+    async def release(self, conn):
+        self.in_use -= 1
+        self.idle.append(conn)
+
+
+def test_repository_warm_up():
+    """测试存储引擎预热：每个连接都执行热点查询，连接全部归还；未开启预热时跳过"""
+    from database_operations import PostgresRepository, WARMUP_QUERIES
+    from local_standins import InMemoryStore
+    from storage_engine import MemoryRepository
+
+    repository = PostgresRepository("postgresql://unused")
+    repository.pool = FakePool(3)
+    connections = list(repository.pool.idle)
+    summary = asyncio.run(repository.warm_up())
+    assert summary == {"connections": 3, "statements": len(WARMUP_QUERIES)}
+    assert repository.pool.peak == 3 and repository.pool.in_use == 0
+    assert all(len(conn.statements) == len(WARMUP_QUERIES) for conn in connections)
+
+    memory = MemoryRepository(InMemoryStore())
+    os.environ.pop("STARTUP_WARMUP", None)
+    assert asyncio.run(startup_warmup.warm_up_repository(memory)) == {}
+    os.environ["STARTUP_WARMUP"] = "1"
+    try:
+        assert set(asyncio.run(startup_warmup.warm_up_repository(memory))) == {"repository"}
+    finally:
+        os.environ.pop("STARTUP_WARMUP", None)
+    print("✅ 存储引擎预热正确")
+
+
+class FakeSession:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_release_singletons_closes_http_clients():
+    """测试关闭时 Supabase 客户端（含 admin 客户端）和 Ark 客户端的连接池都被关闭"""
+    import llm_client
+    import supabase_integration
+    from types import SimpleNamespace
+
+    def fake_supabase():
+        return SimpleNamespace(_postgrest=SimpleNamespace(session=FakeSession()), _storage=None, _functions=None,
+                               auth=SimpleNamespace(_http_client=FakeSession()))
+
+    client = supabase_integration.SupabaseClient.__new__(supabase_integration.SupabaseClient)
+    client.client, client.admin_client = fake_supabase(), fake_supabase()
+    ark = FakeSession()
+    supabase_integration.supabase_client = client
+    llm_client._ark_client = ark
+
+    startup_warmup._release_singletons()
+    assert supabase_integration.supabase_client is None and llm_client._ark_client is None
+    for supabase in (client.client, client.admin_client):
+        assert supabase._postgrest.session.closed and supabase.auth._http_client.closed
+    assert ark.closed
+    print("✅ 关闭时释放客户端连接")
+
+
+if __name__ == "__main__":
+    print("🧪 测试启动和导入耗时")
+    print("=" * 50)
+    test_app_modules_import_without_env_and_within_budget()
+    test_warmup_is_opt_in_and_tolerates_failures()
+    test_repository_warm_up()
+    test_release_singletons_closes_http_clients()
+    print("\n🎉 所有测试通过")
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 计时器实时推送测试
+验证按用户扇出、慢消费者丢弃旧消息、WebSocket 和 SSE 推送开始/完成与统计更新，
+以及 main.py 的受保护计时器接口同样推送
+"""
+
+import asyncio
+import json
+import sys
+import os
+
+from fastapi.testclient import TestClient
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from local_standins import InMemoryStore, InMemorySupabaseClient
+from storage_engine import MemoryRepository
+from timer_events import TimerEventHub
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+
+
+def test_hub_fans_out_per_user_and_drops_for_slow_consumers():
+    """测试消息只发给对应用户、队列满时丢弃最旧消息并标记 lagged、取消订阅后清理"""
+    async def run():
+        hub = TimerEventHub(max_queue=2, heartbeat=0.01)
+        first, second = hub.subscribe("a"), hub.subscribe("a")
+        other = hub.subscribe("b")
+        assert hub.publish("a", {"type": "session_started"}) == 2
+        assert (await first.next())["type"] == "session_started"
+        assert (await second.next())["type"] == "session_started"
+        assert await other.next(0.01) is None
+
+        for i in range(3):
+            hub.publish("a", {"type": "tick", "n": i})
+        message = await first.next()
+        assert message["n"] == 1 and message["lagged"]
+        assert "lagged" not in await first.next()
+
+        for subscription in (first, second, other):
+            hub.unsubscribe(subscription)
+        assert hub.subscriber_count == 0 and hub.publish("a", {"type": "x"}) == 0
+
+        # listen() 在没有消息时产出 None 作为心跳，结束后自动取消订阅
+        stream = hub.listen("c", first={"type": "snapshot"})
+        assert (await stream.__anext__())["type"] == "snapshot"
+        assert await stream.__anext__() is None
+        await stream.aclose()
+        assert not hub.has_subscribers("c")
+
+    asyncio.run(run())
+    print("✅ 按用户扇出正确")
+
+
+def test_websocket_pushes_session_changes_and_stats():
+    """测试 WebSocket 先收到快照，然后收到开始和带统计的完成消息"""
+    import main_supabase
+
+    previous = main_supabase.repository
+    main_supabase.repository = MemoryRepository(InMemoryStore())
+    try:
+        client = TestClient(main_supabase.app)
+        with client.websocket_connect(f"/ws/timer/{USER_ID}") as websocket:
+            snapshot = websocket.receive_json()
+            assert snapshot["type"] == "snapshot" and snapshot["current"] is None
+            assert len(snapshot["timer_stats"]) == 3
+
+            started = client.post("/api/timer/start", params={"user_id": USER_ID}, json={"timer_type_id": 1}).json()
+            message = websocket.receive_json()
+            assert message["type"] == "session_started"
+            assert message["session"]["session_id"] == started["data"]["session_id"]
+
+            client.put("/api/timer/complete", params={"user_id": USER_ID}, json={"actual_duration": 1200})
+            message = websocket.receive_json()
+            assert message["type"] == "session_completed" and message["session"]["actual_duration"] == 1200
+            assert message["daily"]["total_focus_time"] == 1200
+            assert message["timer_stats"][0]["completed_count"] == 1
+        assert not main_supabase.timer_hub.has_subscribers(USER_ID)
+    finally:
+        main_supabase.repository = previous
+    print("✅ WebSocket 推送正确")
+
+
+def test_sse_stream_frames():
+    """测试 SSE 帧格式：快照、事件和心跳"""
+    import main_supabase
+
+    previous = main_supabase.repository
+    main_supabase.repository = MemoryRepository(InMemoryStore())
+
+    async def run():
+        stream = main_supabase.sse_timer_events(USER_ID)
+        frame = await stream.__anext__()
+        assert frame.startswith("event: snapshot\ndata: ")
+        main_supabase.timer_hub.publish(USER_ID, {"type": "session_started", "session": {"session_id": "s"}})
+        frame = await stream.__anext__()
+        assert frame.startswith("event: session_started\n")
+        assert json.loads(frame.split("data: ", 1)[1])["session"]["session_id"] == "s"
+        await stream.aclose()
+
+    try:
+        asyncio.run(run())
+    finally:
+        main_supabase.repository = previous
+    print("✅ SSE 推送正确")
+
+
+def test_protected_routes_publish_on_main_app():
+    """测试 main.py 的受保护开始/结束接口推送开始和带统计的完成消息"""
+    import main
+    import protected_routes
+    from supabase_auth import AuthenticatedUser, get_current_user
+
+    client = InMemorySupabaseClient(InMemoryStore())
+
+    async def fake_get_client():
+        return client
+
+    user = AuthenticatedUser(user_id=USER_ID, email="u@example.com", aud="authenticated", exp=0, iat=0,
+                             iss="test", sub=USER_ID, role="authenticated")
+    previous = main.get_client, protected_routes.get_client
+    main.get_client = protected_routes.get_client = fake_get_client
+    main.app.dependency_overrides[get_current_user] = lambda: user
+    try:
+        http = TestClient(main.app)
+        with http.websocket_connect(f"/ws/timer/{USER_ID}") as websocket:
+            assert websocket.receive_json()["type"] == "snapshot"
+            started = http.post("/api/timer/start", params={"timer_type_id": 1, "planned_duration": 1500}).json()
+            session_id = started["data"]["session_id"]
+            message = websocket.receive_json()
+            assert message["type"] == "session_started" and message["session"]["session_id"] == session_id
+
+            http.patch(f"/api/timer/sessions/{session_id}/end", params={"actual_duration": 1200})
+            message = websocket.receive_json()
+            assert message["type"] == "session_completed" and message["session"]["actual_duration"] == 1200
+            assert message["daily"]["total_focus_time"] == 1200
+            assert message["timer_stats"][0]["completed_count"] == 1
+    finally:
+        main.get_client, protected_routes.get_client = previous
+        main.app.dependency_overrides.pop(get_current_user, None)
+    print("✅ 受保护计时器接口推送正确")
+
+
+if __name__ == "__main__":
+    print("🧪 测试计时器实时推送")
+    print("=" * 50)
+    test_hub_fans_out_per_user_and_drops_for_slow_consumers()
+    test_websocket_pushes_session_changes_and_stats()
+    test_sse_stream_frames()
+    test_protected_routes_publish_on_main_app()
+    print("\n🎉 所有测试通过")
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 计时器本地日志测试
+验证数据库不可达时写入日志、恢复后按原时间幂等重放、业务错误不阻塞重放、重启后日志仍在，
+Supabase 引擎的同步请求阻塞时写入仍能超时转入日志，确定性失败的事件不进日志、重放多次后移到死信表，
+以及多个 worker 共用日志文件时每个事件只被重放一次
+"""
+
+import asyncio
+import sys
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from clock import VirtualClock
+from local_standins import InMemoryStore
+from storage_engine import MemoryRepository, SupabaseRepository
+from supabase_integration import SupabaseClient
+from timer_journal import JournaledTimerWrites, TimerJournal
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+
+
+class FlakyRepository(MemoryRepository):
+    """可以模拟数据库宕机和变慢的内存引擎"""
+
+    def __init__(self, store):
+        super().__init__(store)
+        self.down = False
+        self.delay = 0.0
+        self.calls = 0
+        # 这些用户的开始写入总是失败（模拟外键/约束冲突）
+        self.poisoned = set()
+
+    async def _check(self):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.down:
+            raise ConnectionError("database unreachable")
+
+    async def start_timer_session(self, *args, **kwargs):
+        await self._check()
+        if kwargs.get("user_id") in self.poisoned:
+            raise RuntimeError("无法创建计时器会话")
+        return await super().start_timer_session(*args, **kwargs)
+
+    async def complete_timer_session(self, *args, **kwargs):
+        await self._check()
+        return await super().complete_timer_session(*args, **kwargs)
+
+    async def get_current_session(self, user_id):
+        await self._check()
+        return await super().get_current_session(user_id)
+
+
+def make_writes(path, clock):
+    store = InMemoryStore(clock=clock)
+    repository = FlakyRepository(store)
+    writes = JournaledTimerWrites(lambda: repository, journal=TimerJournal(path),
+                                  write_timeout=0.05, clock=clock)
+    return store, repository, writes
+
+
+def test_outage_is_journaled_and_replayed_with_original_times():
+    """测试宕机期间的开始/完成写入日志，恢复后按原时间重放，重复重放不产生重复会话"""
+    clock = VirtualClock(datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc))
+
+    async def run(path):
+        store, repository, writes = make_writes(path, clock)
+        repository.down = True
+
+        started = await writes.start(USER_ID, timer_type_id=1, planned_duration=90, exclusive=False)
+        assert started["queued"] and writes.degraded
+        clock.advance(1500)
+        current = await writes.current(USER_ID)
+        assert current["session_id"] == started["session_id"] and current["elapsed_time"] == 1500
+        completed = await writes.complete(USER_ID)
+        assert completed["queued"] and completed["actual_duration"] == 1500
+        assert await writes.current(USER_ID) is None
+
+        # 数据库仍不可用时重放停在第一个事件
+        assert await writes.replay_once() == 0 and await writes.journal.pending_count() == 2
+
+        repository.down = False
+        clock.advance(3600)
+        assert await writes.replay_once() == 2
+        assert not writes.degraded and await writes.journal.pending_count() == 0
+        session = store.sessions[started["session_id"]]
+        assert session["completed"] and session["actual_duration"] == 1500
+        assert session["started_at"] == datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc)
+
+        # 同一事件再次应用（例如标记前进程退出）是幂等的
+        event = {"session_id": started["session_id"], "timer_type_id": 1, "planned_duration": 90,
+                 "audio_track_id": None, "exclusive": True, "started_at": started["started_at"]}
+        await writes._apply(repository, "start", USER_ID, event)
+        assert len(store.sessions) == 1
+
+        # 恢复后直接写数据库
+        direct = await writes.start(USER_ID, timer_type_id=2)
+        assert "queued" not in direct
+        await writes.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(os.path.join(tmp, "journal.db")))
+    print("✅ 宕机期间写入日志并重放")
+
+
+def test_slow_write_times_out_into_journal_without_duplicates():
+    """测试写入超时转入日志，超时的写入后来落库时重放不会重复创建"""
+    clock = VirtualClock(datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc))
+
+    async def run(path):
+        store, repository, writes = make_writes(path, clock)
+        repository.delay = 0.02
+        writes.write_timeout = 0.01
+        started = await writes.start(USER_ID, timer_type_id=1)
+        assert started["queued"]
+
+        repository.delay = 0
+        writes.write_timeout = 1
+        # 模拟超时的那次写入实际已经落库
+        await MemoryRepository.start_timer_session(
+            repository, USER_ID, timer_type_id=1, session_id=started["session_id"],
+            started_at=datetime.fromisoformat(started["started_at"]))
+        assert await writes.replay_once() == 1
+        assert len(store.sessions) == 1
+        await writes.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(os.path.join(tmp, "journal.db")))
+    print("✅ 超时写入不会重复")
+
+
+def test_rejected_event_does_not_block_and_journal_survives_restart():
+    """测试业务错误的事件被标记为 rejected，日志重启后仍可重放"""
+    clock = VirtualClock(datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc))
+
+    async def write_during_outage(path):
+        _, repository, writes = make_writes(path, clock)
+        repository.down = True
+        await writes.start(USER_ID, timer_type_id=99)
+        await writes.start("00000000-0000-0000-0000-000000000002", timer_type_id=2)
+        await writes.close()
+
+    async def replay_after_restart(path):
+        store, _, writes = make_writes(path, clock)
+        assert await writes.journal.pending_count() == 2
+        assert await writes.replay_once() == 1
+        assert await writes.journal.pending_count() == 0 and len(store.sessions) == 1
+        await writes.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "journal.db")
+        asyncio.run(write_during_outage(path))
+        asyncio.run(replay_after_restart(path))
+    print("✅ 被拒绝的事件不阻塞重放，重启后日志仍在")
+
+
+def test_deterministic_failures_are_not_journaled_and_dead_letter():
+    """测试约束冲突类错误直接返回不进日志；重放时多次失败的事件移到死信表，不阻塞其他用户"""
+    clock = VirtualClock(datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc))
+    other = "00000000-0000-0000-0000-000000000002"
+
+    async def run(path):
+        store, repository, writes = make_writes(path, clock)
+        writes.max_attempts = 3
+        repository.poisoned.add(USER_ID)
+        try:
+            await writes.start(USER_ID, timer_type_id=1)
+            raise AssertionError("确定性失败应直接抛出")
+        except RuntimeError:
+            pass
+        assert not writes.degraded and await writes.journal.pending_count() == 0
+
+        repository.down = True
+        await writes.start(USER_ID, timer_type_id=1)
+        await writes.start(other, timer_type_id=2)
+        repository.down = False
+
+        # 前两轮停在失败的事件上（保持顺序），第三次失败后移到死信表，后面的事件继续重放
+        assert await writes.replay_once() == 0 and await writes.replay_once() == 0
+        assert await writes.replay_once() == 1
+        assert not writes.degraded and await writes.journal.pending_count() == 0
+        dead = await writes.journal.dead_letters()
+        assert len(dead) == 1 and dead[0]["user_id"] == USER_ID and dead[0]["attempts"] == 3
+        assert "RuntimeError" in dead[0]["last_error"] and len(store.sessions) == 1
+        assert (await writes.snapshot())["dead_lettered"] == 1
+        await writes.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(os.path.join(tmp, "journal.db")))
+    print("✅ 确定性失败不进日志，多次失败的事件移到死信表")
+
+
+class BlockingQuery:
+    """模拟 supabase-py 的同步查询构造器：execute() 阻塞当前线程"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        time.sleep(self.seconds)
+        return type("Response", (), {"data": []})()
+
+
+def test_blocking_supabase_write_times_out_into_journal():
+    """测试 Supabase 同步请求阻塞时，写入按超时转入日志，事件循环不被卡住"""
+    clock = VirtualClock(datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc))
+    client = SupabaseClient.__new__(SupabaseClient)
+    client._clock = clock
+    client.client = BlockingQuery(0.3)
+
+    async def run(path):
+        writes = JournaledTimerWrites(lambda: SupabaseRepository(client), journal=TimerJournal(path),
+                                      write_timeout=0.05, clock=clock)
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.01)
+
+        ticking = asyncio.ensure_future(ticker())
+        started_at = time.perf_counter()
+        started = await writes.start(USER_ID, timer_type_id=1)
+        elapsed = time.perf_counter() - started_at
+        ticking.cancel()
+        assert started["queued"] and writes.degraded and elapsed < 0.25, elapsed
+        # 等待期间事件循环照常运行
+        assert len(ticks) >= 3 and max(b - a for a, b in zip(ticks, ticks[1:])) < 0.1
+        await writes.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(os.path.join(tmp, "journal.db")))
+    print("✅ Supabase 请求阻塞时写入转入日志")
+
+
+def test_workers_sharing_a_journal_replay_each_event_once():
+    """测试两个 worker 共用日志文件同时重放时每个事件只应用一次，认领者退出后由其他 worker 接手"""
+    clock = VirtualClock(datetime(2024, 5, 1, 8, 0, tzinfo=timezone.utc))
+
+    async def run(path):
+        store, repository, first = make_writes(path, clock)
+        second = JournaledTimerWrites(lambda: repository, journal=TimerJournal(path, claim_ttl=0.2),
+                                      write_timeout=0.5, clock=clock)
+        repository.down = True
+        for _ in range(3):
+            await first.start(USER_ID, timer_type_id=1)
+            clock.advance(600)
+            # 不带 session_id 的完成：重复应用会完成下一个会话
+            await first.complete(USER_ID)
+        repository.down, repository.delay, repository.calls = False, 0.01, 0
+
+        applied = await asyncio.gather(first.replay_once(), second.replay_once())
+        applied += (await first.replay_once(), await second.replay_once())
+        assert sum(applied) == 6 and repository.calls == 6, (applied, repository.calls)
+        assert len(store.sessions) == 3 and all(s["completed"] for s in store.sessions.values())
+
+        # 认领后退出的 worker：认领未过期时其他 worker 不重放，过期后接手
+        repository.down = True
+        await first.start(USER_ID, timer_type_id=1)
+        repository.down = False
+        crashed = TimerJournal(path)
+        assert len(await crashed.claim()) == 1
+        assert await second.replay_once() == 0 and await second.journal.pending_count() == 1
+        await asyncio.sleep(0.25)
+        assert await second.replay_once() == 1 and await second.journal.pending_count() == 0
+        crashed.close()
+        await first.close()
+        await second.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(os.path.join(tmp, "journal.db")))
+    print("✅ 多个 worker 共用日志时每个事件只重放一次")
+
+
+if __name__ == "__main__":
+    print("🧪 测试计时器本地日志")
+    print("=" * 50)
+    test_outage_is_journaled_and_replayed_with_original_times()
+    test_slow_write_times_out_into_journal_without_duplicates()
+    test_rejected_event_does_not_block_and_journal_survives_restart()
+    test_deterministic_failures_are_not_journaled_and_dead_letter()
+    test_blocking_supabase_write_times_out_into_journal()
+    test_workers_sharing_a_journal_replay_each_event_once()
+    print("\n🎉 所有测试通过")
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 请求追踪测试
+验证 span 树的嵌套和并发、按类型汇总不重复计算、请求外不记录，
+以及慢请求输出一行包含各步骤耗时的结构化日志，流式响应按首字节时间判断
+"""
+
+import sys
+import os
+import json
+import time
+import asyncio
+import logging
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import tracing
+from tracing import Trace, install_tracing, span, traced
+from fast_json import FastJSONResponse, ok
+from local_standins import InMemoryStore
+from storage_engine import MemoryRepository
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+
+
+def test_span_tree_and_totals():
+    """测试嵌套和并发的 span、同类嵌套只计一次、请求外的 span 不记录"""
+    @traced("verify", kind="cpu")
+    def verify():
+        time.sleep(0.01)
+
+    async def query(name):
+        with span(f"db.{name}", kind="db"):
+            with span(f"sql.{name}", kind="db"):
+                await asyncio.sleep(0.02)
+
+    async def run():
+        assert span("outside").__enter__() is None
+        trace = Trace("GET /demo")
+        token = tracing._current.set(trace)
+        try:
+            verify()
+            await asyncio.gather(query("a"), query("b"))
+        finally:
+            tracing._current.reset(token)
+            trace.finish()
+        return trace
+
+    trace = asyncio.run(run())
+    names = [child.name for child in trace.children]
+    assert names == ["verify", "db.a", "db.b"], names
+    assert trace.children[1].children[0].name == "sql.a"
+    totals = trace.totals()
+    assert set(totals) == {"cpu", "db"}
+    # 两个并发查询各约 20ms，嵌套的 sql span 不重复计算
+    assert 35 <= totals["db"] < 80, totals
+    assert trace.unaccounted_ms() < trace.duration_ms - 25
+    assert trace.span_count == 5
+
+    limited = Trace("GET /limited", max_spans=2)
+    token = tracing._current.set(limited)
+    try:
+        for i in range(4):
+            with span(f"step{i}"):
+                pass
+    finally:
+        tracing._current.reset(token)
+    assert len(limited.children) == 2 and limited.dropped == 2
+    print(f"✅ span 树正确：{totals}")
+
+
+class _Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_slow_request_logged_with_breakdown():
+    """测试慢请求输出一行 JSON：路由模板、按类型汇总和各步骤（数据库方法、JSON 编码）"""
+    app = FastAPI(default_response_class=FastJSONResponse)
+    install_tracing(app, slow_ms=30)
+    repository = MemoryRepository(InMemoryStore(latency=0.04))
+
+    @app.get("/api/stats/daily/{user_id}")
+    async def daily(user_id: str):
+        return ok(await repository.get_daily_stats(user_id))
+
+    @app.get("/fast")
+    async def fast():
+        return ok({"status": "ok"})
+
+    handler = _Records()
+    tracing.logger.addHandler(handler)
+    try:
+        client = TestClient(app)
+        assert client.get(f"/api/stats/daily/{USER_ID}").status_code == 200
+        assert client.get("/fast").status_code == 200
+    finally:
+        tracing.logger.removeHandler(handler)
+
+    assert len(handler.messages) == 1, handler.messages
+    line = handler.messages[0]
+    assert "\n" not in line
+    record = json.loads(line)
+    assert record["event"] == "slow_request" and record["status"] == 200
+    assert record["route"] == "/api/stats/daily/{user_id}" and record["duration_ms"] >= 30
+    names = [s["name"] for s in record["spans"]]
+    assert "db.memory.get_daily_stats" in names and "json.encode" in names, names
+    assert record["totals"]["db"] >= 40 and "cpu" in record["totals"]
+    print(f"✅ 慢请求日志：{line[:120]}...")
+
+
+def test_streamed_responses_judged_by_first_byte():
+    """测试 SSE 和分块流式响应按首字节时间判断，长连接不记为慢请求，首字节慢时仍然记录"""
+    from fastapi.responses import StreamingResponse
+
+    app = FastAPI()
+    install_tracing(app, slow_ms=30)
+
+    async def events(first_delay):
+        await asyncio.sleep(first_delay)
+        for i in range(3):
+            yield f"data: {i}\n\n"
+            await asyncio.sleep(0.03)
+
+    @app.get("/stream")
+    async def stream():
+        return StreamingResponse(events(0), media_type="text/event-stream")
+
+    @app.get("/chunks")
+    async def chunks():
+        return StreamingResponse(events(0), media_type="text/plain")
+
+    @app.get("/late")
+    async def late():
+        return StreamingResponse(events(0.05), media_type="text/event-stream")
+
+    handler = _Records()
+    tracing.logger.addHandler(handler)
+    try:
+        client = TestClient(app)
+        for path in ("/stream", "/chunks", "/late"):
+            assert client.get(path).status_code == 200
+    finally:
+        tracing.logger.removeHandler(handler)
+
+    assert len(handler.messages) == 1, handler.messages
+    record = json.loads(handler.messages[0])
+    assert record["path"] == "/late" and record["streamed"] and record["ttfb_ms"] >= 50
+    assert record["duration_ms"] >= 100
+    print("✅ 流式响应按首字节时间判断")
+
+
+if __name__ == "__main__":
+    print("🧪 测试请求追踪")
+    print("=" * 50)
+    test_span_tree_and_totals()
+    test_slow_request_logged_with_breakdown()
+    test_streamed_responses_judged_by_first_byte()
+    print("\n🎉 所有测试通过")
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 多 worker 运行配置测试
+验证 worker 数计算、请求计数、就绪状态和状态文件
+"""
+
+import sys
+import os
+import tempfile
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# 添加当前目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from gunicorn_conf import default_workers
+from worker_health import (
+    WorkerState, WorkerHealthMiddleware, read_worker_statuses, remove_stale_statuses, router
+)
+
+
+def test_default_workers():
+    """测试按核数计算 worker 数"""
+    assert default_workers(1) == 3
+    assert default_workers(4) == 9
+    assert default_workers(16, max_workers=8) == 8
+    print("✅ worker 数计算正确")
+
+
+def test_middleware_counts_requests_and_marks_ready():
+    """测试请求计数和 startup 完成后的就绪标记"""
+    with tempfile.TemporaryDirectory() as status_dir:
+        os.environ["WORKER_STATUS_DIR"] = status_dir
+        try:
+            state = WorkerState()
+            app = FastAPI()
+            app.include_router(router)
+            app.add_middleware(WorkerHealthMiddleware, state=state)
+
+            @app.get("/ping")
+            async def ping():
+                return {"ok": True}
+
+            assert state.ready is False
+            with TestClient(app) as client:
+                assert state.ready is True
+                client.get("/ping")
+                client.get("/ping")
+                body = client.get("/api/health/worker").json()
+
+            assert state.requests == 3
+            assert body["worker"]["pid"] == os.getpid()
+
+            statuses = read_worker_statuses(status_dir)
+            assert len(statuses) == 1 and statuses[0]["ready"] is True
+
+            state.remove_status()
+            assert read_worker_statuses(status_dir) == []
+        finally:
+            os.environ.pop("WORKER_STATUS_DIR", None)
+    print("✅ 请求计数和就绪状态正确")
+
+
+def test_remove_stale_statuses():
+    """测试清理已退出进程的状态文件，保留存活进程的状态"""
+    with tempfile.TemporaryDirectory() as status_dir:
+        for pid in (os.getpid(), 2 ** 22 + 1):
+            with open(os.path.join(status_dir, f"worker-{pid}.json"), "w") as f:
+                f.write('{"pid": %d}' % pid)
+
+        remove_stale_statuses(status_dir)
+        assert [s["pid"] for s in read_worker_statuses(status_dir)] == [os.getpid()]
+    print("✅ 过期状态文件清理正确")
+
+
+if __name__ == "__main__":
+    print("🧪 测试多 worker 运行配置")
+    print("=" * 50)
+    test_default_workers()
+    test_middleware_counts_requests_and_marks_ready()
+    test_remove_stale_statuses()
+    print("\n🎉 所有测试通过")
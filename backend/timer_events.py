@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 计时器实时推送
+进程内按用户的发布/订阅：计时器开始、完成以及当天统计更新时推送给该用户所有打开的页面，
+代替前端轮询 /api/timer/current 和统计接口
+
+- 每个订阅者一个有界队列；消费太慢时丢弃最旧的消息并在下一条消息上标记 lagged，
+  客户端收到 lagged 后重新拉一次快照即可，不会拖慢发布方
+- 只在本进程内扇出：多 worker 部署时，同一用户的推送只到达连接在同一个 worker 上的页面，
+  需要跨 worker 时在负载均衡上按 user_id 做粘性路由
+- 推送通道：WebSocket /ws/timer/{user_id} 和 SSE /api/timer/stream/{user_id}，消息格式相同，
+  由 install_timer_push() 注册；各应用的计时器写入接口在写入成功后调用 publish_session_change()
+
+使用方法：
+from timer_events import timer_hub, install_timer_push, publish_session_change
+
+install_timer_push(app, snapshot)   # snapshot(user_id) 返回连接建立时发送的快照
+timer_hub.publish(user_id, {"type": "session_started", "session": session})
+await publish_session_change(user_id, {"type": "session_completed", "session": session}, repository)
+async for message in timer_hub.listen(user_id): ...
+"""
+
+import os
+import json
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+from fastapi import WebSocket
+from fastapi.responses import StreamingResponse
+
+from clock import get_clock, local_date
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+TIMER_SUBSCRIBERS = REGISTRY.gauge("aura_timer_subscribers", "当前的计时器推送订阅数", multiprocess_mode="sum")
+TIMER_EVENTS_PUBLISHED = REGISTRY.counter("aura_timer_events_published_total", "发布的计时器推送消息", ["type"])
+TIMER_EVENTS_DROPPED = REGISTRY.counter("aura_timer_events_dropped_total", "订阅者消费太慢而丢弃的推送消息")
+
+
+class Subscription:
+    """一个订阅者（一个打开的页面）"""
+
+    def __init__(self, user_id: str, max_queue: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.lagged = False
+
+    def offer(self, message: Dict[str, Any]):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.lagged = True
+            TIMER_EVENTS_DROPPED.inc()
+        self.queue.put_nowait(message)
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """等待下一条消息，超时返回 None（用于发送心跳）"""
+        try:
+            message = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if self.lagged:
+            self.lagged = False
+            message = {**message, "lagged": True}
+        return message
+
+
+class TimerEventHub:
+    """按 user_id 扇出的进程内发布/订阅"""
+
+    def __init__(self, max_queue: int = None, heartbeat: float = None):
+        self.max_queue = max_queue or int(os.getenv("TIMER_PUSH_QUEUE", "32"))
+        self.heartbeat = heartbeat or float(os.getenv("TIMER_PUSH_HEARTBEAT", "25"))
+        self._subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+
+    def has_subscribers(self, user_id: str) -> bool:
+        return bool(self._subscribers.get(user_id))
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(subs) for subs in self._subscribers.values())
+
+    def subscribe(self, user_id: str) -> Subscription:
+        subscription = Subscription(user_id, self.max_queue)
+        self._subscribers[user_id].add(subscription)
+        TIMER_SUBSCRIBERS.set(self.subscriber_count)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.user_id]
+        TIMER_SUBSCRIBERS.set(self.subscriber_count)
+
+    def publish(self, user_id: str, message: Dict[str, Any]) -> int:
+        """推送给该用户的所有订阅者，返回送达的订阅数；不会阻塞"""
+        subscribers = self._subscribers.get(user_id)
+        if not subscribers:
+            return 0
+        TIMER_EVENTS_PUBLISHED.inc(type=message.get("type", "unknown"))
+        for subscription in list(subscribers):
+            subscription.offer(message)
+        return len(subscribers)
+
+    async def listen(self, user_id: str, first: Dict[str, Any] = None) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """订阅并逐条产出消息；每隔 heartbeat 秒没有消息时产出 None，调用方据此发送心跳"""
+        subscription = self.subscribe(user_id)
+        try:
+            if first is not None:
+                yield first
+            while True:
+                yield await subscription.next(self.heartbeat)
+        finally:
+            self.unsubscribe(subscription)
+
+
+def sse_format(message: Optional[Dict[str, Any]]) -> str:
+    """SSE 帧；None 输出注释行作为心跳"""
+    if message is None:
+        return ": keep-alive\n\n"
+    return f"event: {message.get('type', 'message')}\ndata: {json.dumps(message, ensure_ascii=False, default=str)}\n\n"
+
+
+# 进程内共享
+timer_hub = TimerEventHub()
+
+
+# ==================== 推送内容和接口 ====================
+
+Snapshot = Callable[[str], Awaitable[Dict[str, Any]]]
+
+
+async def today_stats(repository, user_id: str) -> Dict[str, Any]:
+    """推送用的统计：今天的日志和各计时器类型的累计"""
+    today = local_date(get_clock().now())
+    daily, timer_stats = await asyncio.gather(
+        repository.get_daily_stats(user_id=user_id, start_date=today, end_date=today),
+        repository.get_user_timer_stats(user_id)
+    )
+    return {"daily": daily[0] if daily else None, "timer_stats": timer_stats}
+
+
+async def publish_session_change(user_id: str, message: Dict[str, Any], repository=None):
+    """推送会话变化；传入 repository 时附带最新统计，没有订阅者时不额外查询"""
+    if not timer_hub.has_subscribers(user_id):
+        return
+    if repository is not None:
+        try:
+            message = {**message, **await today_stats(repository, user_id)}
+        except Exception as e:
+            logger.warning(f"推送统计查询失败: {e}")
+    timer_hub.publish(user_id, message)
+
+
+async def sse_events(user_id: str, snapshot: Snapshot):
+    async for message in timer_hub.listen(user_id, first=await snapshot(user_id)):
+        yield sse_format(message)
+
+
+def install_timer_push(app, snapshot: Snapshot):
+    """注册 SSE 和 WebSocket 推送接口；snapshot(user_id) 返回连接建立时发送一次的快照，之后只推送变化"""
+
+    @app.get("/api/timer/stream/{user_id}", summary="计时器实时推送（SSE）")
+    async def timer_event_stream(user_id: str):
+        """Server-Sent Events：先推送快照，之后推送会话开始/完成和统计更新"""
+        return StreamingResponse(
+            sse_events(user_id, snapshot),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    @app.websocket("/ws/timer/{user_id}")
+    async def timer_websocket(websocket: WebSocket, user_id: str):
+        """WebSocket 推送，消息与 SSE 相同；没有消息时定期发送 ping"""
+        await websocket.accept()
+
+        async def forward():
+            try:
+                async for message in timer_hub.listen(user_id, first=await snapshot(user_id)):
+                    await websocket.send_json(message or {"type": "ping"})
+            except Exception as e:
+                logger.warning(f"计时器推送中断: {e}")
+                await websocket.close(code=1011)
+
+        sender = asyncio.ensure_future(forward())
+        try:
+            # 客户端不需要发送内容，这里只用来及时发现断开
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+        finally:
+            sender.cancel()
@@ -0,0 +1,516 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 计时器写入本地日志
+数据库变慢或不可达时，计时器的开始/完成先写入本地 SQLite（WAL 模式）追加日志并立即返回，
+后台重放任务在数据库恢复后按顺序把日志应用到存储引擎
+
+- 每个事件带有唯一 event_id；开始事件在写入前就生成 session_id 和 started_at，
+  完成事件记录 ended_at，重放时原样传给存储引擎，按 session_id 幂等，重复应用不会产生重复会话
+- 写数据库超过 TIMER_JOURNAL_WRITE_TIMEOUT 秒或连接失败（TRANSIENT_ERRORS）时转入日志，并进入降级状态：
+  之后的写入直接进日志，不再等待超时，直到重放把积压清空；其他异常（例如约束冲突）直接抛给调用方，不进日志
+- 某个用户还有未重放的事件时，他的新写入也进日志，保证同一用户的事件顺序
+- 业务错误（ValueError，例如计时器类型不存在）在重放时标记为 rejected，不阻塞后续事件
+- 重放时连接和超时错误视为数据库仍不可用，停在该事件等下一轮；其他异常每次计一次尝试，
+  达到 TIMER_JOURNAL_MAX_ATTEMPTS 次后移到死信表 timer_events_dead，后面的事件继续重放
+- 查询当前会话时先看该用户未重放的事件，保证刚开始的会话在降级期间也能查到
+- 多个 worker 共用同一个日志文件：重放前在一个 IMMEDIATE 事务中把一批事件认领为 replaying（owner 为本进程），
+  其他 worker 有未过期的认领时这一轮不重放，所以同一事件只会被一个 worker 应用，顺序也不会交错；
+  每处理一个事件刷新认领时间，认领者崩溃后超过 TIMER_JOURNAL_CLAIM_TTL 秒由其他 worker 接手
+
+使用方法：
+from timer_journal import JournaledTimerWrites, open_journal
+
+timer_writes = JournaledTimerWrites(lambda: repository)
+timer_writes.journal = open_journal()
+timer_writes.start_replay()
+"""
+
+import os
+import json
+import uuid
+import asyncio
+import sqlite3
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from clock import Clock, get_clock, elapsed_seconds
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "timer_journal.db")
+
+JOURNAL_EVENTS = REGISTRY.counter(
+    "aura_timer_journal_events_total",
+    "计时器日志事件（journaled 写入日志，applied/rejected/dead_lettered 重放结果）", ["kind", "outcome"])
+# 各 worker 共用同一个日志文件，读到的是同一个数
+JOURNAL_PENDING = REGISTRY.gauge("aura_timer_journal_pending", "等待重放的计时器事件数", multiprocess_mode="max")
+JOURNAL_REPLAY_ERRORS = REGISTRY.counter("aura_timer_journal_replay_errors_total", "重放时数据库仍不可用的次数")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS timer_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    recorded_at TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    owner TEXT,
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_timer_events_status ON timer_events (status, seq);
+CREATE INDEX IF NOT EXISTS idx_timer_events_user ON timer_events (user_id, status, seq);
+CREATE TABLE IF NOT EXISTS timer_events_dead (
+    seq INTEGER PRIMARY KEY,
+    event_id TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    recorded_at TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    last_error TEXT,
+    dead_at TEXT NOT NULL
+);
+"""
+
+
+def _transient_errors() -> tuple:
+    """表示数据库暂时不可用的异常：连接失败、超时、连接数已满、语句被取消"""
+    errors = [asyncio.TimeoutError, OSError]
+    try:
+        import asyncpg
+        errors += [asyncpg.PostgresConnectionError, asyncpg.CannotConnectNowError,
+                   asyncpg.TooManyConnectionsError, asyncpg.QueryCanceledError, asyncpg.InterfaceError]
+    except ImportError:  # pragma: no cover - 只使用 Supabase 引擎时
+        pass
+    try:
+        import httpx
+        errors.append(httpx.TransportError)
+    except ImportError:  # pragma: no cover
+        pass
+    return tuple(errors)
+
+
+TRANSIENT_ERRORS = _transient_errors()
+
+
+class TimerJournal:
+    """SQLite 追加日志，所有访问在单个线程中串行执行，不阻塞事件循环"""
+
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH, synchronous: str = "NORMAL", claim_ttl: float = None):
+        self.path = path
+        # 认领重放事件时的身份；同一个文件可能被多个 worker 进程打开
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.claim_ttl = claim_ttl if claim_ttl is not None else float(os.getenv("TIMER_JOURNAL_CLAIM_TTL", "60"))
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="timer-journal")
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        # WAL 下 NORMAL 在进程崩溃时不丢已提交事务，FULL 还能扛住断电，但每次提交多一次 fsync
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={synchronous}")
+        # 多个 worker 同时写入时等待锁而不是立即报 database is locked
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(_SCHEMA)
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(timer_events)")}
+        for column, kind in (("owner", "TEXT"), ("claimed_at", "REAL")):
+            if column not in columns:  # 旧版本创建的日志文件
+                self._conn.execute(f"ALTER TABLE timer_events ADD COLUMN {column} {kind}")
+
+    async def _run(self, fn: Callable, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    # ---------- 同步实现，在日志线程中执行 ----------
+
+    def _append(self, event_id: str, kind: str, user_id: str, payload: str, recorded_at: str) -> int:
+        self._conn.execute(
+            "INSERT OR IGNORE INTO timer_events (event_id, kind, user_id, payload, recorded_at) VALUES (?, ?, ?, ?, ?)",
+            (event_id, kind, user_id, payload, recorded_at))
+        return self._pending_count()
+
+    def _pending_count(self) -> int:
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM timer_events WHERE status IN ('pending', 'replaying')").fetchone()[0]
+
+    def _select(self, sql: str, params: tuple) -> List[Dict[str, Any]]:
+        return [
+            {**dict(row), "payload": json.loads(row["payload"])}
+            for row in self._conn.execute(sql, params).fetchall()
+        ]
+
+    def _claim(self, limit: int, now: float) -> List[Dict[str, Any]]:
+        """认领最早的一批待重放事件；其他 worker 的认领未过期时返回空列表"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            busy = self._conn.execute(
+                "SELECT 1 FROM timer_events WHERE status = 'replaying' AND owner != ? AND claimed_at > ? LIMIT 1",
+                (self.owner, now - self.claim_ttl)).fetchone()
+            if busy:
+                self._conn.execute("COMMIT")
+                return []
+            # 自己没处理完的和已过期的认领一起放回，按 seq 重新认领
+            self._conn.execute(
+                "UPDATE timer_events SET status = 'pending', owner = NULL, claimed_at = NULL "
+                "WHERE status = 'replaying'")
+            events = self._select("SELECT * FROM timer_events WHERE status = 'pending' ORDER BY seq LIMIT ?",
+                                  (limit,))
+            self._conn.executemany(
+                "UPDATE timer_events SET status = 'replaying', owner = ?, claimed_at = ? WHERE seq = ?",
+                [(self.owner, now, event["seq"]) for event in events])
+            self._conn.execute("COMMIT")
+            return events
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _mark(self, seq: int, status: str, error: Optional[str], now: float) -> int:
+        """更新自己认领的事件并刷新其余认领的时间；认领已被其他 worker 接手时返回 -1"""
+        cursor = self._conn.execute(
+            "UPDATE timer_events SET status = ?, attempts = attempts + 1, last_error = ?, "
+            "owner = NULL, claimed_at = NULL WHERE seq = ? AND owner = ?",
+            (status, error, seq, self.owner))
+        if cursor.rowcount == 0:
+            return -1
+        self._conn.execute("UPDATE timer_events SET claimed_at = ? WHERE status = 'replaying' AND owner = ?",
+                           (now, self.owner))
+        return self._pending_count()
+
+    def _release(self) -> int:
+        self._conn.execute(
+            "UPDATE timer_events SET status = 'pending', owner = NULL, claimed_at = NULL "
+            "WHERE status = 'replaying' AND owner = ?", (self.owner,))
+        return self._pending_count()
+
+    def _dead_letter(self, seq: int, error: str, dead_at: str) -> int:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            moved = self._conn.execute(
+                "INSERT OR REPLACE INTO timer_events_dead "
+                "SELECT seq, event_id, kind, user_id, payload, recorded_at, attempts + 1, ?, ? "
+                "FROM timer_events WHERE seq = ? AND owner = ?", (error, dead_at, seq, self.owner)).rowcount
+            self._conn.execute("DELETE FROM timer_events WHERE seq = ? AND owner = ?", (seq, self.owner))
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return self._pending_count() if moved else -1
+
+    def _writable(self) -> bool:
+        # 取得写锁后立即回滚：文件所在磁盘只读、已满或被锁住时抛出异常
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.execute("ROLLBACK")
+        return True
+
+    def _dead_count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM timer_events_dead").fetchone()[0]
+
+    # ---------- 异步接口 ----------
+
+    async def append(self, kind: str, user_id: str, payload: Dict[str, Any], event_id: str = None,
+                     recorded_at: datetime = None) -> str:
+        """追加一个事件，返回 event_id；同一 event_id 只记录一次"""
+        event_id = event_id or str(uuid.uuid4())
+        recorded_at = recorded_at or get_clock().now()
+        pending = await self._run(self._append, event_id, kind, user_id,
+                                  json.dumps(payload, ensure_ascii=False, default=str), recorded_at.isoformat())
+        JOURNAL_PENDING.set(pending)
+        return event_id
+
+    async def pending(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """按写入顺序返回尚未重放的事件（包括已被认领、正在重放的）"""
+        return await self._run(self._select,
+                               "SELECT * FROM timer_events WHERE status IN ('pending', 'replaying') "
+                               "ORDER BY seq LIMIT ?", (limit,))
+
+    async def pending_for_user(self, user_id: str) -> List[Dict[str, Any]]:
+        return await self._run(self._select,
+                               "SELECT * FROM timer_events WHERE user_id = ? AND status IN ('pending', 'replaying') "
+                               "ORDER BY seq", (user_id,))
+
+    async def pending_count(self) -> int:
+        return await self._run(self._pending_count)
+
+    async def claim(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """认领一批待重放的事件（见 _claim），返回认领到的事件"""
+        return await self._run(self._claim, limit, time.time())
+
+    async def release(self):
+        """把本进程认领但没有处理的事件放回待重放"""
+        JOURNAL_PENDING.set(await self._run(self._release))
+
+    async def _update(self, fn: Callable, *args) -> bool:
+        pending = await self._run(fn, *args)
+        if pending < 0:
+            return False
+        JOURNAL_PENDING.set(pending)
+        return True
+
+    # 以下方法只修改本进程认领的事件；认领已过期被其他 worker 接手时返回 False
+
+    async def mark_applied(self, seq: int) -> bool:
+        return await self._update(self._mark, seq, "applied", None, time.time())
+
+    async def mark_rejected(self, seq: int, error: str) -> bool:
+        return await self._update(self._mark, seq, "rejected", error, time.time())
+
+    async def record_attempt(self, seq: int, error: str) -> bool:
+        """重放失败但可重试：增加尝试次数并放回待重放"""
+        return await self._update(self._mark, seq, "pending", error, time.time())
+
+    async def dead_letter(self, seq: int, error: str) -> bool:
+        """把多次重放都失败的事件移到死信表，不再阻塞后续事件"""
+        return await self._update(self._dead_letter, seq, error, get_clock().now().isoformat())
+
+    async def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        return await self._run(self._select, "SELECT * FROM timer_events_dead ORDER BY seq LIMIT ?", (limit,))
+
+    async def dead_count(self) -> int:
+        return await self._run(self._dead_count)
+
+    async def writable(self) -> bool:
+        """日志能否写入（就绪检查用）"""
+        return await self._run(self._writable)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._conn.close()
+
+
+def open_journal(path: str = None) -> Optional[TimerJournal]:
+    """按 TIMER_JOURNAL_PATH 打开日志；设置为 off 时不启用"""
+    path = path or os.getenv("TIMER_JOURNAL_PATH", DEFAULT_JOURNAL_PATH)
+    if path.lower() in ("", "off", "none"):
+        return None
+    return TimerJournal(path, synchronous=os.getenv("TIMER_JOURNAL_SYNCHRONOUS", "NORMAL").upper())
+
+
+class JournaledTimerWrites:
+    """计时器写入入口：正常时直接写存储引擎，数据库慢或不可达时写本地日志
+
+    journal 为 None 时直接透传给存储引擎
+    """
+
+    def __init__(self, get_repository: Callable[[], Any], journal: TimerJournal = None,
+                 write_timeout: float = None, replay_interval: float = None, max_attempts: int = None,
+                 clock: Clock = None):
+        self.get_repository = get_repository
+        self.journal = journal
+        self.write_timeout = write_timeout if write_timeout is not None else \
+            float(os.getenv("TIMER_JOURNAL_WRITE_TIMEOUT", "2"))
+        self.replay_interval = replay_interval if replay_interval is not None else \
+            float(os.getenv("TIMER_JOURNAL_REPLAY_INTERVAL", "5"))
+        self.max_attempts = max_attempts or int(os.getenv("TIMER_JOURNAL_MAX_ATTEMPTS", "5"))
+        self._clock = clock
+        # 最近一次写数据库失败后置为 True，重放清空积压后恢复
+        self.degraded = False
+        self._replay_task: Optional[asyncio.Task] = None
+        self._replay_lock = asyncio.Lock()
+
+    @property
+    def clock(self) -> Clock:
+        return self._clock or get_clock()
+
+    async def _write(self, kind: str, user_id: str, payload: Dict[str, Any], apply: Callable):
+        """先尝试直接写，数据库不可用或超时转入日志；返回 (结果, 是否已写入日志)
+
+        其他异常（业务错误、约束冲突等）重放也不会成功，直接抛给调用方
+        """
+        if self.journal is None:
+            return await apply(), False
+
+        if not self.degraded and not await self.journal.pending_for_user(user_id):
+            try:
+                return await asyncio.wait_for(apply(), self.write_timeout), False
+            except TRANSIENT_ERRORS as e:
+                # 超时的写入可能已经落库，重放时按 session_id 幂等
+                logger.warning(f"计时器写入数据库失败，转入本地日志: {type(e).__name__}: {e}")
+                self.degraded = True
+
+        await self.journal.append(kind, user_id, payload)
+        JOURNAL_EVENTS.inc(kind=kind, outcome="journaled")
+        return None, True
+
+    async def start(self, user_id: str, timer_type_id: int, planned_duration: int = None,
+                    audio_track_id: int = None, exclusive: bool = True) -> Dict[str, Any]:
+        """开始会话；写入日志时返回的 data 带 queued=True"""
+        payload = {
+            "timer_type_id": timer_type_id, "planned_duration": planned_duration,
+            "audio_track_id": audio_track_id, "exclusive": exclusive,
+            "session_id": str(uuid.uuid4()), "started_at": self.clock.now().isoformat()
+        }
+        result, queued = await self._write(
+            "start", user_id, payload, lambda: self._apply(self.get_repository(), "start", user_id, payload))
+        if not queued:
+            return result
+        return {
+            "session_id": payload["session_id"], "timer_type_id": timer_type_id,
+            "planned_duration": planned_duration, "audio_track_id": audio_track_id,
+            "started_at": payload["started_at"], "queued": True
+        }
+
+    async def complete(self, user_id: str, session_id: str = None, actual_duration: int = None) -> Dict[str, Any]:
+        """完成会话；写入日志时尽量根据日志中的开始事件算出实际时长"""
+        ended_at = self.clock.now()
+        payload = {"session_id": session_id, "actual_duration": actual_duration, "ended_at": ended_at.isoformat()}
+        result, queued = await self._write(
+            "complete", user_id, payload, lambda: self._apply(self.get_repository(), "complete", user_id, payload))
+        if not queued:
+            return result
+
+        # 折叠时去掉刚写入的完成事件本身
+        started = self._open_start((await self.journal.pending_for_user(user_id))[:-1])
+        if actual_duration is None and started and session_id in (None, started["session_id"]):
+            actual_duration = elapsed_seconds(datetime.fromisoformat(started["started_at"]), ended_at)
+        return {
+            "session_id": session_id or (started["session_id"] if started else None),
+            "actual_duration": actual_duration, "completed_at": ended_at.isoformat(), "queued": True
+        }
+
+    @staticmethod
+    def _open_start(events: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """按顺序折叠某个用户的待重放事件，返回仍在进行中的开始事件（不含完成事件之后的）"""
+        open_start = None
+        for event in events:
+            if event["kind"] == "start":
+                open_start = event["payload"]
+            elif event["kind"] == "complete":
+                if event["payload"]["session_id"] in (None, open_start and open_start["session_id"]):
+                    open_start = None
+        return open_start
+
+    async def current(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """当前会话；该用户有待重放的事件时以日志为准"""
+        if self.journal is not None:
+            events = await self.journal.pending_for_user(user_id)
+            if events:
+                started = self._open_start(events)
+                if started is None:
+                    return None
+                started_at = datetime.fromisoformat(started["started_at"])
+                return {
+                    "session_id": started["session_id"], "timer_type_id": started["timer_type_id"],
+                    "planned_duration": started["planned_duration"],
+                    "elapsed_time": elapsed_seconds(started_at, self.clock.now()),
+                    "started_at": started["started_at"], "queued": True
+                }
+        return await self.get_repository().get_current_session(user_id)
+
+    @staticmethod
+    async def _apply(repository, kind: str, user_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if kind == "start":
+            return await repository.start_timer_session(
+                user_id=user_id, timer_type_id=payload["timer_type_id"],
+                planned_duration=payload["planned_duration"], audio_track_id=payload["audio_track_id"],
+                exclusive=payload["exclusive"], session_id=payload["session_id"],
+                started_at=datetime.fromisoformat(payload["started_at"]))
+        return await repository.complete_timer_session(
+            user_id=user_id, session_id=payload["session_id"], actual_duration=payload["actual_duration"],
+            ended_at=datetime.fromisoformat(payload["ended_at"]))
+
+    # ---------- 重放 ----------
+
+    async def replay_once(self, batch_size: int = 100) -> int:
+        """按顺序重放待处理事件，数据库仍不可用时停在第一个失败的事件；返回应用的事件数
+
+        事件先由本进程认领（见 TimerJournal.claim），其他 worker 正在重放时直接返回 0。
+        非连接类的异常每次计一次尝试并停在该事件（保持同一用户的事件顺序），
+        达到 max_attempts 次后移到死信表，继续重放后面的事件
+        """
+        if self.journal is None:
+            return 0
+        async with self._replay_lock:
+            applied = 0
+            try:
+                while True:
+                    events = await self.journal.claim(batch_size)
+                    if not events:
+                        if not await self.journal.pending_count():
+                            self.degraded = False
+                        return applied
+                    for event in events:
+                        outcome = await self._replay_event(event)
+                        if outcome is None:
+                            return applied
+                        applied += outcome
+            finally:
+                await self.journal.release()
+
+    async def _replay_event(self, event: Dict[str, Any]) -> Optional[int]:
+        """重放一个已认领的事件：返回应用数（0 或 1），需要停止本轮重放时返回 None"""
+        try:
+            await asyncio.wait_for(
+                self._apply(self.get_repository(), event["kind"], event["user_id"], event["payload"]),
+                self.write_timeout)
+        except ValueError as e:
+            logger.warning(f"计时器事件 {event['event_id']} 被拒绝: {e}")
+            if not await self.journal.mark_rejected(event["seq"], str(e)):
+                return self._lost_claim(event)
+            JOURNAL_EVENTS.inc(kind=event["kind"], outcome="rejected")
+            return 0
+        except TRANSIENT_ERRORS as e:
+            await self.journal.record_attempt(event["seq"], f"{type(e).__name__}: {e}")
+            JOURNAL_REPLAY_ERRORS.inc()
+            return None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if event["attempts"] + 1 < self.max_attempts:
+                await self.journal.record_attempt(event["seq"], error)
+                JOURNAL_REPLAY_ERRORS.inc()
+                return None
+            logger.error(f"计时器事件 {event['event_id']} 重放 {event['attempts'] + 1} 次失败，移到死信表: {error}")
+            if not await self.journal.dead_letter(event["seq"], error):
+                return self._lost_claim(event)
+            JOURNAL_EVENTS.inc(kind=event["kind"], outcome="dead_lettered")
+            return 0
+        if not await self.journal.mark_applied(event["seq"]):
+            return self._lost_claim(event)
+        JOURNAL_EVENTS.inc(kind=event["kind"], outcome="applied")
+        return 1
+
+    @staticmethod
+    def _lost_claim(event: Dict[str, Any]) -> None:
+        # 本轮超过 TIMER_JOURNAL_CLAIM_TTL，事件已被其他 worker 接手（按 session_id 幂等），停止本轮
+        logger.warning(f"计时器事件 {event['event_id']} 的认领已过期，交给其他 worker 重放")
+        return None
+
+    async def _replay_loop(self):
+        while True:
+            try:
+                applied = await self.replay_once()
+                if applied:
+                    logger.info(f"已重放 {applied} 个计时器事件")
+            except Exception as e:
+                logger.error(f"计时器日志重放异常: {e}")
+            await asyncio.sleep(self.replay_interval)
+
+    async def snapshot(self) -> Dict[str, Any]:
+        """健康检查用的状态"""
+        if self.journal is None:
+            return {"enabled": False}
+        return {"enabled": True, "degraded": self.degraded, "pending": await self.journal.pending_count(),
+                "dead_lettered": await self.journal.dead_count()}
+
+    def start_replay(self):
+        """启动后台重放任务（在事件循环中调用）"""
+        if self.journal is not None and self._replay_task is None:
+            self._replay_task = asyncio.get_running_loop().create_task(self._replay_loop())
+
+    async def close(self):
+        if self._replay_task is not None:
+            self._replay_task.cancel()
+            try:
+                await self._replay_task
+            except asyncio.CancelledError:
+                pass
+            self._replay_task = None
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 请求内追踪与慢请求日志
+每个请求在进程内记录一棵 span 树：数据库方法和其中的每条 SQL、取连接等待、LLM 调用和准入排队、
+JWT 校验、JSON 编码、响应压缩等步骤各是一个 span，通过 contextvars 自动挂到当前 span 下，
+不需要在函数之间传递追踪对象，也不依赖外部采集器
+
+请求耗时超过 TRACE_SLOW_MS 毫秒时，用一行 JSON 日志（logger: aura.trace）输出各步骤耗时：
+{"event": "slow_request", "method": "PUT", "route": "/api/timer/complete", "status": 200,
+ "duration_ms": 812.4, "totals": {"db": 790.2, "cpu": 3.1}, "unaccounted_ms": 19.1,
+ "spans": [{"name": "db.supabase.end_timer_session", "kind": "db", "ms": 402.0, "children": [...]}]}
+
+- totals：按类型汇总，嵌套的同类 span 不重复计算；unaccounted_ms 是请求中没有被任何 span 覆盖的时间
+- 不在请求中的调用（后台任务、脚本）不记录；每个请求最多记录 TRACE_MAX_SPANS 个 span
+- TRACE_SLOW_MS=0 关闭慢请求日志（span 仍会记录，开销为每个 span 一次对象分配）
+- 流式响应（text/event-stream、分多次发送的响应体，例如 SSE 推送和流式对话）按首字节时间判断是否慢，
+  连接持续多久不算慢；日志中带 "streamed": true 和 ttfb_ms
+
+使用方法：
+from tracing import install_tracing, span, traced
+
+install_tracing(app)  # 在其他中间件之后调用，使其位于最外层
+
+with span("insights.compute", kind="cpu"):
+    ...
+
+@traced("auth.verify_jwt", kind="cpu")
+def verify_token(token): ...
+"""
+
+import os
+import time
+import json
+import inspect
+import logging
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence
+
+logger = logging.getLogger("aura.trace")
+
+
+class Span:
+    """一个计时步骤；子 span 按开始顺序排列，并发的子 span 时间可以重叠"""
+
+    __slots__ = ("name", "kind", "attrs", "start", "end", "children", "error", "root")
+
+    def __init__(self, name: str, kind: str = None, attrs: Dict[str, Any] = None, root: "Trace" = None):
+        self.name = name
+        self.kind = kind
+        self.attrs = attrs or None
+        self.start = time.perf_counter()
+        self.end = None
+        self.children: List["Span"] = []
+        self.error = None
+        self.root = root
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"name": self.name, "ms": round(self.duration_ms, 1)}
+        if self.kind:
+            data["kind"] = self.kind
+        if self.attrs:
+            data.update(self.attrs)
+        if self.error:
+            data["error"] = self.error
+        if self.children:
+            data["children"] = [child.to_dict() for child in self.children]
+        return data
+
+
+class Trace(Span):
+    """请求的根 span，同时记录本请求的 span 数量"""
+
+    __slots__ = ("max_spans", "span_count", "dropped")
+
+    def __init__(self, name: str, max_spans: int = None):
+        super().__init__(name)
+        self.root = self
+        self.max_spans = max_spans or int(os.getenv("TRACE_MAX_SPANS", "200"))
+        self.span_count = 0
+        self.dropped = 0
+
+    def totals(self) -> Dict[str, float]:
+        """按 kind 汇总耗时；同类 span 嵌套时只计算最外层"""
+        totals: Dict[str, float] = {}
+
+        def walk(spans: Sequence[Span], kinds: frozenset):
+            for child in spans:
+                if child.kind and child.kind not in kinds:
+                    totals[child.kind] = totals.get(child.kind, 0.0) + child.duration_ms
+                walk(child.children, kinds | {child.kind} if child.kind else kinds)
+
+        walk(self.children, frozenset())
+        return {kind: round(ms, 1) for kind, ms in sorted(totals.items(), key=lambda item: -item[1])}
+
+    def unaccounted_ms(self) -> float:
+        """根 span 中没有被任何直接子 span 覆盖的时间（合并重叠区间）"""
+        covered, cursor = 0.0, self.start
+        for child in sorted(self.children, key=lambda s: s.start):
+            end = child.end or time.perf_counter()
+            if end > cursor:
+                covered += end - max(child.start, cursor)
+                cursor = end
+        return round(max(self.duration_ms - covered * 1000, 0.0), 1)
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("aura_trace_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, kind: str = None, **attrs):
+    """在当前 span 下记录一个子步骤；不在请求中时什么也不做"""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    trace = parent.root
+    if trace.span_count >= trace.max_spans:
+        trace.dropped += 1
+        yield None
+        return
+    trace.span_count += 1
+    child = Span(name, kind, attrs, trace)
+    parent.children.append(child)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = type(e).__name__
+        raise
+    finally:
+        child.finish()
+        _current.reset(token)
+
+
+def traced(name: str = None, kind: str = None):
+    """函数装饰器：每次调用记录一个 span，同时支持同步和异步函数"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, kind):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ==================== HTTP 中间件 ====================
+
+class TracingMiddleware:
+    """为每个请求建立根 span，耗时超过阈值时输出一行结构化日志（纯 ASGI 实现）"""
+
+    def __init__(self, app, slow_ms: float = None,
+                 exclude_paths: Sequence[str] = ("/metrics", "/api/health/live", "/api/health/ready")):
+        self.app = app
+        self.slow_ms = slow_ms if slow_ms is not None else float(os.getenv("TRACE_SLOW_MS", "1000"))
+        self.exclude_paths = set(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(f"{scope['method']} {scope['path']}")
+        response = {"status": 500, "streamed": False, "first_byte": None}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["streamed"] = any(name == b"content-type" and value.startswith(b"text/event-stream")
+                                           for name, value in message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                if response["first_byte"] is None:
+                    response["first_byte"] = time.perf_counter()
+                if message.get("more_body"):
+                    response["streamed"] = True
+            await send(message)
+
+        token = _current.set(trace)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            trace.error = type(e).__name__
+            raise
+        finally:
+            trace.finish()
+            _current.reset(token)
+            ttfb_ms = None
+            if response["streamed"]:
+                ttfb_ms = ((response["first_byte"] or trace.end) - trace.start) * 1000
+            if self.slow_ms > 0 and (ttfb_ms if ttfb_ms is not None else trace.duration_ms) >= self.slow_ms:
+                log_slow_request(trace, scope, response["status"], ttfb_ms)
+
+
+def slow_request_record(trace: Trace, scope, status: int, ttfb_ms: float = None) -> Dict[str, Any]:
+    from metrics import _route_template  # metrics 依赖本模块，延迟导入
+
+    record = {
+        "event": "slow_request",
+        "method": scope["method"],
+        "route": _route_template(scope),
+        "path": scope["path"],
+        "status": status,
+        "duration_ms": round(trace.duration_ms, 1),
+        "totals": trace.totals(),
+        "unaccounted_ms": trace.unaccounted_ms(),
+        "spans": [child.to_dict() for child in trace.children],
+    }
+    if ttfb_ms is not None:
+        record["streamed"] = True
+        record["ttfb_ms"] = round(ttfb_ms, 1)
+    if trace.error:
+        record["error"] = trace.error
+    if trace.dropped:
+        record["dropped_spans"] = trace.dropped
+    return record
+
+
+def log_slow_request(trace: Trace, scope, status: int, ttfb_ms: float = None):
+    logger.warning(json.dumps(slow_request_record(trace, scope, status, ttfb_ms), ensure_ascii=False,
+                              separators=(",", ":"), default=str))
+
+
+def install_tracing(app, **options):
+    """为应用注册请求追踪中间件；应在其他中间件（包括响应压缩）之后调用，使其位于最外层"""
+    app.add_middleware(TracingMiddleware, **options)
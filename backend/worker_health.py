@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+AURA STUDIO - 多 worker 运行时状态
+每个 worker 进程记录自己的 pid、启动时间、是否就绪、已处理请求数和内存占用，
+通过 /api/health/worker 返回，并定期写入状态目录，供 production_runner.py 汇总
+
+使用方法：
+from worker_health import install_worker_health
+install_worker_health(app)
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter
+
+STATUS_DIR_ENV = "WORKER_STATUS_DIR"
+DEFAULT_STATUS_DIR = "/tmp/aura-workers"
+HEARTBEAT_INTERVAL = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", "5"))
+
+
+def status_dir() -> str:
+    return os.getenv(STATUS_DIR_ENV, DEFAULT_STATUS_DIR)
+
+
+def _rss_mb() -> float:
+    """当前进程的峰值常驻内存（MB），Linux 返回 KB，macOS 返回字节"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(rss / divisor, 1)
+
+
+class WorkerState:
+    """单个 worker 进程的运行状态
+
+    preload 模式下模块在 master 中导入，fork 后必须调用 reset() 重新记录 pid 和启动时间，
+    否则所有 worker 会共用 master 的数据
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, max_requests: int = 0):
+        self.pid = os.getpid()
+        self.started_at = time.time()
+        self.ready = False
+        self.requests = 0
+        self.in_flight = 0
+        self.max_requests = max_requests
+        self.last_heartbeat = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "pid": self.pid,
+            "ppid": os.getppid(),
+            "started_at": self.started_at,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "ready": self.ready,
+            "requests_served": self.requests,
+            "in_flight": self.in_flight,
+            "max_requests": self.max_requests,
+            "rss_mb": _rss_mb(),
+            "heartbeat": time.time(),
+        }
+
+    def status_path(self) -> str:
+        return os.path.join(status_dir(), f"worker-{self.pid}.json")
+
+    def write_status(self, force: bool = False):
+        """写入状态文件；未到心跳间隔时跳过，避免每个请求都写磁盘"""
+        now = time.time()
+        if not force and now - self.last_heartbeat < HEARTBEAT_INTERVAL:
+            return
+        self.last_heartbeat = now
+        path = self.status_path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.to_dict(), f)
+            os.replace(tmp_path, path)
+        except OSError:
+            # 状态文件只用于观测，写失败不影响请求
+            pass
+
+    def remove_status(self):
+        try:
+            os.remove(self.status_path())
+        except OSError:
+            pass
+
+
+WORKER_STATE = WorkerState()
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def remove_stale_statuses(directory: Optional[str] = None):
+    """删除已退出 worker 的状态文件"""
+    directory = directory or status_dir()
+    os.makedirs(directory, exist_ok=True)
+    for status in read_worker_statuses(directory):
+        if not pid_alive(status["pid"]):
+            try:
+                os.remove(os.path.join(directory, f"worker-{status['pid']}.json"))
+            except OSError:
+                pass
+
+
+def read_worker_statuses(directory: Optional[str] = None) -> List[Dict[str, Any]]:
+    """读取状态目录中所有 worker 的状态（由管理进程调用）"""
+    directory = directory or status_dir()
+    statuses = []
+    if not os.path.isdir(directory):
+        return statuses
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith("worker-") and name.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                statuses.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return statuses
+
+
+class WorkerHealthMiddleware:
+    """统计本 worker 处理的请求数，并顺带刷新心跳文件"""
+
+    def __init__(self, app, state: WorkerState = WORKER_STATE):
+        self.app = app
+        self.state = state
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.app(scope, receive, self._lifespan_send(send))
+            return
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        self.state.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.state.in_flight -= 1
+            self.state.requests += 1
+            self.state.write_status()
+
+    def _lifespan_send(self, send):
+        """startup 事件全部执行完后才把 worker 标记为就绪，滚动重启据此判断能否切换"""
+        async def wrapper(message):
+            if message["type"] == "lifespan.startup.complete":
+                self.state.ready = True
+                self.state.write_status(force=True)
+            await send(message)
+        return wrapper
+
+
+router = APIRouter()
+
+
+@router.get("/api/health/worker", summary="当前 worker 状态")
+async def worker_health():
+    """返回处理本次请求的 worker 进程状态"""
+    return {"status": "healthy", "worker": WORKER_STATE.to_dict()}
+
+
+def install_worker_health(app):
+    """为应用注册 worker 状态中间件和接口"""
+    app.add_middleware(WorkerHealthMiddleware)
+    app.include_router(router, tags=["健康检查"])
@@ -142,15 +142,35 @@ export function TimerStatsModal({ isOpen, onClose }: TimerStatsModalProps) {
     }
   }, [isOpen, user])
 
-  // 🔄 自动刷新机制：每30秒自动刷新一次数据（仅在弹窗打开时）
+  // 🔄 实时更新：订阅后端推送（SSE），会话开始/完成时直接收到最新统计，不再定时轮询
+  // 推送连接断开时浏览器会自动重连；不支持 EventSource 时退回到每30秒刷新
   useEffect(() => {
     if (!isOpen || !user) return
 
-    const interval = setInterval(() => {
-      loadTimerStats()
-    }, 30000) // 30秒自动刷新
+    if (typeof EventSource === 'undefined') {
+      const interval = setInterval(() => {
+        loadTimerStats()
+      }, 30000)
+      return () => clearInterval(interval)
+    }
+
+    const source = new EventSource(`http://localhost:8000/api/timer/stream/${user.id}`)
+    const applyStats = (event: MessageEvent) => {
+      const message = JSON.parse(event.data)
+      if (message.lagged) {
+        // 推送积压被丢弃过，重新拉一次完整数据
+        loadTimerStats()
+      } else if (message.timer_stats) {
+        console.log('📡 [TimerStats] 收到实时统计更新:', message.type)
+        setStats(message.timer_stats)
+      }
+    }
+    source.addEventListener('session_completed', applyStats)
+    source.addEventListener('events_applied', applyStats)
+    // 超时未完成的会话被后端自动结束时也会更新统计
+    source.addEventListener('sessions_closed', applyStats)
 
-    return () => clearInterval(interval)
+    return () => source.close()
   }, [isOpen, user])
 
   // 🎨 格式化时长显示 - 精确到MM:SS
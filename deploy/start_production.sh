@@ -8,17 +8,23 @@ echo "🚀 启动 AURA STUDIO 生产环境..."
 
 cd $PROJECT_DIR
 
-# 停止现有服务
+# 停止现有前端服务
 echo "🛑 停止现有服务..."
 pm2 delete aura-frontend 2>/dev/null || true
 pm2 delete aura-backend 2>/dev/null || true
 
-# 启动后端服务
+# 启动后端服务（gunicorn 多 worker，配置见 backend/gunicorn_conf.py）
 echo "🐍 启动后端服务..."
 cd backend
 source venv/bin/activate
 
-pm2 start "python -m uvicorn main:app --host 0.0.0.0 --port 8000" --name aura-backend
+# 后端已在运行时做零停机滚动重启，否则后台启动
+if python production_runner.py status >/dev/null 2>&1; then
+    python production_runner.py reload
+else
+    python production_runner.py stop >/dev/null 2>&1 || true
+    python production_runner.py start --daemon
+fi
 
 # 启动前端服务
 echo "🌐 启动前端服务..."
@@ -32,5 +38,5 @@ pm2 startup
 echo "✅ 服务启动完成！"
 echo "🌐 前端地址: http://your-server-ip:3000"
 echo "🔧 后端地址: http://your-server-ip:8000"
-echo "📊 查看服务状态: pm2 status"
+echo "📊 查看服务状态: pm2 status / python backend/production_runner.py status"
 echo "📝 查看日志: pm2 logs" 
\ No newline at end of file
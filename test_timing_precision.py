@@ -2,25 +2,32 @@
 """
 AURA STUDIO - 计时器精度测试脚本
 测试计时器的精确性和统计数据的实时更新
+
+会话时长在虚拟时钟中推进，不需要真的等待；
+离线的大规模精度测试（跨午夜、夏令时）见 backend/test_clock.py
 """
 
 import asyncio
 import sys
 import os
-import time
-from datetime import datetime
+from datetime import datetime, timezone
 
 # 添加backend目录到Python路径
 sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
 
 from supabase_integration import SupabaseClient
+from clock import VirtualClock, elapsed_seconds
+
+# 测试会话时长（秒），虚拟时间下可以设置任意长度
+SESSION_SECONDS = int(os.getenv("TIMING_TEST_SECONDS", "30"))
 
 
 async def test_timing_precision():
     """测试计时器精度"""
     print("🧪 开始测试计时器精度...")
     
-    client = SupabaseClient()
+    clock = VirtualClock(datetime.now(timezone.utc))
+    client = SupabaseClient(clock=clock)
     
     # 测试用户ID (使用已知存在的用户)
     test_user_id = "501e5f63-5e00-4c24-b3fe-abffef1f42da"
@@ -38,27 +45,28 @@ async def test_timing_precision():
         formatted_duration = stat.get('total_duration_formatted', f"{total_duration}秒")
         print(f"  {timer_name}: {usage_count}次使用, 总时长: {formatted_duration}")
     
-    # 2. 开始一个短时间的计时会话
-    print("\n2️⃣ 开始30秒聚焦计时会话...")
-    session_start_time = datetime.now()
+    # 2. 开始一个计时会话
+    print(f"\n2️⃣ 开始{SESSION_SECONDS}秒聚焦计时会话...")
+    session_start_time = clock.now()
     session_id = await client.start_timer_session(
         user_id=test_user_id,
         timer_type_id=1,  # 聚焦
-        planned_duration=30  # 30秒
+        planned_duration=SESSION_SECONDS
     )
     
     if session_id:
         print(f"  ✅ 会话开始: {session_id}")
         print(f"  开始时间: {session_start_time.strftime('%H:%M:%S')}")
         
-        # 等待精确的30秒
-        print("  ⏱️ 等待30秒...")
-        await asyncio.sleep(30)
+        # 在虚拟时间中前进，不需要真的等待
+        print(f"  ⏱️ 虚拟时间前进{SESSION_SECONDS}秒...")
+        await clock.sleep(SESSION_SECONDS)
         
         # 3. 完成会话
         print("\n3️⃣ 完成计时会话...")
-        session_end_time = datetime.now()
-        actual_duration = int((session_end_time - session_start_time).total_seconds())
+        session_end_time = clock.now()
+        actual_duration = elapsed_seconds(session_start_time, session_end_time)
+        assert actual_duration == SESSION_SECONDS, f"时长误差: {actual_duration} != {SESSION_SECONDS}"
         
         success = await client.end_timer_session(
             session_id=session_id,